@@ -0,0 +1 @@
+# ScratchLang 性能基准测试
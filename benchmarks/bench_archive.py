@@ -0,0 +1,110 @@
+"""
+.sb3 写入基准测试：按条目选择压缩方式和多线程压缩对保存耗时、文件大小的影响
+
+生成带大量 PNG 造型、SVG 造型和 WAV 音效的项目，编译后比较 builder.save 的耗时和 .sb3 大小：
+旧方式（所有条目都用 deflate，逐个压缩）、新方式（PNG/JPEG/GIF/MP3 原样存储）逐个压缩和多线程压缩。
+
+用法: python benchmarks/bench_archive.py [--costumes 100] [--sounds 40] [--workers 1,4] [--level 6]
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+from compiler import archive
+from compiler.parser import ScratchLangParser
+
+
+def write_assets(directory, costumes, sounds):
+    """生成内容各不相同的 PNG、SVG 造型和 WAV 音效，返回 (造型文件名, 音效文件名)"""
+    rng = random.Random(0)
+    costume_names = []
+    for index in range(costumes):
+        if index % 4 == 3:
+            name = f"costume{index}.svg"
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                f.write('<svg xmlns="http://www.w3.org/2000/svg" width="200" height="200">'
+                        + "".join(f'<circle cx="{rng.randrange(200)}" cy="{rng.randrange(200)}" r="{i % 30 + 1}"/>'
+                                  for i in range(400))
+                        + "</svg>")
+        else:
+            name = f"costume{index}.png"
+            image = Image.frombytes("RGB", (320, 240), rng.randbytes(320 * 240 * 3))
+            image.save(os.path.join(directory, name))
+        costume_names.append(name)
+    sound_names = []
+    for index in range(sounds):
+        name = f"sound{index}.wav"
+        with wave.open(os.path.join(directory, name), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(22050)
+            f.writeframes(b"".join(struct.pack("<h", int(8000 * math.sin(i * (index + 1) / 50)))
+                                   for i in range(22050)))
+        sound_names.append(name)
+    return costume_names, sound_names
+
+
+def save_once(builder, path, workers, level, stored_formats):
+    """保存一次，返回 (耗时, 文件大小)"""
+    builder.asset_manager.workers = workers
+    builder.compress_level = level
+    original = archive.STORED_FORMATS
+    archive.STORED_FORMATS = stored_formats
+    try:
+        start = time.perf_counter()
+        builder.save(path)
+        elapsed = time.perf_counter() - start
+    finally:
+        archive.STORED_FORMATS = original
+    return elapsed, os.path.getsize(path)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--costumes", type=int, default=100, help="造型数（每 4 个中 1 个为 SVG）")
+    arg_parser.add_argument("--sounds", type=int, default=40, help="音效数")
+    arg_parser.add_argument("--workers", default="1,4", help="新方式的线程数，逗号分隔")
+    arg_parser.add_argument("--level", type=int, default=archive.DEFAULT_COMPRESS_LEVEL, help="deflate 压缩级别")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="每种方式重复次数，取最短耗时")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        costume_names, sound_names = write_assets(directory, args.costumes, args.sounds)
+        code = (": 开始\n# 角色1\n" + "".join(f"造型: {name}\n" for name in costume_names)
+                + "".join(f"音效: {name}\n" for name in sound_names) + "当绿旗被点击\n  移动 10 步\n")
+        parser = ScratchLangParser(image_cache=False, asset_workers=1)
+        parser.current_dir = directory
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser.parse(code)
+        path = os.path.join(directory, "out.sb3")
+
+        cases = [("全部 deflate", 1, frozenset())]
+        cases += [("按格式选择", int(value), archive.STORED_FORMATS) for value in args.workers.split(",")]
+        print(f"{args.costumes} 个造型、{args.sounds} 个音效，压缩级别 {args.level}，CPU 核数 {os.cpu_count()}")
+        print(f"{'方式':<12}{'线程数':>6}{'保存耗时':>10}{'文件大小':>14}")
+        baseline = None
+        for label, workers, stored_formats in cases:
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = [save_once(parser.builder, path, workers, args.level, stored_formats)
+                           for _ in range(args.repeat)]
+            elapsed = min(result[0] for result in results)
+            size = results[0][1]
+            baseline = baseline or elapsed
+            print(f"{label:<12}{workers:>8}{elapsed:>10.3f}s{size:>12} B  x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
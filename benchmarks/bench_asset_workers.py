@@ -0,0 +1,70 @@
+"""
+资源线程池基准测试：不同线程数下处理大量位图造型的编译耗时
+
+生成 count 张位图造型（不使用造型图片缓存、开启自动缩放，每张都要用 PIL 解码、缩放和编码），
+比较 asset_workers 取不同值时的编译耗时，以及各资源在工作线程中的处理耗时之和。
+
+用法: python benchmarks/bench_asset_workers.py [--count 150] [--size 1024x768] [--workers 1,2,4,8]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+from compiler.parser import ScratchLangParser
+
+
+def write_costumes(directory, count, width, height):
+    """生成 count 张内容各不相同的 PNG（不会按 MD5 合并）"""
+    names = []
+    for index in range(count):
+        name = f"costume{index}.png"
+        image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        image.putpixel((0, 0), (index % 256, index // 256 % 256, 0))
+        image.save(os.path.join(directory, name))
+        names.append(name)
+    return names
+
+
+def compile_once(directory, code, workers):
+    """编译一次，返回 (耗时, 资源处理统计)"""
+    parser = ScratchLangParser(auto_scale_costumes=True, image_cache=False, asset_workers=workers)
+    parser.current_dir = directory
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(code)
+        parser.compile(os.path.join(directory, "out.sb3"))
+    return time.perf_counter() - start, parser.builder.asset_stats
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--count", type=int, default=150, help="造型数")
+    arg_parser.add_argument("--size", default="1024x768", help="造型尺寸，如 1024x768")
+    arg_parser.add_argument("--workers", default="1,2,4,8", help="线程数，逗号分隔")
+    args = arg_parser.parse_args()
+    width, height = (int(value) for value in args.size.split("x"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        names = write_costumes(directory, args.count, width, height)
+        code = ": 开始\n# 角色1\n" + "".join(f"造型: {name}\n" for name in names) + "当绿旗被点击\n  移动 10 步\n"
+        print(f"{args.count} 个 {width}x{height} 造型，CPU 核数 {os.cpu_count()}")
+        print(f"{'线程数':>6}{'编译耗时':>10}{'等待资源':>10}{'资源耗时之和':>14}")
+        baseline = None
+        for workers in (int(value) for value in args.workers.split(",")):
+            elapsed, stats = compile_once(directory, code, workers)
+            baseline = baseline or elapsed
+            print(f"{workers:>8}{elapsed:>10.2f}s{stats.wait_seconds:>10.2f}s{stats.total_seconds:>12.2f}s"
+                  f"  x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
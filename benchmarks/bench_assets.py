@@ -0,0 +1,87 @@
+"""
+资源流式写入内存基准测试：资源总量增加时保存 .sb3 的峰值内存（RSS）
+
+每个资源总量在单独的子进程中编译和保存，比较流式写入（默认）和把全部资源读入内存
+（等同于以前 AssetManager 用 bytes 保存资源）的峰值 RSS。
+
+用法: python benchmarks/bench_assets.py [--volumes 0,50,100,200] [--sound-size 10]
+"""
+import argparse
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_wav(path, size, seed=0):
+    """生成约 size 字节的 16 位单声道 WAV（重复的锯齿波，seed 不同时内容不同，不会按 MD5 合并）"""
+    pcm = bytes((value + seed) % 256 for value in range(256)) * (size // 256)
+    header = (b'RIFF' + struct.pack('<I', 36 + len(pcm)) + b'WAVEfmt '
+              + struct.pack('<IHHIIHH', 16, 1, 1, 22050, 44100, 2, 16) + b'data' + struct.pack('<I', len(pcm)))
+    with open(path, 'wb') as f:
+        f.write(header + pcm)
+
+
+def _child(directory, mode):
+    """子进程：编译引用 directory 中全部音效的项目并保存，输出峰值 RSS 和耗时"""
+    import contextlib
+    import io
+    import resource
+    from compiler.assets import AssetSource
+    from compiler.parser import ScratchLangParser
+
+    sounds = sorted(name for name in os.listdir(directory) if name.endswith('.wav'))
+    code = ": 开始\n# 角色1\n" + "".join(f"音效: {name}\n" for name in sounds) + "当绿旗被点击\n  移动 10 步\n"
+    start = time.perf_counter()
+    parser = ScratchLangParser()
+    parser.current_dir = directory
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(code)
+        if mode == "memory":
+            assets = parser.builder.asset_manager.assets
+            for name, asset in assets.items():
+                assets[name] = AssetSource.from_bytes(name, asset.read())
+        parser.compile(os.path.join(directory, "out.sb3"))
+    elapsed = time.perf_counter() - start
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, elapsed)
+
+
+def _measure(directory, mode):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", directory, mode],
+                            capture_output=True, text=True, check=True)
+    peak, elapsed = result.stdout.split()
+    return int(peak), float(elapsed)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--volumes", default="0,50,100,200", help="资源总量（MB），逗号分隔")
+    arg_parser.add_argument("--sound-size", type=int, default=10, help="每个音效的大小（MB）")
+    arg_parser.add_argument("--child", nargs=2, metavar=("DIR", "MODE"), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.child:
+        _child(*args.child)
+        return
+
+    mb = 1024 * 1024
+    print(f"{'资源总量':>10}{'流式 RSS':>12}{'耗时':>9}{'内存 RSS':>12}{'耗时':>9}")
+    for volume in (int(value) for value in args.volumes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            for index in range(-(-volume // args.sound_size)):
+                size = min(args.sound_size, volume - index * args.sound_size) * mb
+                write_wav(os.path.join(directory, f"sound{index}.wav"), size, seed=index)
+            stream_peak, stream_time = _measure(directory, "stream")
+            memory_peak, memory_time = _measure(directory, "memory")
+        print(f"{volume:>8} MB{stream_peak / mb:>9.1f} MB{stream_time:>8.2f}s"
+              f"{memory_peak / mb:>9.1f} MB{memory_time:>8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
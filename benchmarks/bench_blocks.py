@@ -0,0 +1,123 @@
+"""
+积木表示内存基准测试：原先的字典 vs Block 记录
+
+用解析器编译同一个合成程序两次：一次把各模块中的 new_block 换成原先的构造方式
+（每个积木一个字典，字符串不驻留），一次使用 new_block（带 __slots__ 的 Block，驻留字符串），
+比较积木占用的内存、解析耗时和 project.json 编码耗时。两次生成的 project.json 必须相同。
+
+用法: python benchmarks/bench_blocks.py [--lines 190000]（约 20 万个积木）
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler import blockrecord
+from compiler.blockrecord import Block
+from compiler.parser import ScratchLangParser
+from benchmarks.synthetic import generate_program
+
+
+def baseline_block(opcode, inputs=None, fields=None, parent=None, next_id=None, shadow=False,
+                   top_level=False, x=None, y=None, mutation=None):
+    """原先的积木构造方式：每个积木新建 inputs/fields 字典，字符串不驻留"""
+    block = {
+        "opcode": opcode,
+        "next": next_id,
+        "parent": parent,
+        "inputs": inputs if inputs is not None else {},
+        "fields": fields if fields is not None else {},
+        "shadow": shadow,
+        "topLevel": top_level,
+    }
+    if x is not None:
+        block["x"] = x
+    if y is not None:
+        block["y"] = y
+    if mutation is not None:
+        block["mutation"] = mutation
+    return block
+
+
+@contextlib.contextmanager
+def baseline_layout():
+    """临时把所有模块中导入的 new_block 换成 baseline_block"""
+    new_block = blockrecord.new_block
+    modules = [module for module in list(sys.modules.values())
+               if module is not blockrecord and getattr(module, "new_block", None) is new_block]
+    for module in modules:
+        module.new_block = baseline_block
+    try:
+        yield
+    finally:
+        for module in modules:
+            module.new_block = new_block
+
+
+def deep_size(obj):
+    """obj 及其引用的 Block、字典、列表和字符串的总字节数（共用的对象只计一次）"""
+    seen = set()
+    total = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, Block):
+            pending.extend(getattr(item, name) for name in Block.__slots__)
+        elif isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, list):
+            pending.extend(item)
+    return total
+
+
+def _measure(code):
+    """返回 (积木数, 积木占用字节数, 解析耗时, project.json 编码耗时, project.json)"""
+    gc.collect()
+    parser = ScratchLangParser(id_mode="counter")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(code)
+    parse_time = time.perf_counter() - start
+    project = parser.builder.project
+    blocks = [target["blocks"] for target in project["targets"]]
+    count = sum(len(target_blocks) for target_blocks in blocks)
+    start = time.perf_counter()
+    text = "".join(parser.builder.iter_project_json())
+    dump_time = time.perf_counter() - start
+    return count, deep_size(blocks), parse_time, dump_time, text
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--lines", type=int, default=190000, help="合成程序行数")
+    args = arg_parser.parse_args()
+
+    code = generate_program(args.lines, num_sprites=20)
+    with baseline_layout():
+        before = _measure(code)
+    after = _measure(code)
+    assert before[0] == after[0] and before[4] == after[4], "两种布局生成的 project.json 不同"
+
+    mb = 1024 * 1024
+    count = after[0]
+    print(f"项目: {count} 个积木, project.json {len(after[4].encode('utf-8')) / mb:.1f} MB")
+    print(f"{'':<12}{'积木内存':>12}{'每个积木':>10}{'解析':>12}{'编码':>12}")
+    for name, (_, used, parse_time, dump_time, _) in (("原先的字典", before), ("Block", after)):
+        print(f"{name:<12}{used / mb:>10.1f} MB{used / count:>8.0f} B"
+              f"{parse_time * 1000:>10.0f} ms{dump_time * 1000:>10.0f} ms")
+    print(f"内存减少 {(1 - after[1] / before[1]) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
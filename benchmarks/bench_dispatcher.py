@@ -0,0 +1,72 @@
+"""
+语句分派基准测试：逐个正则扫描 vs BlockDispatcher
+
+用法: python benchmarks/bench_dispatcher.py [--lines 50000]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler.blocks import BlockDefinitions
+from compiler.dispatcher import BlockDispatcher
+from compiler.parser import ScratchLangParser
+from benchmarks.synthetic import generate_program
+
+
+def _rate(func, lines, repeat=3):
+    """返回 func 处理 lines 的最佳吞吐量（行/秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+def _parse_rate(code, linear):
+    """返回完整解析的吞吐量（行/秒）"""
+    parser = ScratchLangParser()
+    if linear:
+        parser.dispatcher.match = parser.dispatcher.match_linear
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(code)
+    return code.count("\n") / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--lines", type=int, default=50000, help="合成程序行数")
+    args = arg_parser.parse_args()
+
+    dispatcher = BlockDispatcher(BlockDefinitions.get_all_blocks())
+
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "examples", "*.sl"))):
+        with open(path, encoding="utf-8") as f:
+            corpus.extend(line.strip() for line in f if line.strip())
+    synthetic = generate_program(args.lines)
+    synthetic_lines = [line.strip() for line in synthetic.splitlines() if line.strip()]
+
+    print(f"{'数据集':<24}{'逐个扫描 行/秒':>16}{'分派器 行/秒':>16}{'加速比':>10}")
+    for label, lines in [(f"examples/ ({len(corpus)} 行)", corpus),
+                         (f"合成程序 ({len(synthetic_lines)} 行)", synthetic_lines)]:
+        before = _rate(dispatcher.match_linear, lines)
+        after = _rate(dispatcher.match, lines)
+        print(f"{label:<24}{before:>16,.0f}{after:>16,.0f}{after / before:>9.1f}x")
+
+    before = _parse_rate(synthetic, linear=True)
+    after = _parse_rate(synthetic, linear=False)
+    print(f"{'完整解析 (合成程序)':<24}{before:>16,.0f}{after:>16,.0f}{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
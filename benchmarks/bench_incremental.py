@@ -0,0 +1,70 @@
+"""
+增量编译基准测试：修改一个角色后的编译时间
+
+用法: python benchmarks/bench_incremental.py [--sprites 40] [--lines 40000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler.parser import ScratchLangParser
+from benchmarks.synthetic import generate_program
+
+
+def _compile(code, output, incremental, cache_dir):
+    """返回 (解析耗时, 解析 + 保存总耗时, 增量统计)"""
+    parser = ScratchLangParser(incremental=incremental, cache_dir=cache_dir)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(code)
+        parsed = time.perf_counter()
+        parser.compile(output)
+    return parsed - start, time.perf_counter() - start, parser.incremental_stats
+
+
+def _edit_one_sprite(code, sprite):
+    """在指定角色的声明后插入一个新脚本"""
+    header = f"# 角色{sprite}\n"
+    return code.replace(header, header + "当绿旗被点击\n  移动 1 步\n", 1)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--sprites", type=int, default=40, help="角色数量")
+    arg_parser.add_argument("--lines", type=int, default=40000, help="合成程序行数")
+    args = arg_parser.parse_args()
+
+    code = generate_program(args.lines, num_sprites=args.sprites)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, "cache")
+        output = os.path.join(tmp, "out.sb3")
+
+        full = _compile(code, output, False, cache_dir)
+        cold = _compile(code, output, True, cache_dir)
+        warm = _compile(code, output, True, cache_dir)
+        edited = _edit_one_sprite(code, args.sprites // 2)
+        edit = _compile(edited, output, True, cache_dir)
+        with open(output, "rb") as f:
+            incremental_bytes = f.read()
+        _compile(edited, output, False, cache_dir)
+        with open(output, "rb") as f:
+            assert f.read() == incremental_bytes
+
+    print(f"源码: {args.lines} 行, {args.sprites} 个角色")
+    print(f"{'':18}{'解析':>10}{'解析+保存':>12}")
+    for label, (parse_time, total, _) in [("完整编译", full), ("增量（冷缓存）", cold),
+                                          ("增量（无修改）", warm), ("增量（改 1 角色）", edit)]:
+        print(f"{label:18}{parse_time * 1000:8.1f} ms{total * 1000:9.1f} ms")
+    print(f"重建: {edit[2].rebuilt}")
+    print(f"加速（改 1 角色）: 解析 {full[0] / edit[0]:.1f}x, 总计 {full[1] / edit[1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+词法分析基准测试：逐字符 CharLexer vs 主正则 Lexer
+
+用法: python benchmarks/bench_lexer.py [--terms 2000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler.lexer import Lexer
+from benchmarks.char_lexer import CharLexer
+
+
+# 操作数组合：混合算术表达式，以及以较长变量名/单词为主的表达式
+PROFILES = {
+    "算术": ["12", "3.75", "1.5e3", "~分数", "~x", "(~速度 * 2)", "sqrt(~面积)", "四舍五入(~y / 3)"],
+    "长标识符": ["~玩家得分", "~敌人移动速度", "3.14159", "~重力加速度", "最大生命值", "~player_speed"],
+}
+
+
+def generate_expression(terms, operands, seed=0):
+    """生成一条很长的算术表达式"""
+    rng = random.Random(seed)
+    parts = [rng.choice(operands)]
+    for _ in range(terms - 1):
+        parts.append(rng.choice("+-*/%"))
+        parts.append(rng.choice(operands))
+    return " ".join(parts)
+
+
+def _best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--terms", type=int, default=2000, help="表达式中的操作数个数")
+    arg_parser.add_argument("--repeat", type=int, default=20, help="重复次数（取最快一次）")
+    args = arg_parser.parse_args()
+
+    for name, operands in PROFILES.items():
+        text = generate_expression(args.terms, operands)
+        tokens = Lexer(text).tokenize()
+        assert tokens == CharLexer(text).tokenize(), "Lexer 与 CharLexer 的输出不同"
+
+        before = _best_time(lambda: CharLexer(text).tokenize(), args.repeat)
+        after = _best_time(lambda: Lexer(text).tokenize(), args.repeat)
+        print(f"[{name}] {args.terms} 个操作数, {len(text) / 1e3:.1f} K 字符, {len(tokens)} 个 token")
+        print(f"  {'CharLexer':<12}{before * 1000:>10.2f} ms{len(text) / before / 1e6:>10.2f} M 字符/秒")
+        print(f"  {'Lexer':<12}{after * 1000:>10.2f} ms{len(text) / after / 1e6:>10.2f} M 字符/秒"
+              f"{before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
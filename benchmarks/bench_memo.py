@@ -0,0 +1,79 @@
+"""
+表达式缓存基准测试：表达式重复出现的程序，关闭 vs 开启表达式缓存
+
+用法: python benchmarks/bench_memo.py [--lines 20000] [--sprites 10] [--size 1024]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler.memo import DEFAULT_EXPRESSION_CACHE_SIZE
+from compiler.parser import ScratchLangParser
+
+# 游戏程序中常见的、反复出现的表达式
+_EXPRESSIONS = [
+    "~x + 1",
+    "(~速度 + 1) * 2",
+    "鼠标的x坐标",
+    "从 1 到 10 随机选一个数",
+    "~速度 * ~方向系数 - 3",
+    "四舍五入(~分数 / 10)",
+]
+_CONDITIONS = ["~分数 > 10", "~x < 0 且 ~速度 > 2", "按下 空格 键?", "碰到 边缘"]
+
+
+def generate_program(num_lines, num_sprites, seed=0):
+    """生成表达式重复出现的合成程序"""
+    rng = random.Random(seed)
+    lines = [": 开始", "@ 舞台", "变量: 分数 = 0"]
+    per_sprite = max(1, num_lines // num_sprites)
+    for sprite in range(num_sprites):
+        lines += [f"# 角色{sprite}", "变量: x = 0", "变量: 速度 = 3", "变量: 方向系数 = 1", "当绿旗被点击"]
+        written = 5
+        while written < per_sprite:
+            if rng.random() < 0.3:
+                lines += [f"  如果 {rng.choice(_CONDITIONS)} 那么",
+                          f"    将x坐标增加 {rng.choice(_EXPRESSIONS)}", "  结束"]
+                written += 3
+            else:
+                lines.append(f"  设置 ~x 为 {rng.choice(_EXPRESSIONS)}")
+                written += 1
+    return "\n".join(lines) + "\n"
+
+
+def _compile(code, size):
+    parser = ScratchLangParser(expression_cache_size=size)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(code)
+    return time.perf_counter() - start, parser
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--lines", type=int, default=20000, help="合成程序行数")
+    arg_parser.add_argument("--sprites", type=int, default=10, help="角色数量")
+    arg_parser.add_argument("--size", type=int, default=DEFAULT_EXPRESSION_CACHE_SIZE, help="缓存容量")
+    args = arg_parser.parse_args()
+
+    code = generate_program(args.lines, args.sprites)
+    before, uncached = _compile(code, 0)
+    after, cached = _compile(code, args.size)
+    assert cached.builder.project == uncached.builder.project, "开启缓存后生成的项目不同"
+
+    stats = cached.expression_cache.stats
+    print(f"源码: {args.lines} 行, {args.sprites} 个角色")
+    print(f"{'关闭缓存':<12}{before * 1000:>10.1f} ms")
+    print(f"{'开启缓存':<12}{after * 1000:>10.1f} ms{before / after:>8.2f}x")
+    print(f"命中 {stats.hits}, 未命中 {stats.misses}, 清空 {stats.invalidations}, 淘汰 {stats.evictions}")
+
+
+if __name__ == "__main__":
+    main()
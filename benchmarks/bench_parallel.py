@@ -0,0 +1,54 @@
+"""
+并行编译扩展性基准测试：1 到 N 个工作进程
+
+用法: python benchmarks/bench_parallel.py [--sprites 40] [--lines 40000] [--max-jobs N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler.parser import ScratchLangParser
+from benchmarks.synthetic import generate_program
+
+
+def _compile(code, output, jobs):
+    parser = ScratchLangParser(jobs=jobs)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(code)
+    elapsed = time.perf_counter() - start
+    parser.compile(output)
+    with open(output, "rb") as f:
+        return elapsed, f.read()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--sprites", type=int, default=40, help="角色数量")
+    arg_parser.add_argument("--lines", type=int, default=40000, help="合成程序行数")
+    arg_parser.add_argument("--max-jobs", type=int, default=os.cpu_count() or 1, help="最大进程数")
+    args = arg_parser.parse_args()
+
+    code = generate_program(args.lines, num_sprites=args.sprites)
+    jobs_list = sorted({1, *(2 ** i for i in range(1, args.max_jobs.bit_length())), args.max_jobs})
+
+    print(f"源码: {args.lines} 行, {args.sprites} 个角色, CPU 核数: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "out.sb3")
+        serial, expected = _compile(code, output, 1)
+        print(f"jobs={1:<3} {serial * 1000:8.1f} ms  1.00x")
+        for jobs in jobs_list[1:]:
+            elapsed, data = _compile(code, output, jobs)
+            assert data == expected, f"jobs={jobs} 的输出与串行编译不同"
+            print(f"jobs={jobs:<3} {elapsed * 1000:8.1f} ms  {serial / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
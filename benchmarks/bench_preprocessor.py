@@ -0,0 +1,46 @@
+"""
+预处理基准测试：原先的四步预处理 vs 单遍 preprocess
+
+用法: python benchmarks/bench_preprocessor.py [--lines 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler.preprocessor import preprocess
+from benchmarks.synthetic import generate_program
+from benchmarks.preprocess_steps import four_pass
+
+
+def _best_time(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--lines", type=int, default=200000, help="合成程序行数")
+    args = arg_parser.parse_args()
+
+    code = generate_program(args.lines, comments=True)
+    result = preprocess(code)
+    assert (result.lines, result.extension_files, result.js_blocks) == four_pass(code)
+
+    before = _best_time(lambda: four_pass(code))
+    after = _best_time(lambda: preprocess(code))
+    size = len(code.encode("utf-8")) / 1e6
+    print(f"源码: {args.lines} 行, {size:.1f} MB")
+    print(f"{'四步预处理':<16}{before * 1000:>10.1f} ms")
+    print(f"{'单遍预处理':<16}{after * 1000:>10.1f} ms{before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+逐步预处理 - parse() 改用 compiler.preprocessor 单遍预处理之前的四个步骤
+
+只作为对照：bench_preprocessor.py 比较两者的速度，tests/test_preprocessor.py 比较两者的结果。
+"""
+import re
+
+
+def remove_block_comments(code):
+    """移除块注释 /* */"""
+    result = []
+    i = 0
+    in_comment = False
+
+    while i < len(code):
+        if not in_comment:
+            if code[i:i+2] == '/*':
+                in_comment = True
+                i += 2
+            else:
+                result.append(code[i])
+                i += 1
+        else:
+            if code[i:i+2] == '*/':
+                in_comment = False
+                i += 2
+            else:
+                # 保留换行符以维持行号
+                if code[i] == '\n':
+                    result.append('\n')
+                i += 1
+
+    return ''.join(result)
+
+
+def process_multiline_strings(code):
+    """处理多行字符串 \"""...\""" 转换为单行"""
+    result = []
+    i = 0
+    while i < len(code):
+        if code[i:i+3] == '"""':
+            # 找到多行字符串开始
+            i += 3
+            string_content = []
+            while i < len(code) and code[i:i+3] != '"""':
+                string_content.append(code[i])
+                i += 1
+            if code[i:i+3] == '"""':
+                i += 3
+            # 将换行转换为 \n
+            content = ''.join(string_content).replace('\n', '\\n')
+            result.append('"' + content + '"')
+        else:
+            result.append(code[i])
+            i += 1
+    return ''.join(result)
+
+
+def extract_js_blocks(code):
+    """提取 #code# ... #end# 块中的 JavaScript 代码
+
+    Args:
+        code: 源代码
+
+    Returns:
+        tuple: (处理后的代码, JS代码块列表)
+    """
+    js_blocks = []
+    result = []
+    in_js_block = False
+    js_content = []
+    block_indent = 0
+
+    lines = code.split('\n')
+    for line in lines:
+        stripped = line.strip()
+        if stripped == '#code#':
+            in_js_block = True
+            js_content = []
+            # 保存缩进级别
+            block_indent = len(line) - len(line.lstrip())
+            # 用占位符替换 #code# 块，保留缩进
+            js_blocks.append(None)  # 占位，稍后填充
+            placeholder = ' ' * block_indent + f'__INLINE_CODE_{len(js_blocks)}__'
+            result.append(placeholder)
+        elif stripped == '#end#' and in_js_block:
+            in_js_block = False
+            js_blocks[-1] = '\n'.join(js_content)
+            result.append('')  # 保留行号
+        elif in_js_block:
+            js_content.append(line)
+            result.append('')  # 保留行号
+        else:
+            result.append(line)
+
+    return '\n'.join(result), js_blocks
+
+
+def extract_extension_imports(code):
+    """提取扩展导入语句
+
+    Args:
+        code: 源代码
+
+    Returns:
+        tuple: (处理后的代码, 扩展文件路径列表)
+    """
+    extension_files = []
+    result = []
+
+    lines = code.split('\n')
+    for line in lines:
+        stripped = line.strip()
+        # 匹配: 导入扩展: "file.js" 或 import extension: "file.js"
+        match = re.match(r'(?:导入扩展|import\s+extension)\s*:\s*["\']([^"\']+)["\']', stripped)
+        if match:
+            extension_files.append(match.group(1))
+            result.append('')  # 保留行号
+        else:
+            result.append(line)
+
+    return '\n'.join(result), extension_files
+
+
+def four_pass(source):
+    """原先 parse() 中依次执行的四个预处理步骤"""
+    code = remove_block_comments(source)
+    code = process_multiline_strings(code)
+    code, extension_files = extract_extension_imports(code)
+    code, js_blocks = extract_js_blocks(code)
+    return code.split('\n'), extension_files, js_blocks
@@ -0,0 +1,70 @@
+"""
+合成 ScratchLang 程序生成器（供基准测试使用）
+"""
+import random
+
+_STATEMENTS = [
+    "移动 {n} 步",
+    "旋转右 {n} 度",
+    "旋转左 {n} 度",
+    "将x坐标增加 {n}",
+    "将y坐标设为 {n}",
+    "面向 {n} 方向",
+    "设置 ~分数 为 ~分数 + {n}",
+    "将 分数 增加 {n}",
+    "等待 0.{n} 秒",
+    "说 \"你好\" 2 秒",
+    "下一个造型",
+    "将大小设为 {n}",
+    "将颜色特效增加 {n}",
+    "广播 消息{n}",
+    "添加 {n} 到 数据",
+    "落笔",
+    "抬笔",
+    "碰到边缘就反弹",
+]
+
+
+def generate_program(num_lines: int, num_sprites: int = 10, seed: int = 0,
+                     comments: bool = False) -> str:
+    """生成约 num_lines 行的合成程序
+
+    Args:
+        num_lines: 目标行数
+        num_sprites: 角色数量
+        seed: 随机种子
+        comments: 是否穿插块注释和多行字符串
+
+    Returns:
+        str: ScratchLang 源代码
+    """
+    rng = random.Random(seed)
+    lines = [": 开始", "@ 舞台", "变量: 分数 = 0", "列表: 数据"]
+    per_sprite = max(1, (num_lines - len(lines)) // num_sprites)
+    # 穿插注释时 [0, 0.05) 留给注释和多行字符串
+    loop_threshold = 0.1 if comments else 0.05
+
+    for sprite in range(num_sprites):
+        lines.append(f"# 角色{sprite}")
+        lines.append("当绿旗被点击")
+        written = 2
+        while written < per_sprite:
+            roll = rng.random()
+            if comments and roll < 0.03:
+                lines.append("  /* 第 {0} 段说明".format(written))
+                lines.append("     跨越两行 */ 移动 {0} 步".format(rng.randint(1, 99)))
+                written += 2
+            elif comments and roll < 0.05:
+                lines.append('  说 """第一行')
+                lines.append('第二行""" 2 秒')
+                written += 2
+            elif roll < loop_threshold:
+                lines.append(f"  重复 {rng.randint(2, 10)} 次")
+                for _ in range(3):
+                    lines.append("    " + rng.choice(_STATEMENTS).format(n=rng.randint(1, 99)))
+                lines.append("  结束")
+                written += 5
+            else:
+                lines.append("  " + rng.choice(_STATEMENTS).format(n=rng.randint(1, 99)))
+                written += 1
+    return "\n".join(lines) + "\n"
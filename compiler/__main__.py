@@ -0,0 +1,8 @@
+"""
+python -m compiler 入口，见 cli.py
+"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+.sb3 压缩包写入 - 按条目选择压缩方式，在线程中并行压缩，再按顺序写入
+
+PNG、JPEG、GIF、MP3 本身已经压缩过，再用 deflate 压缩几乎不会变小，原样存储；project.json、
+SVG、WAV 等用 deflate 按 compress_level 压缩。各条目互不依赖，在线程池中同时压缩（zlib 压缩时
+释放 GIL），压缩结果（原样存储的条目为原始内容）超过 SPOOL_SIZE 时写入临时文件，主线程按条目
+顺序把结果写入压缩包，峰值内存与资源总量无关。
+
+本地文件头、中央目录和结束记录按 zip 格式规范（PKWARE APPNOTE 4.3）用下面的 struct 格式
+自己写入，不依赖 zipfile 的内部实现；写入的字节与 zipfile.ZipFile 逐条目
+writestr(zip_info(...), data, compresslevel=level) 写入时完全相同（见 test_archive.py）。
+条目顺序由调用方决定，时间戳固定，相同输入得到相同的文件。
+不支持 zip64：条目或压缩包超过 zipfile.ZIP64_LIMIT 时抛出 zipfile.LargeZipFile，
+由调用方改用 zipfile 写入（见 SB3Builder.save）。
+"""
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+from .assets import CHUNK_SIZE
+
+# .sb3 中所有条目使用固定的时间戳，保证相同输入得到字节一致的文件
+ZIP_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+
+# 已经压缩过的资源格式，原样存储
+STORED_FORMATS = frozenset({"png", "jpg", "jpeg", "gif", "mp3", "ogg"})
+
+# deflate 压缩级别（与 zlib 默认相同），0 为全部原样存储
+DEFAULT_COMPRESS_LEVEL = 6
+
+# 压缩结果超过这个大小时写入临时文件
+SPOOL_SIZE = 8 * CHUNK_SIZE
+
+# 本地文件头：签名、解压所需版本、主机系统、标志位、压缩方式、修改时间、修改日期、CRC-32、
+# 压缩后大小、原始大小、文件名长度、扩展字段长度
+_LOCAL_HEADER = struct.Struct("<4sBBHHHHLLLHH")
+_LOCAL_SIGNATURE = b"PK\x03\x04"
+# 中央目录记录：签名、创建版本、创建系统、解压所需版本、主机系统、标志位、压缩方式、修改时间、
+# 修改日期、CRC-32、压缩后大小、原始大小、文件名长度、扩展字段长度、注释长度、起始磁盘号、
+# 内部属性、外部属性、本地文件头偏移
+_CENTRAL_HEADER = struct.Struct("<4sBBBBHHHHLLLHHHHHLL")
+_CENTRAL_SIGNATURE = b"PK\x01\x02"
+# 中央目录结束记录：签名、磁盘号、中央目录起始磁盘号、本磁盘条目数、总条目数、中央目录大小、
+# 中央目录偏移、注释长度
+_END_RECORD = struct.Struct("<4sHHHHLLH")
+_END_SIGNATURE = b"PK\x05\x06"
+
+# 格式版本 2.0（支持 deflate），与 zipfile 的默认值相同
+_ZIP_VERSION = 20
+# 创建系统：Unix（external_attr 的高 16 位是 Unix 权限）
+_CREATE_SYSTEM = 3
+# 标志位：条目名使用 UTF-8 编码
+_UTF8_FLAG = 0x800
+# 不使用 zip64 时条目数的上限（与 zipfile.ZIP_FILECOUNT_LIMIT 相同）
+_MAX_ENTRIES = 0xffff
+
+
+@dataclass
+class ArchiveEntry:
+    """压缩包中的一个条目
+
+    Attributes:
+        name: 条目名
+        chunks: 产生条目内容的分块（只调用一次）
+    """
+    name: str
+    chunks: Callable[[], Iterator[bytes]]
+
+
+@dataclass
+class _Prepared:
+    """已计算 CRC 和大小（需要压缩时已压缩）的条目"""
+    info: zipfile.ZipInfo
+    # 要写入压缩包的内容（原样存储时为原始内容），已定位到开头
+    spool: BinaryIO
+
+
+def compress_type(name: str, level: int = DEFAULT_COMPRESS_LEVEL) -> int:
+    """条目的压缩方式：已经压缩过的格式和 level 为 0 时原样存储，其余用 deflate"""
+    if level == 0 or name.rsplit('.', 1)[-1].lower() in STORED_FORMATS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def zip_info(name: str, level: int = DEFAULT_COMPRESS_LEVEL) -> zipfile.ZipInfo:
+    """创建固定时间戳和权限的 zip 条目"""
+    info = zipfile.ZipInfo(name, date_time=ZIP_TIMESTAMP)
+    info.compress_type = compress_type(name, level)
+    info.create_system = _CREATE_SYSTEM
+    info.external_attr = 0o644 << 16
+    if hasattr(info, "compress_level"):
+        # Python 3.13+：zipfile.open(info, 'w') 按条目自身的压缩级别压缩；更早的版本用 zlib 默认级别
+        info.compress_level = level
+    return info
+
+
+def _prepare(entry: ArchiveEntry, level: int) -> _Prepared:
+    """读取条目内容，计算 CRC 和大小，需要压缩时压缩，结果暂存到临时文件（在工作线程中调用）
+
+    原样存储的条目也暂存，内容只读取一次（project.json 的编码是保存时最耗时的一步）。
+    """
+    info = zip_info(entry.name, level)
+    # 与 zipfile 的 deflate 参数相同：raw deflate（无 zlib 头）
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if info.compress_type == zipfile.ZIP_DEFLATED else None
+    crc = 0
+    size = 0
+    spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+    try:
+        for chunk in entry.chunks():
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            spool.write(compressor.flush())
+    except BaseException:
+        spool.close()
+        raise
+    info.CRC, info.file_size, info.compress_size = crc, size, spool.tell()
+    spool.seek(0)
+    return _Prepared(info, spool)
+
+
+def _dos_date_time(info: zipfile.ZipInfo) -> tuple:
+    """条目时间戳的 MS-DOS 格式 (时间, 日期)"""
+    year, month, day, hour, minute, second = info.date_time
+    return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+
+def _filename_flags(info: zipfile.ZipInfo) -> tuple:
+    """条目名的编码和标志位（与 zipfile 相同：非 ASCII 名称用 UTF-8 并设置 0x800）"""
+    try:
+        return info.filename.encode('ascii'), 0
+    except UnicodeEncodeError:
+        return info.filename.encode('utf-8'), _UTF8_FLAG
+
+
+def _local_header(info: zipfile.ZipInfo) -> bytes:
+    """条目的本地文件头"""
+    filename, flag_bits = _filename_flags(info)
+    dostime, dosdate = _dos_date_time(info)
+    return _LOCAL_HEADER.pack(_LOCAL_SIGNATURE, _ZIP_VERSION, 0, flag_bits, info.compress_type, dostime, dosdate,
+                              info.CRC, info.compress_size, info.file_size, len(filename), 0) + filename
+
+
+def _central_directory(info: zipfile.ZipInfo) -> bytes:
+    """条目的中央目录记录"""
+    filename, flag_bits = _filename_flags(info)
+    dostime, dosdate = _dos_date_time(info)
+    return _CENTRAL_HEADER.pack(_CENTRAL_SIGNATURE, _ZIP_VERSION, _CREATE_SYSTEM, _ZIP_VERSION, 0, flag_bits,
+                                info.compress_type, dostime, dosdate, info.CRC, info.compress_size,
+                                info.file_size, len(filename), 0, 0, 0, 0, info.external_attr,
+                                info.header_offset) + filename
+
+
+def _check_size(value: int, what: str) -> None:
+    """超过 zip64 界限时抛出 LargeZipFile（界限与 zipfile 判断是否使用 zip64 的相同）"""
+    if value > zipfile.ZIP64_LIMIT:
+        raise zipfile.LargeZipFile(f"{what} 需要 zip64")
+
+
+def write_archive(stream: BinaryIO, entries: Iterable[ArchiveEntry], level: int = DEFAULT_COMPRESS_LEVEL,
+                  workers: int = 1) -> None:
+    """把条目按顺序写入 zip 压缩包
+
+    Args:
+        stream: 可写的二进制流
+        entries: 条目，按写入顺序
+        level: deflate 压缩级别（0-9），0 为全部原样存储
+        workers: 同时压缩条目的线程数，1 时在当前线程中逐个处理
+
+    Raises:
+        ValueError: 压缩级别无效
+        zipfile.LargeZipFile: 需要 zip64（条目或压缩包过大、条目过多）
+    """
+    if not 0 <= level <= 9:
+        raise ValueError(f"无效的压缩级别: {level}，应为 0-9")
+    infos = []
+    offset = 0
+
+    def write(prepared: _Prepared) -> None:
+        nonlocal offset
+        with prepared.spool:
+            info = prepared.info
+            # zipfile 在 file_size * 1.05 超过界限时就使用 zip64 文件头
+            _check_size(int(info.file_size * 1.05), info.filename)
+            _check_size(info.compress_size, info.filename)
+            _check_size(offset, "压缩包")
+            info.header_offset = offset
+            header = _local_header(info)
+            stream.write(header)
+            shutil.copyfileobj(prepared.spool, stream, CHUNK_SIZE)
+        offset += len(header) + info.compress_size
+        infos.append(info)
+
+    if workers <= 1:
+        for entry in entries:
+            write(_prepare(entry, level))
+    else:
+        # 最多提前准备 2 * workers 个条目，按顺序取结果写入
+        iterator = iter(entries)
+        with ThreadPoolExecutor(workers, thread_name_prefix="scratchlang-zip") as executor:
+            pending = deque(executor.submit(_prepare, entry, level) for entry in islice(iterator, 2 * workers))
+            prepared = None
+            try:
+                while pending:
+                    prepared = pending.popleft().result()
+                    entry = next(iterator, None)
+                    if entry is not None:
+                        pending.append(executor.submit(_prepare, entry, level))
+                    write(prepared)
+            finally:
+                # 出错时取消还没开始的条目，关闭已经准备好的条目的临时文件（关闭已写入的条目没有影响）
+                if prepared is not None:
+                    prepared.spool.close()
+                for future in pending:
+                    future.cancel()
+                for future in pending:
+                    if not future.cancelled() and future.exception() is None:
+                        future.result().spool.close()
+
+    if len(infos) > _MAX_ENTRIES:
+        raise zipfile.LargeZipFile("条目数需要 zip64")
+    directory_offset = offset
+    directory_size = 0
+    for info in infos:
+        record = _central_directory(info)
+        stream.write(record)
+        directory_size += len(record)
+    _check_size(directory_offset, "中央目录")
+    _check_size(directory_size, "中央目录")
+    stream.write(_END_RECORD.pack(_END_SIGNATURE, 0, 0, len(infos), len(infos), directory_size, directory_offset, 0))
@@ -1,16 +1,54 @@
 """
 资源文件管理
+
+资源不在内存中保存内容，而是记录为 AssetSource 引用（内容所在的文件、MD5 和转换方式），
+保存 .sb3 时再从磁盘分块复制到 zip 条目中（见 SB3Builder.save），峰值内存与资源总量无关。
+原样使用的文件（音效、SVG）直接引用源文件；经 PIL 转换的图片（或从造型图片缓存读取的转换结果，
+见 imagecache.py）写入暂存目录，随 AssetManager 删除。
+
+解析器通过 submit 登记资源，由线程池并发处理（PIL 编解码和缩放时释放 GIL），
+SB3Builder.resolve_assets 再按登记顺序把结果填入造型和音效列表。
 """
 import hashlib
 import os
-from typing import Dict, Any, Optional
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, BinaryIO, Callable, Iterator, List, Optional, Tuple
+import PIL
 from PIL import Image
 import io
 import struct
+import zlib
 from .constants import (
     MAX_IMAGE_SIZE, MAX_SOUND_SIZE,
     SUPPORTED_IMAGE_FORMATS, SUPPORTED_SOUND_FORMATS
 )
+from .exceptions import AssetError
+from .imagecache import ImageCache
+
+# 流式读取和复制资源时每块的大小
+CHUNK_SIZE = 1024 * 1024
+
+# 位图造型重新编码为 PNG 的力度：fast 压缩最快，default 为 PIL 默认设置，max 最小（更慢）
+PNG_EFFORTS = ("fast", "default", "max")
+DEFAULT_PNG_EFFORT = "default"
+
+# 各力度重新编码为 PNG 时传给 Image.save 的参数（是造型图片缓存键的一部分）；
+# max 还会在颜色不超过 256 种时尝试无损转换为调色板图片，取较小的结果
+PNG_SAVE_OPTIONS = {
+    "fast": {"format": "PNG", "compress_level": 1},
+    "default": {"format": "PNG"},
+    "max": {"format": "PNG", "optimize": True},
+}
+
+# 资源种类（AssetManager.submit）
+IMAGE = "image"
+SOUND = "sound"
 
 
 def validate_image_format(filepath: str, data: bytes) -> bool:
@@ -58,6 +96,19 @@ def _get_wav_audio_info(data: bytes) -> tuple:
     Args:
         data: WAV 文件数据
 
+    Returns:
+        tuple: (sample_rate, sample_count) 或 (None, None) 如果解析失败
+    """
+    return _read_wav_audio_info(io.BytesIO(data), len(data))
+
+
+def _read_wav_audio_info(f: BinaryIO, size: int) -> tuple:
+    """从文件中解析 WAV 文件头（只读取文件头和各 chunk 的头部，不读入音频数据）
+
+    Args:
+        f: 可定位的二进制文件
+        size: 文件字节数
+
     Returns:
         tuple: (sample_rate, sample_count) 或 (None, None) 如果解析失败
     """
@@ -75,27 +126,32 @@ def _get_wav_audio_info(data: bytes) -> tuple:
         # 32-33: Block align
         # 34-35: Bits per sample
 
-        if len(data) < 44:
+        if size < 44:
             return None, None
 
+        f.seek(0)
+        header = f.read(36)
+
         # 验证是 WAV 文件
-        if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
             return None, None
 
         # 读取 fmt chunk
-        fmt_chunk_size = struct.unpack('<I', data[16:20])[0]
-        num_channels = struct.unpack('<H', data[22:24])[0]
-        sample_rate = struct.unpack('<I', data[24:28])[0]
-        bits_per_sample = struct.unpack('<H', data[34:36])[0]
+        fmt_chunk_size = struct.unpack('<I', header[16:20])[0]
+        num_channels = struct.unpack('<H', header[22:24])[0]
+        sample_rate = struct.unpack('<I', header[24:28])[0]
+        bits_per_sample = struct.unpack('<H', header[34:36])[0]
 
         # 查找 data chunk
         pos = 12 + 8 + fmt_chunk_size  # 跳过 RIFF header 和 fmt chunk
-        while pos < len(data) - 8:
-            chunk_id = data[pos:pos+4]
-            chunk_size = struct.unpack('<I', data[pos+4:pos+8])[0]
+        while pos < size - 8:
+            f.seek(pos)
+            chunk = f.read(8)
+            chunk_id = chunk[:4]
+            chunk_size = struct.unpack('<I', chunk[4:8])[0]
             if chunk_id == b'data':
                 # data chunk 找到，计算采样数
-                data_size = min(chunk_size, len(data) - pos - 8)
+                data_size = min(chunk_size, size - pos - 8)
                 bytes_per_sample = (bits_per_sample // 8) * num_channels
                 if bytes_per_sample > 0:
                     sample_count = data_size // bytes_per_sample
@@ -107,6 +163,240 @@ def _get_wav_audio_info(data: bytes) -> tuple:
         return None, None
 
 
+# PNG 各颜色类型每个像素的通道数
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Adam7 隔行扫描七遍的 (起始列, 起始行, 列间隔, 行间隔)
+ADAM7_PASSES = ((0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2))
+
+
+def _png_rows(header: bytes) -> Optional[List[Tuple[int, int]]]:
+    """由 IHDR 数据计算解压后各遍扫描的 (行数, 每行字节数)，每行另有一个过滤类型字节
+
+    Returns:
+        位深度、颜色类型或压缩/过滤/隔行方式无效时为 None
+    """
+    width, height, depth, color_type, compression, filter_method, interlace = struct.unpack('>IIBBBBB', header)
+    channels = PNG_CHANNELS.get(color_type)
+    if (not width or not height or channels is None or depth not in (1, 2, 4, 8, 16)
+            or (depth < 8 and color_type not in (0, 3)) or (depth == 16 and color_type == 3)
+            or compression or filter_method or interlace > 1):
+        return None
+    passes = ADAM7_PASSES if interlace else ((0, 0, 1, 1),)
+    rows = []
+    for x0, y0, dx, dy in passes:
+        columns = (width - x0 + dx - 1) // dx
+        count = (height - y0 + dy - 1) // dy
+        if columns > 0 and count > 0:
+            rows.append((count, (columns * depth * channels + 7) // 8))
+    return rows
+
+
+def _png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """检查 PNG 文件的结构并解压像素数据（不还原像素），返回 (宽, 高)
+
+    Returns:
+        各数据块的 CRC 都正确、IDAT 数据能完整解压且长度和每行的过滤类型正确、
+        以 IEND 结束且不是动画 PNG 时返回尺寸，否则为 None
+    """
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    size = None
+    rows = None
+    decompressor = zlib.decompressobj()
+    pixels = []
+    pos = 8
+    while pos + 12 <= len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        end = pos + 12 + length
+        if end > len(data):
+            return None
+        if zlib.crc32(data[pos + 4:end - 4]) != struct.unpack('>I', data[end - 4:end])[0]:
+            return None
+        if size is None:
+            if chunk_type != b'IHDR' or length != 13:
+                return None
+            size = struct.unpack('>II', data[pos + 8:pos + 16])
+            rows = _png_rows(data[pos + 8:pos + 21])
+            if rows is None:
+                return None
+            expected = sum(count * (row_bytes + 1) for count, row_bytes in rows)
+        elif chunk_type == b'acTL':
+            return None
+        elif chunk_type == b'IDAT':
+            # 限制解压长度，数据多于图片尺寸时不会解压出大量内容
+            try:
+                pixels.append(decompressor.decompress(data[pos + 8:end - 4], expected + 1))
+            except zlib.error:
+                return None
+            expected -= len(pixels[-1])
+            if expected < 0 or decompressor.unconsumed_tail:
+                return None
+        elif chunk_type == b'IEND':
+            if expected or not decompressor.eof or decompressor.unused_data:
+                return None
+            pixels = b''.join(pixels)
+            pos = 0
+            for count, row_bytes in rows:
+                if max(pixels[pos:pos + count * (row_bytes + 1):row_bytes + 1]) > 4:
+                    return None
+                pos += count * (row_bytes + 1)
+            return size
+        pos = end
+    return None
+
+
+def _file_md5(f: BinaryIO) -> str:
+    """分块计算文件内容的 MD5"""
+    f.seek(0)
+    digest = hashlib.md5()
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class AssetSource:
+    """资源内容的引用
+
+    Attributes:
+        md5ext: 资源文件名（内容的 MD5 + 扩展名）
+        size: 内容字节数
+        path: 内容所在的文件（源文件或暂存文件）；内容在内存中时为 None
+        data: 保存在内存中的内容（生成的默认造型等小资源）
+        source: 原始文件路径，生成的资源为 None
+        recipe: 由 source 得到内容的转换，如 ("png", 480) 表示缩放到 480 以内并编码为 PNG；原样使用时为 None
+        mtime_ns: path 的修改时间，读取时校验文件在编译期间没有被修改
+        spooled: path 是否为 AssetManager 的暂存文件（随 AssetManager 删除）
+    """
+    md5ext: str
+    size: int
+    path: Optional[str] = None
+    data: Optional[bytes] = None
+    source: Optional[str] = None
+    recipe: Optional[Tuple[Any, ...]] = None
+    mtime_ns: Optional[int] = None
+    spooled: bool = False
+
+    @classmethod
+    def from_file(cls, md5ext: str, path: str, **kwargs: Any) -> "AssetSource":
+        """引用磁盘上的文件（记录当前的大小和修改时间）"""
+        stat = os.stat(path)
+        return cls(md5ext, stat.st_size, path=path, mtime_ns=stat.st_mtime_ns, **kwargs)
+
+    @classmethod
+    def from_bytes(cls, md5ext: str, data: bytes, **kwargs: Any) -> "AssetSource":
+        """内容保存在内存中"""
+        return cls(md5ext, len(data), data=data, **kwargs)
+
+    def open(self) -> BinaryIO:
+        """打开内容，返回二进制文件对象
+
+        Raises:
+            AssetError: 引用的文件不存在或在编译期间被修改
+        """
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        try:
+            f = open(self.path, 'rb')
+        except OSError as e:
+            raise AssetError(f"无法读取资源文件: {self.path}，错误: {e}")
+        stat = os.fstat(f.fileno())
+        if stat.st_size != self.size or (self.mtime_ns is not None and stat.st_mtime_ns != self.mtime_ns):
+            f.close()
+            raise AssetError(f"资源文件在编译期间被修改: {self.path}")
+        return f
+
+    def read(self) -> bytes:
+        """读取全部内容"""
+        if self.data is not None:
+            return self.data
+        with self.open() as f:
+            return f.read()
+
+    def chunks(self) -> Iterator[bytes]:
+        """分块读取内容"""
+        with self.open() as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+
+    def portable(self) -> "AssetSource":
+        """可以交给其他进程的引用：暂存文件随创建它的 AssetManager 删除，改为把内容读入内存"""
+        if not self.spooled:
+            return self
+        return replace(self, path=None, data=self.read(), mtime_ns=None, spooled=False)
+
+
+@dataclass
+class AssetTiming:
+    """一个资源的处理耗时和大小
+
+    Attributes:
+        path: 资源文件路径
+        kind: IMAGE 或 SOUND
+        seconds: 在工作线程中处理（读取、校验、转换）的耗时
+        ok: 是否处理成功
+        source_bytes: 源文件的字节数
+        output_bytes: 写入 .sb3 的资源字节数（失败时为 0）
+    """
+    path: str
+    kind: str
+    seconds: float
+    ok: bool
+    source_bytes: int = 0
+    output_bytes: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        """重新编码比源文件减少的字节数（变大时为负数）"""
+        return self.source_bytes - self.output_bytes if self.ok else 0
+
+
+@dataclass
+class AssetLoadStats:
+    """资源处理统计
+
+    Attributes:
+        workers: 处理资源的线程数
+        wait_seconds: 解析结束后等待资源处理完成的时间
+        assets: 按登记顺序的每个资源的耗时
+    """
+    workers: int = 1
+    wait_seconds: float = 0.0
+    assets: List[AssetTiming] = field(default_factory=list)
+
+    @property
+    def total_seconds(self) -> float:
+        """各资源处理耗时之和（并发处理时大于实际经过的时间）"""
+        return sum(timing.seconds for timing in self.assets)
+
+    @property
+    def bytes_saved(self) -> int:
+        """全部资源重新编码比源文件减少的字节数"""
+        return sum(timing.bytes_saved for timing in self.assets)
+
+    def merge(self, other: 'AssetLoadStats') -> None:
+        """累加另一份统计（如并行编译工作进程的统计）"""
+        self.wait_seconds += other.wait_seconds
+        self.assets.extend(other.assets)
+
+
+@dataclass
+class AssetLoad:
+    """AssetManager.submit 的处理结果
+
+    Attributes:
+        info: 造型或音效的资源信息（同 add_image/add_sound 的返回值），失败时为 None
+        asset: 资源内容的引用，失败时为 None
+        error: 处理失败时的异常
+        seconds: 处理耗时
+        source_bytes: 源文件的字节数
+    """
+    info: Optional[Dict[str, Any]]
+    asset: Optional[AssetSource]
+    error: Optional[Exception]
+    seconds: float
+    source_bytes: int = 0
+
+
 def validate_sound_format(filepath: str, data: bytes) -> bool:
     """验证音频文件格式是否有效
 
@@ -143,14 +433,134 @@ def validate_sound_format(filepath: str, data: bytes) -> bool:
 class AssetManager:
     """资源文件管理器
 
-    管理 Scratch 项目中的图片和音效资源。
+    管理 Scratch 项目中的图片和音效资源。assets 按 md5ext 记录每个资源的 AssetSource，
+    内容留在磁盘上，保存时再流式写入 .sb3。
+
+    Args:
+        auto_scale_costumes: 是否自动缩放位图造型
+        max_costume_size: 自动缩放时造型的最大边长
+        image_cache: 位图造型处理结果的磁盘缓存，为 None 时每次都用 PIL 处理
+        workers: submit 使用的线程数，1 时在调用线程中立即处理
+        png_effort: 位图造型重新编码为 PNG 的力度（PNG_EFFORTS）。fast 和 default 时不需要缩放的 PNG
+            原样使用、不解码；max 时也重新编码，与源文件比较后取较小的一个
+
+    Raises:
+        ValueError: png_effort 无效
     """
 
-    def __init__(self, auto_scale_costumes: bool = False, max_costume_size: int = 480) -> None:
-        self.assets: Dict[str, bytes] = {}
+    def __init__(self, auto_scale_costumes: bool = False, max_costume_size: int = 480,
+                 image_cache: Optional[ImageCache] = None, workers: int = 1,
+                 png_effort: str = DEFAULT_PNG_EFFORT) -> None:
+        if png_effort not in PNG_EFFORTS:
+            raise ValueError(f"无效的 PNG 压缩力度: {png_effort}，可选: {', '.join(PNG_EFFORTS)}")
+        self.assets: Dict[str, AssetSource] = {}
         self.auto_scale_costumes = auto_scale_costumes
         self.max_costume_size = max_costume_size
-        
+        self.png_effort = png_effort
+        self.image_cache = image_cache
+        self.workers = max(1, workers)
+        # 转换后图片的暂存目录，第一次使用时创建，AssetManager 被回收时删除
+        self._spool_dir: Optional[str] = None
+        self._spool_lock = threading.Lock()
+        # 处理资源的线程池，第一次 submit 时创建，shutdown 时关闭
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 已提交的资源 {(种类, 路径): Future}，同一文件只处理一次
+        self._submitted: Dict[Tuple[str, str], Future] = {}
+
+    def read(self, name: str) -> bytes:
+        """读取资源内容
+
+        Args:
+            name: 资源文件名（md5ext）
+
+        Returns:
+            bytes: 资源内容
+        """
+        return self.assets[name].read()
+
+    @property
+    def total_size(self) -> int:
+        """全部资源的字节数"""
+        return sum(asset.size for asset in self.assets.values())
+
+    @property
+    def image_settings(self) -> Dict[str, Any]:
+        """影响位图造型处理结果的设置（造型图片缓存键的一部分）"""
+        return {
+            "auto_scale_costumes": self.auto_scale_costumes,
+            "max_costume_size": self.max_costume_size if self.auto_scale_costumes else None,
+            "png_effort": self.png_effort,
+            "encoder": PNG_SAVE_OPTIONS[self.png_effort],
+            "pillow": PIL.__version__,
+        }
+
+    def _needs_scaling(self, width: int, height: int) -> bool:
+        """自动缩放时尺寸是否超出上限"""
+        return self.auto_scale_costumes and max(width, height) > self.max_costume_size
+
+    def _encode_png(self, img: Image.Image) -> bytes:
+        """按 png_effort 把图片编码为 PNG"""
+        options = PNG_SAVE_OPTIONS[self.png_effort]
+        output = io.BytesIO()
+        img.save(output, **options)
+        best = output.getvalue()
+        if self.png_effort == "max" and img.mode in ("RGB", "RGBA"):
+            colors = img.getcolors(256)
+            if colors is not None:
+                # 颜色不超过 256 种：转换为调色板图片，解码后与原图逐像素相同时才采用
+                palette = img.quantize(len(colors), method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+                output = io.BytesIO()
+                palette.save(output, **options)
+                candidate = output.getvalue()
+                if (len(candidate) < len(best)
+                        and Image.open(io.BytesIO(candidate)).convert(img.mode).tobytes() == img.tobytes()):
+                    best = candidate
+        return best
+
+    def _spool(self, filename: str, data: bytes) -> str:
+        """把转换结果写入暂存目录，返回文件路径"""
+        with self._spool_lock:
+            if self._spool_dir is None:
+                self._spool_dir = tempfile.mkdtemp(prefix="scratchlang-assets-")
+                weakref.finalize(self, shutil.rmtree, self._spool_dir, ignore_errors=True)
+            path = os.path.join(self._spool_dir, filename)
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+        return path
+
+    def submit(self, kind: str, filepath: str) -> Future:
+        """提交资源到线程池处理，不登记到 assets（由调用方按顺序登记）
+
+        Args:
+            kind: IMAGE 或 SOUND
+            filepath: 资源文件路径
+
+        Returns:
+            Future: 结果为 AssetLoad，处理失败时异常记录在 AssetLoad.error 中
+        """
+        key = (kind, filepath)
+        future = self._submitted.get(key)
+        if future is not None:
+            return future
+        load = self._load_image if kind == IMAGE else self._load_sound
+        if self.workers <= 1:
+            future = Future()
+            future.set_result(_timed(load, filepath))
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="scratchlang-assets")
+            future = self._executor.submit(_timed, load, filepath)
+        self._submitted[key] = future
+        return future
+
+    def shutdown(self) -> None:
+        """关闭线程池（之后再 submit 时重新创建）"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._submitted.clear()
+
     def add_image(self, filepath: str) -> Dict[str, Any]:
         """添加图片资源
 
@@ -160,6 +570,23 @@ class AssetManager:
         Returns:
             Dict: 包含资源信息的字典
 
+        Raises:
+            FileNotFoundError: 文件不存在
+            ValueError: 文件过大或格式无效
+        """
+        result, asset = self._load_image(filepath)
+        self.assets[asset.md5ext] = asset
+        return result
+
+    def _load_image(self, filepath: str) -> Tuple[Dict[str, Any], AssetSource]:
+        """读取、校验并转换图片（可以在工作线程中调用）
+
+        Args:
+            filepath: 图片文件路径
+
+        Returns:
+            Tuple: (资源信息, 资源内容的引用)
+
         Raises:
             FileNotFoundError: 文件不存在
             ValueError: 文件过大或格式无效
@@ -186,37 +613,70 @@ class AssetManager:
 
         rotation_center = None
         if ext == '.svg':
-            final_data = data
             format_ext = 'svg'
             # 解析 SVG 尺寸计算 rotationCenter
             rotation_center = self._get_svg_rotation_center(data)
+            md5 = hashlib.md5(data).hexdigest()
+            filename = f"{md5}.{format_ext}"
+            # SVG 原样使用，直接引用源文件
+            asset = AssetSource.from_file(filename, filepath, source=filepath)
         else:
-            # 使用PIL转换
-            try:
-                img = Image.open(io.BytesIO(data))
-
-                # 自动缩放
-                if self.auto_scale_costumes:
-                    max_dim = max(img.width, img.height)
-                    if max_dim > self.max_costume_size:
-                        scale = self.max_costume_size / max_dim
+            format_ext = 'png'
+            png_size = _png_size(data) if ext == '.png' else None
+            # 不需要缩放且像素数据完整的 PNG（max 力度除外）原样使用，不调用 PIL 也不查缓存
+            passthrough = png_size is not None and self.png_effort != "max" and not self._needs_scaling(*png_size)
+            cache = self.image_cache if self.image_cache is not None and self.image_cache.enabled else None
+            if passthrough:
+                cache = None
+            cache_key = cache.key(hashlib.sha256(data).hexdigest(), self.image_settings) if cache else None
+            cached = cache.load(cache_key) if cache else None
+            if passthrough:
+                rotation_center = (png_size[0] // 2, png_size[1] // 2)
+                md5 = hashlib.md5(data).hexdigest()
+                filename = f"{md5}.{format_ext}"
+                asset = AssetSource.from_file(filename, filepath, source=filepath)
+            elif cached is not None:
+                # 缓存命中：不调用 PIL。缓存的 PNG 写入暂存目录（源文件更小时引用源文件），
+                # 同时编译的其他进程可能在保存前淘汰缓存中的文件
+                rotation_center = cached.rotation_center
+                filename = cached.md5ext
+                md5 = os.path.splitext(filename)[0]
+                if cached.recipe is None:
+                    asset = AssetSource.from_file(filename, filepath, source=filepath)
+                else:
+                    asset = AssetSource.from_file(filename, self._spool(filename, cached.data),
+                                                  source=filepath, recipe=cached.recipe, spooled=True)
+            else:
+                # 使用PIL转换
+                try:
+                    img = Image.open(io.BytesIO(data))
+                    recipe = ("png", None)
+
+                    # 自动缩放
+                    if self._needs_scaling(img.width, img.height):
+                        scale = self.max_costume_size / max(img.width, img.height)
                         new_width = int(img.width * scale)
                         new_height = int(img.height * scale)
                         img = img.resize((new_width, new_height), Image.LANCZOS)
-
-                # 计算 rotationCenter（图片中心）
-                rotation_center = (img.width // 2, img.height // 2)
-                output = io.BytesIO()
-                img.save(output, format='PNG')
-                final_data = output.getvalue()
-                format_ext = 'png'
-            except Exception as e:
-                raise ValueError(f"无法处理图片文件: {filepath}，错误: {e}")
-
-        md5 = hashlib.md5(final_data).hexdigest()
-        filename = f"{md5}.{format_ext}"
-
-        self.assets[filename] = final_data
+                        recipe = ("png", self.max_costume_size)
+
+                    # 计算 rotationCenter（图片中心）
+                    rotation_center = (img.width // 2, img.height // 2)
+                    final_data = self._encode_png(img)
+                except Exception as e:
+                    raise ValueError(f"无法处理图片文件: {filepath}，错误: {e}")
+                if png_size is not None and recipe[1] is None and len(data) <= len(final_data):
+                    # 不需要缩放的 PNG 重新编码后没有变小：保留源文件
+                    final_data, recipe = data, None
+                md5 = hashlib.md5(final_data).hexdigest()
+                filename = f"{md5}.{format_ext}"
+                if cache:
+                    cache.store(cache_key, final_data, filename, rotation_center, recipe)
+                if recipe is None:
+                    asset = AssetSource.from_file(filename, filepath, source=filepath)
+                else:
+                    asset = AssetSource.from_file(filename, self._spool(filename, final_data),
+                                                  source=filepath, recipe=recipe, spooled=True)
 
         result = {
             "assetId": md5,
@@ -229,7 +689,7 @@ class AssetManager:
             result["rotationCenterX"] = rotation_center[0]
             result["rotationCenterY"] = rotation_center[1]
 
-        return result
+        return result, asset
 
     def _get_svg_rotation_center(self, data: bytes) -> tuple:
         """从 SVG 数据中解析尺寸并计算 rotationCenter
@@ -274,6 +734,23 @@ class AssetManager:
         Returns:
             Dict: 包含资源信息的字典
 
+        Raises:
+            FileNotFoundError: 文件不存在
+            ValueError: 文件过大或格式无效
+        """
+        result, asset = self._load_sound(filepath)
+        self.assets[asset.md5ext] = asset
+        return result
+
+    def _load_sound(self, filepath: str) -> Tuple[Dict[str, Any], AssetSource]:
+        """读取并校验音效（可以在工作线程中调用）
+
+        Args:
+            filepath: 音效文件路径
+
+        Returns:
+            Tuple: (资源信息, 资源内容的引用)
+
         Raises:
             FileNotFoundError: 文件不存在
             ValueError: 文件过大或格式无效
@@ -291,29 +768,25 @@ class AssetManager:
         if file_size > MAX_SOUND_SIZE:
             raise ValueError(f"音效文件过大: {file_size / 1024 / 1024:.1f}MB，最大允许 {MAX_SOUND_SIZE / 1024 / 1024:.0f}MB")
 
-        with open(filepath, 'rb') as f:
-            data = f.read()
-
-        # 验证文件内容格式
-        if not validate_sound_format(filepath, data):
-            raise ValueError(f"音频文件格式无效或已损坏: {filepath}")
-
+        # 音效原样使用：只读取文件头，分块计算 MD5，不把音频读入内存
         ext = ext_with_dot.replace('.', '')
-        md5 = hashlib.md5(data).hexdigest()
-        filename = f"{md5}.{ext}"
-
-        self.assets[filename] = data
-
-        # 尝试获取音频文件的采样信息
         sample_rate = 48000
         sample_count = 0
+        with open(filepath, 'rb') as f:
+            # 验证文件内容格式
+            if not validate_sound_format(filepath, f.read(12)):
+                raise ValueError(f"音频文件格式无效或已损坏: {filepath}")
+
+            md5 = _file_md5(f)
 
-        if ext == 'wav':
-            wav_rate, wav_count = _get_wav_audio_info(data)
-            if wav_rate is not None:
-                sample_rate = wav_rate
-                sample_count = wav_count
+            # 尝试获取音频文件的采样信息
+            if ext == 'wav':
+                wav_rate, wav_count = _read_wav_audio_info(f, file_size)
+                if wav_rate is not None:
+                    sample_rate = wav_rate
+                    sample_count = wav_count
 
+        filename = f"{md5}.{ext}"
         return {
             "assetId": md5,
             "name": os.path.basename(filepath),
@@ -321,7 +794,7 @@ class AssetManager:
             "dataFormat": ext,
             "rate": sample_rate,
             "sampleCount": sample_count
-        }
+        }, AssetSource.from_file(filename, filepath, source=filepath)
     
     def create_default_svg(self, name, color="#FF6680"):
         """创建默认SVG造型"""
@@ -332,7 +805,7 @@ class AssetManager:
         data = svg.encode('utf-8')
         md5 = hashlib.md5(data).hexdigest()
         filename = f"{md5}.svg"
-        self.assets[filename] = data
+        self.assets[filename] = AssetSource.from_bytes(filename, data)
         
         return {
             "assetId": md5,
@@ -351,7 +824,7 @@ class AssetManager:
         data = svg.encode('utf-8')
         md5 = hashlib.md5(data).hexdigest()
         filename = f"{md5}.svg"
-        self.assets[filename] = data
+        self.assets[filename] = AssetSource.from_bytes(filename, data)
         
         return {
             "assetId": md5,
@@ -360,4 +833,15 @@ class AssetManager:
             "dataFormat": "svg",
             "rotationCenterX": 240,
             "rotationCenterY": 180
-        }
\ No newline at end of file
+        }
+
+
+def _timed(load: Callable[[str], Tuple[Dict[str, Any], AssetSource]], filepath: str) -> AssetLoad:
+    """调用 load(filepath) 并计时，异常记录在结果中"""
+    start = time.perf_counter()
+    try:
+        info, asset = load(filepath)
+        source_bytes = os.path.getsize(filepath)
+    except Exception as e:
+        return AssetLoad(None, None, e, time.perf_counter() - start)
+    return AssetLoad(info, asset, None, time.perf_counter() - start, source_bytes)
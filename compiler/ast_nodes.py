@@ -42,3 +42,9 @@ class FunctionNode(ASTNode):
     """函数调用节点"""
     name: str
     args: List[ASTNode]
+
+@dataclass
+class ConstantNode(ASTNode):
+    """常量折叠得到的字面量节点（见 folding.py）"""
+    text: str
+    primitive: int
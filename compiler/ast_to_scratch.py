@@ -2,12 +2,20 @@
 AST转Scratch JSON转换器
 """
 from .ast_nodes import *
+from .blockrecord import new_block
+from .folding import ConstantFolder, number_to_string
 
 class ASTToScratch:
-    """将AST转换为Scratch积木JSON"""
+    """将AST转换为Scratch积木JSON
 
-    def __init__(self, builder):
+    Args:
+        builder: SB3 构建器
+        fold_constants: 是否在生成积木前做常量折叠（见 folding.py）
+    """
+
+    def __init__(self, builder, fold_constants=True):
         self.builder = builder
+        self.fold_constants = fold_constants
         # 内置reporter块映射
         self.builtin_reporters = {
             "回答": "sensing_answer",
@@ -23,30 +31,41 @@ class ASTToScratch:
             "大小": "looks_size",
             "音量": "sound_volume",
         }
+        self.folder = ConstantFolder(self.builtin_reporters)
+
+    @property
+    def folding_stats(self):
+        """常量折叠统计"""
+        return self.folder.stats
+
+    def convert(self, node, boolean=False):
+        """
+        转换表达式的AST为Scratch积木（启用时先做常量折叠）
+        boolean: 表达式是否放在布尔输入中（此时不整体折叠成字面量）
+        返回: (block_type, block_id或value)
+        """
+        if self.fold_constants:
+            node = self.folder.fold(node, boolean)
+        return self._convert(node)
 
-    def convert(self, node):
+    def _convert(self, node):
         """
         转换AST节点为Scratch积木
         返回: (block_type, block_id或value)
         - block_type: 1=直接值, 2=shadow block, 3=block
         """
         if isinstance(node, NumberNode):
-            # Scratch格式: [1, [4, "数字"]]
-            return (1, [4, str(node.value)])
+            # Scratch格式: [1, [4, "数字"]]（按 JavaScript 的写法，2.0 写成 "2"）
+            return (1, [4, number_to_string(float(node.value))])
+
+        elif isinstance(node, ConstantNode):
+            return (1, [node.primitive, node.text])
 
         elif isinstance(node, StringNode):
             # 检查是否是内置reporter块
             if node.value in self.builtin_reporters:
                 block_id = self.builder.generate_id()
-                self.builder.current_sprite["blocks"][block_id] = {
-                    "opcode": self.builtin_reporters[node.value],
-                    "next": None,
-                    "parent": None,
-                    "inputs": {},
-                    "fields": {},
-                    "shadow": False,
-                    "topLevel": False
-                }
+                self.builder.current_sprite["blocks"][block_id] = new_block(self.builtin_reporters[node.value])
                 return (2, block_id)
             # Scratch格式: [1, [10, "字符串"]]
             return (1, [10, node.value])
@@ -69,27 +88,11 @@ class ASTToScratch:
     def _convert_variable(self, node):
         """转换变量节点"""
         # 查找变量ID
-        var_id = None
-        for vid, vdata in self.builder.current_sprite.get("variables", {}).items():
-            if vdata[0] == node.name:
-                var_id = vid
-                break
-        if var_id is None and self.builder.stage:
-            for vid, vdata in self.builder.stage.get("variables", {}).items():
-                if vdata[0] == node.name:
-                    var_id = vid
-                    break
+        var_id = self.builder.resolve_variable(node.name)
 
         block_id = self.builder.generate_id()
-        self.builder.current_sprite["blocks"][block_id] = {
-            "opcode": "data_variable",
-            "next": None,
-            "parent": None,
-            "inputs": {},
-            "fields": {"VARIABLE": [node.name, var_id]},
-            "shadow": False,
-            "topLevel": False
-        }
+        self.builder.current_sprite["blocks"][block_id] = new_block(
+            "data_variable", fields={"VARIABLE": [node.name, var_id]})
         return (2, block_id)
 
     def _convert_binop(self, node):
@@ -115,19 +118,19 @@ class ASTToScratch:
             # a >= b  =>  not (a < b)
             lt_node = BinOpNode(node.left, '<', node.right)
             not_node = UnaryOpNode('非', lt_node)
-            return self.convert(not_node)
+            return self._convert(not_node)
 
         if node.op == '<=':
             # a <= b  =>  not (a > b)
             gt_node = BinOpNode(node.left, '>', node.right)
             not_node = UnaryOpNode('非', gt_node)
-            return self.convert(not_node)
+            return self._convert(not_node)
 
         if node.op == '≠':
             # a ≠ b  =>  not (a = b)
             eq_node = BinOpNode(node.left, '=', node.right)
             not_node = UnaryOpNode('非', eq_node)
-            return self.convert(not_node)
+            return self._convert(not_node)
 
         if node.op not in op_map:
             raise ValueError(f"不支持的运算符: {node.op}")
@@ -135,23 +138,15 @@ class ASTToScratch:
         opcode, input1, input2 = op_map[node.op]
 
         # 递归转换左右子树
-        left_type, left_value = self.convert(node.left)
-        right_type, right_value = self.convert(node.right)
+        left_type, left_value = self._convert(node.left)
+        right_type, right_value = self._convert(node.right)
 
         # 创建运算符积木
         block_id = self.builder.generate_id()
-        self.builder.current_sprite["blocks"][block_id] = {
-            "opcode": opcode,
-            "next": None,
-            "parent": None,
-            "inputs": {
-                input1: [left_type, left_value],
-                input2: [right_type, right_value]
-            },
-            "fields": {},
-            "shadow": False,
-            "topLevel": False
-        }
+        self.builder.current_sprite["blocks"][block_id] = new_block(opcode, {
+            input1: [left_type, left_value],
+            input2: [right_type, right_value]
+        })
 
         # 设置子块的parent指向当前块
         if left_type == 2 and isinstance(left_value, str):
@@ -167,24 +162,16 @@ class ASTToScratch:
             # 负号: 0 - operand
             zero_node = NumberNode(0)
             sub_node = BinOpNode(zero_node, '-', node.operand)
-            return self.convert(sub_node)
+            return self._convert(sub_node)
 
         elif node.op in ['非', 'not']:
             # 非运算
-            operand_type, operand_value = self.convert(node.operand)
+            operand_type, operand_value = self._convert(node.operand)
 
             block_id = self.builder.generate_id()
-            self.builder.current_sprite["blocks"][block_id] = {
-                "opcode": "operator_not",
-                "next": None,
-                "parent": None,
-                "inputs": {
-                    "OPERAND": [operand_type, operand_value]
-                },
-                "fields": {},
-                "shadow": False,
-                "topLevel": False
-            }
+            self.builder.current_sprite["blocks"][block_id] = new_block("operator_not", {
+                "OPERAND": [operand_type, operand_value]
+            })
 
             # 设置子块的parent指向当前块
             if operand_type == 2 and isinstance(operand_value, str):
@@ -224,23 +211,15 @@ class ASTToScratch:
             raise ValueError(f"函数 {node.name} 需要参数")
 
         # 转换参数
-        arg_type, arg_value = self.convert(node.args[0])
+        arg_type, arg_value = self._convert(node.args[0])
 
         block_id = self.builder.generate_id()
 
         if node.name in ['四舍五入', 'round']:
             # 四舍五入
-            self.builder.current_sprite["blocks"][block_id] = {
-                "opcode": opcode,
-                "next": None,
-                "parent": None,
-                "inputs": {
-                    "NUM": [arg_type, arg_value]
-                },
-                "fields": {},
-                "shadow": False,
-                "topLevel": False
-            }
+            self.builder.current_sprite["blocks"][block_id] = new_block(opcode, {
+                "NUM": [arg_type, arg_value]
+            })
         else:
             # 数学运算
             # 映射函数名到Scratch的OPERATOR字段
@@ -260,19 +239,11 @@ class ASTToScratch:
             }
             operator = operator_map.get(node.name, node.name)
 
-            self.builder.current_sprite["blocks"][block_id] = {
-                "opcode": opcode,
-                "next": None,
-                "parent": None,
-                "inputs": {
-                    "NUM": [arg_type, arg_value]
-                },
-                "fields": {
-                    "OPERATOR": [operator, None]
-                },
-                "shadow": False,
-                "topLevel": False
-            }
+            self.builder.current_sprite["blocks"][block_id] = new_block(opcode, {
+                "NUM": [arg_type, arg_value]
+            }, {
+                "OPERATOR": [operator, None]
+            })
 
         # 设置参数块的parent指向当前块
         if arg_type == 2 and isinstance(arg_value, str):
@@ -0,0 +1,218 @@
+"""
+积木图工具 - 在 target["blocks"] 上遍历和改写积木栈
+
+Scratch 的积木以 {ID: 积木} 的扁平字典存储，靠以下指针连成图：
+
+- 栈中前一个积木的 next 指向后一个，后一个的 parent 指向前一个
+- C 形积木（重复、如果）的 SUBSTACK/SUBSTACK2 输入为 [2, 第一个子积木ID]，子栈第一个积木的 parent 指向 C 形积木
+- 表达式输入为 [1, [类型, 文本]]（字面量）、[1, 阴影ID]、[2, 积木ID] 或 [3, 积木ID, 阴影或字面量]，
+  被引用积木的 parent 指向使用它的积木
+- 脚本的第一个积木 topLevel 为 True，parent 为 None
+
+优化遍（见 peephole.py）通过这里的函数改写积木，保证上述指针始终一致。
+"""
+from typing import Any, Dict, Iterator, List, Optional
+
+from .blockrecord import is_block
+
+Blocks = Dict[str, Dict[str, Any]]
+
+# 含子栈的输入名
+SUBSTACK_INPUTS = ("SUBSTACK", "SUBSTACK2")
+
+# 数字和文本字面量的基本类型（math_number、math_positive_number、math_whole_number、math_integer、
+# math_angle、text）
+LITERAL_PRIMITIVES = (4, 5, 6, 7, 8, 10)
+
+# Scratch 内置积木的类别前缀（其余为扩展积木，行为未知）
+CORE_PREFIXES = ("motion_", "looks_", "sound_", "event_", "control_", "data_", "operator_",
+                 "sensing_", "pen_", "procedures_", "argument_")
+
+# 阴影积木中保存字面量的字段
+_SHADOW_FIELDS = {
+    "math_number": "NUM", "math_positive_number": "NUM", "math_whole_number": "NUM",
+    "math_integer": "NUM", "math_angle": "NUM", "text": "TEXT",
+}
+
+
+def referenced_ids(value: Any) -> List[str]:
+    """输入值引用的积木 ID（包括被遮住的阴影积木）"""
+    if not isinstance(value, list):
+        return []
+    return [item for item in value[1:] if isinstance(item, str)]
+
+
+def child_ids(block: Dict[str, Any]) -> List[str]:
+    """积木的输入（包括子栈）直接引用的积木 ID"""
+    return [child for value in block.get("inputs", {}).values() for child in referenced_ids(value)]
+
+
+def literal_text(blocks: Blocks, value: Any) -> Optional[str]:
+    """输入值是数字或文本字面量时返回其文本，否则返回 None
+
+    Args:
+        blocks: 积木字典
+        value: 输入值，如 [1, [4, "10"]] 或 [1, 阴影积木ID]
+    """
+    if not isinstance(value, list) or len(value) != 2 or value[0] != 1:
+        return None
+    item = value[1]
+    if isinstance(item, list):
+        if len(item) >= 2 and item[0] in LITERAL_PRIMITIVES:
+            return str(item[1])
+        return None
+    shadow = blocks.get(item)
+    if shadow is None or shadow["opcode"] not in _SHADOW_FIELDS:
+        return None
+    field = shadow["fields"].get(_SHADOW_FIELDS[shadow["opcode"]])
+    return str(field[0]) if field else None
+
+
+def set_literal(blocks: Blocks, value: List[Any], text: str) -> None:
+    """修改 literal_text 能识别的字面量输入的文本"""
+    item = value[1]
+    if isinstance(item, list):
+        item[1] = text
+    else:
+        shadow = blocks[item]
+        shadow["fields"][_SHADOW_FIELDS[shadow["opcode"]]][0] = text
+
+
+def stack(blocks: Blocks, first_id: Optional[str]) -> Iterator[str]:
+    """按 next 指针依次产出从 first_id 开始的积木栈"""
+    block_id = first_id
+    while block_id is not None:
+        yield block_id
+        block_id = blocks[block_id]["next"]
+
+
+def substack(block: Dict[str, Any], name: str = "SUBSTACK") -> Optional[str]:
+    """C 形积木子栈的第一个积木 ID，没有时返回 None"""
+    value = block.get("inputs", {}).get(name)
+    if not isinstance(value, list) or len(value) < 2 or not isinstance(value[1], str):
+        return None
+    return value[1]
+
+
+def is_linked(blocks: Blocks, block_id: str) -> bool:
+    """积木的 parent 是否确实通过 next 或输入引用了它（可以安全地改写它所在的栈）"""
+    block = blocks[block_id]
+    parent_id = block["parent"]
+    if parent_id is None or parent_id not in blocks:
+        return False
+    parent = blocks[parent_id]
+    return parent["next"] == block_id or block_id in child_ids(parent)
+
+
+def delete_tree(blocks: Blocks, block_id: str) -> int:
+    """删除积木及其输入和子栈中的全部积木（不包括 next 之后的积木）
+
+    Returns:
+        删除的积木数量
+    """
+    block = blocks.pop(block_id)
+    removed = 1
+    for value in block.get("inputs", {}).values():
+        for child in referenced_ids(value):
+            if child in blocks:
+                for item in list(stack(blocks, child)):
+                    removed += delete_tree(blocks, item)
+    return removed
+
+
+def replace_in_stack(blocks: Blocks, block_id: str, first_id: Optional[str] = None) -> int:
+    """把栈中的一个积木换成以 first_id 开头的积木栈（first_id 为 None 时直接删除）
+
+    first_id 所在的栈接到原积木的位置，原积木的 next 接到它的末尾。原积木及其剩余的输入
+    （不包括 first_id 开头的栈）被删除。调用前须确认 is_linked(blocks, block_id)。
+
+    Args:
+        blocks: 积木字典
+        block_id: 要替换的积木
+        first_id: 替换成的积木栈的第一个积木（通常是原积木的子栈）
+
+    Returns:
+        删除的积木数量
+    """
+    block = blocks[block_id]
+    parent_id, next_id = block["parent"], block["next"]
+    block["next"] = None
+    # 把要保留的栈从原积木上摘下，避免被一起删除
+    for name, value in list(block["inputs"].items()):
+        if first_id is not None and first_id in referenced_ids(value):
+            del block["inputs"][name]
+
+    if first_id is None:
+        head = next_id
+    else:
+        head = first_id
+        last_id = first_id
+        for last_id in stack(blocks, first_id):
+            pass
+        blocks[last_id]["next"] = next_id
+        if next_id is not None:
+            blocks[next_id]["parent"] = last_id
+
+    parent = blocks[parent_id]
+    if parent["next"] == block_id:
+        parent["next"] = head
+    else:
+        for name, value in list(parent["inputs"].items()):
+            if block_id in referenced_ids(value):
+                if head is None:
+                    del parent["inputs"][name]
+                else:
+                    parent["inputs"][name] = [2, head]
+    if head is not None:
+        blocks[head]["parent"] = parent_id
+    return delete_tree(blocks, block_id)
+
+
+def insert_before(blocks: Blocks, block_id: str, first_id: str) -> None:
+    """把以 first_id 开头的积木栈插入到栈中的一个积木之前
+
+    调用前须确认 is_linked(blocks, block_id)，且 first_id 所在的栈没有接在其他积木上。
+    """
+    block = blocks[block_id]
+    parent_id = block["parent"]
+    parent = blocks[parent_id]
+    last_id = first_id
+    for last_id in stack(blocks, first_id):
+        pass
+    if parent["next"] == block_id:
+        parent["next"] = first_id
+    else:
+        for name, value in parent["inputs"].items():
+            if block_id in referenced_ids(value):
+                parent["inputs"][name] = [2, first_id]
+    blocks[first_id]["parent"] = parent_id
+    blocks[last_id]["next"] = block_id
+    block["parent"] = last_id
+
+
+def check_links(blocks: Blocks) -> List[str]:
+    """检查积木图的指针一致性，返回发现的问题（空列表表示一致）"""
+    problems = []
+    referrers: Dict[str, List[str]] = {}
+    for block_id, block in blocks.items():
+        if not is_block(block):
+            continue
+        targets = ([block["next"]] if block["next"] is not None else []) + child_ids(block)
+        for target in targets:
+            if target not in blocks:
+                problems.append(f"{block_id} 引用了不存在的积木 {target}")
+                continue
+            referrers.setdefault(target, []).append(block_id)
+            if blocks[target]["parent"] != block_id:
+                problems.append(f"{target} 的 parent 应为 {block_id}，实际为 {blocks[target]['parent']}")
+    for block_id, block in blocks.items():
+        if not is_block(block):
+            continue
+        if block.get("topLevel"):
+            if block["parent"] is not None:
+                problems.append(f"顶层积木 {block_id} 的 parent 不为空")
+        elif block_id not in referrers:
+            problems.append(f"{block_id} 既不是顶层积木也没有被引用")
+        elif len(referrers[block_id]) > 1:
+            problems.append(f"{block_id} 被多个积木引用: {referrers[block_id]}")
+    return problems
@@ -0,0 +1,212 @@
+"""
+积木记录 - SB3Builder 内部的紧凑积木表示
+
+project.json 中每个积木是一个 7~11 个键的字典，二十万个积木的项目在序列化之前就要占用数百 MB。
+编译器内部改用带 __slots__ 的 Block 记录积木，SB3Builder、ASTToScratch、解析器和各优化遍都通过
+new_block 创建：
+
+- 没有每个实例的 __dict__ 和哈希表，积木本身只占一个定长对象；只有顶层积木和自定义积木才有的
+  x、y、mutation 等键放在一个额外的字典里，其余积木不为它们占空间
+- opcode、字段中重复出现的名字（变量名、菜单选项）和输入中的字面量文本驻留为同一个字符串对象
+
+Block 实现字典协议（block["opcode"]、block.get("mutation")、"x" in block、block.items()），
+积木图工具和各优化遍不需要区分 Block 和从 JSON 加载的普通字典。只在序列化时（json_default）
+或需要普通字典视图时（plain_project）转换为 Scratch 的字典形式。
+
+benchmarks/bench_blocks.py 比较普通字典和 Block 的内存占用和耗时。
+"""
+import sys
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+# 每个积木都有的键，按 project.json 中的顺序
+CORE_KEYS = ("opcode", "next", "parent", "inputs", "fields", "shadow", "topLevel")
+
+_CORE_SET = frozenset(CORE_KEYS)
+_intern = sys.intern
+
+
+def _intern_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """原地驻留字段值 [值, ID] 中的字符串"""
+    for value in fields.values():
+        if value.__class__ is list:
+            for index, item in enumerate(value):
+                if item.__class__ is str:
+                    value[index] = _intern(item)
+    return fields
+
+
+def _intern_inputs(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """原地驻留输入中字面量 [类型, 文本] 的文本"""
+    for value in inputs.values():
+        if value.__class__ is list:
+            for item in value:
+                if item.__class__ is list and len(item) > 1 and item[1].__class__ is str:
+                    item[1] = _intern(item[1])
+    return inputs
+
+
+class Block(MutableMapping):
+    """一个积木（字段见 new_block）
+
+    每个积木都有的七个键各占一个 slot；其余键（x、y、mutation、comment）只出现在少数积木上，
+    按写入顺序放在 _extra 字典中，没有时 _extra 为 None。
+    """
+    __slots__ = CORE_KEYS + ("_extra",)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _CORE_SET:
+            return getattr(self, key)
+        extra = self._extra
+        if extra is None:
+            raise KeyError(key)
+        return extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _CORE_SET:
+            return getattr(self, key)
+        extra = self._extra
+        return default if extra is None else extra.get(key, default)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _CORE_SET:
+            setattr(self, key, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _CORE_SET:
+            raise KeyError(f"不能删除积木的 {key!r} 键")
+        extra = self._extra
+        if extra is None:
+            raise KeyError(key)
+        del extra[key]
+        if not extra:
+            self._extra = None
+
+    def __contains__(self, key: object) -> bool:
+        return key in _CORE_SET or (self._extra is not None and key in self._extra)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from CORE_KEYS
+        if self._extra is not None:
+            yield from tuple(self._extra)
+
+    def __len__(self) -> int:
+        return len(CORE_KEYS) + (0 if self._extra is None else len(self._extra))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Block):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def copy(self) -> "Block":
+        """浅复制（与 dict.copy 相同，输入、字段等仍与原积木共用）"""
+        block = Block.__new__(Block)
+        block.opcode = self.opcode
+        block.next = self.next
+        block.parent = self.parent
+        block.inputs = self.inputs
+        block.fields = self.fields
+        block.shadow = self.shadow
+        block.topLevel = self.topLevel
+        block._extra = None if self._extra is None else dict(self._extra)
+        return block
+
+    def to_dict(self) -> Dict[str, Any]:
+        """project.json 中的字典形式（输入、字段和 mutation 与积木共用）"""
+        data = {"opcode": self.opcode, "next": self.next, "parent": self.parent, "inputs": self.inputs,
+                "fields": self.fields, "shadow": self.shadow, "topLevel": self.topLevel}
+        if self._extra is not None:
+            data.update(self._extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f"Block({self.to_dict()!r})"
+
+
+def new_block(opcode: str, inputs: Optional[Dict[str, Any]] = None, fields: Optional[Dict[str, Any]] = None,
+              parent: Optional[str] = None, next_id: Optional[str] = None, shadow: bool = False,
+              top_level: bool = False, x: Optional[float] = None, y: Optional[float] = None,
+              mutation: Optional[Dict[str, Any]] = None) -> Block:
+    """创建一个积木
+
+    Args:
+        opcode: 积木操作码
+        inputs: 输入参数
+        fields: 字段参数
+        parent: 父积木 ID
+        next_id: 下一个积木 ID
+        shadow: 是否为阴影积木
+        top_level: 是否为顶层积木
+        x: 顶层积木在代码区的横坐标
+        y: 顶层积木在代码区的纵坐标
+        mutation: 自定义积木的 mutation
+
+    Returns:
+        Block: 积木，为 None 的可选键（x、y、mutation）不存在
+    """
+    block = Block.__new__(Block)
+    block.opcode = _intern(opcode)
+    block.next = next_id
+    block.parent = parent
+    block.inputs = _intern_inputs(inputs) if inputs else {}
+    block.fields = _intern_fields(fields) if fields else {}
+    block.shadow = shadow
+    block.topLevel = top_level
+    block._extra = None
+    if x is not None:
+        block["x"] = x
+    if y is not None:
+        block["y"] = y
+    if mutation is not None:
+        block["mutation"] = mutation
+    return block
+
+
+def is_block(value: Any) -> bool:
+    """是否为积木（Block 或 JSON 加载的字典），而不是顶层的变量/列表 reporter [12, 名字, ID]"""
+    return isinstance(value, (Block, dict))
+
+
+def load_block(data: Dict[str, Any]) -> Block:
+    """由 project.json 中的积木字典创建 Block（复用其中的输入、字段和 mutation）"""
+    if data.__class__ is Block:
+        return data
+    block = Block.__new__(Block)
+    block._extra = None
+    for key, value in data.items():
+        block[key] = value
+    block.opcode = _intern(block.opcode)
+    _intern_fields(block.fields)
+    return block
+
+
+def load_blocks(blocks: Dict[str, Any]) -> Dict[str, Any]:
+    """把 {ID: 积木字典} 中的积木原地转换为 Block"""
+    for block_id, block in blocks.items():
+        if block.__class__ is dict:
+            blocks[block_id] = load_block(block)
+    return blocks
+
+
+def json_default(value: Any) -> Any:
+    """json.dumps 的 default：把 Block 转换为字典"""
+    if value.__class__ is Block:
+        return value.to_dict()
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+def plain_blocks(blocks: Dict[str, Any]) -> Dict[str, Any]:
+    """{ID: 积木} 的普通字典视图（Block 转换为字典）"""
+    return {block_id: block.to_dict() if block.__class__ is Block else block for block_id, block in blocks.items()}
+
+
+def plain_project(project: Dict[str, Any]) -> Dict[str, Any]:
+    """项目的普通字典视图：积木转换为字典，其余内容与原项目共用（供测试和反编译器读取）"""
+    return dict(project, targets=[dict(target, blocks=plain_blocks(target["blocks"]))
+                                  for target in project["targets"]])
@@ -19,6 +19,17 @@ from typing import Dict, Any, Union, List, Optional
 BlockDef = Dict[str, Any]
 BlocksDict = Dict[str, BlockDef]
 
+# 输入槽类型对应的阴影积木基本类型编号（project.json 中的 [编号, 值]）
+SLOT_PRIMITIVES = {
+    "math_number": 4,
+    "math_positive_number": 5,
+    "math_whole_number": 6,
+    "math_integer": 7,
+    "math_angle": 8,
+    "colour_picker": 9,
+    "text": 10,
+}
+
 
 class BlockDefinitions:
     """积木定义字典"""
@@ -530,6 +541,88 @@ class BlockDefinitions:
         },
     }
 
+    # ==================== 输入槽类型 ====================
+    # opcode -> {输入名: 输入槽的类型}，与 Scratch 编辑器中积木的默认阴影一致（见 SLOT_PRIMITIVES）。
+    # 没有列出的输入（菜单、广播、子栈）不做类型推断
+    INPUT_TYPES = {
+        "motion_movesteps": {"STEPS": "math_number"},
+        "motion_turnright": {"DEGREES": "math_number"},
+        "motion_turnleft": {"DEGREES": "math_number"},
+        "motion_gotoxy": {"X": "math_number", "Y": "math_number"},
+        "motion_glideto": {"SECS": "math_number"},
+        "motion_glidesecstoxy": {"SECS": "math_number", "X": "math_number", "Y": "math_number"},
+        "motion_pointindirection": {"DIRECTION": "math_angle"},
+        "motion_changexby": {"DX": "math_number"},
+        "motion_setx": {"X": "math_number"},
+        "motion_changeyby": {"DY": "math_number"},
+        "motion_sety": {"Y": "math_number"},
+        "looks_say": {"MESSAGE": "text"},
+        "looks_sayforsecs": {"MESSAGE": "text", "SECS": "math_number"},
+        "looks_think": {"MESSAGE": "text"},
+        "looks_thinkforsecs": {"MESSAGE": "text", "SECS": "math_number"},
+        "looks_setsizeto": {"SIZE": "math_number"},
+        "looks_changesizeby": {"CHANGE": "math_number"},
+        "looks_seteffectto": {"VALUE": "math_number"},
+        "looks_changeeffectby": {"CHANGE": "math_number"},
+        "looks_goforwardbackwardlayers": {"NUM": "math_integer"},
+        "sound_setvolumeto": {"VOLUME": "math_number"},
+        "sound_changevolumeby": {"VOLUME": "math_number"},
+        "sound_seteffectto": {"VALUE": "math_number"},
+        "sound_changeeffectby": {"VALUE": "math_number"},
+        "control_wait": {"DURATION": "math_positive_number"},
+        "control_repeat": {"TIMES": "math_whole_number"},
+        "control_if": {"CONDITION": "boolean"},
+        "control_if_else": {"CONDITION": "boolean"},
+        "control_repeat_until": {"CONDITION": "boolean"},
+        "control_wait_until": {"CONDITION": "boolean"},
+        "control_while": {"CONDITION": "boolean"},
+        "sensing_askandwait": {"QUESTION": "text"},
+        "sensing_touchingcolor": {"COLOR": "colour_picker"},
+        "sensing_coloristouchingcolor": {"COLOR": "colour_picker", "COLOR2": "colour_picker"},
+        "operator_add": {"NUM1": "math_number", "NUM2": "math_number"},
+        "operator_subtract": {"NUM1": "math_number", "NUM2": "math_number"},
+        "operator_multiply": {"NUM1": "math_number", "NUM2": "math_number"},
+        "operator_divide": {"NUM1": "math_number", "NUM2": "math_number"},
+        "operator_mod": {"NUM1": "math_number", "NUM2": "math_number"},
+        "operator_random": {"FROM": "math_number", "TO": "math_number"},
+        "operator_round": {"NUM": "math_number"},
+        "operator_mathop": {"NUM": "math_number"},
+        "operator_gt": {"OPERAND1": "text", "OPERAND2": "text"},
+        "operator_lt": {"OPERAND1": "text", "OPERAND2": "text"},
+        "operator_equals": {"OPERAND1": "text", "OPERAND2": "text"},
+        "operator_and": {"OPERAND1": "boolean", "OPERAND2": "boolean"},
+        "operator_or": {"OPERAND1": "boolean", "OPERAND2": "boolean"},
+        "operator_not": {"OPERAND": "boolean"},
+        "operator_join": {"STRING1": "text", "STRING2": "text"},
+        "operator_letter_of": {"LETTER": "math_whole_number", "STRING": "text"},
+        "operator_length": {"STRING": "text"},
+        "operator_contains": {"STRING1": "text", "STRING2": "text"},
+        "data_setvariableto": {"VALUE": "text"},
+        "data_changevariableby": {"VALUE": "math_number"},
+        "data_addtolist": {"ITEM": "text"},
+        "data_deleteoflist": {"INDEX": "math_integer"},
+        "data_insertatlist": {"ITEM": "text", "INDEX": "math_integer"},
+        "data_replaceitemoflist": {"INDEX": "math_integer", "ITEM": "text"},
+        "data_itemoflist": {"INDEX": "math_integer"},
+        "data_itemnumoflist": {"ITEM": "text"},
+        "data_listcontainsitem": {"ITEM": "text"},
+        "pen_setPenColorToColor": {"COLOR": "colour_picker"},
+        "pen_changePenColorParamBy": {"VALUE": "math_number"},
+        "pen_setPenColorParamTo": {"VALUE": "math_number"},
+        "pen_changePenSizeBy": {"SIZE": "math_number"},
+        "pen_setPenSizeTo": {"SIZE": "math_number"},
+        "music_playDrumForBeats": {"BEATS": "math_number"},
+        "music_restForBeats": {"BEATS": "math_number"},
+        "music_playNoteForBeats": {"BEATS": "math_number"},
+        "music_setTempo": {"TEMPO": "math_number"},
+        "music_changeTempo": {"TEMPO": "math_number"},
+    }
+
+    @classmethod
+    def get_input_type(cls, opcode: str, input_name: str) -> Optional[str]:
+        """获取积木输入槽的类型（如 "math_number"、"text"、"boolean"），没有定义时返回 None"""
+        return cls.INPUT_TYPES.get(opcode, {}).get(input_name)
+
     @classmethod
     def get_all_blocks(cls) -> BlocksDict:
         """获取所有积木定义
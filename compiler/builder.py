@@ -2,27 +2,74 @@
 SB3项目构建器
 """
 import json
+import shutil
+import time
 import zipfile
-import random
-import string
-from typing import Dict, List, Any, Optional, Union
+from concurrent.futures import Future
+from dataclasses import dataclass
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterator, List, Any, Optional, Union
 from urllib.parse import quote
-from .assets import AssetManager
+from .archive import DEFAULT_COMPRESS_LEVEL, ArchiveEntry, write_archive, zip_info
+from .assets import CHUNK_SIZE, DEFAULT_PNG_EFFORT, IMAGE, SOUND, AssetLoadStats, AssetManager, AssetTiming
+from .blockrecord import new_block, plain_blocks
+from .imagecache import ImageCache
+from .ids import IdAllocator, create_id_allocator, DEFAULT_ID_MODE
+from .symbols import SymbolTable, Symbol, VARIABLE, LIST, BROADCAST
 
 # 类型别名
 SpriteData = Dict[str, Any]
 BlockData = Dict[str, Any]
 ProjectData = Dict[str, Any]
 
+# 流式编码 project.json 时每段包含的积木数
+JSON_BLOCK_BATCH = 2000
+
+
+@dataclass
+class AssetRequest:
+    """已登记、尚未填入结果的造型或音效（见 SB3Builder.request_costume）
+
+    Attributes:
+        kind: IMAGE 或 SOUND
+        filepath: 资源文件路径
+        target: 登记时的角色/舞台
+        placeholder: 已按登记顺序放入 target 造型或音效列表的占位项，处理完成后原地填入
+        future: AssetManager.submit 返回的 Future
+        is_backdrop: 是否为背景
+        report: 处理完成后的回调，参数为处理失败时的异常（成功时为 None）
+    """
+    kind: str
+    filepath: str
+    target: SpriteData
+    placeholder: Dict[str, Any]
+    future: Future
+    is_backdrop: bool = False
+    report: Optional[Callable[[Optional[Exception]], None]] = None
+
 
 class SB3Builder:
     """SB3 项目文件构建器
 
     用于构建 Scratch 3.0 项目文件 (.sb3)，支持添加角色、舞台、
     积木、变量、列表、造型、音效等。
+
+    Args:
+        auto_scale_costumes: 是否自动缩放造型
+        max_costume_size: 造型最大尺寸
+        id_mode: ID 分配模式（"counter"、"reproducible" 或 "random"），见 ids.py
+        id_allocator: 自定义 ID 分配器，提供时忽略 id_mode
+        image_cache: 位图造型处理结果的磁盘缓存，见 imagecache.py
+        asset_workers: 处理 request_costume/request_sound 登记的资源的线程数
+        png_effort: 位图造型重新编码为 PNG 的力度，见 assets.PNG_EFFORTS
+        compress_level: 保存时 deflate 的压缩级别（0-9），0 为全部原样存储，见 archive.py
     """
 
-    def __init__(self, auto_scale_costumes: bool = False, max_costume_size: int = 480) -> None:
+    def __init__(self, auto_scale_costumes: bool = False, max_costume_size: int = 480,
+                 id_mode: str = DEFAULT_ID_MODE, id_allocator: Optional[IdAllocator] = None,
+                 image_cache: Optional[ImageCache] = None, asset_workers: int = 1,
+                 png_effort: str = DEFAULT_PNG_EFFORT,
+                 compress_level: int = DEFAULT_COMPRESS_LEVEL) -> None:
         self.project = {
             "targets": [],
             "monitors": [],
@@ -34,12 +81,28 @@ class SB3Builder:
                 "agent": "ScratchLang Compiler v1.0"
             }
         }
-        self.asset_manager = AssetManager(auto_scale_costumes, max_costume_size)
+        self.asset_manager = AssetManager(auto_scale_costumes, max_costume_size, image_cache, asset_workers,
+                                          png_effort)
+        self.compress_level = compress_level
+        # 已登记、尚未填入结果的资源（按登记顺序），由 resolve_assets 填入
+        self.asset_requests: List[AssetRequest] = []
+        # 资源处理耗时统计
+        self.asset_stats = AssetLoadStats(workers=self.asset_manager.workers)
+        # 有资源尚未填入而推迟到 resolve_assets 之后的 finalize_sprite
+        self._deferred_finalize: List[SpriteData] = []
+        self.id_allocator = id_allocator or create_id_allocator(id_mode)
         self.current_sprite = None
         self.stage = None
         self.variables = {}
         self.lists = {}
         self.broadcasts = {}
+        # 每个 target 的符号表 {id(target): SymbolTable}
+        self.symbol_tables: Dict[int, SymbolTable] = {}
+        # 依赖日志：不为 None 时记录对舞台符号的读取和对项目全局状态的修改，
+        # 供增量编译校验和重放（见 incremental.py）
+        self.journal: Optional[List[tuple]] = None
+        # ID 日志：不为 None 时按分配顺序记录 generate_id 生成的 ID，供表达式缓存截取模板（见 memo.py）
+        self.id_log: Optional[List[str]] = None
         self.has_custom_costume = False
         
     def add_sprite(self, name: str, is_stage: bool = False) -> SpriteData:
@@ -87,6 +150,9 @@ class SB3Builder:
             })
         
         self.project["targets"].append(sprite)
+        self.symbol_tables[id(sprite)] = SymbolTable(sprite)
+        # 按创建顺序登记 ID 作用域，与 target 何时分配第一个 ID 无关
+        self.id_allocator.scope(sprite)
         self.current_sprite = sprite
         self.has_custom_costume = False
         return sprite
@@ -112,17 +178,25 @@ class SB3Builder:
             filepath: 图片文件路径
             is_backdrop: 是否为背景
         """
-        if not self.has_custom_costume and len(self.current_sprite["costumes"]) > 0:
-            self.current_sprite["costumes"] = []
-            print(f"🗑️  清除默认{'背景' if is_backdrop else '造型'}")
-        
-        costume = self.asset_manager.add_image(filepath)
-        
+        self._clear_default_costume(is_backdrop)
+        costume = self._costume_entry(self.asset_manager.add_image(filepath), is_backdrop)
         if is_backdrop:
             costume["name"] = f"backdrop{len(self.current_sprite['costumes']) + 1}"
         else:
             costume["name"] = f"costume{len(self.current_sprite['costumes']) + 1}"
-        
+        self.current_sprite["costumes"].append(costume)
+        self.has_custom_costume = True
+
+    def _clear_default_costume(self, is_backdrop: bool) -> None:
+        """添加第一个自定义造型前清除默认造型"""
+        if not self.has_custom_costume and len(self.current_sprite["costumes"]) > 0:
+            self.current_sprite["costumes"] = []
+            print(f"🗑️  清除默认{'背景' if is_backdrop else '造型'}")
+
+    @staticmethod
+    def _costume_entry(costume: Dict[str, Any], is_backdrop: bool) -> Dict[str, Any]:
+        """由 add_image 的结果得到造型数据（名称由调用方按位置设置）"""
+        costume["name"] = "backdrop" if is_backdrop else "costume"
         costume.update({
             "rotationCenterX": 0,
             "rotationCenterY": 0,
@@ -130,9 +204,7 @@ class SB3Builder:
         
         if costume["dataFormat"] in ["png", "jpg"]:
             costume["bitmapResolution"] = 1
-        
-        self.current_sprite["costumes"].append(costume)
-        self.has_custom_costume = True
+        return costume
     
     def add_backdrop(self, filepath: str) -> None:
         """添加背景（舞台专用）
@@ -154,9 +226,104 @@ class SB3Builder:
         """
         sound = self.asset_manager.add_sound(filepath)
         self.current_sprite["sounds"].append(sound)
-    
+
+    def request_costume(self, filepath: str, is_backdrop: bool = False,
+                        report: Optional[Callable[[Optional[Exception]], None]] = None) -> None:
+        """登记造型或背景，交给资源线程池处理，resolve_assets 时按登记顺序填入
+
+        与 add_costume 不同，文件不存在或格式无效时不抛出异常，而是把异常传给 report
+        （未提供 report 时打印警告），并从造型列表中去掉占位项。
+
+        Args:
+            filepath: 图片文件路径
+            is_backdrop: 是否为背景
+            report: 处理完成后的回调，参数为失败时的异常
+        """
+        self._clear_default_costume(is_backdrop)
+        placeholder: Dict[str, Any] = {}
+        self.current_sprite["costumes"].append(placeholder)
+        self.has_custom_costume = True
+        self.asset_requests.append(AssetRequest(IMAGE, filepath, self.current_sprite, placeholder,
+                                                self.asset_manager.submit(IMAGE, filepath), is_backdrop, report))
+
+    def request_sound(self, filepath: str,
+                      report: Optional[Callable[[Optional[Exception]], None]] = None) -> None:
+        """登记音效，交给资源线程池处理，resolve_assets 时按登记顺序填入
+
+        Args:
+            filepath: 音效文件路径
+            report: 处理完成后的回调，参数为失败时的异常
+        """
+        placeholder: Dict[str, Any] = {}
+        self.current_sprite["sounds"].append(placeholder)
+        self.asset_requests.append(AssetRequest(SOUND, filepath, self.current_sprite, placeholder,
+                                                self.asset_manager.submit(SOUND, filepath), report=report))
+
+    def resolve_assets(self) -> None:
+        """等待已登记的资源处理完成，按登记顺序填入结果
+
+        成功的资源按登记顺序加入 asset_manager.assets，占位项原地填入资源信息，造型名称按
+        最终位置编号（与逐个调用 add_costume 相同）；失败的资源从列表中去掉。之后补做因资源
+        未填入而推迟的 finalize_sprite。
+        """
+        requests, self.asset_requests = self.asset_requests, []
+        if requests:
+            start = time.perf_counter()
+            loads = [request.future.result() for request in requests]
+            self.asset_stats.wait_seconds += time.perf_counter() - start
+            self.asset_manager.shutdown()
+
+            named = []
+            for request, load in zip(requests, loads):
+                self.asset_stats.assets.append(AssetTiming(
+                    request.filepath, request.kind, load.seconds, load.error is None,
+                    load.source_bytes, load.asset.size if load.asset is not None else 0))
+                if load.error is not None:
+                    items = request.target["sounds" if request.kind == SOUND else "costumes"]
+                    del items[next(i for i, item in enumerate(items) if item is request.placeholder)]
+                else:
+                    self.asset_manager.assets[load.asset.md5ext] = load.asset
+                    # 同一文件只处理一次，多次登记时共用 load.info，复制后再填入
+                    info = dict(load.info)
+                    if request.kind == SOUND:
+                        request.placeholder.update(info)
+                    else:
+                        request.placeholder.update(self._costume_entry(info, request.is_backdrop))
+                        named.append(request)
+                if request.report is not None:
+                    request.report(load.error)
+                elif load.error is not None:
+                    print(f"⚠️ 警告: {load.error}")
+
+            for request in named:
+                costumes = request.target["costumes"]
+                index = next(i for i, item in enumerate(costumes) if item is request.placeholder)
+                request.placeholder["name"] = f"{'backdrop' if request.is_backdrop else 'costume'}{index + 1}"
+
+            bitmaps = [timing for timing in self.asset_stats.assets[-len(requests):]
+                       if timing.ok and timing.kind == IMAGE and not timing.path.lower().endswith('.svg')]
+            if bitmaps:
+                source = sum(timing.source_bytes for timing in bitmaps)
+                output = sum(timing.output_bytes for timing in bitmaps)
+                print(f"🗜️  {len(bitmaps)} 个位图造型: 源文件 {source / 1024:.1f} KB -> {output / 1024:.1f} KB")
+
+        deferred, self._deferred_finalize = self._deferred_finalize, []
+        if deferred:
+            current = self.current_sprite
+            for target in deferred:
+                self.current_sprite = target
+                self.finalize_sprite()
+            self.current_sprite = current
+
     def finalize_sprite(self) -> None:
-        """完成角色设置，如果没有造型则添加默认造型"""
+        """完成角色设置，如果没有造型则添加默认造型
+
+        角色还有登记的造型没有填入时推迟到 resolve_assets（登记的造型可能全部失败）。
+        """
+        if any(request.target is self.current_sprite for request in self.asset_requests):
+            if not any(target is self.current_sprite for target in self._deferred_finalize):
+                self._deferred_finalize.append(self.current_sprite)
+            return
         if len(self.current_sprite["costumes"]) == 0:
             if self.current_sprite["isStage"]:
                 default_bg = self.asset_manager.create_default_backdrop()
@@ -173,16 +340,70 @@ class SB3Builder:
             print(f"[{self.current_sprite['name']}] {len(self.current_sprite['costumes'])} 个{costume_type}")
     
     def generate_id(self, length: int = 20) -> str:
-        """生成唯一ID
+        """生成唯一ID（由 id_allocator 为当前角色分配）
 
         Args:
-            length: ID 长度，默认 20
+            length: ID 长度，默认 20（仅 random 模式使用）
 
         Returns:
-            str: 随机生成的 ID
+            str: 新的 ID
         """
-        return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+        new_id = self.id_allocator.new_id(self.current_sprite, length)
+        if self.id_log is not None:
+            self.id_log.append(new_id)
+        return new_id
     
+    def symbols(self, target: Optional[SpriteData] = None) -> SymbolTable:
+        """获取 target 的符号表
+
+        Args:
+            target: 角色/舞台数据，默认为当前角色
+
+        Returns:
+            SymbolTable: 符号表（不是通过 add_sprite 创建的 target 会按其内容建立）
+        """
+        if target is None:
+            target = self.current_sprite
+        table = self.symbol_tables.get(id(target))
+        if table is None or table.target is not target:
+            table = SymbolTable.from_target(target)
+            self.symbol_tables[id(target)] = table
+        return table
+
+    def lookup(self, kind: str, name: str, target: Optional[SpriteData] = None) -> Optional[Symbol]:
+        """按作用域查找符号：先查角色局部，再查舞台全局
+
+        Args:
+            kind: 符号种类（VARIABLE / LIST / BROADCAST）
+            name: 名称
+            target: 查找起点，默认为当前角色
+
+        Returns:
+            Symbol 或 None
+        """
+        if target is None:
+            target = self.current_sprite
+        if target is not None:
+            symbol = self.symbols(target).lookup(kind, name)
+            if symbol is not None:
+                return symbol
+        if self.stage is not None and self.stage is not target:
+            symbol = self.symbols(self.stage).lookup(kind, name)
+            if self.journal is not None:
+                self.journal.append(("lookup", kind, name, symbol.id if symbol else None))
+            return symbol
+        return None
+
+    def resolve_variable(self, name: str) -> Optional[str]:
+        """查找变量 ID（角色局部优先），不存在时返回 None"""
+        symbol = self.lookup(VARIABLE, name)
+        return symbol.id if symbol else None
+
+    def resolve_list(self, name: str) -> Optional[str]:
+        """查找列表 ID（角色局部优先），不存在时返回 None"""
+        symbol = self.lookup(LIST, name)
+        return symbol.id if symbol else None
+
     def add_variable(self, name: str, value: Union[int, float, str] = 0) -> str:
         """添加变量
 
@@ -194,16 +415,12 @@ class SB3Builder:
             str: 变量 ID
         """
         # 检查是否已存在同名变量
-        for var_id, var_data in self.current_sprite.get("variables", {}).items():
-            if var_data[0] == name:
-                return var_id
-        if self.stage and self.current_sprite != self.stage:
-            for var_id, var_data in self.stage.get("variables", {}).items():
-                if var_data[0] == name:
-                    return var_id
+        var_id = self.resolve_variable(name)
+        if var_id is not None:
+            return var_id
 
         var_id = self.generate_id()
-        self.current_sprite["variables"][var_id] = [name, value]
+        self.symbols().create(VARIABLE, name, var_id, value)
         return var_id
 
     def add_cloud_variable(self, name: str, value: Union[int, float] = 0) -> str:
@@ -220,6 +437,7 @@ class SB3Builder:
         cloud_name = f"☁ {name}" if not name.startswith("☁") else name
         # 云变量存储格式: [name, value, True] 第三个参数表示是云变量
         self.current_sprite["variables"][var_id] = [cloud_name, value, True]
+        self.symbols().define(VARIABLE, cloud_name, var_id, cloud=True)
         return var_id
 
     def add_list(self, name: str, items: Optional[List[Any]] = None) -> str:
@@ -233,11 +451,11 @@ class SB3Builder:
             str: 列表 ID
         """
         list_id = self.generate_id()
-        self.current_sprite["lists"][list_id] = [name, items or []]
+        self.symbols().create(LIST, name, list_id, items or [])
         return list_id
 
     def add_broadcast(self, name: str) -> str:
-        """添加广播
+        """添加广播（登记在舞台上，同名广播共用一个 ID）
 
         Args:
             name: 广播名称
@@ -245,10 +463,17 @@ class SB3Builder:
         Returns:
             str: 广播 ID
         """
-        if name not in self.broadcasts:
-            broadcast_id = self.generate_id()
-            self.broadcasts[name] = broadcast_id
-        return self.broadcasts[name]
+        target = self.stage if self.stage is not None else self.current_sprite
+        symbol = self.symbols(target).lookup(BROADCAST, name)
+        if symbol is None:
+            # 广播 ID 由名称决定，与在哪个角色中首次使用无关
+            broadcast_id = self.id_allocator.named_id(BROADCAST, name)
+            target["broadcasts"][broadcast_id] = name
+            symbol = self.symbols(target).define(BROADCAST, name, broadcast_id)
+        self.broadcasts[name] = symbol.id
+        if self.journal is not None:
+            self.journal.append(("broadcast", name, symbol.id))
+        return symbol.id
 
     def add_extension(self, extension_name: str) -> None:
         """添加扩展
@@ -258,6 +483,8 @@ class SB3Builder:
         """
         if extension_name not in self.project["extensions"]:
             self.project["extensions"].append(extension_name)
+        if self.journal is not None:
+            self.journal.append(("extension", extension_name))
 
     def add_custom_extension_code(self, extension_id: str, js_code: str) -> None:
         """添加自定义扩展 JS 代码（TurboWarp 格式）
@@ -266,6 +493,8 @@ class SB3Builder:
             extension_id: 扩展 ID
             js_code: JavaScript 代码
         """
+        if self.journal is not None:
+            self.journal.append(("extension_code", extension_id, js_code))
         # 将用户代码包装为 Scratch 扩展格式，创建可执行的积木
         class_name = extension_id.replace('inlinecode', 'InlineCode')
         wrapped_code = f"""class {class_name} {{
@@ -316,15 +545,7 @@ Scratch.extensions.register(new {class_name}());"""
             str: 积木 ID
         """
         block_id = self.generate_id()
-        block = {
-            "opcode": opcode,
-            "next": None,
-            "parent": parent,
-            "inputs": inputs or {},
-            "fields": fields or {},
-            "shadow": False,
-            "topLevel": top_level
-        }
+        block = new_block(opcode, inputs, fields, parent, top_level=top_level)
 
         if top_level:
             block["x"] = 50 + (len(self.current_sprite["blocks"]) % 3) * 300
@@ -354,16 +575,7 @@ Scratch.extensions.register(new {class_name}());"""
             str: 阴影积木 ID
         """
         shadow_id = self.generate_id()
-        shadow_block = {
-            "opcode": opcode,
-            "next": None,
-            "parent": None,
-            "inputs": {},
-            "fields": fields,
-            "shadow": True,
-            "topLevel": False
-        }
-        self.current_sprite["blocks"][shadow_id] = shadow_block
+        self.current_sprite["blocks"][shadow_id] = new_block(opcode, fields=fields, shadow=True)
         return shadow_id
     
     def save(self, filename: str) -> None:
@@ -372,14 +584,103 @@ Scratch.extensions.register(new {class_name}());"""
         Args:
             filename: 输出文件路径
         """
+        self.resolve_assets()
         for target in self.project["targets"]:
             if len(target["costumes"]) == 0:
                 self.current_sprite = target
                 self.finalize_sprite()
         
-        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as zf:
-            project_json = json.dumps(self.project, ensure_ascii=False, indent=2)
-            zf.writestr('project.json', project_json)
-            
-            for asset_name, asset_data in self.asset_manager.assets.items():
-                zf.writestr(asset_name, asset_data)
\ No newline at end of file
+        # project.json 在前，资源按文件名排序，输出与添加顺序无关；
+        # 各条目在 asset_workers 个线程中同时压缩（已经压缩过的格式原样存储），再按顺序写入
+        assets = self.asset_manager.assets
+        entries = [ArchiveEntry('project.json', self.iter_project_json_bytes)]
+        entries.extend(ArchiveEntry(name, assets[name].chunks) for name in sorted(assets))
+        try:
+            with open(filename, 'wb') as f:
+                write_archive(f, entries, self.compress_level, self.asset_manager.workers)
+        except zipfile.LargeZipFile:
+            self._save_zip64(filename)
+
+    def _save_zip64(self, filename: str) -> None:
+        """用 zipfile 逐条目流式写入（需要 zip64 的大项目），压缩方式与 write_archive 相同
+
+        Python 3.13 之前 zipfile 不能给 open(info, 'w') 的条目指定压缩级别，deflate 的条目使用 zlib 默认级别。
+        """
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED, compresslevel=self.compress_level) as zf:
+            # project.json 的大小事先未知，直接使用 zip64 文件头
+            with zf.open(zip_info('project.json', self.compress_level), 'w', force_zip64=True) as entry:
+                self.write_project_json(entry)
+
+            for asset_name in sorted(self.asset_manager.assets):
+                asset = self.asset_manager.assets[asset_name]
+                info = zip_info(asset_name, self.compress_level)
+                # 预先给出大小，zip64 的判断与 writestr 相同
+                info.file_size = asset.size
+                with asset.open() as source, zf.open(info, 'w') as entry:
+                    shutil.copyfileobj(source, entry, CHUNK_SIZE)
+
+    def iter_project_json(self) -> Iterator[str]:
+        """分段编码 project.json
+
+        拼接结果与 json.dumps(plain_project(project), ensure_ascii=False, separators=(',', ':')) 逐字节相同。
+        每个角色单独编码，积木每 JSON_BLOCK_BATCH 个一段（Block 逐段转换为字典），每段仍走 json 的 C 编码器
+        （紧凑格式与 Scratch 自身一致；indent 或 iterencode 会退回纯 Python 实现）。
+
+        Yields:
+            str: project.json 的片段
+        """
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        yield '{'
+        for index, (key, value) in enumerate(self.project.items()):
+            yield f"{',' if index else ''}{encode(key)}:"
+            if key != "targets":
+                yield encode(value)
+                continue
+            yield '['
+            for target_index, target in enumerate(value):
+                yield ',{' if target_index else '{'
+                for field_index, (field, field_value) in enumerate(target.items()):
+                    yield f"{',' if field_index else ''}{encode(field)}:"
+                    if field != "blocks":
+                        yield encode(field_value)
+                        continue
+                    # 每批积木编码为一个字典后去掉两端的花括号
+                    items = iter(field_value.items())
+                    yield '{'
+                    for batch_index, batch in enumerate(iter(lambda: dict(islice(items, JSON_BLOCK_BATCH)), {})):
+                        if batch_index:
+                            yield ','
+                        yield encode(plain_blocks(batch))[1:-1]
+                    yield '}'
+                yield '}'
+            yield ']'
+        yield '}'
+
+    def iter_project_json_bytes(self) -> Iterator[bytes]:
+        """project.json 的 UTF-8 编码，每块约 CHUNK_SIZE 字节
+
+        Yields:
+            bytes: project.json 的分块
+        """
+        buffer: List[bytes] = []
+        size = 0
+        for piece in self.iter_project_json():
+            data = piece.encode('utf-8')
+            buffer.append(data)
+            size += len(data)
+            if size >= CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield b''.join(buffer)
+
+    def write_project_json(self, stream: BinaryIO) -> None:
+        """把 project.json 以 UTF-8 分段写入二进制流
+
+        Args:
+            stream: 可写的二进制流（如 zip 条目）
+        """
+        for piece in self.iter_project_json():
+            stream.write(piece.encode('utf-8'))
+
@@ -0,0 +1,88 @@
+"""
+磁盘缓存工具 - 编译器各类缓存共用的目录与原子写入
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Iterable, Optional
+
+from .blockrecord import json_default
+
+logger = logging.getLogger(__name__)
+
+# 环境变量：自定义缓存目录；设为空字符串则禁用磁盘缓存
+CACHE_DIR_ENV = "SCRATCHLANG_CACHE_DIR"
+
+
+def get_cache_dir(subdir: Optional[str] = None) -> Optional[str]:
+    """获取缓存目录
+
+    Args:
+        subdir: 子目录名（如 "registry"）
+
+    Returns:
+        缓存目录路径；禁用缓存时返回 None
+    """
+    base = os.environ.get(CACHE_DIR_ENV)
+    if base is None:
+        if os.name == "nt":
+            root = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        else:
+            root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        base = os.path.join(root, "scratchlang")
+    elif not base:
+        return None
+    return os.path.join(base, subdir) if subdir else base
+
+
+def fingerprint(*parts: Any) -> str:
+    """计算若干可 JSON 序列化对象的稳定哈希"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def read_json(path: str) -> Optional[Any]:
+    """读取 JSON 缓存文件，不存在或损坏时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.debug(f"读取缓存失败 {path}: {e}")
+        return None
+
+
+def write_bytes_atomic(path: str, data: bytes) -> bool:
+    """原子写入文件（先写临时文件再替换），失败时返回 False"""
+    return write_chunks_atomic(path, (data,))
+
+
+def write_chunks_atomic(path: str, chunks: Iterable[bytes]) -> bool:
+    """分块原子写入文件（内容不需要全部在内存中），失败时返回 False"""
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return True
+    except OSError as e:
+        logger.debug(f"写入缓存失败 {path}: {e}")
+        return False
+
+
+def write_json(path: str, data: Any) -> bool:
+    """原子写入 JSON 缓存文件（积木写为字典），失败时返回 False"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=json_default)
+    return write_bytes_atomic(path, payload.encode("utf-8"))
@@ -0,0 +1,333 @@
+"""
+批量编译命令行 - python -m compiler
+
+一次编译多个 .sl 文件（支持通配符和目录），在预热过的工作进程池中并发编译。
+编译日志和进度写到 stderr，stdout 只输出 JSON 汇总，便于脚本处理：
+
+    python -m compiler "classes/**/*.sl" -o build/ --jobs 8 > summary.json
+
+退出码：0 全部成功，1 有文件编译失败（包括每帧代价估计超过 --frame-budget），2 参数错误或没有匹配的输入文件。
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .archive import DEFAULT_COMPRESS_LEVEL
+from .assets import DEFAULT_PNG_EFFORT, PNG_EFFORTS
+from .blockrecord import is_block
+from .exceptions import CompileError
+from .framecost import format_report, load_cost_table
+from .ids import DEFAULT_ID_MODE, ID_MODES
+from .inliner import DEFAULT_MAX_SIZE
+from .memo import DEFAULT_EXPRESSION_CACHE_SIZE
+from .peephole import PeepholeStats
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+SOURCE_SUFFIX = ".sl"
+OUTPUT_SUFFIX = ".sb3"
+
+
+def expand_inputs(patterns: Sequence[str]) -> Tuple[List[str], List[str]]:
+    """展开输入参数
+
+    目录展开为其中（含子目录）的全部 .sl 文件，含通配符的参数按 glob 展开
+    （支持 **），其余参数按原样作为文件路径。重复的文件只保留第一次出现。
+
+    Args:
+        patterns: 命令行中的输入参数
+
+    Returns:
+        (文件路径列表, 没有匹配任何文件的通配符参数列表)
+    """
+    files = []
+    unmatched = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, "**", f"*{SOURCE_SUFFIX}"), recursive=True))
+        elif glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            matches = [pattern]
+        if not matches:
+            unmatched.append(pattern)
+        for path in matches:
+            key = os.path.normcase(os.path.abspath(path))
+            if key not in seen:
+                seen.add(key)
+                files.append(path)
+    return files, unmatched
+
+
+def output_paths(inputs: Sequence[str], output_dir: Optional[str]) -> List[str]:
+    """计算每个输入文件的输出路径
+
+    未指定输出目录时输出到源文件旁边；指定时保留输入文件相对于其公共父目录的
+    子目录结构，避免不同目录下的同名文件互相覆盖。
+    """
+    stems = [os.path.splitext(path)[0] + OUTPUT_SUFFIX for path in inputs]
+    if output_dir is None:
+        return stems
+    absolute = [os.path.abspath(path) for path in stems]
+    base = os.path.commonpath([os.path.dirname(path) for path in absolute])
+    return [os.path.join(output_dir, os.path.relpath(path, base)) for path in absolute]
+
+
+def compile_one(task: Tuple[str, str, Dict[str, Any]]) -> Dict[str, Any]:
+    """编译单个文件（在工作进程中运行）
+
+    Args:
+        task: (输入路径, 输出路径, 解析器参数)
+
+    Returns:
+        该文件的汇总记录
+    """
+    from .parser import ScratchLangParser
+
+    input_path, output_path, options = task
+    record: Dict[str, Any] = {"input": input_path, "output": output_path, "ok": False}
+    log = io.StringIO()
+    start = time.perf_counter()
+    parser = None
+    try:
+        with contextlib.redirect_stdout(log):
+            parser = ScratchLangParser(**options)
+            parser.parse_file(input_path)
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            parser.compile(output_path)
+        builder = parser.builder
+        targets = builder.project["targets"]
+        record.update(
+            ok=True,
+            targets=len(targets),
+            blocks=sum(1 for target in targets for block in target["blocks"].values()
+                       if is_block(block)),
+            assets=len(builder.asset_manager.assets),
+            asset_bytes=builder.asset_manager.total_size,
+            sb3_bytes=os.path.getsize(output_path),
+            expression_cache=asdict(parser.expression_cache.stats),
+            constant_folding=asdict(parser.ast_converter.folding_stats),
+            peephole=asdict(parser.peephole.stats),
+            warp=asdict(parser.warp_report) if parser.warp_report else None,
+            dead_code=asdict(parser.dead_code_report) if parser.dead_code_report else None,
+            inline=asdict(parser.inline_stats) if parser.inline_stats else None,
+            hoisting=asdict(parser.hoist_stats) if parser.hoist_stats else None,
+            types=asdict(parser.type_report) if parser.type_report else None,
+            image_cache=(asdict(builder.asset_manager.image_cache.stats)
+                         if builder.asset_manager.image_cache else None),
+            asset_loading=asdict(builder.asset_stats),
+        )
+    except Exception as e:
+        record.update(error=str(e), error_type=type(e).__name__)
+    # 超过每帧代价预算而失败时也附上估计结果
+    if parser is not None and parser.frame_cost is not None:
+        record["frame_cost"] = asdict(parser.frame_cost)
+        record["cost_report"] = format_report(parser.frame_cost, title=input_path)
+    record["seconds"] = round(time.perf_counter() - start, 6)
+    record["log"] = log.getvalue()
+    return record
+
+
+def _warm_up() -> None:
+    """工作进程初始化：提前加载积木注册表"""
+    from .registry import get_registry
+    get_registry()
+
+
+def run_batch(inputs: Sequence[str], outputs: Sequence[str], options: Dict[str, Any],
+              jobs: int = 1, verbose: bool = False) -> List[Dict[str, Any]]:
+    """编译一批文件
+
+    Args:
+        inputs: 输入文件路径
+        outputs: 对应的输出路径
+        options: 传给 ScratchLangParser 的参数
+        jobs: 工作进程数，1 时在当前进程中编译
+        verbose: 是否把每个文件的编译日志写到 stderr
+
+    Returns:
+        按输入顺序排列的汇总记录
+    """
+    tasks = [(source, output, options) for source, output in zip(inputs, outputs)]
+    records = []
+
+    def report(record: Dict[str, Any]) -> None:
+        if verbose and record["log"]:
+            sys.stderr.write(record["log"])
+        if record["ok"]:
+            sys.stderr.write(f"✅ {record['input']} -> {record['output']} "
+                             f"({record['seconds'] * 1000:.1f} ms, {record['blocks']} 个积木)\n")
+        else:
+            sys.stderr.write(f"❌ {record['input']}: {record['error']}\n")
+        records.append(record)
+
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            report(compile_one(task))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=_warm_up) as executor:
+            for record in executor.map(compile_one, tasks):
+                report(record)
+    return records
+
+
+def summarize(records: Sequence[Dict[str, Any]], seconds: float) -> Dict[str, Any]:
+    """生成 JSON 汇总（去掉编译日志）"""
+    files = [{key: value for key, value in record.items() if key not in ("log", "cost_report")}
+             for record in records]
+    succeeded = [record for record in files if record["ok"]]
+    return {
+        "files": files,
+        "total": {
+            "files": len(files),
+            "succeeded": len(succeeded),
+            "failed": len(files) - len(succeeded),
+            "blocks": sum(record["blocks"] for record in succeeded),
+            "asset_bytes": sum(record["asset_bytes"] for record in succeeded),
+            "sb3_bytes": sum(record["sb3_bytes"] for record in succeeded),
+            "expression_cache": {
+                key: sum(record["expression_cache"][key] for record in succeeded)
+                for key in ("hits", "misses", "invalidations", "evictions")
+            },
+            "constant_folding": {
+                key: sum(record["constant_folding"][key] for record in succeeded)
+                for key in ("expressions", "removed_blocks")
+            },
+            "peephole": _sum_peephole(record["peephole"] for record in succeeded),
+            "warp_promoted": sum(len(record["warp"]["promoted"]) for record in succeeded if record["warp"]),
+            "dead_code_removed_blocks": sum(record["dead_code"]["removed_blocks"]
+                                            for record in succeeded if record["dead_code"]),
+            "inlined_calls": sum(record["inline"]["calls"] for record in succeeded if record["inline"]),
+            "hoisted_expressions": sum(record["hoisting"]["expressions"]
+                                       for record in succeeded if record["hoisting"]),
+            "type_warnings": sum(len(record["types"]["warnings"]) for record in succeeded if record["types"]),
+            "image_cache": {
+                key: sum(record["image_cache"][key] for record in succeeded if record["image_cache"])
+                for key in ("hits", "misses", "stores", "evictions")
+            },
+            "asset_seconds": round(sum(timing["seconds"] for record in succeeded
+                                       for timing in record["asset_loading"]["assets"]), 6),
+            "asset_bytes_saved": sum(timing["source_bytes"] - timing["output_bytes"] for record in succeeded
+                                     for timing in record["asset_loading"]["assets"] if timing["ok"]),
+            "max_frame_cost": max((record["frame_cost"]["total"] for record in files if "frame_cost" in record),
+                                  default=0),
+            "seconds": round(seconds, 6),
+        },
+    }
+
+
+def _sum_peephole(stats: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总各文件的窥孔优化统计"""
+    total = PeepholeStats()
+    for item in stats:
+        total.merge(PeepholeStats(dict(item["rules"]), item["removed_blocks"]))
+    return asdict(total)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """命令行参数定义"""
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m compiler",
+        description="批量编译 ScratchLang 源文件为 .sb3，stdout 输出 JSON 汇总",
+    )
+    arg_parser.add_argument("inputs", nargs="+", help="源文件、目录或通配符（如 'classes/**/*.sl'）")
+    arg_parser.add_argument("-o", "--output-dir", help="输出目录，默认输出到源文件旁边")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=0,
+                            help="并发编译的进程数，默认为 CPU 核数")
+    arg_parser.add_argument("--id-mode", choices=ID_MODES, default=DEFAULT_ID_MODE, help="积木 ID 分配模式")
+    arg_parser.add_argument("--incremental", action="store_true", help="使用按角色的增量编译缓存")
+    arg_parser.add_argument("--expression-cache-size", type=int, default=DEFAULT_EXPRESSION_CACHE_SIZE,
+                            help="表达式解析缓存的容量，0 为禁用")
+    arg_parser.add_argument("--no-constant-folding", dest="fold_constants", action="store_false",
+                            help="不折叠只含字面量的表达式")
+    arg_parser.add_argument("--no-peephole", dest="peephole", action="store_false",
+                            help="保存前不做积木图窥孔优化")
+    arg_parser.add_argument("--no-warp-inference", dest="warp_inference", action="store_false",
+                            help="不自动为不会让出的自定义积木开启不刷新屏幕")
+    arg_parser.add_argument("--no-type-inference", dest="infer_types", action="store_false",
+                            help="保存前不按输入槽的类型改写字面量和阴影")
+    arg_parser.add_argument("--eliminate-dead-code", action="store_true",
+                            help="删除执行不到的脚本、没有调用的自定义积木和没有读取的变量、列表")
+    arg_parser.add_argument("--inline-procedures", action="store_true",
+                            help="把对小自定义积木的调用替换为积木体")
+    arg_parser.add_argument("--inline-max-size", type=int, default=DEFAULT_MAX_SIZE,
+                            help="可内联的自定义积木体的最大积木数")
+    arg_parser.add_argument("--hoist-invariants", action="store_true",
+                            help="把循环中不变的运算表达式提到循环之前")
+    arg_parser.add_argument("--no-image-cache", dest="image_cache", action="store_false",
+                            help="不使用造型图片缓存，每次都用 PIL 处理位图造型")
+    arg_parser.add_argument("--png-effort", choices=PNG_EFFORTS, default=DEFAULT_PNG_EFFORT,
+                            help="位图造型重新编码为 PNG 的力度：fast 最快，max 最小（尝试无损调色板，取与源文件中较小的）")
+    arg_parser.add_argument("--asset-workers", type=int, default=1,
+                            help="每个文件处理造型和音效的线程数，0 为 CPU 核数（默认 1：文件之间已经按进程并发）")
+    arg_parser.add_argument("--compress-level", type=int, choices=range(10), default=DEFAULT_COMPRESS_LEVEL,
+                            metavar="0-9", help="project.json、SVG、WAV 的 deflate 压缩级别，0 为不压缩（默认 6）")
+    arg_parser.add_argument("--frame-budget", type=float, metavar="COST",
+                            help="每帧代价估计超过 COST 的文件编译失败")
+    arg_parser.add_argument("--cost-table", metavar="FILE", help="覆盖默认积木代价的 JSON 文件 {opcode: 代价}")
+    arg_parser.add_argument("--cost-report", metavar="FILE", help="把按代价排序的每帧代价文本报告写入文件")
+    arg_parser.add_argument("--summary", help="把 JSON 汇总写入文件而不是 stdout")
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="把编译日志写到 stderr")
+    return arg_parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """命令行入口
+
+    Args:
+        argv: 命令行参数，默认为 sys.argv[1:]
+
+    Returns:
+        int: 退出码
+    """
+    args = build_arg_parser().parse_args(argv)
+    inputs, unmatched = expand_inputs(args.inputs)
+    for pattern in unmatched:
+        sys.stderr.write(f"⚠️ 没有匹配的文件: {pattern}\n")
+    if not inputs:
+        sys.stderr.write("❌ 没有要编译的文件\n")
+        return EXIT_USAGE
+
+    try:
+        cost_table = load_cost_table(args.cost_table) if args.cost_table else None
+    except CompileError as e:
+        sys.stderr.write(f"❌ {e}\n")
+        return EXIT_USAGE
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    options = {"id_mode": args.id_mode, "incremental": args.incremental,
+               "expression_cache_size": args.expression_cache_size, "fold_constants": args.fold_constants,
+               "peephole": args.peephole, "warp_inference": args.warp_inference,
+               "eliminate_dead_code": args.eliminate_dead_code, "inline_procedures": args.inline_procedures,
+               "inline_max_size": args.inline_max_size, "hoist_invariants": args.hoist_invariants,
+               "infer_types": args.infer_types, "frame_budget": args.frame_budget, "cost_table": cost_table,
+               "image_cache": args.image_cache, "asset_workers": args.asset_workers, "png_effort": args.png_effort,
+               "compress_level": args.compress_level}
+    start = time.perf_counter()
+    records = run_batch(inputs, output_paths(inputs, args.output_dir), options, jobs, args.verbose)
+    summary = summarize(records, time.perf_counter() - start)
+
+    if args.cost_report:
+        with open(args.cost_report, "w", encoding="utf-8") as f:
+            f.write("\n".join(record["cost_report"] for record in records if "cost_report" in record))
+
+    payload = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        sys.stdout.write(payload + "\n")
+    return EXIT_OK if summary["total"]["failed"] == 0 else EXIT_FAILED
@@ -7,6 +7,10 @@ TARGET_MOUSE = "_mouse_"
 TARGET_RANDOM = "_random_"
 TARGET_EDGE = "_edge_"
 TARGET_STAGE = "_stage_"
+TARGET_MYSELF = "_myself_"
+
+# 克隆菜单中表示 "自己" 的取值（编译器把 "克隆 自己" 的参数原样输出为文本）
+MYSELF_OPTIONS = (TARGET_MYSELF, "自己", "myself")
 
 # 中文到 Scratch 特殊值的映射
 SPECIAL_TARGETS = {
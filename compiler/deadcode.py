@@ -0,0 +1,290 @@
+"""
+死代码消除 - 删除整个项目中执行不到的脚本和没有用到的符号
+
+编译器会保留源码中声明的一切：没有帽子积木的脚本片段、没有被调用的自定义积木、
+没有被读取的变量和列表。模板较多的项目中这些内容可占 project.json 的三到四成，
+拖慢编辑器和播放器的加载。本遍在保存前对所有 target 做可达性分析：
+
+- 删除没有帽子积木的顶层脚本（以及游离的变量、列表积木）
+- 从帽子积木出发沿调用关系查找用到的自定义积木，删除其余自定义积木的定义和原型
+- 删除既没有被读取、也没有被显示（显示变量积木或监视器）的变量和列表，
+  只写入它们的积木一并删除；云变量和被 "侦测 X 的属性" 按名称读取的变量保留
+- 删除没有被发送或接收的广播声明，警告发送了但没有脚本接收的广播
+
+扩展积木的行为未知：顶层的扩展积木视为帽子积木保留，输入中含扩展积木的写入也保留。
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .blockgraph import Blocks, CORE_PREFIXES, child_ids, delete_tree, is_linked, replace_in_stack, stack
+from .blockrecord import is_block
+from .symbols import SymbolTable
+
+# 写入变量、列表的积木（它们的 VARIABLE/LIST 字段不算读取）
+VARIABLE_WRITERS = ("data_setvariableto", "data_changevariableby")
+LIST_WRITERS = ("data_addtolist", "data_deleteoflist", "data_deletealloflist",
+                "data_insertatlist", "data_replaceitemoflist")
+
+# 发送广播的积木
+BROADCAST_SENDERS = ("event_broadcast", "event_broadcastandwait")
+
+# 输入中变量、列表和广播字面量的基本类型
+_VARIABLE_PRIMITIVE = 12
+_LIST_PRIMITIVE = 13
+_BROADCAST_PRIMITIVE = 11
+
+
+@dataclass
+class DeadCodeReport:
+    """死代码消除的结果"""
+    # 删除的没有帽子积木的脚本（"角色/第一个积木的 opcode"）
+    scripts: List[str] = field(default_factory=list)
+    # 删除的没有被调用的自定义积木（"角色/积木签名"）
+    procedures: List[str] = field(default_factory=list)
+    # 删除的没有被读取的变量和列表（"角色/名称"）
+    variables: List[str] = field(default_factory=list)
+    lists: List[str] = field(default_factory=list)
+    # 删除的没有用到的广播声明
+    broadcasts: List[str] = field(default_factory=list)
+    # 发送了但没有脚本接收的广播
+    unreceived: List[str] = field(default_factory=list)
+    # 删除的积木总数
+    removed_blocks: int = 0
+
+
+def eliminate_dead_code(project: Dict[str, Any],
+                        symbols: Optional[Callable[[Dict[str, Any]], SymbolTable]] = None) -> DeadCodeReport:
+    """删除项目中执行不到的脚本和没有用到的符号
+
+    Args:
+        project: project.json 的内容，原地修改
+        symbols: 获取 target 符号表的函数（如 SB3Builder.symbols），变量、列表和广播通过它删除；
+            默认按 target 内容新建符号表
+
+    Returns:
+        DeadCodeReport: 删除的内容和广播警告
+    """
+    symbols = symbols or SymbolTable.from_target
+    report = DeadCodeReport()
+    for target in project["targets"]:
+        _remove_unreachable(target, report)
+    _remove_unused_symbols(project, report, symbols)
+    _check_broadcasts(project, report, symbols)
+
+    removed = (len(report.scripts) + len(report.procedures) + len(report.variables)
+               + len(report.lists) + len(report.broadcasts))
+    if removed:
+        print(f"🧹 死代码消除: 删除 {len(report.scripts)} 个脚本、{len(report.procedures)} 个自定义积木、"
+              f"{len(report.variables)} 个变量、{len(report.lists)} 个列表、{len(report.broadcasts)} 个广播，"
+              f"共 {report.removed_blocks} 个积木")
+    return report
+
+
+def _is_root(opcode: str) -> bool:
+    """顶层积木是否是脚本的入口（帽子积木，或行为未知的扩展积木）"""
+    return opcode.startswith("event_when") or opcode == "control_start_as_clone" \
+        or not opcode.startswith(CORE_PREFIXES)
+
+
+def _script(blocks: Blocks, first_id: str) -> Iterator[str]:
+    """脚本中的全部积木 ID（沿 next、输入和子栈展开）"""
+    pending = [first_id]
+    while pending:
+        block_id = pending.pop()
+        block = blocks.get(block_id)
+        if not is_block(block):
+            continue
+        yield block_id
+        if block["next"] is not None:
+            pending.append(block["next"])
+        pending.extend(child_ids(block))
+
+
+def _delete_script(blocks: Blocks, first_id: str) -> int:
+    """删除一个顶层脚本，返回删除的积木数量"""
+    return sum(delete_tree(blocks, block_id) for block_id in list(stack(blocks, first_id)))
+
+
+def _proccode(blocks: Blocks, definition: Dict[str, Any]) -> Optional[str]:
+    """自定义积木定义的积木签名，原型缺失时返回 None"""
+    value = definition["inputs"].get("custom_block")
+    prototype = blocks.get(value[1]) if value and isinstance(value[1], str) else None
+    if prototype is None or "mutation" not in prototype:
+        return None
+    return prototype["mutation"]["proccode"]
+
+
+def _remove_unreachable(target: Dict[str, Any], report: DeadCodeReport) -> None:
+    """删除一个 target 中没有帽子积木的脚本和没有被调用的自定义积木"""
+    blocks = target["blocks"]
+    name = target["name"]
+    roots = []
+    definitions: Dict[str, List[str]] = {}
+    for block_id, block in list(blocks.items()):
+        if not is_block(block):
+            # 游离的变量或列表积木 [12, 名称, ID, x, y]
+            del blocks[block_id]
+            report.scripts.append(f"{name}/{'data_listcontents' if block[0] == _LIST_PRIMITIVE else 'data_variable'}")
+            report.removed_blocks += 1
+            continue
+        if not block.get("topLevel") or block_id not in blocks:
+            continue
+        opcode = block["opcode"]
+        proccode = _proccode(blocks, block) if opcode == "procedures_definition" else None
+        if proccode is not None:
+            definitions.setdefault(proccode, []).append(block_id)
+        elif _is_root(opcode) or opcode == "procedures_definition":
+            roots.append(block_id)
+        else:
+            report.scripts.append(f"{name}/{opcode}")
+            report.removed_blocks += _delete_script(blocks, block_id)
+
+    called: Set[str] = set()
+    pending = list(roots)
+    while pending:
+        for block_id in _script(blocks, pending.pop()):
+            block = blocks[block_id]
+            if block["opcode"] != "procedures_call":
+                continue
+            proccode = block.get("mutation", {}).get("proccode")
+            if proccode in definitions and proccode not in called:
+                called.add(proccode)
+                pending.extend(definitions[proccode])
+
+    for proccode, definition_ids in definitions.items():
+        if proccode in called:
+            continue
+        for definition_id in definition_ids:
+            report.removed_blocks += _delete_script(blocks, definition_id)
+        report.procedures.append(f"{name}/{proccode}")
+
+
+def _reads(project: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
+    """收集被读取或显示的变量、列表
+
+    Returns:
+        (ID 集合, 名称集合)：名称来自 "侦测 X 的属性" 和监视器，按名称匹配所有 target
+    """
+    ids: Set[str] = set()
+    names: Set[str] = set()
+    for target in project["targets"]:
+        for block in target["blocks"].values():
+            if not is_block(block):
+                continue
+            opcode = block["opcode"]
+            if opcode not in VARIABLE_WRITERS and opcode not in LIST_WRITERS:
+                for field_name in ("VARIABLE", "LIST"):
+                    value = block["fields"].get(field_name)
+                    if isinstance(value, list) and len(value) > 1:
+                        ids.add(value[1])
+            if opcode == "sensing_of":
+                value = block["fields"].get("PROPERTY")
+                if value:
+                    names.add(value[0])
+            for value in block["inputs"].values():
+                for item in value[1:] if isinstance(value, list) else ():
+                    if isinstance(item, list) and len(item) >= 3 \
+                            and item[0] in (_VARIABLE_PRIMITIVE, _LIST_PRIMITIVE):
+                        ids.add(item[2])
+    for monitor in project.get("monitors", []):
+        ids.add(monitor.get("id"))
+        names.update(str(value) for value in monitor.get("params", {}).values())
+    return ids, names
+
+
+def _is_pure(blocks: Blocks, block: Dict[str, Any]) -> bool:
+    """积木的输入中是否只有内置的 reporter（删除它不会丢掉扩展积木的副作用）"""
+    return all(blocks[child]["opcode"].startswith(CORE_PREFIXES)
+               for child_id in child_ids(block) for child in _script(blocks, child_id))
+
+
+def _remove_writers(project: Dict[str, Any], field_name: str, symbol_id: str, writers: Tuple[str, ...]) -> Optional[int]:
+    """删除所有写入某个变量或列表的积木
+
+    Returns:
+        删除的积木数量；有不能安全删除的写入时不做修改，返回 None
+    """
+    found = []
+    for target in project["targets"]:
+        blocks = target["blocks"]
+        for block_id, block in blocks.items():
+            if is_block(block) and block["opcode"] in writers:
+                value = block["fields"].get(field_name)
+                if isinstance(value, list) and len(value) > 1 and value[1] == symbol_id:
+                    if not is_linked(blocks, block_id) or not _is_pure(blocks, block):
+                        return None
+                    found.append((blocks, block_id))
+    return sum(replace_in_stack(blocks, block_id) for blocks, block_id in found)
+
+
+def _remove_unused_symbols(project: Dict[str, Any], report: DeadCodeReport,
+                           symbols: Callable[[Dict[str, Any]], SymbolTable]) -> None:
+    """删除没有被读取的变量和列表（删除写入后可能产生新的未读取符号，重复直到不变）"""
+    changed = True
+    while changed:
+        changed = False
+        ids, names = _reads(project)
+        for target in project["targets"]:
+            for store, field_name, writers, removed in (
+                    (target["variables"], "VARIABLE", VARIABLE_WRITERS, report.variables),
+                    (target["lists"], "LIST", LIST_WRITERS, report.lists)):
+                for symbol_id, symbol in list(store.items()):
+                    cloud = len(symbol) > 2 and symbol[2]
+                    if symbol_id in ids or symbol[0] in names or cloud:
+                        continue
+                    removed_blocks = _remove_writers(project, field_name, symbol_id, writers)
+                    if removed_blocks is None:
+                        continue
+                    symbols(target).remove(symbol_id)
+                    removed.append(f"{target['name']}/{symbol[0]}")
+                    report.removed_blocks += removed_blocks
+                    changed = changed or removed_blocks > 0
+
+
+def _check_broadcasts(project: Dict[str, Any], report: DeadCodeReport,
+                      symbols: Callable[[Dict[str, Any]], SymbolTable]) -> None:
+    """警告没有接收者的广播，删除没有用到的广播声明"""
+    sent: Dict[str, str] = {}
+    received: Set[str] = set()
+    used: Set[str] = set()
+    for target in project["targets"]:
+        blocks = target["blocks"]
+        for block in blocks.values():
+            if not is_block(block):
+                continue
+            option = block["fields"].get("BROADCAST_OPTION")
+            if isinstance(option, list) and len(option) > 1:
+                used.add(option[1])
+                if block["opcode"] == "event_whenbroadcastreceived":
+                    received.add(str(option[0]).lower())
+            for value in block["inputs"].values():
+                for item in value[1:] if isinstance(value, list) else ():
+                    if isinstance(item, list) and len(item) >= 3 and item[0] == _BROADCAST_PRIMITIVE:
+                        used.add(item[2])
+            if block["opcode"] in BROADCAST_SENDERS:
+                name = _broadcast_name(blocks, block["inputs"].get("BROADCAST_INPUT"))
+                if name is not None:
+                    sent.setdefault(name.lower(), name)
+
+    for key, name in sent.items():
+        if key not in received:
+            report.unreceived.append(name)
+            print(f"⚠️ 警告: 广播 {name} 被发送但没有脚本接收")
+    for target in project["targets"]:
+        for broadcast_id, name in list(target.get("broadcasts", {}).items()):
+            key = str(name).lower()
+            if broadcast_id not in used and key not in sent and key not in received:
+                symbols(target).remove(broadcast_id)
+                report.broadcasts.append(name)
+
+
+def _broadcast_name(blocks: Blocks, value: Any) -> Optional[str]:
+    """广播积木发送的消息名，由表达式计算时返回 None"""
+    if not isinstance(value, list) or len(value) != 2 or value[0] != 1:
+        return None
+    item = value[1]
+    if isinstance(item, list):
+        return str(item[1]) if len(item) >= 2 and item[0] == _BROADCAST_PRIMITIVE else None
+    menu = blocks.get(item)
+    option = menu["fields"].get("BROADCAST_OPTION") if is_block(menu) else None
+    return str(option[0]) if option else None
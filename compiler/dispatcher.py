@@ -0,0 +1,353 @@
+"""
+语句分派器 - 根据积木定义快速找到匹配的积木
+
+create_block 原先对每一行源代码依次用 re.search 尝试所有积木定义，
+耗时与 (行数 × 积木定义数) 成正比。分派器在构建时从每个 pattern 中提取
+"必需字面量"（每个 | 分支的任何匹配都必然包含的固定文本），按首字符建立索引：
+一行代码只有包含某个定义的字面量时，该定义才可能匹配。
+无法提取字面量的定义（如 (.+) 这类）合并为一个组合正则做快速排除。
+
+匹配结果与逐个 re.search 的"第一个匹配"顺序完全一致。
+"""
+import re
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+# 正则元字符：遇到这些字符时字面量前缀结束
+_META_CHARS = set('.^$*+?{}[]()|\\')
+# 量词：前一个字符可能出现 0 次，需要从字面量中去掉
+_OPTIONAL_QUANTIFIERS = set('*?{')
+
+
+def split_alternatives(pattern: str) -> List[str]:
+    """按顶层的 | 拆分正则表达式
+
+    Args:
+        pattern: 正则表达式字符串
+
+    Returns:
+        List[str]: 顶层分支列表（括号和字符类内部的 | 不拆分）
+    """
+    branches = []
+    depth = 0
+    in_class = False
+    start = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            branches.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    branches.append(pattern[start:])
+    return branches
+
+
+def literal_prefix(branch: str) -> str:
+    """提取一个正则分支开头的固定文本
+
+    Args:
+        branch: 不含顶层 | 的正则分支
+
+    Returns:
+        str: 任何匹配都必然包含的字面量前缀，无法确定时返回空字符串
+    """
+    if branch.startswith('^'):
+        branch = branch[1:]
+    end = 0
+    while end < len(branch) and branch[end] not in _META_CHARS:
+        end += 1
+    prefix = branch[:end]
+    # "时?" 这类可选字符不能算作必需字面量
+    if prefix and end < len(branch) and branch[end] in _OPTIONAL_QUANTIFIERS:
+        prefix = prefix[:-1]
+    return prefix
+
+
+def _scan_item(branch: str, i: int) -> int:
+    """返回从 i 开始的一个正则单元（字符、转义、字符类或分组）的结束位置"""
+    char = branch[i]
+    if char == '\\':
+        return i + 2
+    if char == '[':
+        j = i + 1
+        if j < len(branch) and branch[j] == '^':
+            j += 1
+        if j < len(branch) and branch[j] == ']':
+            j += 1
+        while j < len(branch) and branch[j] != ']':
+            j += 2 if branch[j] == '\\' else 1
+        return j + 1
+    if char == '(':
+        depth = 0
+        j = i
+        while j < len(branch):
+            if branch[j] == '\\':
+                j += 2
+                continue
+            if branch[j] == '[':
+                j = _scan_item(branch, j)
+                continue
+            if branch[j] == '(':
+                depth += 1
+            elif branch[j] == ')':
+                depth -= 1
+                if depth == 0:
+                    return j + 1
+            j += 1
+        return j
+    return i + 1
+
+
+def _literal_text(item: str) -> Optional[str]:
+    """单元是普通字符（或转义的标点）时返回其文本，否则返回 None"""
+    if item == '\\' or item in ('.', '^', '$'):
+        return None
+    if item.startswith('\\'):
+        escaped = item[1:]
+        return escaped if escaped and not escaped.isalnum() else None
+    if len(item) == 1 and item not in _META_CHARS:
+        return item
+    return None
+
+
+def _group_alternatives(item: str) -> Optional[Tuple[str, ...]]:
+    """分组内容全部是字面量分支（如 (abs|floor)）时返回这些字面量"""
+    body = item[1:-1]
+    if body.startswith('?'):
+        if not body.startswith('?:'):
+            return None
+        body = body[2:]
+    alternatives = []
+    for branch in split_alternatives(body):
+        text = []
+        i = 0
+        while i < len(branch):
+            end = _scan_item(branch, i)
+            literal = _literal_text(branch[i:end])
+            if literal is None:
+                return None
+            text.append(literal)
+            i = end
+        if not text:
+            return None
+        alternatives.append(''.join(text))
+    return tuple(alternatives)
+
+
+def required_literals(branch: str) -> Tuple[str, ...]:
+    """找出一个正则分支的任何匹配都必然包含的字面量
+
+    优先返回最长的顶层连续字面量；没有时退而使用一个必需的
+    纯字面量分组（匹配必然包含其中之一）。
+
+    Args:
+        branch: 不含顶层 | 的正则分支
+
+    Returns:
+        Tuple[str, ...]: 匹配必然包含其中之一的字面量，无法确定时为空元组
+    """
+    runs = []
+    groups = []
+    current = []
+    i = 0
+    while i < len(branch):
+        end = _scan_item(branch, i)
+        item = branch[i:end]
+        quantifier = ''
+        if end < len(branch) and (branch[end] in _OPTIONAL_QUANTIFIERS or branch[end] == '+'):
+            quantifier = branch[end]
+        optional = quantifier in _OPTIONAL_QUANTIFIERS
+        if quantifier:
+            if quantifier == '{':
+                end = branch.index('}', end) + 1
+            else:
+                end += 1
+            if end < len(branch) and branch[end] == '?':
+                end += 1
+
+        literal = _literal_text(item)
+        if literal is not None and not optional:
+            current.append(literal)
+            if quantifier:
+                runs.append(''.join(current))
+                current = []
+        else:
+            if current:
+                runs.append(''.join(current))
+                current = []
+            if item.startswith('(') and not optional:
+                alternatives = _group_alternatives(item)
+                if alternatives:
+                    groups.append(alternatives)
+        i = end
+    if current:
+        runs.append(''.join(current))
+
+    if runs:
+        return (max(runs, key=len),)
+    if groups:
+        return groups[0]
+    return ()
+
+
+def pattern_anchors(pattern: str) -> Optional[Tuple[str, ...]]:
+    """计算一个 pattern 的锚点字面量
+
+    Args:
+        pattern: 积木定义中的正则表达式
+
+    Returns:
+        各分支必需字面量的并集；只要有一个分支无法提取字面量就返回 None
+    """
+    anchors = []
+    for branch in split_alternatives(pattern):
+        literals = required_literals(branch)
+        if not literals:
+            return None
+        anchors.extend(literals)
+    return tuple(anchors)
+
+
+class DispatchMatch:
+    """分派结果：匹配到的积木定义及正则匹配对象"""
+
+    __slots__ = ('name', 'block_def', 'match')
+
+    def __init__(self, name: str, block_def: Dict[str, Any], match: 're.Match') -> None:
+        self.name = name
+        self.block_def = block_def
+        self.match = match
+
+    def __repr__(self) -> str:
+        return f"DispatchMatch({self.name!r}, opcode={self.block_def['opcode']!r})"
+
+
+class BlockDispatcher:
+    """积木语句分派器
+
+    Args:
+        blocks: 积木定义字典 {名称: 定义}，顺序即匹配优先级
+        state: to_state() 导出的分析结果；提供时跳过 pattern 分析
+        compiled: 已编译的正则 {名称: re.Pattern}；提供时不再重新编译
+    """
+
+    def __init__(self, blocks: Dict[str, Dict[str, Any]],
+                 state: Optional[Dict[str, Any]] = None,
+                 compiled: Optional[Dict[str, 're.Pattern']] = None) -> None:
+        # (名称, 定义, 已编译正则)，保持原始优先级顺序
+        self.entries: List[Tuple[str, Dict[str, Any], 're.Pattern']] = []
+        # 字面量 -> 包含该字面量的定义序号
+        self.anchors: Dict[str, List[int]] = {}
+        # 无法建立索引的定义序号（总是候选）
+        self.fallback: List[int] = []
+
+        for name, block_def in blocks.items():
+            pattern = block_def.get("pattern")
+            if not pattern:
+                continue
+            regex = compiled[name] if compiled is not None else re.compile(pattern)
+            self.entries.append((name, block_def, regex))
+
+        if state is not None and self.is_valid_state(state, [entry[0] for entry in self.entries]):
+            self.anchors = {anchor: list(positions) for anchor, positions in state["anchors"].items()}
+            self.fallback = list(state["fallback"])
+        else:
+            for position, (name, block_def, regex) in enumerate(self.entries):
+                anchors = pattern_anchors(regex.pattern)
+                if anchors is None:
+                    self.fallback.append(position)
+                    continue
+                for anchor in anchors:
+                    positions = self.anchors.setdefault(anchor, [])
+                    if position not in positions:
+                        positions.append(position)
+
+        # 首字符 -> ((字面量, 定义序号), ...)；一行代码先与首字符集合求交集，
+        # 只检查可能出现的字面量
+        buckets: Dict[str, List[Tuple[str, FrozenSet[int]]]] = {}
+        for anchor, positions in self.anchors.items():
+            buckets.setdefault(anchor[0], []).append((anchor, frozenset(positions)))
+        self.index: Dict[str, Tuple[Tuple[str, FrozenSet[int]], ...]] = {
+            char: tuple(entries) for char, entries in buckets.items()
+        }
+        self.first_chars: FrozenSet[str] = frozenset(self.index)
+
+        # 组合正则：fallback 定义全部不匹配时一次性排除
+        if self.fallback:
+            combined = '|'.join(f'(?:{self.entries[i][2].pattern})' for i in self.fallback)
+            self.fallback_regex = re.compile(combined)
+        else:
+            self.fallback_regex = None
+
+    @staticmethod
+    def is_valid_state(state: Any, names: List[str]) -> bool:
+        """to_state() 导出的分析结果是否对应 names 中的定义，且每个定义都能成为候选"""
+        if not isinstance(state, dict) or state.get("names") != names:
+            return False
+        anchors, fallback = state.get("anchors"), state.get("fallback")
+        if not isinstance(anchors, dict) or not isinstance(fallback, list):
+            return False
+        covered: Set[int] = set()
+        for anchor, positions in anchors.items():
+            if not anchor or not isinstance(positions, list):
+                return False
+            covered.update(positions)
+        covered.update(fallback)
+        return covered == set(range(len(names)))
+
+    def to_state(self) -> Dict[str, Any]:
+        """导出 pattern 分析结果（可 JSON 序列化），供磁盘缓存使用"""
+        return {
+            "names": [entry[0] for entry in self.entries],
+            "anchors": self.anchors,
+            "fallback": self.fallback,
+        }
+
+    def candidates(self, line: str) -> List[int]:
+        """返回可能匹配该行的定义序号（按优先级排序）"""
+        found: Set[int] = set()
+        index = self.index
+        for char in self.first_chars.intersection(line):
+            for anchor, positions in index[char]:
+                if anchor in line:
+                    found |= positions
+        if self.fallback_regex is not None and self.fallback_regex.search(line):
+            found.update(self.fallback)
+        return sorted(found)
+
+    def match(self, line: str) -> Optional[DispatchMatch]:
+        """找到第一个匹配该行的积木定义
+
+        Args:
+            line: 一行源代码
+
+        Returns:
+            DispatchMatch 或 None
+        """
+        entries = self.entries
+        for position in self.candidates(line):
+            name, block_def, regex = entries[position]
+            match = regex.search(line)
+            if match:
+                return DispatchMatch(name, block_def, match)
+        return None
+
+    def match_linear(self, line: str) -> Optional[DispatchMatch]:
+        """逐个尝试所有定义（原始算法，用于校验和基准测试）"""
+        for name, block_def, regex in self.entries:
+            match = regex.search(line)
+            if match:
+                return DispatchMatch(name, block_def, match)
+        return None
@@ -0,0 +1,413 @@
+"""
+常量折叠 - 在生成积木前计算只含字面量的表达式
+
+"3 * 60 + 5" 原本生成两个运算积木，Scratch 每帧都要重新计算；折叠后只输出字面量 "185"。
+计算规则与 Scratch 3 运行时（scratch-vm 的 Cast 和 operators）一致：
+
+- 字面量在运行时是字符串（数字字面量就是输出到项目中的文本），运算积木的结果是数字或布尔值
+- 数字转换、取余、四舍五入、三角函数的取整方式都按 Scratch 的实现
+- 比较只在两侧都是数字时折叠：比较文本的表达式通常是没解析出来的代码（与 peephole.py 相同）
+
+折叠出的值只在父积木对它的转换结果与原积木相同时才替换成字面量：布尔值作为算术运算的
+操作数时输出 1/0，作为比较运算的操作数时保留原积木（比较会区分 true 和 "true"）。
+表达式整体折叠成布尔值时输出文本 "true"/"false"；布尔输入（且/或/非 的操作数、条件）中的
+表达式不折叠成字面量，只折叠其中的数值子表达式。
+"""
+import math
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .ast_nodes import (
+    ASTNode, BinOpNode, ConstantNode, FunctionNode, NumberNode, StringNode, UnaryOpNode, VariableNode,
+)
+
+# 运行时的值：字面量为 str，运算结果为 float 或 bool
+Value = Union[str, float, bool]
+
+# 字面量的 Scratch 基本类型
+NUMBER_PRIMITIVE = 4
+TEXT_PRIMITIVE = 10
+
+# JavaScript String.prototype.trim 去掉的空白字符
+_JS_WHITESPACE = ("\t\n\v\f\r \u00a0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006"
+                  "\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000\ufeff")
+_DECIMAL_RE = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+_RADIX_RE = re.compile(r'0(?:[xX](?P<hex>[0-9a-fA-F]+)|[oO](?P<oct>[0-7]+)|[bB](?P<bin>[01]+))')
+
+
+def js_to_number(text: str) -> float:
+    """JavaScript 的 Number(字符串)"""
+    text = text.strip(_JS_WHITESPACE)
+    if not text:
+        return 0.0
+    if _DECIMAL_RE.fullmatch(text):
+        return float(text)
+    if text in ("Infinity", "+Infinity"):
+        return math.inf
+    if text == "-Infinity":
+        return -math.inf
+    match = _RADIX_RE.fullmatch(text)
+    if match:
+        for group, base in (("hex", 16), ("oct", 8), ("bin", 2)):
+            if match.group(group):
+                try:
+                    return float(int(match.group(group), base))
+                except OverflowError:
+                    return math.inf
+    return math.nan
+
+
+def number_to_string(value: float) -> str:
+    """JavaScript 的 String(数字)：最短表示，整数不带小数点，极大/极小值用指数形式"""
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "Infinity" if value > 0 else "-Infinity"
+    if value == 0:
+        return "0"
+    sign = "-" if value < 0 else ""
+    decimal = Decimal(repr(abs(value))).normalize()
+    _, digit_tuple, exponent = decimal.as_tuple()
+    digits = "".join(map(str, digit_tuple))
+    # value = 0.digits × 10^point
+    point = len(digits) + exponent
+    if len(digits) <= point <= 21:
+        text = digits + "0" * (point - len(digits))
+    elif 0 < point <= 21:
+        text = digits[:point] + "." + digits[point:]
+    elif -6 < point <= 0:
+        text = "0." + "0" * -point + digits
+    else:
+        mantissa = digits[0] + ("." + digits[1:] if len(digits) > 1 else "")
+        text = f"{mantissa}e{'+' if point - 1 >= 0 else '-'}{abs(point - 1)}"
+    return sign + text
+
+
+def to_number(value: Value) -> float:
+    """Cast.toNumber：无法转换（NaN）时为 0"""
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, str):
+        value = js_to_number(value)
+    return 0.0 if math.isnan(value) else float(value)
+
+
+def to_boolean(value: Value) -> bool:
+    """Cast.toBoolean"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return not (value == "" or value == "0" or value.lower() == "false")
+    return not (value == 0 or math.isnan(value))
+
+
+def to_string(value: Value) -> str:
+    """Cast.toString"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return value
+    return number_to_string(value)
+
+
+def is_numeric(text: Optional[str]) -> bool:
+    """字面量文本能否按数字比较（Scratch 把空白文本当作文本比较）"""
+    return text is not None and text.strip(_JS_WHITESPACE) != "" and not math.isnan(js_to_number(text))
+
+
+def _comparable(value: Value) -> bool:
+    """折叠时能否比较：只比较数字，文本和布尔值的比较留给运行时"""
+    if isinstance(value, bool):
+        return False
+    return not isinstance(value, str) or is_numeric(value)
+
+
+def _js_number(value: Value) -> float:
+    """JavaScript 的 Number(值)（不把 NaN 转成 0）"""
+    if isinstance(value, str):
+        return js_to_number(value)
+    return float(value)
+
+
+def _is_whitespace(value: Value) -> bool:
+    return isinstance(value, str) and not value.strip(_JS_WHITESPACE)
+
+
+def compare(left: Value, right: Value) -> float:
+    """Cast.compare：都能转成数字时按数字比较，否则按字符串不区分大小写比较"""
+    n1 = _js_number(left)
+    n2 = _js_number(right)
+    if n1 == 0 and _is_whitespace(left):
+        n1 = math.nan
+    elif n2 == 0 and _is_whitespace(right):
+        n2 = math.nan
+    if math.isnan(n1) or math.isnan(n2):
+        # JavaScript 按 UTF-16 码元比较字符串
+        s1 = to_string(left).lower().encode("utf-16-be")
+        s2 = to_string(right).lower().encode("utf-16-be")
+        return -1.0 if s1 < s2 else (1.0 if s1 > s2 else 0.0)
+    if n1 == n2:
+        return 0.0
+    return n1 - n2
+
+
+def _divide(left: float, right: float) -> float:
+    if right == 0:
+        if left == 0 or math.isnan(left):
+            return math.nan
+        return math.copysign(math.inf, left) * math.copysign(1.0, right)
+    return left / right
+
+
+def _mod(left: float, right: float) -> float:
+    """operator_mod：结果与除数同号"""
+    if right == 0 or math.isinf(left) or math.isnan(left) or math.isnan(right):
+        return math.nan
+    result = math.fmod(left, right)
+    if result / right < 0:
+        result += right
+    return result
+
+
+def js_round(value: float) -> float:
+    """JavaScript 的 Math.round：.5 向正无穷取整"""
+    if not math.isfinite(value):
+        return value
+    floor = math.floor(value)
+    return float(floor + 1 if value - floor >= 0.5 else floor)
+
+
+def _math_call(func: Any, value: float) -> float:
+    """调用 math 函数，定义域错误时返回 NaN（与 JavaScript 一致）"""
+    try:
+        return func(value)
+    except ValueError:
+        return math.nan
+
+
+def _log(value: float) -> float:
+    if value == 0:
+        return -math.inf
+    return _math_call(math.log, value)
+
+
+def _tan(angle: float) -> float:
+    """MathUtil.tan：90° 和 270° 返回无穷大，其余保留 10 位小数"""
+    if math.isinf(angle):
+        return math.nan
+    angle = math.fmod(angle, 360)
+    if angle in (-270, 90):
+        return math.inf
+    if angle in (-90, 270):
+        return -math.inf
+    return float(f"{math.tan(math.pi * angle / 180):.10f}")
+
+
+def _floor(value: float) -> float:
+    return float(math.floor(value)) if math.isfinite(value) else value
+
+
+def _ceiling(value: float) -> float:
+    return float(math.ceil(value)) if math.isfinite(value) else value
+
+
+# 数学函数（operator_mathop）
+MATH_FUNCTIONS = {
+    'abs': abs,
+    'floor': _floor,
+    'ceiling': _ceiling,
+    'sqrt': lambda n: _math_call(math.sqrt, n),
+    'sin': lambda n: js_round(_math_call(math.sin, math.pi * n / 180) * 1e10) / 1e10,
+    'cos': lambda n: js_round(_math_call(math.cos, math.pi * n / 180) * 1e10) / 1e10,
+    'tan': _tan,
+    'asin': lambda n: _math_call(math.asin, n) * 180 / math.pi,
+    'acos': lambda n: _math_call(math.acos, n) * 180 / math.pi,
+    'atan': lambda n: math.atan(n) * 180 / math.pi,
+    'ln': _log,
+    'log': lambda n: _log(n) / math.log(10),
+    '四舍五入': js_round,
+    'round': js_round,
+}
+
+# 二元运算
+BINARY_OPERATORS = {
+    '+': lambda a, b: to_number(a) + to_number(b),
+    '-': lambda a, b: to_number(a) - to_number(b),
+    '*': lambda a, b: to_number(a) * to_number(b),
+    '/': lambda a, b: _divide(to_number(a), to_number(b)),
+    '%': lambda a, b: _mod(to_number(a), to_number(b)),
+    '>': lambda a, b: compare(a, b) > 0,
+    '<': lambda a, b: compare(a, b) < 0,
+    '=': lambda a, b: compare(a, b) == 0,
+    '>=': lambda a, b: not compare(a, b) < 0,
+    '<=': lambda a, b: not compare(a, b) > 0,
+    '≠': lambda a, b: not compare(a, b) == 0,
+    '且': lambda a, b: to_boolean(a) and to_boolean(b),
+    'and': lambda a, b: to_boolean(a) and to_boolean(b),
+    '或': lambda a, b: to_boolean(a) or to_boolean(b),
+    'or': lambda a, b: to_boolean(a) or to_boolean(b),
+}
+
+# 操作数的使用方式（决定折叠出的值能否替换成字面量）
+_TOP, _NUMERIC, _COMPARE, _LOGIC = "top", "numeric", "compare", "logic"
+
+_OPERAND_CONTEXT = {op: _NUMERIC for op in ('+', '-', '*', '/', '%')}
+_OPERAND_CONTEXT.update({op: _COMPARE for op in ('>', '<', '=', '>=', '<=', '≠')})
+_OPERAND_CONTEXT.update({op: _LOGIC for op in ('且', 'and', '或', 'or')})
+
+# 转换时展开成 "非 (比较)" 两个积木的运算符
+_DESUGARED = ('>=', '<=', '≠')
+
+# 表示"不是常量"
+_UNKNOWN = object()
+
+
+@dataclass
+class FoldingStats:
+    """常量折叠统计"""
+    # 折叠过的表达式数量
+    expressions: int = 0
+    # 因折叠少生成的积木数量
+    removed_blocks: int = 0
+
+    def merge(self, other: 'FoldingStats') -> None:
+        """累加另一份统计（如并行编译工作进程的统计）"""
+        self.expressions += other.expressions
+        self.removed_blocks += other.removed_blocks
+
+
+class ConstantFolder:
+    """AST 常量折叠
+
+    Args:
+        reporters: 会被当作内置 reporter 积木的单词（如 "回答"），它们不是常量
+    """
+
+    def __init__(self, reporters: Dict[str, str]) -> None:
+        self.reporters = reporters
+        self.stats = FoldingStats()
+
+    def fold(self, node: ASTNode, boolean: bool = False) -> ASTNode:
+        """折叠表达式中的常量子表达式
+
+        Args:
+            node: 表达式的 AST
+            boolean: 表达式是否放在布尔输入中（如 "如果" 的条件），此时整个表达式不折叠成字面量
+
+        Returns:
+            折叠后的 AST（没有可折叠的部分时返回原节点）
+        """
+        value, folded = self._fold(node)
+        folded = self._embed(value, folded, _LOGIC if boolean else _TOP)
+        removed = self.count_blocks(node) - self.count_blocks(folded)
+        if removed > 0:
+            self.stats.expressions += 1
+            self.stats.removed_blocks += removed
+            return folded
+        return node
+
+    def fold_literals(self, op: str, left: List[Any], right: List[Any]) -> Optional[List[Any]]:
+        """折叠旧解析路径中两侧都是字面量的二元运算（如 >= 脱糖出的 非(a < b)）
+
+        Args:
+            op: BINARY_OPERATORS 中的运算符
+            left: 左侧输入，形如 [1, [4, "3"]]
+            right: 右侧输入
+
+        Returns:
+            折叠后的字面量输入；有一侧不是数字/文本字面量，或比较的一侧不是数字时返回 None
+        """
+        texts = []
+        for value in (left, right):
+            if value[0] != 1 or value[1][0] not in (NUMBER_PRIMITIVE, TEXT_PRIMITIVE):
+                return None
+            texts.append(value[1][1])
+        if _OPERAND_CONTEXT.get(op) == _COMPARE and not all(is_numeric(text) for text in texts):
+            return None
+        result = self._embed(BINARY_OPERATORS[op](*texts), BinOpNode(None, op, None), _TOP)
+        self.stats.expressions += 1
+        self.stats.removed_blocks += 2 if op in _DESUGARED else 1
+        return [1, [result.primitive, result.text]]
+
+    def count_blocks(self, node: ASTNode) -> int:
+        """统计转换 node 会生成的积木数量"""
+        if isinstance(node, (NumberNode, ConstantNode)):
+            return 0
+        if isinstance(node, StringNode):
+            return 1 if node.value in self.reporters else 0
+        if isinstance(node, VariableNode):
+            return 1
+        if isinstance(node, BinOpNode):
+            own = 2 if node.op in _DESUGARED else 1
+            return own + self.count_blocks(node.left) + self.count_blocks(node.right)
+        if isinstance(node, UnaryOpNode):
+            return 1 + self.count_blocks(node.operand)
+        if isinstance(node, FunctionNode):
+            return 1 + self.count_blocks(node.args[0]) if node.args else 0
+        return 0
+
+    def _fold(self, node: ASTNode) -> Tuple[Any, ASTNode]:
+        """返回 (运行时的值或 _UNKNOWN, 子表达式已折叠的节点)"""
+        if isinstance(node, NumberNode):
+            # 数字字面量在运行时就是输出到项目中的文本（与 ASTToScratch 的写法相同，溢出的写成 "Infinity"）
+            return number_to_string(float(node.value)), node
+        if isinstance(node, StringNode):
+            return (_UNKNOWN if node.value in self.reporters else node.value), node
+
+        if isinstance(node, BinOpNode):
+            operator = BINARY_OPERATORS.get(node.op)
+            if operator is None:
+                return _UNKNOWN, node
+            left_value, left = self._fold(node.left)
+            right_value, right = self._fold(node.right)
+            context = _OPERAND_CONTEXT[node.op]
+            folded = BinOpNode(self._embed(left_value, left, context), node.op,
+                               self._embed(right_value, right, context))
+            if left_value is _UNKNOWN or right_value is _UNKNOWN:
+                return _UNKNOWN, folded
+            if context == _COMPARE and not (_comparable(left_value) and _comparable(right_value)):
+                return _UNKNOWN, folded
+            return operator(left_value, right_value), folded
+
+        if isinstance(node, UnaryOpNode):
+            if node.op == '-':
+                # 与转换时一样视为 0 - 操作数
+                return self._fold(BinOpNode(NumberNode(0), '-', node.operand))
+            if node.op not in ('非', 'not'):
+                return _UNKNOWN, node
+            value, operand = self._fold(node.operand)
+            folded = UnaryOpNode(node.op, self._embed(value, operand, _LOGIC))
+            if value is _UNKNOWN:
+                return _UNKNOWN, folded
+            return not to_boolean(value), folded
+
+        if isinstance(node, FunctionNode):
+            function = MATH_FUNCTIONS.get(node.name)
+            if function is None or not node.args:
+                return _UNKNOWN, node
+            value, argument = self._fold(node.args[0])
+            folded = FunctionNode(node.name, [self._embed(value, argument, _NUMERIC)] + node.args[1:])
+            if value is _UNKNOWN:
+                return _UNKNOWN, folded
+            return function(to_number(value)), folded
+
+        return _UNKNOWN, node
+
+    def _embed(self, value: Any, node: ASTNode, context: str) -> ASTNode:
+        """把折叠出的值换成字面量节点；父积木对字面量的转换结果不同时保留原节点
+
+        布尔输入（且/或/非 的操作数）只接受积木，放进字面量的项目 Scratch 无法正确加载，所以保留原节点。
+        """
+        if value is _UNKNOWN or context == _LOGIC or isinstance(node, (NumberNode, StringNode)):
+            return node
+        if isinstance(value, bool):
+            if context == _NUMERIC:
+                return ConstantNode("1" if value else "0", NUMBER_PRIMITIVE)
+            if context == _COMPARE:
+                return node
+            return ConstantNode("true" if value else "false", TEXT_PRIMITIVE)
+        if isinstance(value, str):
+            return ConstantNode(value, TEXT_PRIMITIVE)
+        return ConstantNode(number_to_string(value), NUMBER_PRIMITIVE)
@@ -0,0 +1,512 @@
+"""
+每帧代价估计 - 静态估计每个脚本和角色一帧内最多执行的工作量
+
+Scratch 每帧依次运行各个线程，每个线程执行到让出为止：
+
+- 等待类积木（见 warp.YIELDING_OPCODES）让出到下一帧
+- 没有开启 "运行时不刷新屏幕"（warp）时，循环每轮结束让出一次：这一轮请求了重绘（移动、外观、
+  画笔）时线程到下一帧才继续，否则同一帧内继续执行
+- 开启 warp 的自定义积木体（以及它调用的积木）中循环不让出
+
+本模块按代价表（DEFAULT_COSTS，执行一个简单积木为 1）累加积木和其中 reporter 的代价，按上面的
+规则把脚本切成一帧内连续执行的片段，取最大的片段作为该脚本每帧的最坏代价：
+
+- 循环次数为字面量时按次数展开；次数未知的循环、重复执行直到、当条件成立时重复，以及一帧内
+  不会结束的重复执行按 assumed_iterations 次估计，并在脚本的假设中注明
+- 如果/否则取代价较大的分支
+- 调用自定义积木时加上积木体的代价；递归调用只计调用本身
+- "当作为克隆体启动" 的脚本乘以克隆体的数量：由创建克隆体的积木所在的循环次数估计，在无界循环、
+  自定义积木的递归调用或会多次触发的脚本中创建时按克隆体上限 CLONE_LIMIT 计
+
+角色的代价为其脚本代价之和，项目的代价为所有角色之和（假设所有脚本在同一帧中同时运行，是最坏
+情况的上界）。脚本和热点积木按代价排序，并通过解析器记录的行号对应回源码。
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from .blockgraph import Blocks, SUBSTACK_INPUTS, literal_text, referenced_ids, stack, substack
+from .blockrecord import is_block
+from .constants import MYSELF_OPTIONS
+from .exceptions import CompileError
+from .folding import to_number
+from .inliner import ARGUMENT_COST, CALL_COST
+from .warp import REDRAW_PREFIXES, UNBOUNDED_LOOPS, YIELDING_OPCODES
+
+# 代价表中没有列出的积木的代价
+DEFAULT_COST = 1
+
+# 积木的代价（以执行一个简单积木为 1），可以用 cost_table 覆盖
+DEFAULT_COSTS: Dict[str, float] = {
+    # 定义本身不执行
+    "procedures_definition": 0,
+    "procedures_prototype": 0,
+    # 调用积木压栈出栈（另加每个参数 ARGUMENT_COST）
+    "procedures_call": CALL_COST,
+    # 碰撞和颜色检测要读取造型的像素
+    "sensing_touchingobject": 20,
+    "sensing_touchingcolor": 40,
+    "sensing_coloristouchingcolor": 50,
+    "motion_ifonedgebounce": 5,
+    # 画笔要重绘画布
+    "pen_stamp": 20,
+    "pen_clear": 10,
+    # 克隆要复制角色的状态并启动脚本
+    "control_create_clone_of": 30,
+    "control_delete_this_clone": 5,
+    # 按内容查找列表项是线性的
+    "data_itemnumoflist": 5,
+    "data_listcontainsitem": 5,
+    # 广播要匹配所有角色的接收脚本
+    "event_broadcast": 5,
+    "event_broadcastandwait": 5,
+    # 对话框要排版文字
+    "looks_say": 3,
+    "looks_think": 3,
+    "looks_sayforsecs": 3,
+    "looks_thinkforsecs": 3,
+}
+
+# 次数未知的循环的估计次数
+DEFAULT_ASSUMED_ITERATIONS = 10
+
+# Scratch 同时存在的克隆体上限
+CLONE_LIMIT = 300
+
+# 循环积木及其次数输入
+_COUNTED_LOOPS = {"control_repeat": "TIMES", "control_for_each": "VALUE"}
+_LOOPS = tuple(_COUNTED_LOOPS) + tuple(UNBOUNDED_LOOPS)
+
+# 只在项目启动时触发一次的帽子积木（其余帽子积木可能多次触发）
+_ONCE_HATS = ("event_whenflagclicked",)
+
+
+@dataclass
+class ScriptCost:
+    """一个脚本的每帧代价"""
+    sprite: str
+    # 帽子积木
+    hat: str
+    block_id: str
+    # 帽子积木的源码行号，未知时为 None
+    line: Optional[int]
+    # 每个实例每帧的最坏代价
+    cost: float
+    # 同时运行的实例数（克隆体脚本为克隆体数量）
+    instances: int
+    # cost * instances
+    total: float
+    # 估计时所做的假设（次数未知的循环、递归等）
+    assumptions: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Hotspot:
+    """一个语句积木在它所在的脚本中每帧的代价（含 reporter、循环展开和调用的积木体）"""
+    sprite: str
+    opcode: str
+    block_id: str
+    line: Optional[int]
+    # 所在脚本帽子积木的行号
+    script_line: Optional[int]
+    cost: float
+
+
+@dataclass
+class FrameCostReport:
+    """每帧代价估计的结果"""
+    # 所有角色的每帧代价之和
+    total: float = 0
+    # 各角色（含舞台）的每帧代价
+    sprites: Dict[str, float] = field(default_factory=dict)
+    # 按 total 从大到小排列的脚本
+    scripts: List[ScriptCost] = field(default_factory=list)
+    # 按 cost 从大到小排列的热点积木
+    hotspots: List[Hotspot] = field(default_factory=list)
+    # 估计的克隆体数量 {角色名: 数量}
+    clones: Dict[str, int] = field(default_factory=dict)
+    # 克隆体数量可能达到上限等（各脚本的假设见 ScriptCost.assumptions）
+    warnings: List[str] = field(default_factory=list)
+
+
+@dataclass
+class _Segment:
+    """积木栈的代价摘要
+
+    first 为开头到第一次让出，last 为最后一次让出到结尾，worst 为两次让出之间的最大值；
+    不让出时三者都等于总代价。
+    """
+    first: float = 0
+    last: float = 0
+    worst: float = 0
+    yields: bool = False
+
+
+def _plain(cost: float) -> _Segment:
+    return _Segment(cost, cost, cost)
+
+
+def _then(a: _Segment, b: _Segment) -> _Segment:
+    """顺序执行 a、b"""
+    return _Segment(
+        first=a.first if a.yields else a.first + b.first,
+        last=b.last if b.yields else a.last + b.first,
+        worst=max(a.worst, b.worst, a.last + b.first),
+        yields=a.yields or b.yields,
+    )
+
+
+def _either(a: _Segment, b: _Segment) -> _Segment:
+    """执行 a、b 之一（取最坏情况）"""
+    return _Segment(max(a.first, b.first), max(a.last, b.last), max(a.worst, b.worst), a.yields or b.yields)
+
+
+def is_hat(opcode: str) -> bool:
+    """是否为会启动脚本的帽子积木"""
+    return opcode == "control_start_as_clone" or "_when" in opcode
+
+
+def loop_count(blocks: Blocks, block: Dict[str, Any]) -> Optional[int]:
+    """循环次数为字面量时返回次数，否则返回 None"""
+    name = _COUNTED_LOOPS.get(block["opcode"])
+    text = literal_text(blocks, block["inputs"].get(name)) if name else None
+    if text is None:
+        return None
+    count = to_number(text)
+    return max(0, int(round(count))) if count == count and abs(count) != float("inf") else None
+
+
+def estimate_frame_cost(project: Dict[str, Any], costs: Optional[Dict[str, float]] = None,
+                        source_lines: Optional[Dict[str, Dict[str, int]]] = None,
+                        assumed_iterations: int = DEFAULT_ASSUMED_ITERATIONS,
+                        max_hotspots: int = 20) -> FrameCostReport:
+    """估计项目每帧的最坏执行代价
+
+    Args:
+        project: project.json 的内容（不修改）
+        costs: 覆盖 DEFAULT_COSTS 的代价表 {opcode: 代价}
+        source_lines: 积木的源码行号 {角色名: {积木ID: 行号}}，见 ScratchLangParser.source_lines()
+        assumed_iterations: 次数未知的循环的估计次数
+        max_hotspots: 报告中保留的热点积木数
+
+    Returns:
+        FrameCostReport: 各脚本、角色和热点积木的代价
+    """
+    table = dict(DEFAULT_COSTS, **(costs or {}))
+    source_lines = source_lines or {}
+    report = FrameCostReport()
+    targets = [target for target in project["targets"] if isinstance(target.get("blocks"), dict)]
+    analyses = [_TargetCost(target, table, source_lines.get(target["name"], {}), assumed_iterations)
+                for target in targets]
+
+    clones: Dict[str, int] = {}
+    for analysis in analyses:
+        for name, count in analysis.clone_sites():
+            clones[name] = min(CLONE_LIMIT, clones.get(name, 0) + count)
+    report.clones = clones
+
+    hotspots: List[Hotspot] = []
+    for analysis in analyses:
+        name = analysis.name
+        scripts = analysis.scripts(clones.get(name, 0))
+        report.scripts.extend(scripts)
+        report.sprites[name] = sum(script.total for script in scripts)
+        hotspots.extend(analysis.hotspots)
+        if clones.get(name, 0) >= CLONE_LIMIT:
+            report.warnings.append(f"{name}: 克隆体数量可能达到上限 {CLONE_LIMIT}")
+
+    report.total = sum(report.sprites.values())
+    report.scripts.sort(key=lambda script: -script.total)
+    hotspots.sort(key=lambda hotspot: -hotspot.cost)
+    report.hotspots = hotspots[:max_hotspots]
+    if report.scripts:
+        top = report.scripts[0]
+        print(f"⏱️ 每帧代价估计: {report.total:g}，最高为 {top.sprite}{_at(top.line)} 的脚本（{top.total:g}）")
+    return report
+
+
+def load_cost_table(path: str) -> Dict[str, float]:
+    """读取 JSON 代价表 {opcode: 代价}，用来覆盖 DEFAULT_COSTS
+
+    Raises:
+        CompileError: 文件无法读取或格式不正确
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CompileError(f"无法读取代价表 '{path}': {e}")
+    if not isinstance(table, dict) or not all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+            for value in table.values()):
+        raise CompileError(f"代价表 '{path}' 应为 {{opcode: 非负数}} 形式的 JSON 对象")
+    return table
+
+
+def format_report(report: FrameCostReport, limit: int = 10, title: str = "") -> str:
+    """把估计结果格式化为按代价排序的文本报告
+
+    Args:
+        report: estimate_frame_cost 的结果
+        limit: 列出的脚本和热点积木数
+        title: 报告标题（如源文件名）
+
+    Returns:
+        str: 多行文本
+    """
+    lines = [f"每帧代价估计{f' - {title}' if title else ''}: {report.total:g}"]
+    if report.sprites:
+        lines.append("角色:")
+        for name, cost in sorted(report.sprites.items(), key=lambda item: -item[1]):
+            clones = report.clones.get(name)
+            lines.append(f"  {name}: {cost:g}" + (f"（{clones} 个克隆体）" if clones else ""))
+    if report.scripts:
+        lines.append("脚本:")
+        for rank, script in enumerate(report.scripts[:limit], 1):
+            instances = f" x {script.instances}" if script.instances != 1 else ""
+            lines.append(f"  {rank}. {script.sprite}{_at(script.line)} {script.hat}: "
+                         f"{script.cost:g}{instances}")
+            for assumption in script.assumptions:
+                lines.append(f"       - {assumption}")
+    if report.hotspots:
+        lines.append("热点积木:")
+        for rank, hotspot in enumerate(report.hotspots[:limit], 1):
+            lines.append(f"  {rank}. {hotspot.sprite}{_at(hotspot.line)} {hotspot.opcode}: {hotspot.cost:g}")
+    for warning in report.warnings:
+        lines.append(f"⚠️ {warning}")
+    return "\n".join(lines) + "\n"
+
+
+def _at(line: Optional[int]) -> str:
+    return f" 第 {line} 行" if line is not None else ""
+
+
+class _TargetCost:
+    """估计一个 target 中各脚本的代价"""
+
+    def __init__(self, target: Dict[str, Any], table: Dict[str, float], lines: Dict[str, int],
+                 assumed_iterations: int) -> None:
+        self.name = target["name"]
+        self.blocks: Blocks = target["blocks"]
+        self.table = table
+        self.lines = lines
+        self.assumed_iterations = assumed_iterations
+        self.procedures: Dict[str, str] = {}
+        for block_id, block in self.blocks.items():
+            if is_block(block) and block["opcode"] == "procedures_definition":
+                value = block["inputs"].get("custom_block")
+                prototype = self.blocks.get(value[1]) if value and isinstance(value[1], str) else None
+                if prototype is not None and "mutation" in prototype:
+                    self.procedures[prototype["mutation"]["proccode"]] = block_id
+        self.hotspots: List[Hotspot] = []
+        # 自定义积木体的代价 {(积木签名, warp): (代价, 假设)}
+        self._procedure_costs: Dict[Tuple[str, bool], Tuple[_Segment, FrozenSet[str]]] = {}
+        self._active: List[str] = []
+        self._assumptions: Set[str] = set()
+        # 当前脚本中各语句积木的代价
+        self._contributions: Optional[Dict[str, float]] = None
+
+    # ---- 脚本 ----
+
+    def scripts(self, clones: int) -> List[ScriptCost]:
+        """估计全部脚本，并收集热点积木"""
+        scripts = []
+        for block_id, block in self.blocks.items():
+            if not is_block(block) or not block.get("topLevel") or not is_hat(block["opcode"]):
+                continue
+            instances = clones if block["opcode"] == "control_start_as_clone" else 1
+            self._assumptions = set()
+            self._contributions = {}
+            segment = self._stack(block_id, False, 1)
+            contributions, self._contributions = self._contributions, None
+            line = self._line(block_id)
+            cost = segment.worst
+            scripts.append(ScriptCost(self.name, block["opcode"], block_id, line, cost, instances,
+                                      cost * instances, sorted(self._assumptions)))
+            for statement_id, value in contributions.items():
+                if value > 0 and instances > 0:
+                    self.hotspots.append(Hotspot(self.name, self.blocks[statement_id]["opcode"], statement_id,
+                                                 self._line(statement_id), line, value * instances))
+        return scripts
+
+    def _line(self, block_id: str) -> Optional[int]:
+        """积木的源码行号：优化遍新建的积木没有记录时取所在栈中前面最近的积木"""
+        while block_id is not None and block_id in self.blocks:
+            if block_id in self.lines:
+                return self.lines[block_id]
+            block_id = self.blocks[block_id].get("parent")
+        return None
+
+    # ---- 代价 ----
+
+    def _cost(self, block_id: str) -> float:
+        """积木本身及其输入中 reporter 的代价（不含子栈）"""
+        block = self.blocks[block_id]
+        if block.get("shadow"):
+            return 0
+        cost = self.table.get(block["opcode"], DEFAULT_COST)
+        if block["opcode"] == "procedures_call":
+            cost += ARGUMENT_COST * len(json.loads(block.get("mutation", {}).get("argumentids", "[]")))
+        for name, value in block["inputs"].items():
+            if name in SUBSTACK_INPUTS:
+                continue
+            for child_id in referenced_ids(value):
+                if is_block(self.blocks.get(child_id)):
+                    cost += self._cost(child_id)
+        return cost
+
+    def _stack(self, first_id: Optional[str], warp: bool, scale: float) -> _Segment:
+        """积木栈的代价；scale 为它在一帧内执行的次数（用于热点积木）"""
+        segment = _Segment()
+        for block_id in stack(self.blocks, first_id):
+            segment = _then(segment, self._block(block_id, warp, scale))
+        return segment
+
+    def _record(self, block_id: str, cost: float) -> None:
+        if self._contributions is not None:
+            self._contributions[block_id] = self._contributions.get(block_id, 0) + cost
+
+    def _block(self, block_id: str, warp: bool, scale: float) -> _Segment:
+        block = self.blocks[block_id]
+        opcode = block["opcode"]
+        own = self._cost(block_id)
+        if opcode in _LOOPS:
+            return self._loop(block_id, warp, scale, own)
+        if opcode == "procedures_call":
+            return self._call(block_id, warp, scale, own)
+        self._record(block_id, own * scale)
+        if opcode in YIELDING_OPCODES:
+            return _Segment(own, 0, own, True)
+        if opcode in ("control_if", "control_if_else"):
+            branches = [self._stack(substack(block, name), warp, scale) for name in SUBSTACK_INPUTS]
+            if opcode == "control_if":
+                branches[1] = _Segment()
+            return _then(_plain(own), _either(*branches))
+        return _plain(own)
+
+    def _loop(self, block_id: str, warp: bool, scale: float, own: float) -> _Segment:
+        block = self.blocks[block_id]
+        opcode = block["opcode"]
+        body_id = substack(block)
+        count = loop_count(self.blocks, block)
+        # 先不记录热点，判断循环是否跨帧
+        contributions, self._contributions = self._contributions, None
+        probe = self._stack(body_id, warp, 1)
+        self._contributions = contributions
+
+        if probe.yields or (not warp and self._redraws(body_id)):
+            # 每帧最多执行一轮
+            self._record(block_id, own * scale)
+            body = self._stack(body_id, warp, scale)
+            if not body.yields:
+                return _Segment(own + body.first, own, own + body.first, True)
+            return _Segment(own + body.first, body.last + own,
+                            max(body.worst, body.last + own + body.first), True)
+
+        # 一帧内执行完（或一直执行到超时）
+        if count is None:
+            count = self.assumed_iterations
+            name = UNBOUNDED_LOOPS.get(opcode, "重复")
+            self._assumptions.add(f"{name}的次数未知，按 {count} 次估计")
+        self._record(block_id, own * scale * count)
+        body = self._stack(body_id, warp, scale * count)
+        return _plain(count * (own + body.first))
+
+    def _call(self, block_id: str, warp: bool, scale: float, own: float) -> _Segment:
+        mutation = self.blocks[block_id].get("mutation", {})
+        proccode = mutation.get("proccode")
+        definition_id = self.procedures.get(proccode)
+        callee = _Segment()
+        if definition_id is None:
+            pass
+        elif proccode in self._active:
+            self._assumptions.add(f"递归调用 {proccode}，只计调用本身")
+        else:
+            definition = self.blocks[definition_id]
+            prototype = self.blocks[definition["inputs"]["custom_block"][1]]
+            callee_warp = warp or prototype["mutation"].get("warp") in ("true", True)
+            key = (proccode, callee_warp)
+            if key not in self._procedure_costs:
+                assumptions, contributions = self._assumptions, self._contributions
+                self._assumptions, self._contributions = set(), None
+                self._active.append(proccode)
+                segment = self._stack(definition["next"], callee_warp, 1)
+                self._active.pop()
+                self._procedure_costs[key] = (segment, frozenset(self._assumptions))
+                self._assumptions, self._contributions = assumptions, contributions
+            callee, assumptions = self._procedure_costs[key]
+            self._assumptions.update(assumptions)
+        self._record(block_id, (own + callee.worst) * scale)
+        return _then(_plain(own), callee)
+
+    def _redraws(self, first_id: Optional[str], seen: Optional[Set[str]] = None) -> bool:
+        """积木栈（包括子栈和调用的自定义积木）中是否有请求重绘的积木"""
+        seen = seen if seen is not None else set()
+        for block_id in stack(self.blocks, first_id):
+            block = self.blocks[block_id]
+            opcode = block["opcode"]
+            if opcode.startswith(REDRAW_PREFIXES):
+                return True
+            if opcode == "procedures_call":
+                proccode = block.get("mutation", {}).get("proccode")
+                if proccode in self.procedures and proccode not in seen:
+                    seen.add(proccode)
+                    if self._redraws(self.blocks[self.procedures[proccode]]["next"], seen):
+                        return True
+            if any(self._redraws(substack(block, name), seen) for name in SUBSTACK_INPUTS):
+                return True
+        return False
+
+    # ---- 克隆 ----
+
+    def clone_sites(self) -> List[Tuple[str, int]]:
+        """创建克隆体的积木：[(被克隆的角色名, 估计的创建次数)]"""
+        sites = []
+        for block_id, block in self.blocks.items():
+            if not is_block(block) or block["opcode"] != "control_create_clone_of":
+                continue
+            option = self._clone_option(block)
+            if option is None:
+                continue
+            sites.append((self.name if option in MYSELF_OPTIONS else option, self._multiplicity(block_id, [])))
+        return sites
+
+    def _clone_option(self, block: Dict[str, Any]) -> Optional[str]:
+        value = block["inputs"].get("CLONE_OPTION")
+        text = literal_text(self.blocks, value)
+        if text is not None:
+            return text
+        menu = self.blocks.get(value[1]) if isinstance(value, list) and isinstance(value[1], str) else None
+        if menu is not None and menu.get("shadow"):
+            option = menu["fields"].get("CLONE_OPTION")
+            return option[0] if option else None
+        return None
+
+    def _multiplicity(self, block_id: str, active: List[str]) -> int:
+        """积木在程序运行期间最多执行的次数（按循环次数字面量估计，无界时为 CLONE_LIMIT）"""
+        blocks = self.blocks
+        count = 1
+        child_id, parent_id = block_id, blocks[block_id]["parent"]
+        while parent_id is not None and parent_id in blocks:
+            parent = blocks[parent_id]
+            if parent["opcode"] in _LOOPS and child_id == substack(parent):
+                times = loop_count(blocks, parent)
+                if times is None:
+                    return CLONE_LIMIT
+                count *= times
+            child_id, parent_id = parent_id, parent["parent"]
+
+        top = blocks[child_id]
+        if top["opcode"] == "procedures_definition":
+            proccode = next((code for code, definition_id in self.procedures.items()
+                             if definition_id == child_id), None)
+            if proccode is None or proccode in active:
+                return CLONE_LIMIT
+            calls = sum(self._multiplicity(call_id, active + [proccode])
+                        for call_id, call in blocks.items()
+                        if is_block(call) and call["opcode"] == "procedures_call"
+                        and call.get("mutation", {}).get("proccode") == proccode)
+            count *= calls
+        elif top["opcode"] not in _ONCE_HATS:
+            return CLONE_LIMIT
+        return min(CLONE_LIMIT, count)
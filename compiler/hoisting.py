@@ -0,0 +1,366 @@
+"""
+循环不变量外提 - 把循环中每次都重新计算的纯表达式提到循环之前
+
+生成的脚本经常在 "重复"、"重复执行" 的每次循环中重新计算同一个表达式，例如
+(~宽度 / 2) * ~缩放。本遍（默认关闭）找出只依赖循环中不会改变的值的运算表达式，
+在循环前用 "设置变量" 存入编译器生成的临时变量（_不变量_N），循环中改为读取临时变量。
+
+副作用模型（保守）：
+
+- 只有运算积木（加减乘除、取余、四舍五入、数学函数、连接、字符、长度，以及作为子表达式的
+  比较和逻辑运算）、字面量、变量和自定义积木参数可以组成不变表达式
+- 侦测类积木（计时器、回答、鼠标、响度、碰到……）、运动和外观的 reporter（坐标、方向、造型）、
+  随机数、列表积木和扩展积木每次求值的结果都可能不同，包含它们的表达式不外提
+- 变量必须在循环中没有被写入；循环中调用了自定义积木或扩展积木时视为所有变量都可能被写入；
+  云变量不外提
+- 非 warp 的循环每次都会让出，其他脚本可能在两次循环之间修改变量：只有当变量属于当前角色、
+  所有写入都在同一个脚本中、循环之外时才提到循环之前。同一个脚本可能在多个克隆体中同时运行，
+  舞台变量被所有克隆体共享，不提到会让出的循环之前（每个克隆体的角色变量是独立的）。
+  自定义积木可能同时被多个线程执行，其中会让出的循环不提到循环之前（临时变量会被其他线程覆盖）
+
+不能提到循环之前、但在一次循环中出现多次的表达式，在循环体中没有让出点时提到每次循环的开头
+（计算一次，多次读取）。"重复直到" 的条件每次循环前求值，其中的表达式只能提到循环之前。
+"""
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .blockgraph import (
+    Blocks, CORE_PREFIXES, SUBSTACK_INPUTS, delete_tree, insert_before, is_linked, literal_text, stack,
+    substack,
+)
+from .blockrecord import is_block, new_block
+from .deadcode import VARIABLE_WRITERS
+from .ids import create_id_allocator
+from .symbols import VARIABLE, SymbolTable
+from .warp import BOUNDED_LOOPS, UNBOUNDED_LOOPS, YIELDING_OPCODES
+
+# 处理的循环
+LOOPS = ("control_repeat", "control_forever", "control_repeat_until")
+
+# 可以外提的运算积木（结果为数字或文本）
+HOISTABLE_OPERATORS = (
+    "operator_add", "operator_subtract", "operator_multiply", "operator_divide", "operator_mod",
+    "operator_round", "operator_mathop", "operator_join", "operator_letter_of", "operator_length",
+)
+
+# 纯的布尔运算：可以作为不变表达式的一部分，但本身不外提（布尔值不能放回条件输入）
+PURE_BOOLEAN_OPERATORS = ("operator_equals", "operator_gt", "operator_lt", "operator_and", "operator_or",
+                          "operator_not", "operator_contains")
+
+_VARIABLE_PRIMITIVE = 12
+
+# 外提的表达式出现的位置：(父积木, 输入名, 表达式积木)
+_Occurrence = Tuple[str, str, str]
+
+
+@dataclass
+class HoistStats:
+    """循环不变量外提统计"""
+    # 改为读取临时变量的表达式数
+    expressions: int = 0
+    # 新建的临时变量数
+    temporaries: int = 0
+    # 提到循环之前的临时变量数（其余提到每次循环的开头）
+    before_loop: int = 0
+    # 有表达式外提的循环数
+    loops: int = 0
+
+
+def _variable_writers(project: Dict[str, Any]) -> Dict[str, List[Tuple[int, str]]]:
+    """变量 ID -> 写入它的积木 [(所在 target 的 id(), 积木ID)]"""
+    writers: Dict[str, List[Tuple[int, str]]] = {}
+    for target in project["targets"]:
+        for block_id, block in target["blocks"].items():
+            if is_block(block) and block["opcode"] in VARIABLE_WRITERS:
+                value = block["fields"].get("VARIABLE")
+                if isinstance(value, list) and len(value) > 1:
+                    writers.setdefault(value[1], []).append((id(target), block_id))
+    return writers
+
+
+class LoopHoister:
+    """循环不变量外提"""
+
+    def __init__(self, new_id: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 symbols: Optional[Callable[[Dict[str, Any]], SymbolTable]] = None) -> None:
+        """
+        Args:
+            new_id: 为 target 分配新积木 ID 的函数，默认使用独立的计数器分配器
+            symbols: 获取 target 符号表的函数（如 SB3Builder.symbols），临时变量通过它登记；
+                默认按 target 内容新建符号表
+        """
+        self.new_id = new_id or create_id_allocator().new_id
+        self.symbols = symbols or SymbolTable.from_target
+        self.stats = HoistStats()
+
+    def hoist_project(self, project: Dict[str, Any]) -> HoistStats:
+        """外提项目中所有循环的不变表达式，返回累计统计"""
+        stage = next((target for target in project["targets"] if target.get("isStage")), None)
+        writers = _variable_writers(project)
+        for target in project["targets"]:
+            _TargetHoister(self, target, stage, writers).run()
+        if self.stats.expressions:
+            print(f"🔁 循环不变量外提: {self.stats.loops} 个循环中的 {self.stats.expressions} 个表达式"
+                  f"改为读取 {self.stats.temporaries} 个临时变量")
+        return self.stats
+
+
+class _TargetHoister:
+    """在一个 target 上执行外提"""
+
+    def __init__(self, hoister: LoopHoister, target: Dict[str, Any], stage: Optional[Dict[str, Any]],
+                 writers: Dict[str, List[Tuple[int, str]]]) -> None:
+        self.hoister = hoister
+        self.stats = hoister.stats
+        self.target = target
+        self.blocks: Blocks = target["blocks"]
+        self.stage = stage
+        self.writers = writers
+        self.cloud = {var_id for owner in (target, stage) if owner is not None
+                      for var_id, value in owner["variables"].items() if len(value) > 2 and value[2]}
+        self.tops: Dict[str, str] = {}
+        # 当前循环的分析结果
+        self.top_id = ""
+        self.loop_blocks: Set[str] = set()
+        self.written: Set[str] = set()
+        self.writes_all = False
+        self.concurrency_safe = False
+
+    def run(self) -> None:
+        tops = [block_id for block_id, block in self.blocks.items()
+                if is_block(block) and block.get("topLevel")]
+        for top_id in tops:
+            # 先处理外层循环：对外层不变的表达式直接提到最外面
+            for loop_id in self._loops(top_id):
+                self._hoist(loop_id, top_id)
+
+    # ==================== 分析 ====================
+
+    def _loops(self, first_id: Optional[str]) -> List[str]:
+        """积木栈（含子栈）中的循环，外层在前"""
+        loops = []
+        for block_id in stack(self.blocks, first_id):
+            block = self.blocks[block_id]
+            if block["opcode"] in LOOPS:
+                loops.append(block_id)
+            for name in SUBSTACK_INPUTS:
+                loops += self._loops(substack(block, name))
+        return loops
+
+    def _tree(self, first_id: Optional[str]) -> List[str]:
+        """从 first_id 开始的积木栈及其输入、子栈中的全部积木"""
+        result = []
+        pending = [first_id] if first_id else []
+        while pending:
+            block_id = pending.pop()
+            block = self.blocks.get(block_id)
+            if not is_block(block):
+                continue
+            result.append(block_id)
+            if block["next"] is not None:
+                pending.append(block["next"])
+            pending.extend(item for value in block["inputs"].values() if isinstance(value, list)
+                           for item in value[1:] if isinstance(item, str))
+        return result
+
+    def _top(self, block_id: str) -> str:
+        """积木所在脚本的顶层积木"""
+        path = []
+        while block_id not in self.tops:
+            path.append(block_id)
+            parent_id = self.blocks[block_id]["parent"]
+            if parent_id is None or parent_id not in self.blocks:
+                self.tops[block_id] = block_id
+                break
+            block_id = parent_id
+        top_id = self.tops[block_id]
+        for item in path:
+            self.tops[item] = top_id
+        return top_id
+
+    def _warp(self, top_id: str) -> bool:
+        top = self.blocks[top_id]
+        if top["opcode"] != "procedures_definition":
+            return False
+        value = top["inputs"].get("custom_block")
+        prototype = self.blocks.get(value[1]) if value and isinstance(value[1], str) else None
+        return bool(prototype and prototype.get("mutation", {}).get("warp") in ("true", True))
+
+    def _variable_ok(self, var_id: str, before_loop: bool) -> bool:
+        """变量在循环中（before_loop 为 False 时：在一次循环中）是否不会改变"""
+        if self.writes_all or var_id in self.written or var_id in self.cloud:
+            return False
+        if not before_loop or self.concurrency_safe:
+            return True
+        if var_id not in self.target["variables"]:
+            return False
+        return all(owner == id(self.target) and self._top(writer) == self.top_id
+                   and writer not in self.loop_blocks
+                   for owner, writer in self.writers.get(var_id, ()))
+
+    def _key(self, block_id: str, before_loop: bool) -> Optional[Tuple[Any, ...]]:
+        """不变表达式的结构键（相同的键表示相同的值），不是不变表达式时返回 None"""
+        block = self.blocks.get(block_id)
+        if block is None:
+            return None
+        opcode = block["opcode"]
+        if opcode == "data_variable":
+            var_id = block["fields"]["VARIABLE"][1]
+            return ("var", var_id) if self._variable_ok(var_id, before_loop) else None
+        if opcode == "argument_reporter_string_number":
+            return ("arg", block["fields"]["VALUE"][0])
+        if opcode not in HOISTABLE_OPERATORS and opcode not in PURE_BOOLEAN_OPERATORS:
+            return None
+        parts: List[Any] = [opcode, json.dumps(block["fields"], sort_keys=True, ensure_ascii=False)]
+        for name in sorted(block["inputs"]):
+            value = block["inputs"][name]
+            text = literal_text(self.blocks, value)
+            if text is not None:
+                parts.append((name, "literal", text))
+                continue
+            item = value[1] if isinstance(value, list) and len(value) > 1 else None
+            if isinstance(item, list) and len(item) >= 3 and item[0] == _VARIABLE_PRIMITIVE:
+                if not self._variable_ok(item[2], before_loop):
+                    return None
+                parts.append((name, "var", item[2]))
+                continue
+            child = self._key(item, before_loop) if isinstance(item, str) else None
+            if child is None:
+                return None
+            parts.append((name, child))
+        return tuple(parts)
+
+    # ==================== 改写 ====================
+
+    def _hoist(self, loop_id: str, top_id: str) -> None:
+        blocks = self.blocks
+        if not is_linked(blocks, loop_id):
+            return
+        loop = blocks[loop_id]
+        body_id = substack(loop)
+        warp = self._warp(top_id)
+        condition = loop["inputs"].get("CONDITION") if loop["opcode"] == "control_repeat_until" else None
+        condition_ids = self._tree(condition[1]) if isinstance(condition, list) and len(condition) > 1 \
+            and isinstance(condition[1], str) else []
+
+        self.top_id = top_id
+        self.loop_blocks = set(self._tree(body_id)) | set(condition_ids)
+        self.written = set()
+        self.writes_all = False
+        yields = False
+        for block_id in self.loop_blocks:
+            opcode = blocks[block_id]["opcode"]
+            if opcode in VARIABLE_WRITERS:
+                self.written.add(blocks[block_id]["fields"]["VARIABLE"][1])
+            elif opcode == "procedures_call" or not opcode.startswith(CORE_PREFIXES):
+                self.writes_all = yields = True
+            elif opcode in YIELDING_OPCODES or (not warp and (opcode in UNBOUNDED_LOOPS or opcode in BOUNDED_LOOPS)):
+                yields = True
+        self.concurrency_safe = warp and not yields
+        # 自定义积木可能被多个线程同时执行，会让出的循环中临时变量可能被覆盖
+        before_allowed = self.concurrency_safe or blocks[top_id]["opcode"] != "procedures_definition"
+        per_iteration_allowed = not yields
+
+        before: Dict[Tuple[Any, ...], List[_Occurrence]] = {}
+        iteration: Dict[Tuple[Any, ...], List[_Occurrence]] = {}
+        if condition_ids and before_allowed:
+            self._collect(loop_id, "CONDITION", condition[1], True, False, before, iteration)
+        for statement_id in self._statements(body_id):
+            for name, value in list(blocks[statement_id]["inputs"].items()):
+                if name not in SUBSTACK_INPUTS and isinstance(value, list) and len(value) > 1 \
+                        and isinstance(value[1], str):
+                    self._collect(statement_id, name, value[1], before_allowed, per_iteration_allowed,
+                                  before, iteration)
+        # 一次循环中只出现一次的表达式提到循环开头没有收益，改为在其中查找能提到循环之前的部分
+        for key in [key for key, occurrences in iteration.items() if len(occurrences) < 2]:
+            for _, _, block_id in iteration.pop(key):
+                self._collect_children(block_id, before_allowed, False, before, iteration)
+
+        if before:
+            insert_before(blocks, loop_id, self._assignments(before))
+            self.stats.before_loop += len(before)
+        if iteration:
+            insert_before(blocks, substack(loop), self._assignments(iteration))
+        if before or iteration:
+            self.stats.loops += 1
+
+    def _statements(self, first_id: Optional[str]) -> List[str]:
+        """积木栈（含子栈）中的语句积木"""
+        statements = []
+        for block_id in stack(self.blocks, first_id):
+            statements.append(block_id)
+            for name in SUBSTACK_INPUTS:
+                statements += self._statements(substack(self.blocks[block_id], name))
+        return statements
+
+    def _collect(self, parent_id: str, name: str, block_id: str, before_allowed: bool,
+                 per_iteration_allowed: bool, before: Dict[Tuple[Any, ...], List[_Occurrence]],
+                 iteration: Dict[Tuple[Any, ...], List[_Occurrence]]) -> None:
+        """在表达式中查找最大的可外提子表达式"""
+        block = self.blocks.get(block_id)
+        if block is None:
+            return
+        if block["opcode"] in HOISTABLE_OPERATORS:
+            key = self._key(block_id, True) if before_allowed else None
+            if key is not None:
+                before.setdefault(key, []).append((parent_id, name, block_id))
+                return
+            key = self._key(block_id, False) if per_iteration_allowed else None
+            if key is not None:
+                iteration.setdefault(key, []).append((parent_id, name, block_id))
+                return
+        self._collect_children(block_id, before_allowed, per_iteration_allowed, before, iteration)
+
+    def _collect_children(self, block_id: str, before_allowed: bool, per_iteration_allowed: bool,
+                          before: Dict[Tuple[Any, ...], List[_Occurrence]],
+                          iteration: Dict[Tuple[Any, ...], List[_Occurrence]]) -> None:
+        for name, value in self.blocks[block_id]["inputs"].items():
+            if isinstance(value, list) and len(value) > 1 and isinstance(value[1], str):
+                self._collect(block_id, name, value[1], before_allowed, per_iteration_allowed, before, iteration)
+
+    def _new_id(self) -> str:
+        while True:
+            new_id = self.hoister.new_id(self.target)
+            if new_id not in self.blocks and new_id not in self.target["variables"]:
+                return new_id
+
+    def _temporary(self) -> Tuple[str, str]:
+        """新建一个临时变量，返回 (名称, ID)"""
+        tables = [self.hoister.symbols(owner) for owner in (self.target, self.stage) if owner is not None]
+        number = self.stats.temporaries + 1
+        while any(table.lookup(VARIABLE, f"_不变量_{number}") for table in tables):
+            number += 1
+        variable_id = self._new_id()
+        tables[0].create(VARIABLE, f"_不变量_{number}", variable_id)
+        self.stats.temporaries += 1
+        return f"_不变量_{number}", variable_id
+
+    def _assignments(self, hoisted: Dict[Tuple[Any, ...], List[_Occurrence]]) -> str:
+        """为每个表达式生成 "设置临时变量" 积木并改写出现的位置，返回积木栈的第一个积木"""
+        blocks = self.blocks
+        first_id = previous_id = None
+        for occurrences in hoisted.values():
+            variable_name, variable_id = self._temporary()
+            set_id = self._new_id()
+            _, _, expression_id = occurrences[0]
+            blocks[set_id] = new_block("data_setvariableto", {"VALUE": [3, expression_id, [10, ""]]},
+                                       {"VARIABLE": [variable_name, variable_id]}, previous_id)
+            for index, (parent_id, name, block_id) in enumerate(occurrences):
+                reporter_id = self._new_id()
+                blocks[reporter_id] = new_block("data_variable", parent=parent_id,
+                                                fields={"VARIABLE": [variable_name, variable_id]})
+                value = list(blocks[parent_id]["inputs"][name])
+                value[1] = reporter_id
+                blocks[parent_id]["inputs"][name] = value
+                if index == 0:
+                    blocks[block_id]["parent"] = set_id
+                else:
+                    delete_tree(blocks, block_id)
+            self.stats.expressions += len(occurrences)
+            if previous_id is None:
+                first_id = set_id
+            else:
+                blocks[previous_id]["next"] = set_id
+            previous_id = set_id
+        return first_id
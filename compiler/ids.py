@@ -0,0 +1,216 @@
+"""
+ID 分配器 - 为积木、变量、列表、广播等生成 ID
+
+SB3Builder 原先为每个 ID 调用 random.choices 生成 20 位随机字符串，速度慢，
+而且每次编译的输出都不同，无法做输出级缓存和比较。分配器有三种模式：
+
+- counter（默认）: 每个 target 一个 3 位前缀（由 target 名称及其同名序号
+  派生）加 base62 计数器，ID 短且保证不重复
+- reproducible: 与 counter 相同的编号方式，但输出 20 位哈希 ID，
+  外观与 Scratch 原生 ID 一致；相同源码在任何机器上得到相同 ID
+- random: 原先的 20 位随机 ID
+
+前两种模式只使用 hashlib，不依赖 Python 的字符串哈希随机化，结果跨进程稳定。
+"""
+import hashlib
+import random
+import string
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Set, Tuple
+
+ID_ALPHABET = string.ascii_letters + string.digits
+
+ID_MODES = ("counter", "reproducible", "random")
+DEFAULT_ID_MODE = "counter"
+
+
+def to_base62(number: int) -> str:
+    """把非负整数编码为 base62 字符串"""
+    if number == 0:
+        return ID_ALPHABET[0]
+    digits = []
+    while number:
+        number, remainder = divmod(number, 62)
+        digits.append(ID_ALPHABET[remainder])
+    return ''.join(reversed(digits))
+
+
+def hash_id(text: str, length: int) -> str:
+    """由文本派生固定长度的 base62 ID"""
+    value = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest(), 'big')
+    return to_base62(value % 62 ** length).rjust(length, ID_ALPHABET[0])
+
+
+class IdAllocator(ABC):
+    """ID 分配器基类（子类实现 new_id 和 named_id）"""
+
+    mode = ""
+    seed = ""
+
+    @abstractmethod
+    def new_id(self, target: Optional[Dict[str, Any]] = None, length: int = 20) -> str:
+        """为 target 中的新对象分配 ID
+
+        Args:
+            target: 对象所属的角色/舞台
+            length: ID 长度（仅 random 模式使用）
+
+        Returns:
+            str: 新 ID
+        """
+
+    @abstractmethod
+    def named_id(self, namespace: str, name: str) -> str:
+        """分配由名称决定的 ID（如广播），与使用顺序无关"""
+
+    def scope(self, target: Optional[Dict[str, Any]]) -> str:
+        """登记 target 并返回其 ID 作用域标识
+
+        同一作用域标识下，相同的分配顺序得到相同的 ID 序列；增量编译用它判断
+        缓存的 target 是否仍可复用。random 模式没有作用域，返回空字符串。
+        """
+        return ""
+
+    def restore_scope(self, target: Optional[Dict[str, Any]], scope: str) -> None:
+        """让 target 使用另一个分配器（通常在其他进程中）登记的作用域
+
+        并行编译时，主进程按声明顺序登记作用域，工作进程据此为同一角色生成
+        与串行编译相同的 ID。
+
+        Args:
+            target: 本分配器中的角色
+            scope: 主进程中 scope() 的返回值
+        """
+
+
+class RandomIdAllocator(IdAllocator):
+    """随机 ID（原先的行为）
+
+    按名称分配的 ID 由随机盐派生：同一次编译内（包括并行编译的各个工作进程，
+    它们共享 seed）同名广播得到相同 ID，不同次编译之间仍然随机。
+    """
+
+    mode = "random"
+
+    def __init__(self, seed: str = "") -> None:
+        self.seed = seed or ''.join(random.choices(ID_ALPHABET, k=20))
+
+    def new_id(self, target: Optional[Dict[str, Any]] = None, length: int = 20) -> str:
+        return ''.join(random.choices(ID_ALPHABET, k=length))
+
+    def named_id(self, namespace: str, name: str) -> str:
+        return hash_id(f"{self.seed}\0{namespace}\0{name}", 20)
+
+
+class CounterIdAllocator(IdAllocator):
+    """计数器 ID：target 前缀 + base62 计数器"""
+
+    mode = "counter"
+    PREFIX_LENGTH = 3
+    NAMED_LENGTH = 8
+
+    def __init__(self, seed: str = "") -> None:
+        self.seed = seed
+        # id(target) -> (target, 前缀)；保存 target 引用，避免 id() 被复用
+        self._prefixes: Dict[int, Tuple[Optional[Dict[str, Any]], str]] = {}
+        self._counters: Dict[str, int] = {}
+        self._name_counts: Dict[str, int] = {}
+        self._named: Dict[Tuple[str, str], str] = {}
+        self._issued_named: Set[str] = set()
+
+    def prefix(self, target: Optional[Dict[str, Any]]) -> str:
+        """获取 target 的 ID 前缀（首次使用时由名称和同名序号派生）"""
+        entry = self._prefixes.get(id(target))
+        if entry is not None and entry[0] is target:
+            return entry[1]
+        name = target.get("name", "") if target is not None else ""
+        occurrence = self._name_counts.get(name, 0)
+        self._name_counts[name] = occurrence + 1
+
+        used = {prefix for _, prefix in self._prefixes.values()}
+        salt = 0
+        while True:
+            prefix = hash_id(f"{self.seed}\0{name}\0{occurrence}\0{salt}", self.PREFIX_LENGTH)
+            if prefix not in used:
+                break
+            salt += 1
+        self._prefixes[id(target)] = (target, prefix)
+        return prefix
+
+    def scope(self, target: Optional[Dict[str, Any]]) -> str:
+        return f"{self.mode}:{self.prefix(target)}"
+
+    def restore_scope(self, target: Optional[Dict[str, Any]], scope: str) -> None:
+        prefix = scope.split(":", 1)[1]
+        self._prefixes[id(target)] = (target, prefix)
+
+    def next_number(self, target: Optional[Dict[str, Any]]) -> Tuple[str, int]:
+        """返回 (前缀, 该 target 的下一个序号)"""
+        prefix = self.prefix(target)
+        number = self._counters.get(prefix, 0)
+        self._counters[prefix] = number + 1
+        return prefix, number
+
+    def new_id(self, target: Optional[Dict[str, Any]] = None, length: int = 20) -> str:
+        prefix, number = self.next_number(target)
+        # 前缀定长，前缀 + 序号的拼接不会产生歧义
+        return prefix + to_base62(number)
+
+    def named_id(self, namespace: str, name: str) -> str:
+        key = (namespace, name)
+        named = self._named.get(key)
+        if named is None:
+            salt = 0
+            while True:
+                named = hash_id(f"{self.seed}\0{namespace}\0{name}\0{salt}", self.NAMED_LENGTH)
+                if named not in self._issued_named:
+                    break
+                salt += 1
+            self._named[key] = named
+            self._issued_named.add(named)
+        return named
+
+
+class ReproducibleIdAllocator(CounterIdAllocator):
+    """可复现 ID：计数器编号经哈希得到 20 位 Scratch 风格 ID"""
+
+    mode = "reproducible"
+    NAMED_LENGTH = 20
+
+    def __init__(self, seed: str = "") -> None:
+        super().__init__(seed)
+        self._issued: Set[str] = set()
+
+    def new_id(self, target: Optional[Dict[str, Any]] = None, length: int = 20) -> str:
+        prefix, number = self.next_number(target)
+        while True:
+            new = hash_id(f"{self.seed}\0{prefix}\0{number}", 20)
+            if new not in self._issued:
+                break
+            # 极少发生的哈希冲突：换下一个序号
+            prefix, number = self.next_number(target)
+        self._issued.add(new)
+        return new
+
+
+def create_id_allocator(mode: str = DEFAULT_ID_MODE, seed: str = "") -> IdAllocator:
+    """根据模式名创建 ID 分配器
+
+    Args:
+        mode: "counter"、"reproducible" 或 "random"
+        seed: 确定性模式的种子（相同种子 + 相同源码 = 相同 ID）；random 模式下为
+            按名称分配 ID 的盐，为空时随机生成
+
+    Returns:
+        IdAllocator: 分配器实例
+
+    Raises:
+        ValueError: 未知的模式
+    """
+    if mode == "counter":
+        return CounterIdAllocator(seed)
+    if mode == "reproducible":
+        return ReproducibleIdAllocator(seed)
+    if mode == "random":
+        return RandomIdAllocator(seed)
+    raise ValueError(f"未知的 ID 模式: {mode}（可选: {', '.join(ID_MODES)}）")
@@ -0,0 +1,325 @@
+"""
+造型图片缓存 - 按内容寻址的磁盘缓存，保存 PIL 处理后的 PNG
+
+AssetManager.add_image 每次编译都要用 PIL 解码位图、按需缩放并重新编码为 PNG。处理结果只取决于
+源文件内容、缩放设置和编码设置，以它们的哈希为键缓存最终的 PNG、rotationCenter 和 MD5 文件名，
+再次编译时读取缓存的 PNG（校验大小和 MD5），不再调用 PIL。读取的内容由 AssetManager 写入本次编译的
+暂存目录，项目不引用缓存中的文件：同时编译的其他进程随时可能淘汰它。
+
+每个条目是 <键>.json（元数据）和 <键>.png 两个文件。AssetManager 在多个线程中处理造型时共用一个 ImageCache，
+统计和淘汰由锁保护。总大小超过 max_bytes 时按最近使用时间
+（元数据文件的修改时间，命中时更新；没有元数据时为 PNG 的修改时间）淘汰最久未使用的条目。查看和清理缓存：
+
+    python -m compiler.imagecache                 # 条目数和总大小
+    python -m compiler.imagecache --prune 64      # 淘汰到 64 MB 以内
+    python -m compiler.imagecache --clear         # 清空
+"""
+import argparse
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from .cache import fingerprint, get_cache_dir, read_json, write_bytes_atomic, write_json
+
+# 缓存格式版本，格式变化时递增
+IMAGE_CACHE_VERSION = 1
+
+# 默认的缓存大小上限
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+@dataclass
+class ImageCacheStats:
+    """造型图片缓存统计"""
+    hits: int = 0
+    misses: int = 0
+    # 写入的新条目数
+    stores: int = 0
+    # 因超出大小上限淘汰的条目数
+    evictions: int = 0
+
+    def merge(self, other: 'ImageCacheStats') -> None:
+        """累加另一份统计（如并行编译工作进程的统计）"""
+        self.hits += other.hits
+        self.misses += other.misses
+        self.stores += other.stores
+        self.evictions += other.evictions
+
+
+@dataclass
+class CachedImage:
+    """一个缓存条目
+
+    Attributes:
+        md5ext: 资源文件名（PNG 内容的 MD5 + 扩展名）
+        data: 缓存的 PNG 内容（已校验 MD5）
+        rotation_center: 造型的 (rotationCenterX, rotationCenterY)
+        recipe: 处理方式，见 AssetSource.recipe
+    """
+    md5ext: str
+    data: bytes
+    rotation_center: Tuple[int, int]
+    recipe: Optional[Tuple[Any, ...]] = None
+
+
+@dataclass
+class CacheEntry:
+    """磁盘上的条目（供清理和查看）"""
+    key: str
+    size: int
+    mtime: float
+
+
+class ImageCache:
+    """造型图片的磁盘缓存
+
+    Args:
+        directory: 缓存目录，默认为 get_cache_dir("images")；禁用磁盘缓存时为 None
+        max_bytes: 缓存总大小上限，写入后超出时淘汰最久未使用的条目
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory if directory is not None else get_cache_dir("images")
+        self.max_bytes = max_bytes
+        self.stats = ImageCacheStats()
+        # 本次编译读取或写入过的条目，自动淘汰时跳过（本次编译刚用过，很可能再次用到）
+        self._pinned: Set[str] = set()
+        # 缓存总大小，第一次写入时扫描目录得到
+        self._total: Optional[int] = None
+        self._lock = threading.RLock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # 传给并行编译的工作进程时只带配置，统计由工作进程各自记录后合并
+        return {"directory": self.directory, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.directory = state["directory"]
+        self.max_bytes = state["max_bytes"]
+        self.stats = ImageCacheStats()
+        self._pinned = set()
+        self._total = None
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用磁盘缓存"""
+        return self.directory is not None
+
+    @staticmethod
+    def key(source_digest: str, settings: Dict[str, Any]) -> str:
+        """缓存键
+
+        Args:
+            source_digest: 源文件内容的 SHA-256
+            settings: 影响处理结果的设置（缩放和编码参数）
+        """
+        return fingerprint(IMAGE_CACHE_VERSION, source_digest, settings)
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key[:2], key)
+        return f"{base}.json", f"{base}.png"
+
+    def load(self, key: str) -> Optional[CachedImage]:
+        """读取缓存条目并标记为最近使用，不存在、损坏或内容与 MD5 文件名不符时返回 None"""
+        if not self.enabled:
+            return None
+        meta_path, png_path = self._paths(key)
+        meta = read_json(meta_path)
+        data = _read_verified(png_path, meta) if isinstance(meta, dict) \
+            and meta.get("version") == IMAGE_CACHE_VERSION else None
+        if data is None:
+            with self._lock:
+                self.stats.misses += 1
+            return None
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        with self._lock:
+            self.stats.hits += 1
+            self._pinned.add(key)
+        recipe = meta.get("recipe")
+        return CachedImage(meta["md5ext"], data, tuple(meta["rotation_center"]),
+                           tuple(recipe) if recipe is not None else None)
+
+    def store(self, key: str, data: bytes, md5ext: str, rotation_center: Tuple[int, int],
+              recipe: Optional[Tuple[Any, ...]] = None) -> bool:
+        """写入缓存条目（先写 PNG 再写元数据），超出大小上限时淘汰旧条目
+
+        相同的键对应相同的内容，本次编译已写入或读取过的条目不再重复写入。
+
+        Returns:
+            是否写入（或已有）该条目；未启用或写入失败时为 False
+        """
+        if not self.enabled:
+            return False
+        meta_path, png_path = self._paths(key)
+        with self._lock:
+            if key in self._pinned and _has_size(png_path, len(data)):
+                return True
+            if not write_bytes_atomic(png_path, data) or not write_json(meta_path, {
+                "version": IMAGE_CACHE_VERSION,
+                "md5ext": md5ext,
+                "size": len(data),
+                "rotation_center": list(rotation_center),
+                "recipe": list(recipe) if recipe is not None else None,
+            }):
+                return False
+            self.stats.stores += 1
+            self._pinned.add(key)
+            if self._total is None:
+                self._total = self.total_size()
+            else:
+                self._total += _entry_size(meta_path, png_path)
+            if self._total > self.max_bytes:
+                self.prune(self.max_bytes)
+        return True
+
+    def entries(self) -> List[CacheEntry]:
+        """磁盘上的全部条目
+
+        写入 PNG 后、写入元数据前中断（或元数据被删除）时只剩下 <键>.png，它同样是一个条目，
+        按 PNG 的修改时间排序，计入总大小并可以被淘汰。
+        """
+        if not self.enabled or not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for shard in sorted(os.listdir(self.directory)):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            keys = sorted({os.path.splitext(name)[0] for name in os.listdir(shard_dir)
+                           if name.endswith((".json", ".png"))})
+            for key in keys:
+                meta_path, png_path = self._paths(key)
+                mtime = _mtime(meta_path)
+                if mtime is None:
+                    mtime = _mtime(png_path)
+                if mtime is None:
+                    continue
+                entries.append(CacheEntry(key, _entry_size(meta_path, png_path), mtime))
+        return entries
+
+    def total_size(self) -> int:
+        """全部条目的字节数"""
+        return sum(entry.size for entry in self.entries())
+
+    def prune(self, max_bytes: int) -> int:
+        """按最近使用时间淘汰条目，直到总大小不超过 max_bytes
+
+        本次编译用到的条目不淘汰。
+
+        Returns:
+            int: 删除的条目数
+        """
+        with self._lock:
+            return self._prune(max_bytes)
+
+    def _prune(self, max_bytes: int) -> int:
+        entries = self.entries()
+        total = sum(entry.size for entry in entries)
+        removed = 0
+        for entry in sorted(entries, key=lambda item: item.mtime):
+            if total <= max_bytes:
+                break
+            if entry.key in self._pinned:
+                continue
+            for path in self._paths(entry.key):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            total -= entry.size
+            removed += 1
+        self.stats.evictions += removed
+        self._total = total
+        return removed
+
+    @property
+    def pinned(self) -> Set[str]:
+        """本次编译读取或写入过的条目的键"""
+        with self._lock:
+            return set(self._pinned)
+
+    def merge(self, stats: ImageCacheStats, pinned: Set[str]) -> None:
+        """合并并行编译工作进程的统计和用到的条目（这些条目同样不能被淘汰）"""
+        with self._lock:
+            self.stats.merge(stats)
+            self._pinned.update(pinned)
+
+    def clear(self) -> int:
+        """删除全部条目，返回删除的条目数"""
+        return self.prune(0)
+
+
+def _has_size(path: str, size: Any) -> bool:
+    """文件是否存在且大小为 size"""
+    try:
+        return os.path.getsize(path) == size
+    except OSError:
+        return False
+
+
+def _mtime(path: str) -> Optional[float]:
+    """文件的修改时间，不存在时返回 None"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _read_verified(path: str, meta: Dict[str, Any]) -> Optional[bytes]:
+    """读取缓存的 PNG，大小或 MD5 与元数据不符时返回 None"""
+    md5ext = meta.get("md5ext")
+    if not isinstance(md5ext, str) or not _has_size(path, meta.get("size")):
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) != meta["size"] or hashlib.md5(data).hexdigest() != os.path.splitext(md5ext)[0]:
+        return None
+    return data
+
+
+def _entry_size(*paths: str) -> int:
+    """条目文件的总字节数（不存在的文件按 0 计）"""
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """python -m compiler.imagecache：查看和清理造型图片缓存"""
+    arg_parser = argparse.ArgumentParser(prog="python -m compiler.imagecache",
+                                         description="查看和清理造型图片缓存")
+    arg_parser.add_argument("--dir", help="缓存目录，默认为用户缓存目录下的 images/")
+    arg_parser.add_argument("--prune", type=float, metavar="MB", help="按最近使用时间淘汰到 MB 以内")
+    arg_parser.add_argument("--clear", action="store_true", help="删除全部条目")
+    args = arg_parser.parse_args(argv)
+
+    cache = ImageCache(args.dir)
+    if not cache.enabled:
+        print("⚠️ 磁盘缓存已禁用（SCRATCHLANG_CACHE_DIR 为空）")
+        return 1
+    if args.clear:
+        print(f"🗑️  删除 {cache.clear()} 个条目")
+    elif args.prune is not None:
+        print(f"🗑️  淘汰 {cache.prune(int(args.prune * 1024 * 1024))} 个条目")
+
+    entries = cache.entries()
+    total = sum(entry.size for entry in entries)
+    print(f"📁 {cache.directory}")
+    print(f"   {len(entries)} 个条目，共 {total / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
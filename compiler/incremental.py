@@ -0,0 +1,394 @@
+"""
+增量编译 - 按角色区段缓存编译结果
+
+源码以角色声明（# 角色名）和舞台声明（@）为界划分区段，脚本遇到这两种行即
+结束，因此每个角色区段可以单独解析。增量模式下，每个角色区段的缓存键由以下
+内容计算：
+
+- 规范化后的区段源码（去掉空行、// 注释行和行尾空白）
+- 区段引用的 #code# 代码、造型/音效文件内容的哈希
+- 编译器源码、资源选项、target 的 ID 作用域
+- 同名角色此前定义的自定义积木
+
+命中时直接复用缓存的 target JSON 和资源。角色对全局状态的依赖记录在构建器的
+依赖日志（SB3Builder.journal）中：对舞台变量/列表的查找结果在复用前逐条校验，
+舞台变量改动后依赖它的角色会自动重建；新增广播、扩展等副作用在复用时按原顺序重放。
+
+舞台区段总是重新编译：它是其他角色的依赖来源，并且可以在文件中多次出现。
+"""
+import functools
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .assets import CHUNK_SIZE, AssetSource
+from .blockrecord import load_blocks
+from .cache import fingerprint, get_cache_dir, read_json, write_chunks_atomic, write_json
+from .exceptions import AssetError, ScratchLangError
+from .symbols import SymbolTable, BROADCAST
+
+INCREMENTAL_VERSION = 2
+
+# 会修改舞台的关键字：包含它们的角色区段不缓存
+STAGE_KEYWORDS = ('背景', 'backdrop')
+# 引用资源文件的关键字：文件内容计入缓存键
+ASSET_KEYWORDS = ('造型', 'costume', '音效', 'sound')
+
+_INLINE_CODE_RE = re.compile(r'__INLINE_CODE_(\d+)__')
+
+
+@dataclass
+class Section:
+    """源码区段 lines[start:end]；sprite 为角色名，舞台和文件开头的区段为 None"""
+    start: int
+    end: int
+    sprite: Optional[str] = None
+
+
+@dataclass
+class IncrementalStats:
+    """一次增量编译的统计"""
+    reused: List[str] = field(default_factory=list)
+    rebuilt: List[str] = field(default_factory=list)
+
+
+def split_sections(lines: List[str]) -> List[Section]:
+    """按角色/舞台声明划分区段
+
+    Args:
+        lines: 预处理后的逻辑行
+
+    Returns:
+        List[Section]: 按源码顺序排列、首尾相接的区段
+    """
+    sections = []
+    start = 0
+    sprite = None
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith(('#', '@')):
+            if index > start:
+                sections.append(Section(start, index, sprite))
+            start = index
+            sprite = stripped[1:].strip() if stripped.startswith('#') else None
+    if len(lines) > start:
+        sections.append(Section(start, len(lines), sprite))
+    return sections
+
+
+def significant_lines(lines: List[str], start: int, end: int) -> List[int]:
+    """lines[start:end] 中计入缓存键的行（非空、非 // 注释行）的下标"""
+    return [index for index in range(start, end)
+            if lines[index].strip() and not lines[index].strip().startswith('//')]
+
+
+def line_ranks(block_lines: Dict[str, int], lines: List[str], start: int, end: int) -> Dict[str, int]:
+    """把积木所在的逻辑行换成区段内有效行的序号
+
+    缓存键忽略空行和注释行，因此缓存条目按有效行的序号记录积木位置，
+    复用时再换回当前源码中的逻辑行。
+
+    Args:
+        block_lines: {积木ID: 逻辑行下标}
+        lines: 预处理后的逻辑行
+        start: 区段起始行
+        end: 区段结束行（不含）
+
+    Returns:
+        Dict[str, int]: {积木ID: 有效行序号}，只包含区段内的积木
+    """
+    ranks = {index: rank for rank, index in enumerate(significant_lines(lines, start, end))}
+    return {block_id: ranks[index] for block_id, index in block_lines.items() if index in ranks}
+
+
+@functools.lru_cache(maxsize=1)
+def compiler_fingerprint() -> str:
+    """编译器源码的哈希：编译器升级后旧的区段缓存自动失效"""
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith('.py'):
+            digest.update(name.encode('utf-8'))
+            with open(os.path.join(package_dir, name), 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class SectionCache:
+    """区段缓存的磁盘存储
+
+    条目按缓存键存放在 sections/ 下，资源按 md5ext 文件名存放在 assets/ 下。
+
+    Args:
+        directory: 缓存目录，默认为 get_cache_dir("incremental")；禁用磁盘缓存时为 None
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory if directory is not None else get_cache_dir("incremental")
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用磁盘缓存"""
+        return self.directory is not None
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, "sections", key[:2], f"{key}.json")
+
+    def _asset_path(self, name: str) -> str:
+        return os.path.join(self.directory, "assets", name)
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目，不存在或版本不符时返回 None"""
+        if not self.enabled:
+            return None
+        entry = read_json(self._entry_path(key))
+        if not isinstance(entry, dict) or entry.get("version") != INCREMENTAL_VERSION:
+            return None
+        return entry
+
+    def store(self, key: str, entry: Dict[str, Any]) -> bool:
+        """写入缓存条目"""
+        if not self.enabled:
+            return False
+        return write_json(self._entry_path(key), dict(entry, version=INCREMENTAL_VERSION))
+
+    def load_asset(self, name: str) -> Optional[AssetSource]:
+        """缓存的资源（引用缓存文件，不读入内容）"""
+        if not self.enabled:
+            return None
+        try:
+            return AssetSource.from_file(name, self._asset_path(name))
+        except OSError:
+            return None
+
+    def store_asset(self, name: str, asset: AssetSource) -> bool:
+        """分块写入资源内容（文件名即内容哈希，已存在时跳过）"""
+        if not self.enabled:
+            return False
+        path = self._asset_path(name)
+        if os.path.exists(path):
+            return True
+        try:
+            return write_chunks_atomic(path, asset.chunks())
+        except AssetError:
+            return False
+
+
+class IncrementalCompiler:
+    """按区段驱动 ScratchLangParser，复用未改动角色的编译结果
+
+    Args:
+        parser: 解析器（已完成预处理和扩展导入）
+        cache: 区段缓存；为 None 时不读写缓存
+    """
+
+    def __init__(self, parser: Any, cache: Optional[SectionCache]) -> None:
+        self.parser = parser
+        self.builder = parser.builder
+        self.cache = cache
+        self._file_digests: Dict[str, Optional[str]] = {}
+
+    def run(self, lines: List[str]) -> IncrementalStats:
+        """编译全部区段
+
+        Args:
+            lines: 预处理后的逻辑行
+
+        Returns:
+            IncrementalStats: 复用和重建的角色
+        """
+        stats = IncrementalStats()
+        for section in split_sections(lines):
+            if section.sprite is None:
+                self.parser._parse_lines(lines, section.start, section.end)
+                continue
+
+            # 声明行按原逻辑处理：必要时创建舞台、结束上一个角色、创建新角色
+            self.parser._parse_lines(lines, section.start, section.start + 1)
+            target = self.builder.current_sprite
+            key = self.section_key(lines, section, target)
+            if self._reuse(key, target, lines, section):
+                stats.reused.append(target['name'])
+                continue
+            self._compile_section(lines, section, target, key)
+            stats.rebuilt.append(target['name'])
+        return stats
+
+    def _reuse(self, key: Optional[str], target: Dict[str, Any], lines: List[str], section: Section) -> bool:
+        """尝试从缓存复用角色区段"""
+        if key is None:
+            return False
+        entry = self.cache.load(key)
+        if entry is None or not self._replay(entry, target):
+            return False
+        self._restore_lines(entry, lines, section, target)
+        print(f"♻️ [{target['name']}] 未修改，复用增量缓存")
+        return True
+
+    def _compile_section(self, lines: List[str], section: Section, target: Dict[str, Any],
+                         key: Optional[str]) -> None:
+        """在当前进程中编译角色区段（声明行已处理），并写入缓存"""
+        journal = self.builder.journal = []
+        try:
+            self.parser._parse_lines(lines, section.start + 1, section.end)
+        finally:
+            self.builder.journal = None
+        # 区段中途切换到了舞台（如 "背景:"）时不缓存
+        if key is not None and self.builder.current_sprite is target:
+            # 缓存条目要记录资源的最终文件名，先等待区段登记的资源处理完成
+            self.builder.resolve_assets()
+            block_lines = self.parser.block_lines.get(target["name"], {})
+            self._store(key, target, journal, line_ranks(block_lines, lines, section.start, section.end))
+
+    def section_key(self, lines: List[str], section: Section, target: Dict[str, Any]) -> Optional[str]:
+        """计算角色区段的缓存键
+
+        Args:
+            lines: 预处理后的逻辑行
+            section: 角色区段
+            target: 声明行创建的角色
+
+        Returns:
+            缓存键；区段不可缓存时返回 None
+        """
+        if self.cache is None or not self.cache.enabled:
+            return None
+        normalized = []
+        inline_code = []
+        asset_digests = []
+        js_blocks = self.parser.js_blocks
+        for line in lines[section.start:section.end]:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('//'):
+                continue
+            normalized.append(line.rstrip())
+
+            for match in _INLINE_CODE_RE.finditer(stripped):
+                index = int(match.group(1)) - 1
+                inline_code.append(js_blocks[index] if index < len(js_blocks) else None)
+
+            if ':' in stripped:
+                keyword, value = (part.strip() for part in stripped.split(':', 1))
+                if keyword in STAGE_KEYWORDS:
+                    return None
+                if keyword in ASSET_KEYWORDS:
+                    try:
+                        path = self.parser.resolve_path(value)
+                    except ScratchLangError:
+                        return None
+                    asset_digests.append(self._file_digest(path))
+
+        asset_manager = self.builder.asset_manager
+        return fingerprint(
+            INCREMENTAL_VERSION,
+            compiler_fingerprint(),
+            self.builder.id_allocator.scope(target),
+            [asset_manager.auto_scale_costumes, asset_manager.max_costume_size, asset_manager.png_effort,
+             self.parser.ast_converter.fold_constants],
+            normalized,
+            inline_code,
+            asset_digests,
+            self.parser.custom_blocks.get(target["name"]),
+        )
+
+    def _file_digest(self, path: str) -> Optional[str]:
+        """资源文件内容的哈希，文件不存在时为 None"""
+        if path not in self._file_digests:
+            try:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                self._file_digests[path] = digest.hexdigest()
+            except OSError:
+                self._file_digests[path] = None
+        return self._file_digests[path]
+
+    def _store(self, key: str, target: Dict[str, Any], journal: List[tuple],
+               block_lines: Dict[str, int]) -> None:
+        """保存刚编译完成的角色区段（block_lines 为积木所在的有效行序号，见 line_ranks）"""
+        asset_names = [item["md5ext"] for item in target["costumes"] + target["sounds"]]
+        for name in asset_names:
+            asset = self.builder.asset_manager.assets.get(name)
+            if asset is None or not self.cache.store_asset(name, asset):
+                return
+        self.cache.store(key, {
+            "target": target,
+            "custom_blocks": self.parser.custom_blocks.get(target["name"]),
+            "journal": journal,
+            "assets": asset_names,
+            "block_lines": block_lines,
+        })
+
+    def _restore_lines(self, entry: Dict[str, Any], lines: List[str], section: Section,
+                       target: Dict[str, Any]) -> None:
+        """复用编译结果后，把其中积木的有效行序号换回当前源码的逻辑行"""
+        indices = significant_lines(lines, section.start, section.end)
+        self.parser.block_lines.setdefault(target["name"], {}).update(
+            (block_id, indices[rank]) for block_id, rank in entry["block_lines"].items() if rank < len(indices))
+
+    def _replay(self, entry: Dict[str, Any], target: Dict[str, Any],
+                asset_data: Optional[Dict[str, AssetSource]] = None) -> bool:
+        """校验依赖并复用编译结果（缓存条目或工作进程的结果）
+
+        先检查全部依赖（不修改项目），全部满足后再写入 target 并重放副作用。
+
+        Args:
+            entry: 编译结果，格式与缓存条目相同
+            target: 声明行创建的空角色，复用时原地填充
+            asset_data: 随结果附带的资源数据，缺少的资源从缓存读取
+
+        Returns:
+            bool: 是否已复用；False 时项目未被修改，应重新编译该区段
+        """
+        builder = self.builder
+        stage_symbols = builder.symbols(builder.stage)
+        pending_broadcasts: Dict[str, str] = {}
+        for event in entry["journal"]:
+            if event[0] == "lookup":
+                _, kind, name, symbol_id = event
+                symbol = stage_symbols.lookup(kind, name)
+                if (symbol.id if symbol else None) != symbol_id:
+                    return False
+            elif event[0] == "broadcast":
+                _, name, broadcast_id = event
+                symbol = stage_symbols.lookup(BROADCAST, name)
+                current = symbol.id if symbol else pending_broadcasts.get(name)
+                if current is None:
+                    current = pending_broadcasts[name] = builder.id_allocator.named_id(BROADCAST, name)
+                if current != broadcast_id:
+                    return False
+
+        assets = {}
+        for name in entry["assets"]:
+            asset = builder.asset_manager.assets.get(name)
+            if asset is None and asset_data is not None:
+                asset = asset_data.get(name)
+            if asset is None and self.cache is not None:
+                asset = self.cache.load_asset(name)
+            if asset is None:
+                return False
+            assets[name] = asset
+
+        layer_order = target["layerOrder"]
+        target.clear()
+        target.update(entry["target"])
+        # 缓存条目中的积木是 JSON 字典
+        load_blocks(target["blocks"])
+        target["layerOrder"] = layer_order
+        builder.symbol_tables[id(target)] = SymbolTable.from_target(target)
+        builder.has_custom_costume = bool(target["costumes"])
+        builder.asset_manager.assets.update(assets)
+        if entry["custom_blocks"] is not None:
+            self.parser.custom_blocks[target["name"]] = entry["custom_blocks"]
+
+        for event in entry["journal"]:
+            if event[0] == "broadcast":
+                builder.add_broadcast(event[1])
+            elif event[0] == "extension":
+                builder.add_extension(event[1])
+            elif event[0] == "extension_code":
+                builder.add_custom_extension_code(event[1], event[2])
+        return True
@@ -0,0 +1,375 @@
+"""
+自定义积木内联 - 把对小自定义积木的调用替换为积木体的副本
+
+每次调用自定义积木，Scratch 虚拟机都要压栈、绑定参数、查找定义，在紧凑的 "重复" 循环中
+调用小积木时这部分开销很明显。本遍（默认关闭）把调用替换为积木体的副本，参数积木换成
+调用处的实际参数：
+
+- 字面量参数直接代入
+- 只在积木体第一个积木的输入中用到一次的表达式参数直接代入（求值时机与调用时相同）
+- 其余表达式参数先用 "设置变量" 存入临时变量，积木体中读取临时变量，保证只求值一次
+
+以下情况不内联：积木体超过 max_size 个积木、积木体中调用了其他自定义积木（包括递归；
+被调用的积木内联后会在下一轮重新检查）、有布尔参数或无法对应的参数积木、积木体中有
+"停止此脚本"（在积木体中它只从调用返回，内联后会停止调用处的整个脚本）。积木体中有循环、
+等待或扩展积木（可能让出）时，只在不需要临时变量、且不改变 "运行时不刷新屏幕" 语义时内联：
+开启了 warp 的积木只内联到同样处于 warp 中的调用处。
+
+内联只改写调用处，定义保留；没有调用的定义可由死代码消除（deadcode.py）删除。
+"""
+import copy
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from .blockgraph import (
+    Blocks, CORE_PREFIXES, LITERAL_PRIMITIVES, SUBSTACK_INPUTS, child_ids, is_linked, literal_text,
+    referenced_ids, replace_in_stack, stack,
+)
+from .blockrecord import is_block, new_block
+from .constants import STOP_THIS_SCRIPT
+from .ids import create_id_allocator
+from .symbols import VARIABLE, SymbolTable
+from .warp import BOUNDED_LOOPS, UNBOUNDED_LOOPS, YIELDING_OPCODES
+
+# 默认可内联的积木体大小（积木数，不含定义和原型）
+DEFAULT_MAX_SIZE = 12
+
+# 估计代价（以执行一个积木为单位）：调用积木本身加压栈出栈，以及每个参数的绑定
+CALL_COST = 2
+ARGUMENT_COST = 1
+
+# 每次循环都会重新求值输入的积木（它们的输入不能直接代入表达式参数）
+_REEVALUATING = ("control_repeat_until", "control_while", "control_forever", "control_wait_until",
+                 "control_for_each")
+
+_TEXT_PRIMITIVE = 10
+
+
+@dataclass
+class InlineStats:
+    """内联统计"""
+    # 被替换的调用数
+    calls: int = 0
+    # 新建的临时变量数
+    temporaries: int = 0
+    # 积木数的变化（负数为减少）
+    block_delta: int = 0
+    # 估计的每次触发脚本时执行积木数的变化（按循环次数字面量展开，负数为减少）
+    cost_delta: float = 0
+    # 没有内联的自定义积木及原因（"角色/积木签名"）
+    skipped: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _Callee:
+    """自定义积木的积木体分析结果"""
+    proccode: str
+    argument_ids: List[str]
+    argument_names: List[str]
+    warp: bool
+    first_id: Optional[str]
+    # 参数名 -> 积木体中引用它的参数积木
+    uses: Dict[str, List[str]]
+    # 积木体中的积木是否可能让出（循环、等待、扩展积木）
+    yields: bool
+    # 只在积木体第一个积木求值时读取的参数积木
+    first_evaluation: Set[str]
+
+
+class Inliner:
+    """自定义积木内联器"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE,
+                 new_id: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 symbols: Optional[Callable[[Dict[str, Any]], SymbolTable]] = None) -> None:
+        """
+        Args:
+            max_size: 可内联的积木体的最大积木数
+            new_id: 为 target 分配新积木 ID 的函数，默认使用独立的计数器分配器
+            symbols: 获取 target 符号表的函数（如 SB3Builder.symbols），临时变量通过它登记；
+                默认按 target 内容新建符号表
+        """
+        self.max_size = max_size
+        self.new_id = new_id or create_id_allocator().new_id
+        self.symbols = symbols or SymbolTable.from_target
+        self.stats = InlineStats()
+
+    def inline_project(self, project: Dict[str, Any]) -> InlineStats:
+        """内联项目中所有 target 的自定义积木调用，返回累计统计"""
+        stage = next((target for target in project["targets"] if target.get("isStage")), None)
+        before = sum(len(target["blocks"]) for target in project["targets"])
+        for target in project["targets"]:
+            self.inline(target, stage)
+        self.stats.block_delta += sum(len(target["blocks"]) for target in project["targets"]) - before
+        if self.stats.calls:
+            print(f"📥 内联了 {self.stats.calls} 处自定义积木调用，积木数变化 {self.stats.block_delta:+d}，"
+                  f"估计执行代价变化 {self.stats.cost_delta:+g}")
+        return self.stats
+
+    def inline(self, target: Dict[str, Any], stage: Optional[Dict[str, Any]] = None) -> None:
+        """内联一个 target 中的调用，直到没有可以内联的调用"""
+        _TargetInliner(self, target, stage).run()
+
+
+class _TargetInliner:
+    """在一个 target 上执行内联"""
+
+    def __init__(self, inliner: Inliner, target: Dict[str, Any], stage: Optional[Dict[str, Any]]) -> None:
+        self.inliner = inliner
+        self.stats = inliner.stats
+        self.target = target
+        self.blocks: Blocks = target["blocks"]
+        self.stage = stage
+        # (积木签名, 参数名) -> 临时变量 (名称, ID)
+        self.temporaries: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self.definitions: Dict[str, str] = {}
+        for block_id, block in self.blocks.items():
+            if is_block(block) and block["opcode"] == "procedures_definition":
+                prototype = self._prototype(block)
+                if prototype is not None:
+                    self.definitions.setdefault(prototype["mutation"]["proccode"], block_id)
+
+    def run(self) -> None:
+        changed = True
+        while changed:
+            changed = False
+            callees: Dict[str, Union[_Callee, str]] = {}
+            for call_id in [block_id for block_id, block in self.blocks.items()
+                            if is_block(block) and block["opcode"] == "procedures_call"]:
+                call = self.blocks.get(call_id)
+                proccode = call.get("mutation", {}).get("proccode") if call else None
+                if proccode not in self.definitions:
+                    continue
+                if proccode not in callees:
+                    callees[proccode] = self._analyze(proccode)
+                callee = callees[proccode]
+                name = f"{self.target['name']}/{proccode}"
+                reason = callee if isinstance(callee, str) else self._inline_call(call_id, callee)
+                if reason:
+                    self.stats.skipped.setdefault(name, reason)
+                    continue
+                changed = True
+                # 内联改变了调用所在积木体，重新分析
+                callees.clear()
+
+    # ==================== 分析 ====================
+
+    def _prototype(self, definition: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        value = definition["inputs"].get("custom_block")
+        prototype = self.blocks.get(value[1]) if value and isinstance(value[1], str) else None
+        return prototype if prototype is not None and "mutation" in prototype else None
+
+    def _analyze(self, proccode: str) -> Union[_Callee, str]:
+        """分析积木体，不能内联时返回原因"""
+        definition = self.blocks[self.definitions[proccode]]
+        mutation = self._prototype(definition)["mutation"]
+        try:
+            argument_ids = json.loads(mutation.get("argumentids", "[]"))
+            argument_names = json.loads(mutation.get("argumentnames", "[]"))
+        except (TypeError, ValueError):
+            return "参数信息无法解析"
+        if len(argument_ids) != len(argument_names) or len(set(argument_names)) != len(argument_names):
+            return "参数名无法对应"
+
+        body = list(self._tree(definition["next"])) if definition["next"] else []
+        if len(body) > self.inliner.max_size:
+            return f"积木太多（{len(body)} > {self.inliner.max_size}）"
+        uses: Dict[str, List[str]] = {name: [] for name in argument_names}
+        yields = False
+        for block_id in body:
+            opcode = self.blocks[block_id]["opcode"]
+            if opcode == "procedures_call":
+                callee = self.blocks[block_id].get("mutation", {}).get("proccode")
+                return "递归调用" if callee == proccode else "调用了其他自定义积木"
+            if opcode == "argument_reporter_boolean":
+                return "有布尔参数"
+            if opcode == "control_stop" and \
+                    (self.blocks[block_id]["fields"].get("STOP_OPTION") or [None])[0] == STOP_THIS_SCRIPT:
+                return "积木体中有停止此脚本"
+            if opcode == "argument_reporter_string_number":
+                argument = self.blocks[block_id]["fields"]["VALUE"][0]
+                if argument not in uses:
+                    return f"参数积木 {argument} 无法对应"
+                uses[argument].append(block_id)
+            elif opcode in YIELDING_OPCODES or opcode in UNBOUNDED_LOOPS or opcode in BOUNDED_LOOPS \
+                    or opcode in _REEVALUATING or not opcode.startswith(CORE_PREFIXES):
+                yields = True
+
+        first_evaluation: Set[str] = set()
+        first = self.blocks.get(definition["next"]) if definition["next"] else None
+        if first is not None and first["opcode"] not in _REEVALUATING:
+            for name, value in first["inputs"].items():
+                if name not in SUBSTACK_INPUTS:
+                    for child in referenced_ids(value):
+                        first_evaluation.update(self._tree(child))
+        return _Callee(proccode, argument_ids, argument_names, mutation.get("warp") in ("true", True),
+                       definition["next"], uses, yields, first_evaluation)
+
+    def _tree(self, first_id: str) -> List[str]:
+        """从 first_id 开始的积木栈及其输入、子栈中的全部积木"""
+        result = []
+        pending = [first_id]
+        while pending:
+            block_id = pending.pop()
+            block = self.blocks.get(block_id)
+            if not is_block(block):
+                continue
+            result.append(block_id)
+            if block["next"] is not None:
+                pending.append(block["next"])
+            pending.extend(child_ids(block))
+        return result
+
+    def _context(self, block_id: str) -> Tuple[bool, float]:
+        """调用处的 (是否处于 warp 中, 外层重复次数字面量之积)"""
+        multiplier = 1.0
+        child_id, parent_id = block_id, self.blocks[block_id]["parent"]
+        while parent_id is not None:
+            parent = self.blocks[parent_id]
+            if parent["opcode"] == "control_repeat" and parent["next"] != child_id:
+                times = literal_text(self.blocks, parent["inputs"].get("TIMES"))
+                try:
+                    multiplier *= max(0.0, round(float(times))) if times is not None else 1.0
+                except ValueError:
+                    pass
+            child_id, parent_id = parent_id, parent["parent"]
+        top = self.blocks[child_id]
+        if top["opcode"] == "procedures_definition":
+            prototype = self._prototype(top)
+            return bool(prototype and prototype["mutation"].get("warp") in ("true", True)), multiplier
+        return False, multiplier
+
+    # ==================== 改写 ====================
+
+    def _inline_call(self, call_id: str, callee: _Callee) -> Optional[str]:
+        """内联一处调用，不能内联时返回原因"""
+        call = self.blocks[call_id]
+        if not is_linked(self.blocks, call_id):
+            return "调用积木不在积木栈中"
+        plans: Dict[str, Tuple[str, Any]] = {}
+        for argument_id, name in zip(callee.argument_ids, callee.argument_names):
+            value = call["inputs"].get(argument_id)
+            if value is None:
+                return "调用缺少参数"
+            text = literal_text(self.blocks, value)
+            if text is not None:
+                plans[name] = ("literal", text)
+                continue
+            expression = [item for item in value[1:2] if isinstance(item, str)]
+            if any(not self.blocks[block_id]["opcode"].startswith(CORE_PREFIXES)
+                   for root in expression for block_id in self._tree(root)):
+                return "参数中有扩展积木"
+            uses = callee.uses[name]
+            if not uses:
+                plans[name] = ("drop", None)
+            elif len(uses) == 1 and uses[0] in callee.first_evaluation:
+                plans[name] = ("direct", value)
+            else:
+                plans[name] = ("temporary", value)
+
+        warp, multiplier = self._context(call_id)
+        needs_temporary = any(kind == "temporary" for kind, _ in plans.values())
+        if callee.yields and callee.warp and not warp:
+            return "开启了不刷新屏幕且积木体会让出，调用处没有开启"
+        if callee.yields and needs_temporary:
+            return "积木体会让出，参数不能存入临时变量"
+
+        # 先给临时变量赋值，再接上积木体的副本
+        chain: List[str] = []
+        for name, (kind, value) in plans.items():
+            if kind == "temporary":
+                variable = self._temporary(callee.proccode, name)
+                chain.append(self._assign(variable, value))
+                plans[name] = (kind, variable)
+        if callee.first_id is not None:
+            chain.append(self._copy(callee.first_id, None, plans))
+        for previous, following in zip(chain, chain[1:]):
+            last = list(stack(self.blocks, previous))[-1]
+            self.blocks[last]["next"] = following
+            self.blocks[following]["parent"] = last
+        replace_in_stack(self.blocks, call_id, chain[0] if chain else None)
+
+        self.stats.calls += 1
+        temporaries = len(chain) - (callee.first_id is not None)
+        saved = CALL_COST + ARGUMENT_COST * len(plans)
+        self.stats.cost_delta += (temporaries - saved) * multiplier
+        return None
+
+    def _new_id(self) -> str:
+        while True:
+            new_id = self.inliner.new_id(self.target)
+            if new_id not in self.blocks and new_id not in self.target["variables"]:
+                return new_id
+
+    def _temporary(self, proccode: str, name: str) -> Tuple[str, str]:
+        """(积木签名, 参数名) 对应的临时变量，同一积木的同一参数共用（内联的积木体不会让出）"""
+        key = (proccode, name)
+        if key not in self.temporaries:
+            tables = [self.inliner.symbols(owner) for owner in (self.target, self.stage) if owner is not None]
+            base = f"_内联_{proccode.split(' ')[0]}_{name}"
+            variable_name, number = base, 1
+            while any(table.lookup(VARIABLE, variable_name) for table in tables):
+                number += 1
+                variable_name = f"{base}_{number}"
+            variable_id = self._new_id()
+            tables[0].create(VARIABLE, variable_name, variable_id)
+            self.temporaries[key] = (variable_name, variable_id)
+            self.stats.temporaries += 1
+        return self.temporaries[key]
+
+    def _assign(self, variable: Tuple[str, str], value: List[Any]) -> str:
+        """生成 "设置临时变量为参数表达式" 积木"""
+        variable_name, variable_id = variable
+        block_id = self._new_id()
+        self.blocks[block_id] = new_block(
+            "data_setvariableto", {"VALUE": self._copy_expression(value, block_id, [_TEXT_PRIMITIVE, ""])},
+            {"VARIABLE": [variable_name, variable_id]})
+        return block_id
+
+    def _copy(self, block_id: str, parent_id: Optional[str],
+              plans: Optional[Dict[str, Tuple[str, Any]]] = None) -> str:
+        """复制积木（沿 next 复制后续积木），plans 不为 None 时按它替换参数积木"""
+        block = self.blocks[block_id]
+        new_id = self._new_id()
+        new = new_block(block["opcode"], None, copy.deepcopy(block["fields"]), parent_id, shadow=block["shadow"],
+                        mutation=copy.deepcopy(block["mutation"]) if "mutation" in block else None)
+        self.blocks[new_id] = new
+        for name, value in block["inputs"].items():
+            new["inputs"][name] = self._copy_input(value, new_id, plans)
+        if block["next"] is not None:
+            new["next"] = self._copy(block["next"], new_id, plans)
+        return new_id
+
+    def _copy_input(self, value: Any, parent_id: str, plans: Optional[Dict[str, Tuple[str, Any]]]) -> Any:
+        if not isinstance(value, list):
+            return copy.deepcopy(value)
+        reporter = self.blocks.get(value[1]) if len(value) > 1 and isinstance(value[1], str) else None
+        if plans is not None and reporter is not None and reporter["opcode"] == "argument_reporter_string_number":
+            return self._substitute(value, parent_id, plans[reporter["fields"]["VALUE"][0]])
+        return [value[0]] + [self._copy(item, parent_id, plans) if isinstance(item, str)
+                             else copy.deepcopy(item) for item in value[1:]]
+
+    def _substitute(self, value: List[Any], parent_id: str, plan: Tuple[str, Any]) -> Any:
+        """把积木体中引用参数积木的输入换成实际参数"""
+        kind, argument = plan
+        shadow = value[2] if len(value) > 2 else None
+        if isinstance(shadow, str):
+            shadow = self._copy(shadow, parent_id)
+        if kind == "literal":
+            primitive = shadow[0] if isinstance(shadow, list) and shadow[0] in LITERAL_PRIMITIVES \
+                else _TEXT_PRIMITIVE
+            return [1, [primitive, argument]]
+        if kind == "direct":
+            return self._copy_expression(argument, parent_id, shadow)
+        variable_name, variable_id = argument
+        reporter_id = self._new_id()
+        self.blocks[reporter_id] = new_block("data_variable", parent=parent_id,
+                                             fields={"VARIABLE": [variable_name, variable_id]})
+        return [3, reporter_id, shadow] if shadow is not None else [2, reporter_id]
+
+    def _copy_expression(self, value: List[Any], parent_id: str, shadow: Any) -> List[Any]:
+        """复制调用处的表达式参数，放进带有 shadow 的输入"""
+        item = value[1]
+        expression = self._copy(item, parent_id) if isinstance(item, str) else copy.deepcopy(item)
+        return [3, expression, shadow] if shadow is not None else [2, expression]
@@ -0,0 +1,1611 @@
+"""
+无界面解释器 - 在进程内运行 SB3Builder.project 的积木图
+
+不打开 Scratch 编辑器就能运行编译出的项目，用于自动化测试和性能分析。调度和积木语义
+参照 scratch-vm：
+
+- 脚本第一次运行时降级为紧凑的字节码（指令元组列表），字段和变量引用在降级时解析，
+  之后不再遍历积木字典；克隆体和原角色共用同一份字节码
+- 协作式的逐帧调度（Sequencer）：每帧依次运行各线程，线程执行到让出为止；没有请求重绘时
+  同一帧内继续下一轮，直到所有线程都在等待或用完每帧的工作量（work_limit 条指令，
+  对应 scratch-vm 每帧 75% 的时间预算）
+- 非 warp 的循环每轮结束让出一次；warp 的自定义积木中循环不让出（连续执行超过
+  WARP_STEP_LIMIT 条指令时让出一次，对应 scratch-vm 的 500 毫秒 warp 计时器）
+- 时间按帧推进（每帧 1/fps 秒），随机数使用固定种子，run_frames(n) 的结果是确定的
+
+覆盖事件、控制、运算、变量和列表、自定义积木、克隆体、广播、计时器，以及动作和外观的状态。
+不渲染：碰撞按造型的包围盒近似（由旋转中心估计尺寸，忽略旋转和透明像素），碰到颜色总为假；
+声音、画笔和扩展积木只计数不执行（见 unsupported）。每个积木的执行次数记录在 opcode_counts 中。
+
+    vm = Interpreter(parser.builder.project)
+    vm.green_flag()
+    vm.run_frames(60)
+    vm.variable("分数"), vm.opcode_counts.most_common(5)
+"""
+import json
+import math
+import random
+import zipfile
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .blockrecord import is_block
+from .constants import KEY_MAP, MYSELF_OPTIONS, TARGET_EDGE, TARGET_MOUSE, TARGET_RANDOM, TARGET_STAGE
+from .framecost import CLONE_LIMIT
+from .folding import BINARY_OPERATORS, MATH_FUNCTIONS, Value, compare, js_round, to_boolean, to_number, to_string
+
+# 默认帧率
+FPS = 30
+
+# 每帧最多执行的指令数
+DEFAULT_WORK_LIMIT = 100_000
+
+# warp 中连续执行超过这么多条指令时在循环末尾让出一次
+WARP_STEP_LIMIT = 50_000
+
+# 非 warp 的递归调用在最近几层调用中出现时让出一次（scratch-vm 的 isRecursiveCall）
+RECURSION_DEPTH = 5
+
+# 舞台尺寸
+STAGE_WIDTH = 480
+STAGE_HEIGHT = 360
+
+# 列表长度上限
+LIST_ITEM_LIMIT = 200000
+
+# sensing_current 和 sensing_dayssince2000 的起点：time 为 0 时的时刻
+EPOCH = datetime(2000, 1, 1)
+
+# ---- 指令 ----
+# 每条指令是 (操作, opcode, a, b)；opcode 不为 None 时计入 opcode_counts
+
+_PUSH = 0           # 压入常量 a
+_GET_LOCAL = 1      # 压入角色变量 a 的值
+_GET_GLOBAL = 2     # 压入舞台变量 a 的值
+_ARG = 3            # 压入自定义积木参数 a 的值，没有时为 b
+_REPORT = 4         # 弹出 b 个值，压入 a(线程, *值)
+_EXEC = 5           # 弹出 b 个值，执行 a(线程, *值)
+_JUMP = 6           # 跳到 a
+_JUMP_IF = 7        # 弹出一个值，为真时跳到 a
+_JUMP_UNLESS = 8    # 弹出一个值，为假时跳到 a
+_REPEAT = 9         # 弹出次数，压入循环计数器
+_NEXT = 10          # 计数器为 0 时弹出计数器并跳到 a，否则减一
+_EACH = 11          # 弹出上限，计数器小于上限时加一并写入变量 b，否则弹出计数器并跳到 a
+_LOOP = 12          # 循环一轮结束：非 warp 时让出，然后跳到 a
+_WAIT_UNTIL = 13    # 条件不满足：让出后回到 a 重新求值
+_BLOCKED = 14       # a(线程) 为真时原地让出（等待、滑行、等待其他线程）
+_CALL = 15          # 弹出 b 个参数，调用自定义积木 a
+_RETURN = 16        # 从自定义积木返回
+_STOP_SCRIPT = 17   # 停止这个脚本（在自定义积木中为返回）
+_END = 18           # 脚本结束
+
+# 帽子积木的字段匹配和重启规则：{opcode: (匹配的字段, 已在运行时是否重启)}
+HATS = {
+    "event_whenflagclicked": (None, True),
+    "event_whenbroadcastreceived": ("BROADCAST_OPTION", True),
+    "event_whenkeypressed": ("KEY_OPTION", False),
+    "event_whenthisspriteclicked": (None, True),
+    "event_whenstageclicked": (None, True),
+    "event_whenbackdropswitchesto": ("BACKDROP", False),
+    "event_whengreaterthan": ("WHENGREATERTHANMENU", False),
+    "control_start_as_clone": (None, False),
+}
+
+
+class Sprite:
+    """运行中的角色、克隆体或舞台"""
+
+    def __init__(self, vm: "Interpreter", data: Dict[str, Any], program: "_Program",
+                 source: Optional["Sprite"] = None) -> None:
+        self.vm = vm
+        self.data = data
+        self.program = program
+        self.name: str = data["name"]
+        self.is_stage: bool = bool(data.get("isStage"))
+        self.costumes: List[Dict[str, Any]] = data.get("costumes", [])
+        if source is None:
+            self.original = self
+            self.variables: Dict[str, Value] = {var_id: value[1] for var_id, value in data["variables"].items()}
+            self.lists: Dict[str, List[Value]] = {list_id: list(value[1])
+                                                  for list_id, value in data.get("lists", {}).items()}
+            self.x = float(data.get("x", 0))
+            self.y = float(data.get("y", 0))
+            self.direction = float(data.get("direction", 90))
+            self.size = float(data.get("size", 100))
+            self.visible = bool(data.get("visible", not self.is_stage))
+            self.costume = int(data.get("currentCostume", 0))
+            self.rotation_style: str = data.get("rotationStyle", "all around")
+            self.draggable = bool(data.get("draggable", False))
+            self.volume = float(data.get("volume", 100))
+            self.effects: Dict[str, float] = {}
+        else:
+            self.original = source.original
+            self.variables = dict(source.variables)
+            self.lists = {list_id: list(items) for list_id, items in source.lists.items()}
+            for name in ("x", "y", "direction", "size", "visible", "costume", "rotation_style", "draggable",
+                         "volume"):
+                setattr(self, name, getattr(source, name))
+            self.effects = dict(source.effects)
+        # 对话气泡 ("say" 或 "think", 文本)
+        self.bubble: Optional[Tuple[str, str]] = None
+
+    @property
+    def is_clone(self) -> bool:
+        return self.original is not self
+
+    @property
+    def costume_name(self) -> str:
+        return self.costumes[self.costume]["name"] if self.costumes else ""
+
+    def variable(self, name: str) -> Value:
+        """按名字读取角色的变量（找不到时读取舞台的同名变量）"""
+        for var_id, value in self.data["variables"].items():
+            if value[0] == name:
+                return self.variables[var_id]
+        if not self.is_stage:
+            return self.vm.stage.variable(name)
+        raise KeyError(name)
+
+    def list(self, name: str) -> List[Value]:
+        """按名字读取角色的列表（找不到时读取舞台的同名列表）"""
+        for list_id, value in self.data.get("lists", {}).items():
+            if value[0] == name:
+                return self.lists[list_id]
+        if not self.is_stage:
+            return self.vm.stage.list(name)
+        raise KeyError(name)
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """包围盒 (左, 右, 下, 上)：由造型的旋转中心估计尺寸"""
+        half_width = half_height = 0.0
+        if self.costumes:
+            costume = self.costumes[self.costume]
+            resolution = costume.get("bitmapResolution", 1) or 1
+            scale = self.size / 100 / resolution
+            half_width = costume.get("rotationCenterX", 0) * scale
+            half_height = costume.get("rotationCenterY", 0) * scale
+        return self.x - half_width, self.x + half_width, self.y - half_height, self.y + half_height
+
+    def set_xy(self, x: float, y: float) -> None:
+        if self.is_stage or not (math.isfinite(x) and math.isfinite(y)):
+            return
+        self.x, self.y = x, y
+        if self.visible:
+            self.vm.redraw_requested = True
+
+    def set_direction(self, direction: float) -> None:
+        if self.is_stage or not math.isfinite(direction):
+            return
+        # MathUtil.wrapClamp(direction, -179, 180)
+        self.direction = direction - math.floor((direction + 179) / 360) * 360
+        if self.visible:
+            self.vm.redraw_requested = True
+
+    def set_costume(self, index: float) -> None:
+        if not self.costumes or not math.isfinite(index):
+            return
+        self.costume = int(index) % len(self.costumes)
+        if self.visible or self.is_stage:
+            self.vm.redraw_requested = True
+        if self.is_stage:
+            name = self.costume_name
+            self.vm.start_hats("event_whenbackdropswitchesto", name)
+
+    def __repr__(self) -> str:
+        kind = "克隆体" if self.is_clone else ("舞台" if self.is_stage else "角色")
+        return f"<{kind} {self.name} x={self.x:g} y={self.y:g}>"
+
+
+class Thread:
+    """一个正在运行的脚本"""
+
+    def __init__(self, vm: "Interpreter", target: Sprite, hat_id: str, code: "_Code") -> None:
+        self.vm = vm
+        self.target = target
+        self.hat_id = hat_id
+        self.script = code
+        self.restart()
+
+    def restart(self) -> None:
+        """回到脚本开头（重新触发正在运行的脚本时）"""
+        self.code = self.script.instructions
+        self.pc = 0
+        self.stack: List[Value] = []
+        self.loops: List[Any] = []
+        # 自定义积木的调用栈 [(指令, 返回位置, 参数, 循环深度, 是否进入了 warp, 积木)]
+        self.frames: List[Tuple[Any, ...]] = []
+        self.procedure: Optional[_Code] = None
+        self.args: Dict[str, Value] = {}
+        self.warp = 0
+        self.done = False
+        # 原语要求执行完当前指令后让出
+        self.yielding = False
+        # 等待结束的时刻、滑行状态、等待结束的线程
+        self.until = 0.0
+        self.glide: Optional[Tuple[float, float, float, float, float, float]] = None
+        self.waiting: List["Thread"] = []
+
+    def sleep(self, seconds: float) -> None:
+        """等待若干秒（至少让出一次）"""
+        self.until = self.vm.time + max(0.0, seconds)
+        self.yielding = True
+        self.vm.redraw_requested = True
+
+    def __repr__(self) -> str:
+        return f"<线程 {self.target.name}/{self.hat_id} pc={self.pc}{' 已结束' if self.done else ''}>"
+
+
+class _Code:
+    """降级后的一段字节码：脚本体或自定义积木体"""
+    __slots__ = ("instructions", "arg_ids", "arg_names", "warp", "proccode")
+
+    def __init__(self, proccode: Optional[str] = None, arg_ids: Tuple[str, ...] = (),
+                 arg_names: Tuple[str, ...] = (), warp: bool = False) -> None:
+        self.instructions: List[Tuple[Any, ...]] = []
+        self.proccode = proccode
+        self.arg_ids = arg_ids
+        self.arg_names = arg_names
+        self.warp = warp
+
+
+class Interpreter:
+    """无界面运行 Scratch 项目
+
+    Args:
+        project: project.json 的内容（SB3Builder.project）；运行时不修改它
+        seed: 随机数种子
+        work_limit: 每帧最多执行的指令数
+        fps: 每秒帧数（决定计时器、等待和滑行的时间）
+    """
+
+    def __init__(self, project: Dict[str, Any], seed: int = 0, work_limit: int = DEFAULT_WORK_LIMIT,
+                 fps: int = FPS) -> None:
+        self.project = project
+        self.random = random.Random(seed)
+        self.work_limit = work_limit
+        self.fps = fps
+        self.frame = 0
+        self.time = 0.0
+        self.timer_start = 0.0
+        self.redraw_requested = False
+        self.threads: List[Thread] = []
+        # 每个积木的执行次数
+        self.opcode_counts: Counter = Counter()
+        # 不支持而跳过的积木的执行次数
+        self.unsupported: Counter = Counter()
+        # 输入状态
+        self.keys: set = set()
+        self.mouse_x = 0.0
+        self.mouse_y = 0.0
+        self.mouse_down = False
+        # 询问时依次使用的回答
+        self.answers: Deque[str] = deque()
+        self.answer = ""
+        # 说/想的记录 [(帧, 角色名, 文本)]
+        self.speech: List[Tuple[int, str, str]] = []
+        self._edge_values: Dict[Tuple[int, str], bool] = {}
+
+        stage_data = next(target for target in project["targets"] if target.get("isStage"))
+        self.stage_data = stage_data
+        self.stage: Sprite = Sprite(self, stage_data, _Program(self, stage_data))
+        sprites = [Sprite(self, data, _Program(self, data))
+                   for data in project["targets"] if not data.get("isStage")]
+        sprites.sort(key=lambda sprite: sprite.data.get("layerOrder", 0))
+        # 执行顺序（也是图层顺序）：舞台在最前，之后从最底层到最顶层
+        self.targets: List[Sprite] = [self.stage] + sprites
+        self.clone_count = 0
+
+    @classmethod
+    def load(cls, path: str, **kwargs: Any) -> "Interpreter":
+        """从 .sb3 文件加载项目"""
+        with zipfile.ZipFile(path) as archive:
+            project = json.loads(archive.read("project.json").decode("utf-8"))
+        return cls(project, **kwargs)
+
+    # ---- 查询 ----
+
+    def sprite(self, name: str) -> Sprite:
+        """按名字查找角色（原角色，不含克隆体）；"Stage" 为舞台"""
+        for target in self.targets:
+            if target.name == name and not target.is_clone:
+                return target
+        raise KeyError(name)
+
+    def clones(self, name: str) -> List[Sprite]:
+        """角色现有的克隆体"""
+        return [target for target in self.targets if target.is_clone and target.name == name]
+
+    def variable(self, name: str, sprite: Optional[str] = None) -> Value:
+        """读取舞台变量，或指定角色的变量"""
+        return (self.sprite(sprite) if sprite else self.stage).variable(name)
+
+    def list(self, name: str, sprite: Optional[str] = None) -> List[Value]:
+        """读取舞台列表，或指定角色的列表"""
+        return (self.sprite(sprite) if sprite else self.stage).list(name)
+
+    @property
+    def timer(self) -> float:
+        return self.time - self.timer_start
+
+    @property
+    def running(self) -> bool:
+        """是否还有未结束的线程"""
+        return any(not thread.done for thread in self.threads)
+
+    # ---- 输入 ----
+
+    def green_flag(self) -> List[Thread]:
+        """点击绿旗：停止全部脚本、删除克隆体，启动 "当绿旗被点击" 脚本"""
+        self.stop_all()
+        self.timer_start = self.time
+        return self.start_hats("event_whenflagclicked")
+
+    def broadcast(self, name: str) -> List[Thread]:
+        """发送广播"""
+        return self.start_hats("event_whenbroadcastreceived", name)
+
+    def press_key(self, key: str) -> List[Thread]:
+        """按下按键（可以使用 "空格"、"上" 等中文按键名）"""
+        key = _key_name(key)
+        self.keys.add(key)
+        return self.start_hats("event_whenkeypressed", key) + self.start_hats("event_whenkeypressed", "any")
+
+    def release_key(self, key: str) -> None:
+        """松开按键"""
+        self.keys.discard(_key_name(key))
+
+    def click(self, name: str = "Stage") -> List[Thread]:
+        """点击角色（最顶层的实例）或舞台"""
+        if name == "Stage":
+            return self.start_hats("event_whenstageclicked", target=self.stage)
+        for target in reversed(self.targets):
+            if target.name == name and target.visible:
+                return self.start_hats("event_whenthisspriteclicked", target=target)
+        return []
+
+    def stop_all(self) -> None:
+        """停止全部脚本并删除克隆体（停止按钮）"""
+        for thread in self.threads:
+            thread.done = True
+        self.threads = []
+        self.targets = [target for target in self.targets if not target.is_clone]
+        self.clone_count = 0
+        self._edge_values.clear()
+
+    # ---- 调度 ----
+
+    def run_frames(self, count: int) -> int:
+        """运行 count 帧
+
+        Returns:
+            int: 这些帧中执行的指令数
+        """
+        return sum(self.step_frame() for _ in range(count))
+
+    def step_frame(self) -> int:
+        """运行一帧（scratch-vm 的 Runtime._step 和 Sequencer.stepThreads）
+
+        Returns:
+            int: 执行的指令数
+        """
+        self.frame += 1
+        self.time = self.frame / self.fps
+        self._start_edge_hats()
+        self.redraw_requested = False
+        work = 0
+        while self.threads and work < self.work_limit:
+            progressed = False
+            index = 0
+            # 本轮中新启动的线程也在本轮运行
+            while index < len(self.threads) and work < self.work_limit:
+                thread = self.threads[index]
+                index += 1
+                if thread.done:
+                    continue
+                steps, blocked = self._run(thread, self.work_limit - work)
+                work += steps
+                progressed = progressed or not blocked
+            self.threads = [thread for thread in self.threads if not thread.done]
+            # 所有线程都在等待时，同一帧内再运行也不会有变化
+            if not progressed or self.redraw_requested:
+                break
+        return work
+
+    def start_hats(self, opcode: str, match: Optional[str] = None,
+                   target: Optional[Sprite] = None) -> List[Thread]:
+        """启动帽子积木为 opcode 的脚本
+
+        Args:
+            opcode: 帽子积木
+            match: 帽子积木字段需要匹配的值（不区分大小写），None 为不检查
+            target: 只启动这个角色（实例）的脚本，默认为所有角色，从最顶层开始
+
+        Returns:
+            List[Thread]: 启动或重新启动的线程
+        """
+        restart = HATS.get(opcode, (None, False))[1]
+        wanted = match.upper() if match is not None else None
+        started = []
+        targets = [target] if target is not None else list(reversed(self.targets))
+        for sprite in targets:
+            for hat_id, value in sprite.program.hats.get(opcode, ()):
+                if wanted is not None and str(value).upper() != wanted:
+                    continue
+                existing = next((thread for thread in self.threads if thread.target is sprite
+                                 and thread.hat_id == hat_id and not thread.done), None)
+                if existing is not None:
+                    if restart:
+                        existing.restart()
+                        started.append(existing)
+                    continue
+                thread = Thread(self, sprite, hat_id, sprite.program.script(hat_id))
+                self.threads.append(thread)
+                started.append(thread)
+        return started
+
+    def _start_edge_hats(self) -> None:
+        """每帧开始时检查 "当计时器/响度大于" 脚本，条件从假变为真时启动"""
+        for sprite in list(reversed(self.targets)):
+            for hat_id, menu in sprite.program.hats.get("event_whengreaterthan", ()):
+                value = self.timer if str(menu).upper() == "TIMER" else -1.0
+                threshold = to_number(self._evaluate(sprite, sprite.program.hat_input(hat_id, "VALUE")))
+                key = (id(sprite), hat_id)
+                current = value > threshold
+                if current and not self._edge_values.get(key, False):
+                    self.start_hats_for(sprite, hat_id)
+                self._edge_values[key] = current
+
+    def start_hats_for(self, sprite: Sprite, hat_id: str) -> Thread:
+        """启动一个指定的脚本"""
+        thread = Thread(self, sprite, hat_id, sprite.program.script(hat_id))
+        self.threads.append(thread)
+        return thread
+
+    def _evaluate(self, sprite: Sprite, code: "_Code") -> Value:
+        """同步求值一段表达式字节码"""
+        thread = Thread(self, sprite, "", code)
+        self._run(thread, self.work_limit)
+        return thread.stack[-1] if thread.stack else ""
+
+    def _run(self, thread: Thread, budget: int) -> Tuple[int, bool]:
+        """运行线程直到让出、结束或用完 budget 条指令
+
+        Returns:
+            (执行的指令数, 是否只是检查了等待条件)
+        """
+        code = thread.code
+        pc = thread.pc
+        stack = thread.stack
+        counts = self.opcode_counts
+        steps = 0
+        while steps < budget:
+            op, opcode, a, b = code[pc]
+            if opcode is not None:
+                counts[opcode] += 1
+            steps += 1
+            pc += 1
+            if op == _REPORT:
+                if b:
+                    args = stack[-b:]
+                    del stack[-b:]
+                    stack.append(a(thread, *args))
+                else:
+                    stack.append(a(thread))
+            elif op == _PUSH:
+                stack.append(a)
+            elif op == _GET_LOCAL:
+                stack.append(thread.target.variables.get(a, 0))
+            elif op == _GET_GLOBAL:
+                stack.append(self.stage.variables.get(a, 0))
+            elif op == _EXEC:
+                thread.pc = pc
+                if b:
+                    args = stack[-b:]
+                    del stack[-b:]
+                    a(thread, *args)
+                else:
+                    a(thread)
+                # 原语结束或重新启动了自己的线程
+                if thread.done or thread.pc != pc:
+                    return steps, False
+                if thread.yielding:
+                    thread.yielding = False
+                    return steps, False
+            elif op == _JUMP_UNLESS:
+                if not to_boolean(stack.pop()):
+                    pc = a
+            elif op == _JUMP_IF:
+                if to_boolean(stack.pop()):
+                    pc = a
+            elif op == _JUMP:
+                pc = a
+            elif op == _ARG:
+                stack.append(thread.args.get(a, b))
+            elif op == _NEXT:
+                if thread.loops[-1] > 0:
+                    thread.loops[-1] -= 1
+                else:
+                    thread.loops.pop()
+                    pc = a
+            elif op == _LOOP:
+                if not thread.warp or steps >= WARP_STEP_LIMIT:
+                    thread.pc = a
+                    return steps, False
+                pc = a
+            elif op == _REPEAT:
+                thread.loops.append(js_round(to_number(stack.pop())))
+            elif op == _EACH:
+                limit = to_number(stack.pop())
+                if thread.loops[-1] < limit:
+                    thread.loops[-1] += 1
+                    b(thread, float(thread.loops[-1]))
+                else:
+                    thread.loops.pop()
+                    pc = a
+            elif op == _CALL:
+                args = stack[-b:] if b else []
+                if b:
+                    del stack[-b:]
+                thread.frames.append((code, pc, thread.args, len(thread.loops), a.warp and not thread.warp,
+                                      thread.procedure))
+                if a.warp and not thread.warp:
+                    thread.warp = 1
+                recursive = not thread.warp and any(frame[5] is a for frame in thread.frames[-RECURSION_DEPTH:])
+                thread.procedure = a
+                thread.args = dict(zip(a.arg_names, args))
+                code = thread.code = a.instructions
+                pc = 0
+                if recursive:
+                    thread.pc = pc
+                    return steps, False
+            elif op == _RETURN or (op == _STOP_SCRIPT and thread.frames):
+                code, pc, thread.args, depth, entered_warp, thread.procedure = thread.frames.pop()
+                del thread.loops[depth:]
+                if entered_warp:
+                    thread.warp = 0
+                thread.code = code
+            elif op == _BLOCKED:
+                if a(thread):
+                    thread.pc = pc - 1
+                    return steps, True
+            elif op == _WAIT_UNTIL:
+                thread.pc = a
+                return steps, True
+            else:
+                # _END 或脚本顶层的 _STOP_SCRIPT
+                thread.done = True
+                return steps, False
+        thread.pc = pc
+        return steps, False
+
+    # ---- 克隆体 ----
+
+    def create_clone(self, source: Sprite) -> Optional[Sprite]:
+        """创建克隆体（放在原角色下面一层），并启动 "当作为克隆体启动" 脚本"""
+        if source.is_stage or self.clone_count >= CLONE_LIMIT:
+            return None
+        clone = Sprite(self, source.data, source.program, source)
+        self.targets.insert(self.targets.index(source), clone)
+        self.clone_count += 1
+        self.start_hats("control_start_as_clone", target=clone)
+        return clone
+
+    def delete_clone(self, clone: Sprite) -> None:
+        """删除克隆体并停止它的脚本"""
+        if not clone.is_clone or clone not in self.targets:
+            return
+        self.targets.remove(clone)
+        self.clone_count -= 1
+        for thread in self.threads:
+            if thread.target is clone:
+                thread.done = True
+
+
+def _key_name(key: str) -> str:
+    """按键名规范化为 scratch-vm 的写法"""
+    key = KEY_MAP.get(key, key)
+    return key.lower() if len(key) == 1 else key
+
+
+# ---- 降级 ----
+
+class _Program:
+    """一个角色（原角色和它的克隆体共用）的帽子积木索引和字节码缓存"""
+
+    def __init__(self, vm: Interpreter, data: Dict[str, Any]) -> None:
+        self.vm = vm
+        self.data = data
+        self.blocks: Dict[str, Any] = data["blocks"]
+        # {帽子 opcode: [(积木ID, 匹配字段的值)]}
+        self.hats: Dict[str, List[Tuple[str, Any]]] = {}
+        self._definitions: Dict[str, str] = {}
+        for block_id, block in self.blocks.items():
+            if not is_block(block):
+                continue
+            opcode = block["opcode"]
+            if block.get("topLevel") and opcode in HATS:
+                field = HATS[opcode][0]
+                value = block["fields"].get(field, [None])[0] if field else None
+                self.hats.setdefault(opcode, []).append((block_id, value))
+            elif opcode == "procedures_prototype" and "mutation" in block:
+                self._definitions[block["mutation"]["proccode"]] = block.get("parent")
+        self._scripts: Dict[str, _Code] = {}
+        self._procedures: Dict[str, Optional[_Code]] = {}
+        self._hat_inputs: Dict[Tuple[str, str], _Code] = {}
+
+    def script(self, hat_id: str) -> _Code:
+        """脚本的字节码（第一次运行时降级）"""
+        code = self._scripts.get(hat_id)
+        if code is None:
+            code = self._scripts[hat_id] = _Code()
+            out = code.instructions
+            self._stack(self.blocks[hat_id]["next"], out)
+            out.append((_END, None, None, None))
+        return code
+
+    def hat_input(self, hat_id: str, name: str) -> _Code:
+        """帽子积木输入的表达式字节码"""
+        key = (hat_id, name)
+        code = self._hat_inputs.get(key)
+        if code is None:
+            code = self._hat_inputs[key] = _Code()
+            self._input(self.blocks[hat_id], name, code.instructions)
+            code.instructions.append((_END, None, None, None))
+        return code
+
+    def procedure(self, proccode: str) -> Optional[_Code]:
+        """自定义积木体的字节码，没有定义时为 None"""
+        if proccode in self._procedures:
+            return self._procedures[proccode]
+        definition_id = self._definitions.get(proccode)
+        definition = self.blocks.get(definition_id) if definition_id else None
+        if definition is None:
+            self._procedures[proccode] = None
+            return None
+        mutation = self.blocks[definition["inputs"]["custom_block"][1]]["mutation"]
+        code = _Code(proccode, tuple(json.loads(mutation.get("argumentids", "[]"))),
+                     tuple(json.loads(mutation.get("argumentnames", "[]"))),
+                     mutation.get("warp") in ("true", True))
+        # 先登记再降级积木体，递归调用引用同一个对象
+        self._procedures[proccode] = code
+        self._stack(definition["next"], code.instructions)
+        code.instructions.append((_RETURN, None, None, None))
+        return code
+
+    # ---- 语句 ----
+
+    def _stack(self, first_id: Optional[str], out: List[Tuple[Any, ...]]) -> None:
+        block_id = first_id
+        while block_id is not None and block_id in self.blocks:
+            self._statement(block_id, out)
+            block_id = self.blocks[block_id]["next"]
+
+    def _substack(self, block: Dict[str, Any], name: str, out: List[Tuple[Any, ...]]) -> None:
+        value = block["inputs"].get(name)
+        if isinstance(value, list) and len(value) > 1 and isinstance(value[1], str):
+            self._stack(value[1], out)
+
+    def _statement(self, block_id: str, out: List[Tuple[Any, ...]]) -> None:
+        block = self.blocks[block_id]
+        opcode = block["opcode"]
+        control = _CONTROL.get(opcode)
+        if control is not None:
+            control(self, block, out)
+            return
+        entry = STATEMENTS.get(opcode)
+        if entry is None:
+            out.append((_EXEC, opcode, partial(_unsupported, opcode), 0))
+            return
+        inputs, fields, function = entry
+        for name in inputs:
+            self._input(block, name, out)
+        out.append((_EXEC, opcode, self._bind(block, fields, function), len(inputs)))
+        for op, argument in _AFTER.get(opcode, ()):
+            out.append((op, None, argument, None))
+
+    def _bind(self, block: Dict[str, Any], fields: Tuple[str, ...], function: Callable) -> Callable:
+        """把字段的值（变量和列表解析为引用）绑定为原语的前几个参数"""
+        if not fields:
+            return function
+        values = []
+        for name in fields:
+            field = block["fields"].get(name) or ["", None]
+            if name == "VARIABLE":
+                values.append(self._variable(field, "variables"))
+            elif name == "LIST":
+                values.append(self._variable(field, "lists"))
+            else:
+                values.append(field[0])
+        return partial(function, *values)
+
+    def _variable(self, field: List[Any], kind: str) -> Tuple[bool, str]:
+        """变量或列表字段 [名字, ID] 解析为 (是否为舞台的, ID)"""
+        name, var_id = field[0], field[1] if len(field) > 1 else None
+        stage = self.vm.stage_data
+        if var_id in self.data.get(kind, {}):
+            return self.data is stage, var_id
+        if var_id in stage.get(kind, {}):
+            return True, var_id
+        for scope in (self.data, stage):
+            for candidate, value in scope.get(kind, {}).items():
+                if value[0] == name:
+                    return scope is stage, candidate
+        # 找不到时在舞台上新建（scratch-vm 的 lookupOrCreateVariable）
+        store = self.vm.stage.variables if kind == "variables" else self.vm.stage.lists
+        store.setdefault(var_id or name, 0 if kind == "variables" else [])
+        return True, var_id or name
+
+    def _jump_placeholder(self, out: List[Tuple[Any, ...]]) -> int:
+        out.append(None)
+        return len(out) - 1
+
+    def _if(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        self._input(block, "CONDITION", out)
+        branch = self._jump_placeholder(out)
+        self._substack(block, "SUBSTACK", out)
+        if block["opcode"] == "control_if_else":
+            skip = self._jump_placeholder(out)
+            out[branch] = (_JUMP_UNLESS, block["opcode"], len(out), None)
+            self._substack(block, "SUBSTACK2", out)
+            out[skip] = (_JUMP, None, len(out), None)
+        else:
+            out[branch] = (_JUMP_UNLESS, block["opcode"], len(out), None)
+
+    def _repeat(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        self._input(block, "TIMES", out)
+        out.append((_REPEAT, None, None, None))
+        head = self._jump_placeholder(out)
+        self._substack(block, "SUBSTACK", out)
+        out.append((_LOOP, None, head, None))
+        out[head] = (_NEXT, "control_repeat", len(out), None)
+
+    def _forever(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        head = len(out)
+        self._substack(block, "SUBSTACK", out)
+        out.append((_LOOP, "control_forever", head, None))
+
+    def _conditional_loop(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        head = len(out)
+        self._input(block, "CONDITION", out)
+        exit_jump = self._jump_placeholder(out)
+        self._substack(block, "SUBSTACK", out)
+        out.append((_LOOP, None, head, None))
+        op = _JUMP_IF if block["opcode"] == "control_repeat_until" else _JUMP_UNLESS
+        out[exit_jump] = (op, block["opcode"], len(out), None)
+
+    def _for_each(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        setter = partial(_set_variable, self._variable(block["fields"].get("VARIABLE") or ["", None], "variables"))
+        out.append((_PUSH, None, 0, None))
+        out.append((_REPEAT, None, None, None))
+        head = len(out)
+        self._input(block, "VALUE", out)
+        step = self._jump_placeholder(out)
+        self._substack(block, "SUBSTACK", out)
+        out.append((_LOOP, None, head, None))
+        out[step] = (_EACH, "control_for_each", len(out), setter)
+
+    def _wait_until(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        head = len(out)
+        self._input(block, "CONDITION", out)
+        out.append((_JUMP_IF, "control_wait_until", len(out) + 2, None))
+        out.append((_WAIT_UNTIL, None, head, None))
+
+    def _stop(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        option = (block["fields"].get("STOP_OPTION") or ["all"])[0]
+        if option == "this script":
+            out.append((_STOP_SCRIPT, "control_stop", None, None))
+        elif option == "all":
+            out.append((_EXEC, "control_stop", _stop_all, 0))
+        else:
+            out.append((_EXEC, "control_stop", _stop_other_scripts, 0))
+
+    def _call(self, block: Dict[str, Any], out: List[Tuple[Any, ...]]) -> None:
+        callee = self.procedure(block.get("mutation", {}).get("proccode"))
+        if callee is None:
+            out.append((_EXEC, "procedures_call", _noop, 0))
+            return
+        for arg_id in callee.arg_ids:
+            self._input(block, arg_id, out)
+        out.append((_CALL, "procedures_call", callee, len(callee.arg_ids)))
+
+    # ---- 表达式 ----
+
+    def _input(self, block: Dict[str, Any], name: str, out: List[Tuple[Any, ...]]) -> None:
+        """压入输入的值"""
+        value = block["inputs"].get(name)
+        item = value[1] if isinstance(value, list) and len(value) > 1 else None
+        if isinstance(item, list):
+            self._primitive(item, out)
+        elif isinstance(item, str) and item in self.blocks:
+            child = self.blocks[item]
+            if child.get("shadow"):
+                fields = list(child["fields"].values())
+                out.append((_PUSH, None, fields[0][0] if fields else "", None))
+            else:
+                self._reporter(item, out)
+        else:
+            out.append((_PUSH, None, "", None))
+
+    def _primitive(self, item: List[Any], out: List[Tuple[Any, ...]]) -> None:
+        """压入基本类型的值 [类型, 值, ID]"""
+        kind = item[0]
+        if kind == 12:
+            is_global, var_id = self._variable(item[1:3], "variables")
+            out.append((_GET_GLOBAL if is_global else _GET_LOCAL, "data_variable", var_id, None))
+        elif kind == 13:
+            out.append((_REPORT, "data_listcontents", partial(_list_contents, self._variable(item[1:3], "lists")),
+                        0))
+        else:
+            out.append((_PUSH, None, item[1] if len(item) > 1 else "", None))
+
+    def _reporter(self, block_id: str, out: List[Tuple[Any, ...]]) -> None:
+        block = self.blocks[block_id]
+        opcode = block["opcode"]
+        if opcode == "data_variable":
+            is_global, var_id = self._variable(block["fields"].get("VARIABLE") or ["", None], "variables")
+            out.append((_GET_GLOBAL if is_global else _GET_LOCAL, opcode, var_id, None))
+            return
+        if opcode.startswith("argument_reporter_"):
+            default = False if opcode == "argument_reporter_boolean" else 0
+            out.append((_ARG, opcode, block["fields"]["VALUE"][0], default))
+            return
+        entry = REPORTERS.get(opcode)
+        if entry is None:
+            out.append((_REPORT, opcode, partial(_unsupported, opcode), 0))
+            return
+        inputs, fields, function = entry
+        for name in inputs:
+            self._input(block, name, out)
+        out.append((_REPORT, opcode, self._bind(block, fields, function), len(inputs)))
+
+
+_CONTROL = {
+    "control_if": _Program._if,
+    "control_if_else": _Program._if,
+    "control_repeat": _Program._repeat,
+    "control_forever": _Program._forever,
+    "control_repeat_until": _Program._conditional_loop,
+    "control_while": _Program._conditional_loop,
+    "control_for_each": _Program._for_each,
+    "control_wait_until": _Program._wait_until,
+    "control_stop": _Program._stop,
+    "procedures_call": _Program._call,
+}
+
+
+# ---- 原语 ----
+# 语句原语 f(线程, *输入) 和 reporter 原语 f(线程, *输入) -> 值；字段的值绑定在线程之前
+
+def _noop(thread: Thread, *args: Value) -> None:
+    pass
+
+
+def _unsupported(opcode: str, thread: Thread, *args: Value) -> str:
+    thread.vm.unsupported[opcode] += 1
+    return ""
+
+
+# 控制
+
+def _wait(thread: Thread, duration: Value) -> None:
+    thread.sleep(to_number(duration))
+
+
+def _is_sleeping(thread: Thread) -> bool:
+    return thread.vm.time < thread.until
+
+
+def _is_waiting_for_threads(thread: Thread) -> bool:
+    return any(not other.done for other in thread.waiting)
+
+
+def _stop_all(thread: Thread) -> None:
+    thread.vm.stop_all()
+
+
+def _stop_other_scripts(thread: Thread) -> None:
+    for other in thread.vm.threads:
+        if other.target is thread.target and other is not thread:
+            other.done = True
+
+
+def _create_clone(thread: Thread, option: Value) -> None:
+    vm = thread.vm
+    option = to_string(option)
+    if option in MYSELF_OPTIONS:
+        source = thread.target
+    else:
+        source = next((target for target in vm.targets if target.name == option and not target.is_clone), None)
+    if source is not None:
+        vm.create_clone(source)
+
+
+def _delete_this_clone(thread: Thread) -> None:
+    if thread.target.is_clone:
+        thread.vm.delete_clone(thread.target)
+        thread.done = True
+
+
+# 事件
+
+def _broadcast(thread: Thread, name: Value) -> None:
+    thread.vm.broadcast(to_string(name))
+
+
+def _broadcast_and_wait(thread: Thread, name: Value) -> None:
+    thread.waiting = thread.vm.broadcast(to_string(name))
+    thread.yielding = bool(thread.waiting)
+
+
+# 变量和列表
+
+def _set_variable(ref: Tuple[bool, str], thread: Thread, value: Value) -> None:
+    (thread.vm.stage if ref[0] else thread.target).variables[ref[1]] = value
+
+
+def _change_variable(ref: Tuple[bool, str], thread: Thread, delta: Value) -> None:
+    variables = (thread.vm.stage if ref[0] else thread.target).variables
+    variables[ref[1]] = to_number(variables.get(ref[1], 0)) + to_number(delta)
+
+
+def _get_list(ref: Tuple[bool, str], thread: Thread) -> List[Value]:
+    return (thread.vm.stage if ref[0] else thread.target).lists.setdefault(ref[1], [])
+
+
+def _list_index(vm: Interpreter, index: Value, length: int, accept_all: bool = False) -> Any:
+    """Cast.toListIndex：返回从 1 开始的位置，"all" 或无效时为 0"""
+    if isinstance(index, str):
+        lowered = index.lower()
+        if lowered == "all":
+            return "all" if accept_all else 0
+        if lowered == "last":
+            return length
+        if lowered in ("random", "any"):
+            return vm.random.randint(1, length) if length > 0 else 0
+    position = math.floor(to_number(index))
+    return position if 1 <= position <= length else 0
+
+
+def _add_to_list(ref: Tuple[bool, str], thread: Thread, item: Value) -> None:
+    items = _get_list(ref, thread)
+    if len(items) < LIST_ITEM_LIMIT:
+        items.append(item)
+
+
+def _delete_of_list(ref: Tuple[bool, str], thread: Thread, index: Value) -> None:
+    items = _get_list(ref, thread)
+    position = _list_index(thread.vm, index, len(items), accept_all=True)
+    if position == "all":
+        items.clear()
+    elif position:
+        del items[position - 1]
+
+
+def _delete_all_of_list(ref: Tuple[bool, str], thread: Thread) -> None:
+    _get_list(ref, thread).clear()
+
+
+def _insert_at_list(ref: Tuple[bool, str], thread: Thread, item: Value, index: Value) -> None:
+    items = _get_list(ref, thread)
+    position = _list_index(thread.vm, index, len(items) + 1)
+    if position and len(items) < LIST_ITEM_LIMIT:
+        items.insert(position - 1, item)
+
+
+def _replace_item_of_list(ref: Tuple[bool, str], thread: Thread, index: Value, item: Value) -> None:
+    items = _get_list(ref, thread)
+    position = _list_index(thread.vm, index, len(items))
+    if position:
+        items[position - 1] = item
+
+
+def _item_of_list(ref: Tuple[bool, str], thread: Thread, index: Value) -> Value:
+    items = _get_list(ref, thread)
+    position = _list_index(thread.vm, index, len(items))
+    return items[position - 1] if position else ""
+
+
+def _item_num_of_list(ref: Tuple[bool, str], thread: Thread, item: Value) -> float:
+    for position, value in enumerate(_get_list(ref, thread), 1):
+        if compare(value, item) == 0:
+            return float(position)
+    return 0.0
+
+
+def _length_of_list(ref: Tuple[bool, str], thread: Thread) -> float:
+    return float(len(_get_list(ref, thread)))
+
+
+def _list_contains_item(ref: Tuple[bool, str], thread: Thread, item: Value) -> bool:
+    return any(compare(value, item) == 0 for value in _get_list(ref, thread))
+
+
+def _list_contents(ref: Tuple[bool, str], thread: Thread) -> str:
+    items = [to_string(value) for value in _get_list(ref, thread)]
+    separator = "" if all(len(item) == 1 for item in items) else " "
+    return separator.join(items)
+
+
+# 运算
+
+def _binary(symbol: str) -> Callable[[Thread, Value, Value], Value]:
+    operator = BINARY_OPERATORS[symbol]
+    return lambda thread, left, right: operator(left, right)
+
+
+def _random(thread: Thread, low: Value, high: Value) -> float:
+    n1, n2 = to_number(low), to_number(high)
+    low_number, high_number = min(n1, n2), max(n1, n2)
+    if low_number == high_number:
+        return low_number
+    if _is_int(low) and _is_int(high):
+        return float(thread.vm.random.randint(int(low_number), int(high_number)))
+    return low_number + thread.vm.random.random() * (high_number - low_number)
+
+
+def _is_int(value: Value) -> bool:
+    """Cast.isInt：数字为整数，或字符串中没有小数点"""
+    if isinstance(value, bool):
+        return True
+    if isinstance(value, str):
+        return "." not in value
+    return float(value).is_integer()
+
+
+def _letter_of(thread: Thread, letter: Value, text: Value) -> str:
+    index = int(to_number(letter)) - 1
+    text = to_string(text)
+    return text[index] if 0 <= index < len(text) else ""
+
+
+def _mathop(operator: str, thread: Thread, value: Value) -> float:
+    number = to_number(value)
+    operator = operator.lower()
+    if operator == "e ^":
+        return math.exp(number) if number < 710 else math.inf
+    if operator == "10 ^":
+        return 10 ** number if number < 309 else math.inf
+    function = MATH_FUNCTIONS.get(operator)
+    return float(function(number)) if function else 0.0
+
+
+# 动作
+
+def _stage_point(vm: Interpreter, name: str, thread: Thread) -> Optional[Tuple[float, float]]:
+    """移到/面向菜单的目标位置"""
+    if name == TARGET_MOUSE:
+        return vm.mouse_x, vm.mouse_y
+    if name == TARGET_RANDOM:
+        return (float(round(STAGE_WIDTH * (vm.random.random() - 0.5))),
+                float(round(STAGE_HEIGHT * (vm.random.random() - 0.5))))
+    try:
+        other = vm.sprite(name)
+    except KeyError:
+        return None
+    return (other.x, other.y) if not other.is_stage else None
+
+
+def _move_steps(thread: Thread, steps: Value) -> None:
+    sprite = thread.target
+    radians = math.radians(90 - sprite.direction)
+    distance = to_number(steps)
+    sprite.set_xy(sprite.x + distance * math.cos(radians), sprite.y + distance * math.sin(radians))
+
+
+def _turn(sign: int, thread: Thread, degrees: Value) -> None:
+    thread.target.set_direction(thread.target.direction + sign * to_number(degrees))
+
+
+def _go_to(thread: Thread, target: Value) -> None:
+    point = _stage_point(thread.vm, to_string(target), thread)
+    if point is not None:
+        thread.target.set_xy(*point)
+
+
+def _go_to_xy(thread: Thread, x: Value, y: Value) -> None:
+    thread.target.set_xy(to_number(x), to_number(y))
+
+
+def _change_x(thread: Thread, dx: Value) -> None:
+    thread.target.set_xy(thread.target.x + to_number(dx), thread.target.y)
+
+
+def _set_x(thread: Thread, x: Value) -> None:
+    thread.target.set_xy(to_number(x), thread.target.y)
+
+
+def _change_y(thread: Thread, dy: Value) -> None:
+    thread.target.set_xy(thread.target.x, thread.target.y + to_number(dy))
+
+
+def _set_y(thread: Thread, y: Value) -> None:
+    thread.target.set_xy(thread.target.x, to_number(y))
+
+
+def _point_in_direction(thread: Thread, direction: Value) -> None:
+    thread.target.set_direction(to_number(direction))
+
+
+def _point_towards(thread: Thread, target: Value) -> None:
+    sprite = thread.target
+    point = _stage_point(thread.vm, to_string(target), thread)
+    if to_string(target) == TARGET_RANDOM:
+        sprite.set_direction(float(thread.vm.random.randint(1, 360)))
+    elif point is not None:
+        dx, dy = point[0] - sprite.x, point[1] - sprite.y
+        sprite.set_direction(90 - math.degrees(math.atan2(dy, dx)))
+
+
+def _glide(thread: Thread, seconds: float, x: float, y: float) -> None:
+    sprite = thread.target
+    if seconds <= 0:
+        sprite.set_xy(x, y)
+        thread.glide = None
+        return
+    thread.glide = (thread.vm.time, seconds, sprite.x, sprite.y, x, y)
+    thread.yielding = True
+
+
+def _glide_to_xy(thread: Thread, seconds: Value, x: Value, y: Value) -> None:
+    _glide(thread, to_number(seconds), to_number(x), to_number(y))
+
+
+def _glide_to(thread: Thread, seconds: Value, target: Value) -> None:
+    point = _stage_point(thread.vm, to_string(target), thread)
+    if point is not None:
+        _glide(thread, to_number(seconds), *point)
+
+
+def _is_gliding(thread: Thread) -> bool:
+    if thread.glide is None:
+        return False
+    start, duration, x0, y0, x1, y1 = thread.glide
+    elapsed = thread.vm.time - start
+    if elapsed < duration:
+        fraction = elapsed / duration
+        thread.target.set_xy(x0 + fraction * (x1 - x0), y0 + fraction * (y1 - y0))
+        return True
+    thread.target.set_xy(x1, y1)
+    thread.glide = None
+    return False
+
+
+def _if_on_edge_bounce(thread: Thread) -> None:
+    """碰到边缘就反弹（motion_ifonedgebounce，按包围盒计算）"""
+    sprite = thread.target
+    if sprite.is_stage:
+        return
+    left, right, bottom, top = sprite.bounds()
+    distances = {
+        "left": max(0.0, STAGE_WIDTH / 2 + left),
+        "top": max(0.0, STAGE_HEIGHT / 2 - top),
+        "right": max(0.0, STAGE_WIDTH / 2 - right),
+        "bottom": max(0.0, STAGE_HEIGHT / 2 + bottom),
+    }
+    edge = min(distances, key=distances.get)
+    if distances[edge] > 0:
+        return
+    radians = math.radians(90 - sprite.direction)
+    dx, dy = math.cos(radians), -math.sin(radians)
+    if edge == "left":
+        dx = max(0.2, abs(dx))
+    elif edge == "top":
+        dy = max(0.2, abs(dy))
+    elif edge == "right":
+        dx = -max(0.2, abs(dx))
+    else:
+        dy = -max(0.2, abs(dy))
+    sprite.set_direction(math.degrees(math.atan2(dy, dx)) + 90)
+    # 移回舞台内
+    shift_x = max(0.0, -STAGE_WIDTH / 2 - left) - max(0.0, right - STAGE_WIDTH / 2)
+    shift_y = max(0.0, -STAGE_HEIGHT / 2 - bottom) - max(0.0, top - STAGE_HEIGHT / 2)
+    sprite.set_xy(sprite.x + shift_x, sprite.y + shift_y)
+
+
+def _set_rotation_style(style: str, thread: Thread) -> None:
+    thread.target.rotation_style = style
+
+
+def _limit_precision(value: float) -> float:
+    """scratch-vm 的 limitPrecision：非常接近整数的坐标取整"""
+    rounded = float(round(value))
+    return rounded if abs(value - rounded) < 1e-9 else value
+
+
+# 外观
+
+def _say(kind: str, thread: Thread, message: Value) -> None:
+    sprite = thread.target
+    if sprite.is_stage:
+        return
+    text = to_string(message)
+    sprite.bubble = (kind, text) if text else None
+    thread.vm.speech.append((thread.vm.frame, sprite.name, text))
+    thread.vm.redraw_requested = True
+
+
+def _say_for_secs(kind: str, thread: Thread, message: Value, seconds: Value) -> None:
+    _say(kind, thread, message)
+    thread.sleep(to_number(seconds))
+
+
+def _clear_bubble(thread: Thread) -> None:
+    thread.target.bubble = None
+
+
+def _costume_index(sprite: Sprite, value: Value, special: Tuple[str, str, str]) -> Optional[float]:
+    """造型/背景菜单的值对应的造型序号（scratch-vm 的 _setCostume）"""
+    if not isinstance(value, str):
+        return to_number(value) - 1
+    for index, costume in enumerate(sprite.costumes):
+        if costume["name"] == value:
+            return float(index)
+    next_name, previous_name, random_name = special
+    if value == next_name:
+        return float(sprite.costume + 1)
+    if value == previous_name:
+        return float(sprite.costume - 1)
+    if random_name and value == random_name and len(sprite.costumes) > 1:
+        choice = sprite.vm.random.randint(0, len(sprite.costumes) - 2)
+        return float(choice + 1 if choice >= sprite.costume else choice)
+    number = to_number(value)
+    if value.strip() and (number != 0 or value.strip() in ("0", "0.0")):
+        return number - 1
+    return None
+
+
+def _switch_costume(thread: Thread, costume: Value) -> None:
+    if thread.target.is_stage:
+        return
+    index = _costume_index(thread.target, costume, ("next costume", "previous costume", ""))
+    if index is not None:
+        thread.target.set_costume(index)
+
+
+def _next_costume(thread: Thread) -> None:
+    thread.target.set_costume(thread.target.costume + 1)
+
+
+def _switch_backdrop(thread: Thread, backdrop: Value) -> List[Thread]:
+    stage = thread.vm.stage
+    index = _costume_index(stage, backdrop, ("next backdrop", "previous backdrop", "random backdrop"))
+    if index is None:
+        return []
+    before = len(thread.vm.threads)
+    stage.set_costume(index)
+    return thread.vm.threads[before:]
+
+
+def _switch_backdrop_and_wait(thread: Thread, backdrop: Value) -> None:
+    thread.waiting = _switch_backdrop(thread, backdrop)
+    thread.yielding = bool(thread.waiting)
+
+
+def _next_backdrop(thread: Thread) -> None:
+    stage = thread.vm.stage
+    stage.set_costume(stage.costume + 1)
+
+
+def _change_size(thread: Thread, change: Value) -> None:
+    _set_size(thread, thread.target.size + to_number(change))
+
+
+def _set_size(thread: Thread, size: Value) -> None:
+    sprite = thread.target
+    if sprite.is_stage:
+        return
+    sprite.size = max(0.0, to_number(size))
+    if sprite.visible:
+        thread.vm.redraw_requested = True
+
+
+def _effect(sprite: Sprite, effect: str, value: float) -> None:
+    effect = effect.lower()
+    if effect == "ghost":
+        value = min(100.0, max(0.0, value))
+    elif effect == "brightness":
+        value = min(100.0, max(-100.0, value))
+    sprite.effects[effect] = value
+    if sprite.visible:
+        sprite.vm.redraw_requested = True
+
+
+def _change_effect(effect: str, thread: Thread, change: Value) -> None:
+    _effect(thread.target, effect, thread.target.effects.get(effect.lower(), 0.0) + to_number(change))
+
+
+def _set_effect(effect: str, thread: Thread, value: Value) -> None:
+    _effect(thread.target, effect, to_number(value))
+
+
+def _clear_effects(thread: Thread) -> None:
+    thread.target.effects.clear()
+    thread.vm.redraw_requested = True
+
+
+def _set_visible(visible: bool, thread: Thread) -> None:
+    if not thread.target.is_stage:
+        thread.target.visible = visible
+        thread.vm.redraw_requested = True
+
+
+def _go_to_front_back(option: str, thread: Thread) -> None:
+    sprite = thread.target
+    targets = thread.vm.targets
+    if sprite.is_stage:
+        return
+    targets.remove(sprite)
+    targets.insert(len(targets) if option == "front" else 1, sprite)
+
+
+def _go_forward_backward(option: str, thread: Thread, layers: Value) -> None:
+    sprite = thread.target
+    targets = thread.vm.targets
+    if sprite.is_stage:
+        return
+    step = int(to_number(layers)) * (1 if option == "forward" else -1)
+    index = targets.index(sprite)
+    targets.remove(sprite)
+    targets.insert(min(len(targets), max(1, index + step)), sprite)
+
+
+def _costume_number_name(option: str, thread: Thread) -> Value:
+    sprite = thread.target
+    return sprite.costume_name if option == "name" else float(sprite.costume + 1)
+
+
+def _backdrop_number_name(option: str, thread: Thread) -> Value:
+    stage = thread.vm.stage
+    return stage.costume_name if option == "name" else float(stage.costume + 1)
+
+
+# 侦测
+
+def _touching(thread: Thread, target: Value) -> bool:
+    sprite = thread.target
+    if sprite.is_stage or not sprite.visible:
+        return False
+    left, right, bottom, top = sprite.bounds()
+    name = to_string(target)
+    vm = thread.vm
+    if name == TARGET_EDGE:
+        return (left < -STAGE_WIDTH / 2 or right > STAGE_WIDTH / 2
+                or bottom < -STAGE_HEIGHT / 2 or top > STAGE_HEIGHT / 2)
+    if name == TARGET_MOUSE:
+        return left <= vm.mouse_x <= right and bottom <= vm.mouse_y <= top
+    for other in vm.targets:
+        if other.name == name and other is not sprite and other.visible and not other.is_stage:
+            other_left, other_right, other_bottom, other_top = other.bounds()
+            if left <= other_right and other_left <= right and bottom <= other_top and other_bottom <= top:
+                return True
+    return False
+
+
+def _false(thread: Thread, *args: Value) -> bool:
+    return False
+
+
+def _distance_to(thread: Thread, target: Value) -> float:
+    sprite = thread.target
+    if sprite.is_stage:
+        return 10000.0
+    name = to_string(target)
+    point = _stage_point(thread.vm, name, thread) if name != TARGET_RANDOM else None
+    if point is None:
+        return 10000.0
+    return math.hypot(sprite.x - point[0], sprite.y - point[1])
+
+
+def _ask(thread: Thread, question: Value) -> None:
+    vm = thread.vm
+    vm.answer = vm.answers.popleft() if vm.answers else ""
+
+
+def _key_pressed(thread: Thread, key: Value) -> bool:
+    keys = thread.vm.keys
+    name = _key_name(to_string(key))
+    return bool(keys) if name == "any" else name in keys
+
+
+def _sensing_of(prop: str, thread: Thread, target: Value) -> Value:
+    """[属性] of [角色]"""
+    vm = thread.vm
+    name = to_string(target)
+    try:
+        other = vm.stage if name == TARGET_STAGE else vm.sprite(name)
+    except KeyError:
+        return 0.0
+    if other.is_stage:
+        if prop == "backdrop #":
+            return float(other.costume + 1)
+        if prop == "backdrop name":
+            return other.costume_name
+        if prop == "volume":
+            return other.volume
+    else:
+        values = {"x position": other.x, "y position": other.y, "direction": other.direction,
+                  "costume #": float(other.costume + 1), "costume name": other.costume_name,
+                  "size": other.size, "volume": other.volume}
+        if prop in values:
+            return values[prop]
+    try:
+        for var_id, value in other.data["variables"].items():
+            if value[0] == prop:
+                return other.variables[var_id]
+    except KeyError:
+        pass
+    return 0.0
+
+
+def _current(option: str, thread: Thread) -> float:
+    now = EPOCH + timedelta(seconds=thread.vm.time)
+    values = {"YEAR": now.year, "MONTH": now.month, "DATE": now.day, "DAYOFWEEK": now.isoweekday() % 7 + 1,
+              "HOUR": now.hour, "MINUTE": now.minute, "SECOND": now.second}
+    return float(values.get(option.upper(), 0))
+
+
+def _reset_timer(thread: Thread) -> None:
+    thread.vm.timer_start = thread.vm.time
+
+
+def _set_drag_mode(mode: str, thread: Thread) -> None:
+    thread.target.draggable = mode == "draggable"
+
+
+# 声音、画笔和不渲染时没有效果的积木：计数后跳过
+_NO_EFFECT = (
+    "sound_play", "sound_playuntildone", "sound_stopallsounds", "sound_seteffectto", "sound_changeeffectby",
+    "sound_cleareffects", "pen_clear", "pen_stamp", "pen_penDown", "pen_penUp", "pen_setPenColorToColor",
+    "pen_changePenColorParamBy", "pen_setPenColorParamTo", "pen_changePenSizeBy", "pen_setPenSizeTo",
+    "data_showvariable", "data_hidevariable", "data_showlist", "data_hidelist",
+)
+
+
+def _set_volume(thread: Thread, volume: Value) -> None:
+    thread.target.volume = min(100.0, max(0.0, to_number(volume)))
+
+
+def _change_volume(thread: Thread, change: Value) -> None:
+    _set_volume(thread, thread.target.volume + to_number(change))
+
+
+# 语句积木：{opcode: (输入名, 字段名, 原语)}
+STATEMENTS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...], Callable]] = {
+    "control_wait": (("DURATION",), (), _wait),
+    "control_create_clone_of": (("CLONE_OPTION",), (), _create_clone),
+    "control_delete_this_clone": ((), (), _delete_this_clone),
+    "event_broadcast": (("BROADCAST_INPUT",), (), _broadcast),
+    "event_broadcastandwait": (("BROADCAST_INPUT",), (), _broadcast_and_wait),
+    "data_setvariableto": (("VALUE",), ("VARIABLE",), _set_variable),
+    "data_changevariableby": (("VALUE",), ("VARIABLE",), _change_variable),
+    "data_addtolist": (("ITEM",), ("LIST",), _add_to_list),
+    "data_deleteoflist": (("INDEX",), ("LIST",), _delete_of_list),
+    "data_deletealloflist": ((), ("LIST",), _delete_all_of_list),
+    "data_insertatlist": (("ITEM", "INDEX"), ("LIST",), _insert_at_list),
+    "data_replaceitemoflist": (("INDEX", "ITEM"), ("LIST",), _replace_item_of_list),
+    "motion_movesteps": (("STEPS",), (), _move_steps),
+    "motion_turnright": (("DEGREES",), (), partial(_turn, 1)),
+    "motion_turnleft": (("DEGREES",), (), partial(_turn, -1)),
+    "motion_goto": (("TO",), (), _go_to),
+    "motion_gotoxy": (("X", "Y"), (), _go_to_xy),
+    "motion_glideto": (("SECS", "TO"), (), _glide_to),
+    "motion_glidesecstoxy": (("SECS", "X", "Y"), (), _glide_to_xy),
+    "motion_pointindirection": (("DIRECTION",), (), _point_in_direction),
+    "motion_pointtowards": (("TOWARDS",), (), _point_towards),
+    "motion_changexby": (("DX",), (), _change_x),
+    "motion_setx": (("X",), (), _set_x),
+    "motion_changeyby": (("DY",), (), _change_y),
+    "motion_sety": (("Y",), (), _set_y),
+    "motion_ifonedgebounce": ((), (), _if_on_edge_bounce),
+    "motion_setrotationstyle": ((), ("STYLE",), _set_rotation_style),
+    "looks_say": (("MESSAGE",), (), partial(_say, "say")),
+    "looks_think": (("MESSAGE",), (), partial(_say, "think")),
+    "looks_sayforsecs": (("MESSAGE", "SECS"), (), partial(_say_for_secs, "say")),
+    "looks_thinkforsecs": (("MESSAGE", "SECS"), (), partial(_say_for_secs, "think")),
+    "looks_switchcostumeto": (("COSTUME",), (), _switch_costume),
+    "looks_nextcostume": ((), (), _next_costume),
+    "looks_switchbackdropto": (("BACKDROP",), (), _switch_backdrop),
+    "looks_switchbackdroptoandwait": (("BACKDROP",), (), _switch_backdrop_and_wait),
+    "looks_nextbackdrop": ((), (), _next_backdrop),
+    "looks_changesizeby": (("CHANGE",), (), _change_size),
+    "looks_setsizeto": (("SIZE",), (), _set_size),
+    "looks_changeeffectby": (("CHANGE",), ("EFFECT",), _change_effect),
+    "looks_seteffectto": (("VALUE",), ("EFFECT",), _set_effect),
+    "looks_cleargraphiceffects": ((), (), _clear_effects),
+    "looks_show": ((), (), partial(_set_visible, True)),
+    "looks_hide": ((), (), partial(_set_visible, False)),
+    "looks_gotofrontback": ((), ("FRONT_BACK",), _go_to_front_back),
+    "looks_goforwardbackwardlayers": (("NUM",), ("FORWARD_BACKWARD",), _go_forward_backward),
+    "sensing_askandwait": (("QUESTION",), (), _ask),
+    "sensing_resettimer": ((), (), _reset_timer),
+    "sensing_setdragmode": ((), ("DRAG_MODE",), _set_drag_mode),
+    "sound_setvolumeto": (("VOLUME",), (), _set_volume),
+    "sound_changevolumeby": (("VOLUME",), (), _change_volume),
+}
+STATEMENTS.update({opcode: ((), (), _noop) for opcode in _NO_EFFECT})
+
+# 语句原语之后追加的指令：会等待的积木在原语之后检查等待条件
+_AFTER: Dict[str, Tuple[Tuple[int, Any], ...]] = {
+    "control_wait": ((_BLOCKED, _is_sleeping),),
+    "event_broadcastandwait": ((_BLOCKED, _is_waiting_for_threads),),
+    "looks_switchbackdroptoandwait": ((_BLOCKED, _is_waiting_for_threads),),
+    "looks_sayforsecs": ((_BLOCKED, _is_sleeping), (_EXEC, _clear_bubble)),
+    "looks_thinkforsecs": ((_BLOCKED, _is_sleeping), (_EXEC, _clear_bubble)),
+    "motion_glideto": ((_BLOCKED, _is_gliding),),
+    "motion_glidesecstoxy": ((_BLOCKED, _is_gliding),),
+}
+
+# reporter 积木：{opcode: (输入名, 字段名, 原语)}
+REPORTERS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...], Callable]] = {
+    "operator_add": (("NUM1", "NUM2"), (), _binary("+")),
+    "operator_subtract": (("NUM1", "NUM2"), (), _binary("-")),
+    "operator_multiply": (("NUM1", "NUM2"), (), _binary("*")),
+    "operator_divide": (("NUM1", "NUM2"), (), _binary("/")),
+    "operator_mod": (("NUM1", "NUM2"), (), _binary("%")),
+    "operator_lt": (("OPERAND1", "OPERAND2"), (), _binary("<")),
+    "operator_gt": (("OPERAND1", "OPERAND2"), (), _binary(">")),
+    "operator_equals": (("OPERAND1", "OPERAND2"), (), _binary("=")),
+    "operator_and": (("OPERAND1", "OPERAND2"), (), _binary("and")),
+    "operator_or": (("OPERAND1", "OPERAND2"), (), _binary("or")),
+    "operator_not": (("OPERAND",), (), lambda thread, value: not to_boolean(value)),
+    "operator_random": (("FROM", "TO"), (), _random),
+    "operator_join": (("STRING1", "STRING2"), (), lambda thread, a, b: to_string(a) + to_string(b)),
+    "operator_letter_of": (("LETTER", "STRING"), (), _letter_of),
+    "operator_length": (("STRING",), (), lambda thread, text: float(len(to_string(text)))),
+    "operator_contains": (("STRING1", "STRING2"), (),
+                          lambda thread, a, b: to_string(b).lower() in to_string(a).lower()),
+    "operator_round": (("NUM",), (), lambda thread, value: js_round(to_number(value))),
+    "operator_mathop": (("NUM",), ("OPERATOR",), _mathop),
+    "data_itemoflist": (("INDEX",), ("LIST",), _item_of_list),
+    "data_itemnumoflist": (("ITEM",), ("LIST",), _item_num_of_list),
+    "data_lengthoflist": ((), ("LIST",), _length_of_list),
+    "data_listcontainsitem": (("ITEM",), ("LIST",), _list_contains_item),
+    "data_listcontents": ((), ("LIST",), _list_contents),
+    "motion_xposition": ((), (), lambda thread: _limit_precision(thread.target.x)),
+    "motion_yposition": ((), (), lambda thread: _limit_precision(thread.target.y)),
+    "motion_direction": ((), (), lambda thread: thread.target.direction),
+    "looks_costumenumbername": ((), ("NUMBER_NAME",), _costume_number_name),
+    "looks_backdropnumbername": ((), ("NUMBER_NAME",), _backdrop_number_name),
+    "looks_size": ((), (), lambda thread: float(round(thread.target.size))),
+    "sensing_touchingobject": (("TOUCHINGOBJECTMENU",), (), _touching),
+    "sensing_touchingcolor": (("COLOR",), (), _false),
+    "sensing_coloristouchingcolor": (("COLOR", "COLOR2"), (), _false),
+    "sensing_distanceto": (("DISTANCETOMENU",), (), _distance_to),
+    "sensing_answer": ((), (), lambda thread: thread.vm.answer),
+    "sensing_keypressed": (("KEY_OPTION",), (), _key_pressed),
+    "sensing_mousedown": ((), (), lambda thread: thread.vm.mouse_down),
+    "sensing_mousex": ((), (), lambda thread: thread.vm.mouse_x),
+    "sensing_mousey": ((), (), lambda thread: thread.vm.mouse_y),
+    "sensing_loudness": ((), (), lambda thread: -1.0),
+    "sensing_timer": ((), (), lambda thread: thread.vm.timer),
+    "sensing_of": (("OBJECT",), ("PROPERTY",), _sensing_of),
+    "sensing_current": ((), ("CURRENTMENU",), _current),
+    "sensing_dayssince2000": ((), (), lambda thread: thread.vm.time / 86400),
+    "sensing_username": ((), (), lambda thread: ""),
+    "sound_volume": ((), (), lambda thread: thread.target.volume),
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """python -m compiler.interpreter 项目.sb3 [帧数]：运行项目并输出执行最多的积木"""
+    import sys
+    args = sys.argv[1:] if argv is None else argv
+    if not args:
+        print("用法: python -m compiler.interpreter <项目.sb3> [帧数]")
+        return 2
+    vm = Interpreter.load(args[0])
+    vm.green_flag()
+    frames = int(args[1]) if len(args) > 1 else FPS
+    steps = vm.run_frames(frames)
+    print(f"运行 {frames} 帧，执行 {steps} 条指令，{len(vm.threads)} 个线程未结束")
+    for opcode, count in vm.opcode_counts.most_common(20):
+        print(f"  {opcode}: {count}")
+    for opcode, count in vm.unsupported.most_common():
+        print(f"  ⚠️ 跳过 {opcode}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,14 @@
 """
 词法分析器 - 将字符串转换为Token列表
+
+Lexer 由一个带命名分组的主正则驱动：每个 Token 一次 match，值直接切片得到。
 """
+import re
 from enum import Enum
 from dataclasses import dataclass
+from typing import List, Tuple
+
+from .exceptions import ParseError
 
 class TokenType(Enum):
     NUMBER = "NUMBER"
@@ -22,6 +28,114 @@ class Token:
     value: any
     pos: int
 
+# 逻辑运算符（"不是" 映射为 "非"）
+LOGIC_WORDS = {'且': '且', '或': '或', '非': '非', '不是': '非', 'and': 'and', 'or': 'or', 'not': 'not'}
+
+# 函数名
+FUNCTION_NAMES = frozenset(['四舍五入', 'abs', 'floor', 'ceiling', 'sqrt', 'sin', 'cos', 'tan',
+                            'asin', 'acos', 'atan', 'ln', 'log', 'round'])
+
+# 单词字符：ASCII 字母数字、下划线和所有非 ASCII 字符（与 isalnum() or '_' or ord > 127 相同）
+_WORD_CHARS = '[A-Za-z0-9_\u0080-\U0010FFFF]'
+
+# 主正则：先跳过空白，再按原先 tokenize 中的判断顺序尝试各分组；\s 与 str.isspace() 完全一致。
+# 最后两个分组（end、error）保证任何位置都能匹配，finditer 得到的匹配首尾相接。
+_TOKEN_RE = re.compile(r"""
+    \s*
+    (?:
+        (?P<number>[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)(?![0-9.eE\u0080-\U0010FFFF])
+      | (?P<exact_number>[0-9]|\.)
+      | (?P<string>"[^"\0]*"?|'[^'\0]*'?)
+      | (?P<variable>~(?P<name>""" + _WORD_CHARS + r"""*))
+      | (?P<operator>[-+*/%]|[<>]=?|==?)
+      | (?P<not_equal>!=|≠)
+      | (?P<bang>!)
+      | (?P<lparen>\()
+      | (?P<rparen>\))
+      | (?P<comma>,)
+      | (?P<word>""" + _WORD_CHARS + r"""+)
+      | (?P<end>\Z)
+      | (?P<error>.)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+_GROUP = _TOKEN_RE.groupindex
+_NUMBER = _GROUP['number']
+_EXACT_NUMBER = _GROUP['exact_number']
+_STRING = _GROUP['string']
+_VARIABLE = _GROUP['variable']
+_NAME = _GROUP['name']
+_NOT_EQUAL = _GROUP['not_equal']
+_WORD = _GROUP['word']
+_ERROR = _GROUP['error']
+
+# 值等于匹配文本的简单 Token：分组下标 -> TokenType
+_SIMPLE_TYPES = [None] * (_TOKEN_RE.groups + 1)
+for _kind, _type in (('operator', TokenType.OPERATOR), ('lparen', TokenType.LPAREN),
+                     ('rparen', TokenType.RPAREN), ('comma', TokenType.COMMA)):
+    _SIMPLE_TYPES[_GROUP[_kind]] = _type
+
+
+def _read_number_exact(text: str, start: int) -> Tuple[Token, int]:
+    """按原先的状态机读取数字（支持非 ASCII 数字），并给出相同的错误
+
+    Args:
+        text: 源文本
+        start: 数字起始位置（数字或后跟数字的小数点）
+
+    Returns:
+        (数字 Token, 结束位置)
+    """
+    length = len(text)
+    pos = start
+    has_digit = False
+    has_dot = False
+
+    # 读取整数部分
+    while pos < length and text[pos].isdigit():
+        has_digit = True
+        pos += 1
+
+    # 读取小数部分（只能有一个小数点）
+    if pos < length and text[pos] == '.':
+        # 检查后面是否还有另一个小数点（如 1.2.3）
+        peek_pos = pos + 1
+        while peek_pos < length and text[peek_pos].isdigit():
+            peek_pos += 1
+        if peek_pos < length and text[peek_pos] == '.':
+            raise ParseError("无效的数字格式: 多个小数点", start)
+
+        has_dot = True
+        pos += 1
+        while pos < length and text[pos].isdigit():
+            has_digit = True
+            pos += 1
+
+    # 科学计数法
+    if pos < length and text[pos].lower() == 'e':
+        pos += 1
+        if pos < length and text[pos] in '+-':
+            pos += 1
+        e_has_digit = False
+        while pos < length and text[pos].isdigit():
+            e_has_digit = True
+            pos += 1
+        if not e_has_digit:
+            raise ParseError("科学计数法格式错误: 'e' 后缺少数字", start)
+
+    value_str = text[start:pos]
+
+    if not has_digit:
+        raise ParseError(f"无效的数字格式: '{value_str}'", start)
+
+    try:
+        if has_dot or 'e' in value_str.lower():
+            return Token(TokenType.NUMBER, float(value_str), start), pos
+        return Token(TokenType.NUMBER, int(value_str), start), pos
+    except ValueError as e:
+        raise ParseError(f"无效的数字格式: '{value_str}' - {e}", start)
+
+
 class Lexer:
     """分词器"""
 
@@ -29,189 +143,71 @@ class Lexer:
         self.text = text
         self.pos = 0
 
-    def tokenize(self):
-        """将字符串转换为Token列表"""
+    def tokenize(self) -> List[Token]:
+        """将字符串转换为Token列表
+
+        Raises:
+            ParseError: 数字格式错误或无法识别的字符（位置为字符下标）
+        """
+        text = self.text
+        length = len(text)
+        finditer = _TOKEN_RE.finditer
+        simple_types = _SIMPLE_TYPES
+        number_group, word_group, variable_group = _NUMBER, _WORD, _VARIABLE
+        make_token = Token
+        number_type = TokenType.NUMBER
+        string_type = TokenType.STRING
         tokens = []
-        while self.pos < len(self.text):
-            if self._current().isspace():
-                self.pos += 1
-                continue
-
-            if self._current().isdigit():
-                tokens.append(self._read_number())
-            elif self._current() in '"\'':
-                tokens.append(self._read_string())
-            elif self._current() == '~':
-                tokens.append(self._read_variable())
-            elif self._current() in '+-*/%':
-                tokens.append(Token(TokenType.OPERATOR, self._current(), self.pos))
-                self.pos += 1
-            elif self._current() in '><':
-                tokens.append(self._read_comparison())
-            elif self._current() == '=':
-                # 支持 == 和 = 作为相等运算符（Scratch 使用 =）
-                if self._peek() == '=':
-                    tokens.append(Token(TokenType.OPERATOR, '==', self.pos))
-                    self.pos += 2
-                else:
-                    tokens.append(Token(TokenType.OPERATOR, '=', self.pos))
-                    self.pos += 1
-            elif self._current() == '!':
-                # 检查是否是 !=
-                if self._peek() == '=':
-                    tokens.append(Token(TokenType.OPERATOR, '≠', self.pos))
-                    self.pos += 2
-                else:
-                    self.pos += 1  # 跳过单独的 !
-            elif self._current() == '≠':
-                tokens.append(Token(TokenType.OPERATOR, '≠', self.pos))
-                self.pos += 1
-            elif self._current() == '(':
-                tokens.append(Token(TokenType.LPAREN, '(', self.pos))
-                self.pos += 1
-            elif self._current() == ')':
-                tokens.append(Token(TokenType.RPAREN, ')', self.pos))
-                self.pos += 1
-            elif self._current() == ',':
-                tokens.append(Token(TokenType.COMMA, ',', self.pos))
-                self.pos += 1
-            elif self._current() == '.':
-                # 处理小数点：.5 是有效数字，单独的 . 是错误
-                if self._peek().isdigit():
-                    tokens.append(self._read_number())
-                else:
-                    from compiler.exceptions import ParseError
-                    raise ParseError(f"无效的字符: '.'", self.pos)
+        append = tokens.append
+        pos = self.pos
+
+        while pos < length:
+            for m in finditer(text, pos):
+                index = m.lastindex
+                token_type = simple_types[index]
+                if token_type is not None:
+                    append(make_token(token_type, m[index], m.start(index)))
+                elif index == number_group:
+                    value = m[index]
+                    append(make_token(number_type, int(value) if value.isdigit() else float(value), m.start(index)))
+                elif index == variable_group:
+                    append(make_token(TokenType.VARIABLE, m[_NAME], m.start(index)))
+                elif index == word_group:
+                    word = m[index]
+                    start = m.start(index)
+                    if word in LOGIC_WORDS:
+                        append(Token(TokenType.LOGIC, LOGIC_WORDS[word], start))
+                    elif word in FUNCTION_NAMES:
+                        append(Token(TokenType.FUNCTION, word, start))
+                    elif word[0].isdigit():
+                        # 非 ASCII 数字（如全角数字）开头：按数字读取，之后从数字结尾重新匹配
+                        token, pos = _read_number_exact(text, start)
+                        append(token)
+                        break
+                    else:
+                        # 其他单词作为字符串处理
+                        append(make_token(string_type, word, start))
+                elif index == _STRING:
+                    value = m[index]
+                    closed = len(value) > 1 and value[-1] == value[0]
+                    append(Token(string_type, value[1:-1] if closed else value[1:], m.start(index)))
+                elif index == _EXACT_NUMBER:
+                    # 后面紧跟小数点、e 或非 ASCII 字符的数字，以及 .5 这样的小数：按原逻辑读取
+                    start = m.start(index)
+                    if text[start] == '.' and not text[start + 1:start + 2].isdigit():
+                        raise ParseError("无效的字符: '.'", start)
+                    token, pos = _read_number_exact(text, start)
+                    append(token)
+                    break
+                elif index == _NOT_EQUAL:
+                    append(Token(TokenType.OPERATOR, '≠', m.start(index)))
+                elif index == _ERROR:
+                    start = m.start(index)
+                    raise ParseError(f"无效的字符: '{text[start]}'", start)
+                # bang：跳过单独的 !；end：只剩空白
             else:
-                tokens.append(self._read_word())
+                pos = length
 
-        tokens.append(Token(TokenType.EOF, None, self.pos))
+        self.pos = pos
+        append(Token(TokenType.EOF, None, pos))
         return tokens
-
-    def _current(self):
-        """获取当前字符"""
-        if self.pos >= len(self.text):
-            return '\0'
-        return self.text[self.pos]
-
-    def _peek(self, offset=1):
-        """向前看"""
-        pos = self.pos + offset
-        if pos >= len(self.text):
-            return '\0'
-        return self.text[pos]
-
-    def _read_number(self):
-        """读取数字 - 支持整数、浮点数"""
-        from compiler.exceptions import ParseError
-
-        start = self.pos
-
-        # 状态机解析数字，确保格式正确
-        has_digit = False
-        has_dot = False
-
-        # 读取整数部分
-        while self._current().isdigit():
-            has_digit = True
-            self.pos += 1
-
-        # 读取小数部分（只能有一个小数点）
-        if self._current() == '.':
-            # 检查后面是否还有另一个小数点（如 1.2.3）
-            peek_pos = self.pos + 1
-            while peek_pos < len(self.text) and self.text[peek_pos].isdigit():
-                peek_pos += 1
-            if peek_pos < len(self.text) and self.text[peek_pos] == '.':
-                # 发现 1.2.3 这种格式，抛出错误
-                raise ParseError(f"无效的数字格式: 多个小数点", start)
-
-            has_dot = True
-            self.pos += 1
-            # 小数点后必须有数字
-            while self._current().isdigit():
-                has_digit = True
-                self.pos += 1
-
-        # 科学计数法
-        if self._current().lower() == 'e':
-            self.pos += 1
-            if self._current() in '+-':
-                self.pos += 1
-            # e 后必须有数字
-            e_has_digit = False
-            while self._current().isdigit():
-                e_has_digit = True
-                self.pos += 1
-            if not e_has_digit:
-                raise ParseError(f"科学计数法格式错误: 'e' 后缺少数字", start)
-
-        value_str = self.text[start:self.pos]
-
-        if not has_digit:
-            raise ParseError(f"无效的数字格式: '{value_str}'", start)
-
-        # 转换为数值
-        try:
-            if has_dot or 'e' in value_str.lower():
-                return Token(TokenType.NUMBER, float(value_str), start)
-            else:
-                return Token(TokenType.NUMBER, int(value_str), start)
-        except ValueError as e:
-            raise ParseError(f"无效的数字格式: '{value_str}' - {e}", start)
-
-    def _read_string(self):
-        """读取字符串"""
-        start = self.pos
-        quote = self._current()
-        self.pos += 1
-        value = ''
-        while self._current() != quote and self._current() != '\0':
-            value += self._current()
-            self.pos += 1
-        if self._current() == quote:
-            self.pos += 1
-        return Token(TokenType.STRING, value, start)
-
-    def _read_variable(self):
-        """读取变量引用 ~变量名"""
-        start = self.pos
-        self.pos += 1  # 跳过 ~
-        name = ''
-        while self._current() != '\0' and (self._current().isalnum() or self._current() in '_' or ord(self._current()) > 127):
-            name += self._current()
-            self.pos += 1
-        return Token(TokenType.VARIABLE, name, start)
-
-    def _read_comparison(self):
-        """读取比较运算符 > < >= <="""
-        start = self.pos
-        op = self._current()
-        self.pos += 1
-        if self._current() == '=':
-            op += '='
-            self.pos += 1
-        return Token(TokenType.OPERATOR, op, start)
-
-    def _read_word(self):
-        """读取单词（逻辑运算符或函数名）"""
-        start = self.pos
-        word = ''
-        while self._current() != '\0' and (self._current().isalnum() or self._current() in '_' or ord(self._current()) > 127):
-            word += self._current()
-            self.pos += 1
-
-        # 逻辑运算符
-        if word in ['且', '或', '非', '不是', 'and', 'or', 'not']:
-            # 将"不是"映射为"非"
-            if word == '不是':
-                word = '非'
-            return Token(TokenType.LOGIC, word, start)
-
-        # 函数名
-        if word in ['四舍五入', 'abs', 'floor', 'ceiling', 'sqrt', 'sin', 'cos', 'tan',
-                    'asin', 'acos', 'atan', 'ln', 'log', 'round']:
-            return Token(TokenType.FUNCTION, word, start)
-
-        # 其他单词作为字符串处理
-        return Token(TokenType.STRING, word, start)
@@ -0,0 +1,204 @@
+"""
+表达式缓存 - 按表达式文本记忆化 _parse_value / _parse_condition 的结果
+
+同一段表达式文本（如 "~x + 1"、"鼠标的x坐标"、"从 1 到 10 随机选一个数"）在程序中
+往往重复出现很多次。第一次解析时截取新建的积木作为模板，之后命中时按模板复制
+一份、分配新的积木 ID 并重连 parent/next/输入，跳过词法分析、表达式解析和正则匹配。
+
+模板中积木的顺序就是 ID 的分配顺序，命中时按同样顺序分配 ID，
+所以开启缓存前后生成的项目完全相同。
+
+缓存只在同一作用域内有效，以下情况会整体清空：
+- 切换了当前角色/舞台（变量按角色局部 -> 舞台全局解析）
+- 切换了依赖日志（增量编译按区段记录对舞台符号的读取，命中缓存不会重新查找）
+- 当前角色或舞台声明了新的变量或列表（同名变量的解析结果可能改变）
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .blockrecord import Block, new_block
+from .symbols import LIST, VARIABLE
+
+# 默认最多缓存的表达式数量
+DEFAULT_EXPRESSION_CACHE_SIZE = 1024
+
+
+@dataclass
+class ExpressionCacheStats:
+    """表达式缓存统计"""
+    hits: int = 0
+    misses: int = 0
+    # 因作用域变化整体清空的次数
+    invalidations: int = 0
+    # 因超出容量淘汰的条目数
+    evictions: int = 0
+
+    def merge(self, other: 'ExpressionCacheStats') -> None:
+        """累加另一份统计（如并行编译工作进程的统计）"""
+        self.hits += other.hits
+        self.misses += other.misses
+        self.invalidations += other.invalidations
+        self.evictions += other.evictions
+
+
+@dataclass
+class _Template:
+    """一次解析结果的模板：返回值和按 ID 分配顺序排列的新建积木"""
+    result: Any
+    blocks: List[Tuple[str, Dict[str, Any]]]
+
+
+def _clone(value: Any) -> Any:
+    """复制 JSON 结构的值"""
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    return value
+
+
+def _clone_input(value: Any, mapping: Dict[str, str]) -> Any:
+    """复制输入值，把其中引用的积木 ID（[类型, ID, ...] 中的字符串）换成新 ID
+
+    输入值形如 [1, [10, "文本"]]、[2, 积木ID]、[3, 积木ID, [4, "0"]]，其中的字面量是一层列表。
+    """
+    if value.__class__ is not list:
+        return _clone(value)
+    return [value[0]] + [mapping.get(item, item) if item.__class__ is str else
+                         (item[:] if item.__class__ is list else item) for item in value[1:]]
+
+
+def _clone_block(block: Dict[str, Any], mapping: Dict[str, str]) -> Block:
+    """复制积木并按 mapping 重连 parent、next 和输入
+
+    opcode、shadow 等是不可变值，字段值是 [值, ID] 一层列表，只有 mutation 等其他结构需要深复制。
+    """
+    copy = new_block(block["opcode"],
+                     {name: _clone_input(value, mapping) for name, value in block["inputs"].items()},
+                     {name: value[:] for name, value in block["fields"].items()},
+                     mapping.get(block["parent"], block["parent"]), mapping.get(block["next"], block["next"]),
+                     block["shadow"], block["topLevel"], block.get("x"), block.get("y"),
+                     _clone(block["mutation"]) if "mutation" in block else None)
+    if len(copy) != len(block):
+        # new_block 不认识的键（如 comment）
+        for key, value in block.items():
+            copy.setdefault(key, _clone(value))
+    return copy
+
+
+class ExpressionCache:
+    """表达式解析结果的 LRU 缓存
+
+    Args:
+        builder: SB3 构建器
+        maxsize: 最多缓存的表达式数量，0 表示禁用
+    """
+
+    def __init__(self, builder: Any, maxsize: int = DEFAULT_EXPRESSION_CACHE_SIZE) -> None:
+        self.builder = builder
+        self.maxsize = maxsize
+        self.stats = ExpressionCacheStats()
+        self._entries: 'OrderedDict[Hashable, _Template]' = OrderedDict()
+        self._target = None
+        self._journal = None
+        self._generation: Optional[Tuple[int, int]] = None
+        # 当前正在解析的表达式是否产生了不能重放的副作用（如打印警告）
+        self._tainted = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        if self._entries:
+            self.stats.invalidations += 1
+            self._entries.clear()
+
+    def taint(self) -> None:
+        """标记当前解析有副作用，结果（及外层表达式的结果）不写入缓存"""
+        self._tainted = True
+
+    def memoize(self, kind: str, text: str, context: Hashable, compute: Callable[[str], Any]) -> Any:
+        """返回缓存的解析结果的副本，未命中时调用 compute 解析并记录模板
+
+        Args:
+            kind: 解析方式（如 "value"、"condition"）
+            text: 表达式文本
+            context: 其他影响解析结果的状态（如自定义积木的参数名）
+            compute: 实际的解析函数
+
+        Returns:
+            与 compute(text) 相同格式的结果
+        """
+        if not self.enabled:
+            return compute(text)
+        self._check_scope()
+
+        key = (kind, text, context)
+        template = self._entries.get(key)
+        if template is not None:
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return self._instantiate(template)
+
+        self.stats.misses += 1
+        builder = self.builder
+        outermost = builder.id_log is None
+        if outermost:
+            builder.id_log = []
+        start = len(builder.id_log)
+        outer_tainted, self._tainted = self._tainted, False
+        try:
+            result = compute(text)
+            if not self._tainted:
+                self._store(key, result, builder.id_log[start:])
+        finally:
+            self._tainted = outer_tainted or self._tainted
+            if outermost:
+                builder.id_log = None
+        return result
+
+    def _check_scope(self) -> None:
+        """作用域变化时清空缓存"""
+        builder = self.builder
+        target = builder.current_sprite
+        generation = (self._visible_symbols(target), self._visible_symbols(builder.stage))
+        if target is not self._target or builder.journal is not self._journal or generation != self._generation:
+            self.clear()
+            self._target = target
+            self._journal = builder.journal
+            self._generation = generation
+
+    def _visible_symbols(self, target: Optional[Dict[str, Any]]) -> int:
+        """target 中按名称可见的变量和列表数量"""
+        if target is None:
+            return 0
+        table = self.builder.symbols(target)
+        return len(table.by_name[VARIABLE]) + len(table.by_name[LIST])
+
+    def _store(self, key: Hashable, result: Any, block_ids: List[str]) -> None:
+        """记录模板，超出容量时淘汰最久未使用的条目"""
+        blocks = self.builder.current_sprite["blocks"]
+        if not all(block_id in blocks for block_id in block_ids):
+            # 分配了 ID 却没有新建积木：命中时无法按相同顺序分配 ID，不缓存
+            return
+        template = _Template(_clone(result), [(block_id, _clone_block(blocks[block_id], {}))
+                                              for block_id in block_ids])
+        self._entries[key] = template
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _instantiate(self, template: _Template) -> Any:
+        """按模板新建积木（分配新 ID）并返回对应的结果"""
+        builder = self.builder
+        mapping = {block_id: builder.generate_id() for block_id, _ in template.blocks}
+        blocks = builder.current_sprite["blocks"]
+        for block_id, block in template.blocks:
+            blocks[mapping[block_id]] = _clone_block(block, mapping)
+        return _clone_input(template.result, mapping)
@@ -0,0 +1,247 @@
+"""
+并行编译 - 在进程池中编译角色区段
+
+角色区段（见 incremental.py）之间只通过舞台上的变量/列表、广播、扩展和同名角色的
+自定义积木相互影响。主进程按源码顺序处理各区段的声明行（创建 target、登记 ID
+作用域），把需要的共享状态（舞台变量和列表的快照、ID 作用域、同名角色的自定义
+积木）连同区段源码发给工作进程；工作进程用依赖日志记录编译过程中的舞台查找和
+副作用。主进程再按源码顺序合并结果：校验依赖、填充 target、重放副作用，因此输出
+与串行编译相同（random 模式下积木 ID 除外）。
+
+以下区段在主进程中编译，编译前先合并此前所有未完成的结果：
+
+- 舞台区段和文件开头的区段（它们修改其他角色依赖的舞台状态）
+- 含有 "背景:" 的角色区段（会切换到舞台）
+- 与尚未合并的角色同名的角色区段（依赖前者定义的自定义积木）
+
+工作进程出错或依赖校验失败时，该区段回退到主进程中编译，错误信息与串行编译一致。
+"""
+import contextlib
+import io
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .exceptions import CompileError
+from .ids import create_id_allocator
+from .incremental import (
+    IncrementalCompiler, IncrementalStats, Section, SectionCache, STAGE_KEYWORDS, line_ranks, split_sections,
+)
+from .symbols import SymbolTable
+
+
+def resolve_jobs(jobs: Optional[int]) -> int:
+    """规范化并行进程数：None 或 1 为串行，0 或负数为 CPU 核数"""
+    if jobs is None:
+        return 1
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def touches_stage(lines: List[str], section: Section) -> bool:
+    """角色区段是否含有会切换到舞台的关键字行"""
+    for line in lines[section.start:section.end]:
+        stripped = line.strip()
+        if ':' in stripped and stripped.split(':', 1)[0].strip() in STAGE_KEYWORDS:
+            return True
+    return False
+
+
+def compile_section(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """在工作进程中编译一个角色区段
+
+    Args:
+        payload: ParallelCompiler 打包的区段源码和共享状态
+
+    Returns:
+        编译结果，格式与增量缓存条目相同，另附资源数据和控制台输出
+
+    Raises:
+        CompileError: 区段切换到了其他 target，需要回退到主进程编译
+    """
+    # 延迟导入：parser 模块导入本模块
+    from .parser import ScratchLangParser
+
+    (security_enabled, auto_scale_costumes, max_costume_size,
+     expression_cache_size, fold_constants, image_cache, asset_workers, png_effort) = payload["options"]
+    parser = ScratchLangParser(security_enabled, auto_scale_costumes, max_costume_size,
+                               expression_cache_size=expression_cache_size, fold_constants=fold_constants,
+                               image_cache=image_cache or False, asset_workers=asset_workers,
+                               png_effort=png_effort)
+    builder = parser.builder
+    builder.id_allocator = create_id_allocator(*payload["id"])
+    parser.current_dir = payload["current_dir"]
+    parser.js_blocks = payload["js_blocks"]
+
+    # 还原主进程中该区段开始时的舞台符号
+    stage = builder.add_sprite("Stage", is_stage=True)
+    for key, value in payload["stage"].items():
+        stage[key].update(value)
+    builder.symbol_tables[id(stage)] = SymbolTable.from_target(stage)
+    parser.has_stage = True
+    builder.current_sprite = None
+
+    lines = payload["lines"]
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        parser._parse_lines(lines, 0, 1)
+        target = builder.current_sprite
+        builder.id_allocator.restore_scope(target, payload["scope"])
+        if payload["custom_blocks"] is not None:
+            parser.custom_blocks[target["name"]] = payload["custom_blocks"]
+        journal = builder.journal = []
+        parser._parse_lines(lines, 1, len(lines))
+        builder.resolve_assets()
+
+    if builder.current_sprite is not target:
+        raise CompileError(f"角色 '{target['name']}' 的区段切换到了其他角色或舞台")
+
+    asset_names = [item["md5ext"] for item in target["costumes"] + target["sounds"]]
+    return {
+        "target": target,
+        "custom_blocks": parser.custom_blocks.get(target["name"]),
+        "journal": journal,
+        "assets": asset_names,
+        "block_lines": line_ranks(parser.block_lines.get(target["name"], {}), lines, 0, len(lines)),
+        # 工作进程的暂存目录随进程中的 AssetManager 删除，转换后的图片随结果传回内容
+        "asset_data": {name: builder.asset_manager.assets[name].portable() for name in asset_names},
+        "output": output.getvalue(),
+        "expression_cache": parser.expression_cache.stats,
+        "constant_folding": parser.ast_converter.folding_stats,
+        "image_cache": (image_cache.stats, image_cache.pinned) if image_cache else None,
+        "asset_stats": builder.asset_stats,
+    }
+
+
+@dataclass
+class _Pending:
+    """已分派、尚未合并的角色区段"""
+    section: Section
+    target: Dict[str, Any]
+    key: Optional[str]
+    entry: Optional[Dict[str, Any]] = None
+    future: Optional[Future] = None
+    # 之后是否已处理过其他声明行（合并后需补做 finalize_sprite）
+    followed: bool = False
+
+
+class ParallelCompiler(IncrementalCompiler):
+    """在进程池中编译角色区段，按源码顺序合并
+
+    传入区段缓存时同时启用增量编译：命中缓存的角色不再分派。
+
+    Args:
+        parser: 解析器（已完成预处理和扩展导入）
+        cache: 区段缓存；为 None 时不读写缓存
+        jobs: 工作进程数
+        executor: 复用已有的进程池；为 None 时每次 run() 新建
+    """
+
+    def __init__(self, parser: Any, cache: Optional[SectionCache], jobs: int,
+                 executor: Optional[Executor] = None) -> None:
+        super().__init__(parser, cache)
+        self.jobs = jobs
+        self.executor = executor
+
+    def run(self, lines: List[str]) -> IncrementalStats:
+        """编译全部区段
+
+        Args:
+            lines: 预处理后的逻辑行
+
+        Returns:
+            IncrementalStats: 复用和重建的角色
+        """
+        if self.executor is not None:
+            return self._run(lines, self.executor)
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            return self._run(lines, executor)
+
+    def _run(self, lines: List[str], executor: Executor) -> IncrementalStats:
+        stats = IncrementalStats()
+        pending: List[_Pending] = []
+        for section in split_sections(lines):
+            if pending and self.builder.current_sprite is pending[-1].target:
+                # 尚未合并的角色此时还是空的，推迟到合并后再 finalize
+                pending[-1].followed = True
+                self.builder.current_sprite = None
+
+            worker_section = (section.sprite is not None and not touches_stage(lines, section))
+            if not worker_section or any(item.target["name"] == section.sprite for item in pending):
+                self._merge(pending, lines, stats)
+                pending = []
+            if not worker_section:
+                self.parser._parse_lines(lines, section.start, section.end)
+                continue
+
+            self.parser._parse_lines(lines, section.start, section.start + 1)
+            target = self.builder.current_sprite
+            key = self.section_key(lines, section, target)
+            item = _Pending(section, target, key)
+            if key is not None:
+                item.entry = self.cache.load(key)
+            if item.entry is None:
+                item.future = executor.submit(compile_section, self._payload(lines, section, target))
+            pending.append(item)
+
+        self._merge(pending, lines, stats)
+        return stats
+
+    def _payload(self, lines: List[str], section: Section, target: Dict[str, Any]) -> Dict[str, Any]:
+        """打包工作进程需要的区段源码和共享状态"""
+        parser, builder = self.parser, self.builder
+        stage = builder.stage
+        asset_manager = builder.asset_manager
+        return {
+            "options": (parser.security_enabled, asset_manager.auto_scale_costumes,
+                        asset_manager.max_costume_size, parser.expression_cache.maxsize,
+                        parser.ast_converter.fold_constants, asset_manager.image_cache, asset_manager.workers,
+                        asset_manager.png_effort),
+            "id": (builder.id_allocator.mode, builder.id_allocator.seed),
+            "scope": builder.id_allocator.scope(target),
+            "current_dir": parser.current_dir,
+            "lines": lines[section.start:section.end],
+            "js_blocks": parser.js_blocks,
+            "stage": {key: dict(stage[key]) for key in ("variables", "lists", "broadcasts")},
+            "custom_blocks": parser.custom_blocks.get(target["name"]),
+        }
+
+    def _merge(self, pending: List[_Pending], lines: List[str], stats: IncrementalStats) -> None:
+        """按源码顺序合并已分派的角色区段"""
+        for item in pending:
+            target = item.target
+            if item.entry is not None and self._replay(item.entry, target):
+                self._restore_lines(item.entry, lines, item.section, target)
+                print(f"♻️ [{target['name']}] 未修改，复用增量缓存")
+                stats.reused.append(target["name"])
+            else:
+                result = None
+                if item.future is not None:
+                    try:
+                        result = item.future.result()
+                    except Exception:
+                        # 回退到主进程编译，由它报告与串行编译一致的错误
+                        result = None
+                if result is not None and self._replay(result, target, result["asset_data"]):
+                    self._restore_lines(result, lines, item.section, target)
+                    print(result["output"], end="")
+                    self.parser.expression_cache.stats.merge(result["expression_cache"])
+                    self.parser.ast_converter.folding_stats.merge(result["constant_folding"])
+                    if result["image_cache"] is not None:
+                        self.builder.asset_manager.image_cache.merge(*result["image_cache"])
+                    self.builder.asset_stats.merge(result["asset_stats"])
+                    if item.key is not None:
+                        self._store(item.key, target, result["journal"], result["block_lines"])
+                else:
+                    self.builder.current_sprite = target
+                    self.builder.has_custom_costume = False
+                    self._compile_section(lines, item.section, target, item.key)
+                stats.rebuilt.append(target["name"])
+
+            self.builder.current_sprite = target
+            if item.followed:
+                self.builder.finalize_sprite()
+                # 后续声明行已处理过，不能再次 finalize
+                self.builder.current_sprite = None
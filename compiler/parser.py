@@ -2,13 +2,20 @@
 语法解析器 - ScratchLang Compiler (v2.5 最终修复版)
 修复了所有 shadow block 的 parent 链接问题
 """
+import argparse
 import re
 import os
 import json
 import logging
+from functools import partial
+from typing import Optional, Sequence
+from .archive import DEFAULT_COMPRESS_LEVEL
+from .assets import DEFAULT_PNG_EFFORT
 from .builder import SB3Builder
-from .blocks import BlockDefinitions
-from .exceptions import ParseError, SecurityError, AssetError
+from .blockrecord import new_block
+from .ids import DEFAULT_ID_MODE
+from .registry import get_registry
+from .exceptions import ParseError, SecurityError, AssetError, CompileError
 from .constants import (
     SPECIAL_TARGETS, KEY_MAP, TARGET_STAGE,
     ROTATION_STYLES, STOP_OPTIONS, DRAG_MODES
@@ -17,26 +24,89 @@ from .extensions import extension_manager
 from .lexer import Lexer
 from .expression_parser import ExpressionParser
 from .ast_to_scratch import ASTToScratch
+from .preprocessor import preprocess
+from .incremental import IncrementalCompiler, SectionCache
+from .imagecache import ImageCache
+from .parallel import ParallelCompiler, resolve_jobs
+from .memo import DEFAULT_EXPRESSION_CACHE_SIZE, ExpressionCache
+from .peephole import DEFAULT_RULES, PeepholeOptimizer
+from .warp import infer_warp
+from .deadcode import eliminate_dead_code
+from .inliner import DEFAULT_MAX_SIZE, Inliner
+from .hoisting import LoopHoister
+from .typeinfer import NUMBER, infer_types, literal_type
+from .framecost import estimate_frame_cost
 
 class ScratchLangParser:
-    def __init__(self, security_enabled=True, auto_scale_costumes=False, max_costume_size=480):
-        self.builder = SB3Builder(auto_scale_costumes, max_costume_size)
-        self.blocks_def = BlockDefinitions.get_all_blocks()
+    def __init__(self, security_enabled=True, auto_scale_costumes=False, max_costume_size=480,
+                 id_mode=DEFAULT_ID_MODE, incremental=False, cache_dir=None, jobs=1,
+                 expression_cache_size=DEFAULT_EXPRESSION_CACHE_SIZE, fold_constants=True, peephole=True,
+                 warp_inference=True, eliminate_dead_code=False, inline_procedures=False,
+                 inline_max_size=DEFAULT_MAX_SIZE, hoist_invariants=False, infer_types=True,
+                 frame_budget=None, cost_table=None, image_cache=True, asset_workers=0,
+                 png_effort=DEFAULT_PNG_EFFORT, compress_level=DEFAULT_COMPRESS_LEVEL):
+        # 位图造型处理结果的磁盘缓存：True 为默认目录，也可以传入 ImageCache；False 时每次都用 PIL 处理
+        if image_cache is True:
+            image_cache = ImageCache()
+        # 造型和音效在线程池中与解析并发处理（asset_workers 为线程数，0 为 CPU 核数，1 为逐个处理），
+        # 解析结束时按源码顺序填入，耗时见 builder.asset_stats
+        # 位图造型重新编码为 PNG 的力度（fast/default/max），不需要缩放的 PNG 在 fast/default 时原样使用
+        # compress_level 为 .sb3 中 project.json、SVG、WAV 的 deflate 级别（0 为全部原样存储）
+        self.builder = SB3Builder(auto_scale_costumes, max_costume_size, id_mode=id_mode,
+                                  image_cache=image_cache or None, asset_workers=resolve_jobs(asset_workers),
+                                  png_effort=png_effort, compress_level=compress_level)
+        self.registry = get_registry()
+        self.blocks_def = self.registry.blocks
+        self.dispatcher = self.registry.dispatcher
         self.has_stage = False
         self.current_dir = os.getcwd()
         self.security_enabled = security_enabled
 
-        # 表达式解析器
-        self.ast_converter = ASTToScratch(self.builder)
+        # 表达式解析器（fold_constants 控制是否折叠常量表达式）
+        self.ast_converter = ASTToScratch(self.builder, fold_constants)
+        # 表达式解析结果缓存（0 为禁用）
+        self.expression_cache = ExpressionCache(self.builder, expression_cache_size)
 
         # 使用常量模块中的映射
         self.SPECIAL_TARGETS = SPECIAL_TARGETS
         self.KEY_MAP = KEY_MAP
 
-        # 自定义积木存储 {角色名: {积木名: {proccode, argumentids, argumentnames, warp}}}
+        # 自定义积木存储 {角色名: {积木名: {proccode, argumentids, argumentnames, warp, refresh}}}
         self.custom_blocks = {}
         # 当前正在解析的自定义积木的参数 {参数名: 参数ID}
         self.current_proc_args = {}
+        # 语句积木所在的逻辑行 {角色名: {积木ID: 逻辑行下标}}，见 source_lines()
+        self.block_lines = {}
+        self.line_map = None
+
+        # 增量编译：按角色区段缓存编译结果，只重建改动过的角色
+        self.incremental = incremental
+        self.section_cache = SectionCache(cache_dir) if incremental else None
+        self.incremental_stats = None
+        # 并行编译角色的进程数：1 为串行，0 为 CPU 核数
+        self.jobs = resolve_jobs(jobs)
+        # 保存前的积木图窥孔优化（peephole=False 时不启用任何规则）
+        self.peephole = PeepholeOptimizer(DEFAULT_RULES if peephole else ())
+        # 保存前为不会让出的自定义积木自动开启不刷新屏幕，结果见 warp_report
+        self.warp_inference = warp_inference
+        self.warp_report = None
+        # 保存前把对小自定义积木的调用替换为积木体（默认关闭），结果见 inline_stats
+        self.inliner = Inliner(inline_max_size, self.builder.id_allocator.new_id,
+                               self.builder.symbols) if inline_procedures else None
+        self.inline_stats = None
+        # 保存前把循环中的不变表达式提到循环之前（默认关闭），结果见 hoist_stats
+        self.hoister = LoopHoister(self.builder.id_allocator.new_id, self.builder.symbols) if hoist_invariants else None
+        self.hoist_stats = None
+        # 保存前删除执行不到的脚本和没有用到的符号（默认关闭），结果见 dead_code_report
+        self.eliminate_dead_code = eliminate_dead_code
+        self.dead_code_report = None
+        # 保存前按输入槽的类型改写字面量和阴影并检查类型，结果见 type_report
+        self.infer_types = infer_types
+        self.type_report = None
+        # 保存前估计每帧的执行代价，结果见 frame_cost；超过 frame_budget 时编译失败
+        self.frame_budget = frame_budget
+        self.cost_table = cost_table
+        self.frame_cost = None
         
     def clean_path(self, path):
         """清理文件路径，去除不可见字符"""
@@ -76,32 +146,6 @@ class ScratchLangParser:
             code = f.read()
         return self.parse(code)
 
-    def _remove_block_comments(self, code):
-        """移除块注释 /* */"""
-        result = []
-        i = 0
-        in_comment = False
-
-        while i < len(code):
-            if not in_comment:
-                if code[i:i+2] == '/*':
-                    in_comment = True
-                    i += 2
-                else:
-                    result.append(code[i])
-                    i += 1
-            else:
-                if code[i:i+2] == '*/':
-                    in_comment = False
-                    i += 2
-                else:
-                    # 保留换行符以维持行号
-                    if code[i] == '\n':
-                        result.append('\n')
-                    i += 1
-
-        return ''.join(result)
-
     def _process_escape_chars(self, text):
         """处理转义字符"""
         escape_map = {
@@ -116,110 +160,20 @@ class ScratchLangParser:
             text = text.replace(escape, char)
         return text
 
-    def _process_multiline_strings(self, code):
-        """处理多行字符串 \"""...\""" 转换为单行"""
-        result = []
-        i = 0
-        while i < len(code):
-            if code[i:i+3] == '"""':
-                # 找到多行字符串开始
-                i += 3
-                string_content = []
-                while i < len(code) and code[i:i+3] != '"""':
-                    string_content.append(code[i])
-                    i += 1
-                if code[i:i+3] == '"""':
-                    i += 3
-                # 将换行转换为 \n
-                content = ''.join(string_content).replace('\n', '\\n')
-                result.append('"' + content + '"')
-            else:
-                result.append(code[i])
-                i += 1
-        return ''.join(result)
-
-    def _extract_js_blocks(self, code):
-        """提取 #code# ... #end# 块中的 JavaScript 代码
-
-        Args:
-            code: 源代码
-
-        Returns:
-            tuple: (处理后的代码, JS代码块列表)
-        """
-        js_blocks = []
-        result = []
-        i = 0
-        in_js_block = False
-        js_content = []
-        block_indent = 0
-
-        lines = code.split('\n')
-        for line in lines:
-            stripped = line.strip()
-            if stripped == '#code#':
-                in_js_block = True
-                js_content = []
-                # 保存缩进级别
-                block_indent = len(line) - len(line.lstrip())
-                # 用占位符替换 #code# 块，保留缩进
-                js_blocks.append(None)  # 占位，稍后填充
-                placeholder = ' ' * block_indent + f'__INLINE_CODE_{len(js_blocks)}__'
-                result.append(placeholder)
-            elif stripped == '#end#' and in_js_block:
-                in_js_block = False
-                js_blocks[-1] = '\n'.join(js_content)
-                result.append('')  # 保留行号
-            elif in_js_block:
-                js_content.append(line)
-                result.append('')  # 保留行号
-            else:
-                result.append(line)
-
-        return '\n'.join(result), js_blocks
-
-    def _extract_extension_imports(self, code):
-        """提取扩展导入语句
-
-        Args:
-            code: 源代码
-
-        Returns:
-            tuple: (处理后的代码, 扩展文件路径列表)
-        """
-        extension_files = []
-        result = []
-
-        lines = code.split('\n')
-        for line in lines:
-            stripped = line.strip()
-            # 匹配: 导入扩展: "file.js" 或 import extension: "file.js"
-            match = re.match(r'(?:导入扩展|import\s+extension)\s*:\s*["\']([^"\']+)["\']', stripped)
-            if match:
-                extension_files.append(match.group(1))
-                result.append('')  # 保留行号
-            else:
-                result.append(line)
-
-        return '\n'.join(result), extension_files
-
     def parse(self, code):
         """解析代码"""
-        # 预处理：移除块注释 /* */
-        code = self._remove_block_comments(code)
-        # 预处理：处理多行字符串 """..."""
-        code = self._process_multiline_strings(code)
-        # 预处理：提取扩展导入
-        code, extension_files = self._extract_extension_imports(code)
-        # 预处理：提取 #code# 块
-        code, js_blocks = self._extract_js_blocks(code)
+        # 预处理：单遍处理块注释、多行字符串、扩展导入和 #code# 块
+        preprocessed = preprocess(code)
+        # 逻辑行 -> 原始行号、列号
+        self.line_map = preprocessed.line_map
 
         # 存储 js_blocks 供后续使用
-        self.js_blocks = js_blocks
+        self.js_blocks = preprocessed.js_blocks
         self.inline_code_counter = 0
 
         # 处理扩展导入
-        for ext_file in extension_files:
+        for ext_import in preprocessed.imports:
+            ext_file = ext_import.path
             try:
                 ext_path = self.resolve_path(ext_file)
                 with open(ext_path, 'r', encoding='utf-8') as f:
@@ -228,12 +182,36 @@ class ScratchLangParser:
                 if ext_id:
                     self.builder.add_extension(ext_id)
             except Exception as e:
-                raise ParseError(f"无法加载扩展 '{ext_file}': {e}")
+                raise ParseError(f"无法加载扩展 '{ext_file}': {e}", ext_import.line)
 
-        lines = code.split('\n')
-        i = 0
-        
-        while i < len(lines):
+        lines = preprocessed.lines
+        if self.jobs > 1:
+            self.incremental_stats = ParallelCompiler(self, self.section_cache, self.jobs).run(lines)
+        elif self.incremental:
+            self.incremental_stats = IncrementalCompiler(self, self.section_cache).run(lines)
+        else:
+            self._parse_lines(lines, 0, len(lines))
+
+        self.builder.resolve_assets()
+        if self.builder.current_sprite is not None:
+            self.builder.finalize_sprite()
+
+        return self.builder
+
+    def _parse_lines(self, lines, start, end):
+        """解析 lines[start:end] 中的顶层语句
+
+        脚本和自定义积木定义遇到 #、@ 开头的行即结束，因此以角色/舞台声明为界的
+        区段可以单独解析（增量编译按区段调用）。
+
+        Args:
+            lines: 预处理后的全部逻辑行
+            start: 起始行索引
+            end: 结束行索引（不含）
+        """
+        i = start
+
+        while i < end:
             line = lines[i]
             stripped = line.strip()
             
@@ -293,11 +271,6 @@ class ScratchLangParser:
                 continue
 
             i += 1
-        
-        if self.builder.current_sprite is not None:
-            self.builder.finalize_sprite()
-
-        return self.builder
 
     def _create_inline_code_block(self, placeholder, parent, top_level):
         """创建内联代码积木
@@ -330,15 +303,7 @@ class ScratchLangParser:
         opcode = f"{ext_id}_run"
         block_id = self.builder.generate_id()
 
-        block = {
-            "opcode": opcode,
-            "next": None,
-            "parent": parent,
-            "inputs": {},
-            "fields": {},
-            "shadow": False,
-            "topLevel": top_level
-        }
+        block = new_block(opcode, parent=parent, top_level=top_level)
 
         if top_level:
             block["x"] = 50
@@ -351,44 +316,44 @@ class ScratchLangParser:
 
         return block_id
 
+    def _report_asset(self, label, filepath, error):
+        """报告登记的资源的处理结果（builder.resolve_assets 按源码顺序调用）"""
+        if error is None:
+            print(f"✅ 成功加载{label}: {os.path.basename(filepath)}")
+        else:
+            print(f"⚠️ 警告: {error}")
+
+    def _report_backdrop(self, filepath, error):
+        """报告 背景: 关键字登记的背景的处理结果"""
+        if isinstance(error, FileNotFoundError):
+            print(f"⚠️ 警告: 背景文件不存在: {filepath}")
+        elif error is not None:
+            print(f"⚠️ 警告: 加载背景失败: {error}")
+        else:
+            self._report_asset("背景", filepath, None)
+
     def handle_keyword(self, keyword, value):
         """处理关键字定义"""
         if keyword in ['背景', 'backdrop']:
             filepath = self.resolve_path(value)
             if not self.builder.current_sprite or not self.builder.current_sprite["isStage"]:
                 self.builder.switch_to_stage()
-            try:
-                self.builder.add_backdrop(filepath)
-                print(f"✅ 成功加载背景: {os.path.basename(filepath)}")
-            except FileNotFoundError:
-                print(f"⚠️ 警告: 背景文件不存在: {filepath}")
-            except Exception as e:
-                print(f"⚠️ 警告: 加载背景失败: {e}")
+            self.builder.request_costume(filepath, is_backdrop=True,
+                                         report=partial(self._report_backdrop, filepath))
             return True
         
         if keyword in ['造型', 'costume']:
             filepath = self.resolve_path(value)
             if self.builder.current_sprite and self.builder.current_sprite["isStage"]:
-                try:
-                    self.builder.add_backdrop(filepath)
-                    print(f"✅ 成功加载背景: {os.path.basename(filepath)}")
-                except Exception as e:
-                    print(f"⚠️ 警告: {e}")
+                self.builder.request_costume(filepath, is_backdrop=True,
+                                             report=partial(self._report_asset, "背景", filepath))
             else:
-                try:
-                    self.builder.add_costume(filepath)
-                    print(f"✅ 成功加载造型: {os.path.basename(filepath)}")
-                except Exception as e:
-                    print(f"⚠️ 警告: {e}")
+                self.builder.request_costume(filepath, report=partial(self._report_asset, "造型", filepath))
             return True
         
         if keyword in ['音效', 'sound']:
             filepath = self.resolve_path(value)
-            try:
-                self.builder.add_sound(filepath)
-                print(f"✅ 成功加载音效: {os.path.basename(filepath)}")
-            except Exception as e:
-                print(f"⚠️ 警告: {e}")
+            self.builder.request_sound(filepath, report=partial(self._report_asset, "音效", filepath))
             return True
         
         if keyword in ['变量', 'var']:
@@ -434,12 +399,19 @@ class ScratchLangParser:
         """解析自定义积木定义"""
         cmd = lines[start_idx].strip()
 
-        # 解析: 定义 积木名(参数1, 参数2) [不刷新屏幕]
+        # 解析: 定义 积木名(参数1, 参数2) [不刷新屏幕 | 刷新屏幕]
         warp = '不刷新屏幕' in cmd or 'warp' in cmd.lower()
         cmd = cmd.replace('不刷新屏幕', '').replace('warp', '').strip()
+        definition_pattern = r'(?:定义|define)\s+(\S+?)(?:\(([^)]*)\))?$'
+
+        # "刷新屏幕" 禁止自动开启不刷新屏幕（见 warp.py）
+        refresh = False
+        without_refresh = re.sub(r'\s+(?:刷新屏幕|refresh)$', '', cmd)
+        if without_refresh != cmd and re.match(definition_pattern, without_refresh):
+            cmd, refresh = without_refresh, True
 
         # 提取积木名和参数
-        match = re.match(r'(?:定义|define)\s+(\S+?)(?:\(([^)]*)\))?$', cmd)
+        match = re.match(definition_pattern, cmd)
         if not match:
             print(f"⚠️ 警告: 无法解析自定义积木定义: {cmd}")
             return start_idx + 1
@@ -465,7 +437,8 @@ class ScratchLangParser:
             "proccode": proccode,
             "argumentids": arg_ids,
             "argumentnames": arg_names,
-            "warp": warp
+            "warp": warp,
+            "refresh": refresh
         }
 
         # 设置当前过程参数（用于解析积木体内的参数引用）
@@ -479,27 +452,14 @@ class ScratchLangParser:
         prototype_inputs = {}
         for arg_name, arg_id in zip(arg_names, arg_ids):
             reporter_id = self.builder.generate_id()
-            self.builder.current_sprite["blocks"][reporter_id] = {
-                "opcode": "argument_reporter_string_number",
-                "next": None,
-                "parent": prototype_id,
-                "inputs": {},
-                "fields": {"VALUE": [arg_name, None]},
-                "shadow": True,
-                "topLevel": False
-            }
+            self.builder.current_sprite["blocks"][reporter_id] = new_block(
+                "argument_reporter_string_number", fields={"VALUE": [arg_name, None]}, parent=prototype_id,
+                shadow=True)
             prototype_inputs[arg_id] = [1, reporter_id]
 
         # 创建 prototype 积木
-        self.builder.current_sprite["blocks"][prototype_id] = {
-            "opcode": "procedures_prototype",
-            "next": None,
-            "parent": definition_id,
-            "inputs": prototype_inputs,
-            "fields": {},
-            "shadow": True,
-            "topLevel": False,
-            "mutation": {
+        self.builder.current_sprite["blocks"][prototype_id] = new_block(
+            "procedures_prototype", prototype_inputs, parent=definition_id, shadow=True, mutation={
                 "tagName": "mutation",
                 "children": [],
                 "proccode": proccode,
@@ -507,21 +467,15 @@ class ScratchLangParser:
                 "argumentnames": json.dumps(arg_names),
                 "argumentdefaults": json.dumps(["" for _ in arg_names]),
                 "warp": "true" if warp else "false"
-            }
-        }
+            })
 
         # 创建 definition 积木
-        self.builder.current_sprite["blocks"][definition_id] = {
-            "opcode": "procedures_definition",
-            "next": None,
-            "parent": None,
-            "inputs": {"custom_block": [1, prototype_id]},
-            "fields": {},
-            "shadow": False,
-            "topLevel": True,
-            "x": 50 + (len(self.builder.current_sprite["blocks"]) % 3) * 300,
-            "y": 50 + (len(self.builder.current_sprite["blocks"]) // 3) * 200
-        }
+        self.builder.current_sprite["blocks"][definition_id] = new_block(
+            "procedures_definition", {"custom_block": [1, prototype_id]}, top_level=True,
+            x=50 + (len(self.builder.current_sprite["blocks"]) % 3) * 300,
+            y=50 + (len(self.builder.current_sprite["blocks"]) // 3) * 200)
+
+        self._record_line(definition_id, start_idx)
 
         # 解析积木体
         base_indent = len(lines[start_idx]) - len(lines[start_idx].lstrip())
@@ -626,22 +580,20 @@ class ScratchLangParser:
             inputs[arg_id] = self._parse_value(arg_value)
 
         # 创建调用积木
-        self.builder.current_sprite["blocks"][call_id] = {
-            "opcode": "procedures_call",
-            "next": None,
-            "parent": parent,
-            "inputs": inputs,
-            "fields": {},
-            "shadow": False,
-            "topLevel": False,
-            "mutation": {
+        self.builder.current_sprite["blocks"][call_id] = new_block(
+            "procedures_call", inputs, parent=parent, mutation={
                 "tagName": "mutation",
                 "children": [],
                 "proccode": proc_info["proccode"],
                 "argumentids": json.dumps(proc_info["argumentids"]),
                 "warp": "true" if proc_info["warp"] else "false"
-            }
-        }
+            })
+
+        # 🔥 设置参数 reporter 的 parent
+        for value in inputs.values():
+            if isinstance(value, list) and len(value) > 1 and isinstance(value[1], str) \
+                    and value[1] in self.builder.current_sprite["blocks"]:
+                self.builder.current_sprite["blocks"][value[1]]["parent"] = call_id
 
         if parent:
             self.builder.current_sprite["blocks"][parent]["next"] = call_id
@@ -650,13 +602,13 @@ class ScratchLangParser:
 
     def is_event_block(self, cmd):
         """判断是否是事件积木"""
-        event_patterns = [v.get("pattern", "") for v in BlockDefinitions.EVENTS.values()]
-        return any(re.search(pattern, cmd) for pattern in event_patterns if pattern)
+        return self.registry.is_event(cmd)
     
     def parse_script(self, lines, start_idx):
         """解析一个脚本"""
         event_line = lines[start_idx].strip()
         event_id = self.create_block(event_line, top_level=True)
+        self._record_line(event_id, start_idx)
         idx, _ = self._parse_block_sequence(lines, start_idx + 1, event_id)
         
         # 🔥 事件块级别不需要"结束"，但如果有就跳过
@@ -698,6 +650,7 @@ class ScratchLangParser:
                 idx, new_id = self.parse_control_block(lines, idx, last_id)
             else:
                 new_id = self.create_block(stripped, parent=last_id)
+                self._record_line(new_id, idx)
                 idx += 1
 
             if new_id:
@@ -710,6 +663,19 @@ class ScratchLangParser:
 
         return idx, first_id
         
+    def _record_line(self, block_id, index):
+        """记录语句积木所在的逻辑行"""
+        if block_id:
+            self.block_lines.setdefault(self.builder.current_sprite["name"], {})[block_id] = index
+
+    def source_lines(self):
+        """语句积木对应的源码行号 {角色名: {积木ID: 原始行号}}（从 1 开始，与错误信息一致）"""
+        if self.line_map is None:
+            return {}
+        return {sprite: {block_id: self.line_map.original_line(index) for block_id, index in lines.items()
+                         if index < len(self.line_map)}
+                for sprite, lines in self.block_lines.items()}
+
     def is_control_structure(self, cmd):
         """判断是否是控制结构"""
         return any(keyword in cmd for keyword in ['重复', '如果', 'forever', 'if', 'repeat'])
@@ -721,6 +687,7 @@ class ScratchLangParser:
         
         if not block_id:
             return start_idx + 1, parent
+        self._record_line(block_id, start_idx)
         
         base_indent = len(lines[start_idx]) - len(lines[start_idx].lstrip())
         idx, first_child_id = self._parse_block_sequence(lines, start_idx + 1, None, base_indent=base_indent)
@@ -794,105 +761,107 @@ class ScratchLangParser:
         if proc_info is not None:
             return self.create_custom_block_call(proc_info, arg_values, parent)
 
-        for block_def in self.blocks_def.values():
-            if "pattern" not in block_def:
-                continue
-                
-            pattern = block_def["pattern"]
-            match = re.search(pattern, cmd)
+        dispatched = self.dispatcher.match(cmd)
+        if dispatched is not None:
+            block_def = dispatched.block_def
+            match = dispatched.match
+            opcode = block_def["opcode"]
+            inputs = {}
+            fields = {}
+            shadow_blocks = {}  # 🔥 收集需要设置 parent 的 shadow blocks
             
-            if match:
-                opcode = block_def["opcode"]
-                inputs = {}
-                fields = {}
-                shadow_blocks = {}  # 🔥 收集需要设置 parent 的 shadow blocks
-                
-                if "inputs" in block_def:
-                    for input_name, group_idx in block_def["inputs"].items():
-                        if isinstance(group_idx, int):
-                            value = match.group(group_idx)
-                            
-                            if input_name == "CONDITION":
-                                inputs[input_name] = self._parse_condition(value)
-                            elif input_name == "TOUCHINGOBJECTMENU":
-                                shadow_id = self._create_touching_shadow(value)
-                                inputs[input_name] = [1, shadow_id]
-                                shadow_blocks[input_name] = shadow_id
-                            elif input_name == "DISTANCETOMENU":
-                                shadow_id = self._create_distance_shadow(value)
-                                inputs[input_name] = [1, shadow_id]
-                                shadow_blocks[input_name] = shadow_id
-                            elif input_name in ["TO", "TOWARDS"]:
-                                shadow_id = self._create_goto_shadow(value, input_name)
-                                inputs[input_name] = [1, shadow_id]
-                                shadow_blocks[input_name] = shadow_id
-                            elif input_name == "OBJECT":
-                                if value in ["舞台", "Stage"]:
-                                    inputs[input_name] = [1, [11, TARGET_STAGE, TARGET_STAGE]]
-                                else:
-                                    inputs[input_name] = [1, [11, value, value]]
+            if "inputs" in block_def:
+                for input_name, group_idx in block_def["inputs"].items():
+                    if isinstance(group_idx, int):
+                        value = match.group(group_idx)
+                        
+                        if input_name == "CONDITION":
+                            inputs[input_name] = self._parse_condition(value)
+                        elif input_name == "TOUCHINGOBJECTMENU":
+                            shadow_id = self._create_touching_shadow(value)
+                            inputs[input_name] = [1, shadow_id]
+                            shadow_blocks[input_name] = shadow_id
+                        elif input_name == "DISTANCETOMENU":
+                            shadow_id = self._create_distance_shadow(value)
+                            inputs[input_name] = [1, shadow_id]
+                            shadow_blocks[input_name] = shadow_id
+                        elif input_name in ["TO", "TOWARDS"]:
+                            shadow_id = self._create_goto_shadow(value, input_name)
+                            inputs[input_name] = [1, shadow_id]
+                            shadow_blocks[input_name] = shadow_id
+                        elif input_name == "OBJECT":
+                            if value in ["舞台", "Stage"]:
+                                inputs[input_name] = [1, [11, TARGET_STAGE, TARGET_STAGE]]
                             else:
-                                inputs[input_name] = self._parse_value(value)
-                
-                if "fields" in block_def:
-                    for field_name, group_idx in block_def["fields"].items():
-                        if isinstance(group_idx, int):
-                            value = match.group(group_idx)
-                            
-                            if field_name == "KEY_OPTION" and opcode == "event_whenkeypressed":
-                                key = self._get_key_name(value)
-                                fields[field_name] = [key, None]
-                            elif field_name == "PROPERTY":
-                                property_map = {
-                                    "x坐标": "x position",
-                                    "y坐标": "y position",
-                                    "方向": "direction",
-                                    "造型编号": "costume #",
-                                    "造型名称": "costume name",
-                                    "大小": "size",
-                                    "音量": "volume",
-                                    "背景编号": "backdrop #",
-                                    "背景名称": "backdrop name"
-                                }
-                                fields[field_name] = [property_map.get(value, value), None]
-                            elif field_name == "VARIABLE":
-                                var_name = value[1:].strip() if value.startswith('~') else value.strip()
-                                var_id = None
-                                for vid, vdata in self.builder.current_sprite.get("variables", {}).items():
-                                    if vdata[0] == var_name:
-                                        var_id = vid
-                                        break
-                                if var_id is None and self.builder.stage:
-                                    for vid, vdata in self.builder.stage.get("variables", {}).items():
-                                        if vdata[0] == var_name:
-                                            var_id = vid
-                                            break
-                                fields[field_name] = [var_name, var_id]
-                            else:
-                                fields[field_name] = [value, None]
+                                inputs[input_name] = [1, [11, value, value]]
+                        elif input_name == "BROADCAST_INPUT":
+                            inputs[input_name] = self._parse_broadcast_input(value)
                         else:
-                            fields[field_name] = group_idx
-                
-                block_id = self.builder.add_block(opcode, inputs, fields, parent, top_level)
-
-                # 检查是否需要添加扩展
-                if opcode.startswith("music_"):
-                    self.builder.add_extension("music")
-                elif opcode.startswith("pen_"):
-                    self.builder.add_extension("pen")
-
-                # 🔥 设置所有 shadow blocks 的 parent
-                for shadow_id in shadow_blocks.values():
-                    if shadow_id and shadow_id in self.builder.current_sprite["blocks"]:
-                        self.builder.current_sprite["blocks"][shadow_id]["parent"] = block_id
-                
-                if parent:
-                    self.builder.current_sprite["blocks"][parent]["next"] = block_id
-                
-                return block_id
-        
+                            inputs[input_name] = self._parse_value(value)
+            
+            if "fields" in block_def:
+                for field_name, group_idx in block_def["fields"].items():
+                    if isinstance(group_idx, int):
+                        value = match.group(group_idx)
+                        
+                        if field_name == "KEY_OPTION" and opcode == "event_whenkeypressed":
+                            key = self._get_key_name(value)
+                            fields[field_name] = [key, None]
+                        elif field_name == "PROPERTY":
+                            property_map = {
+                                "x坐标": "x position",
+                                "y坐标": "y position",
+                                "方向": "direction",
+                                "造型编号": "costume #",
+                                "造型名称": "costume name",
+                                "大小": "size",
+                                "音量": "volume",
+                                "背景编号": "backdrop #",
+                                "背景名称": "backdrop name"
+                            }
+                            fields[field_name] = [property_map.get(value, value), None]
+                        elif field_name == "VARIABLE":
+                            var_name = value[1:].strip() if value.startswith('~') else value.strip()
+                            fields[field_name] = [var_name, self.builder.resolve_variable(var_name)]
+                        elif field_name == "LIST":
+                            list_name = value.strip()
+                            fields[field_name] = [list_name, self.builder.resolve_list(list_name)]
+                        elif field_name == "BROADCAST_OPTION":
+                            broadcast_name = value.strip()
+                            fields[field_name] = [broadcast_name, self.builder.add_broadcast(broadcast_name)]
+                        else:
+                            fields[field_name] = [value, None]
+                    else:
+                        fields[field_name] = group_idx
+            
+            block_id = self.builder.add_block(opcode, inputs, fields, parent, top_level)
+
+            # 检查是否需要添加扩展
+            if opcode.startswith("music_"):
+                self.builder.add_extension("music")
+            elif opcode.startswith("pen_"):
+                self.builder.add_extension("pen")
+
+            # 🔥 设置所有 shadow blocks 的 parent
+            for shadow_id in shadow_blocks.values():
+                if shadow_id and shadow_id in self.builder.current_sprite["blocks"]:
+                    self.builder.current_sprite["blocks"][shadow_id]["parent"] = block_id
+            
+            if parent:
+                self.builder.current_sprite["blocks"][parent]["next"] = block_id
+            
+            return block_id
+    
         return None
     
+    def _parse_broadcast_input(self, value):
+        """解析广播输入：字面量广播名登记到舞台并生成广播菜单"""
+        parsed = self._parse_value(value)
+        if parsed[0] == 1 and isinstance(parsed[1], list) and parsed[1][0] in (4, 10):
+            name = value.strip().strip('"\'') if parsed[1][0] == 4 else parsed[1][1]
+            return [1, [11, name, self.builder.add_broadcast(name)]]
+        return parsed
+
     def _create_say_think_block(self, cmd, parent=None, top_level=False):
         """创建"说/想"积木"""
         parts = cmd.strip().split(None, 1)
@@ -1027,7 +996,17 @@ class ScratchLangParser:
         return None
 
     def _parse_value(self, text):
-        """解析值"""
+        """解析值（结果按表达式文本缓存，见 memo.py）"""
+        return self.expression_cache.memoize("value", text, tuple(self.current_proc_args),
+                                             self._parse_value_uncached)
+
+    def _parse_boolean(self, text):
+        """解析放在布尔输入中的值（且/或 的操作数、条件），常量不折叠成字面量"""
+        return self.expression_cache.memoize("boolean", text, tuple(self.current_proc_args),
+                                             lambda text: self._parse_value_uncached(text, boolean=True))
+
+    def _parse_value_uncached(self, text, boolean=False):
+        """解析值（boolean 见 _parse_boolean）"""
         text = text.strip()
         text = self._strip_outer_parentheses(text)
 
@@ -1039,7 +1018,7 @@ class ScratchLangParser:
                 tokens = lexer.tokenize()
                 parser = ExpressionParser(tokens)
                 ast = parser.parse()
-                block_type, block_value = self.ast_converter.convert(ast)
+                block_type, block_value = self.ast_converter.convert(ast, boolean)
                 return [block_type, block_value]
             except Exception as e:
                 # AST 解析失败，降级到旧逻辑
@@ -1050,14 +1029,14 @@ class ScratchLangParser:
         # 1. 逻辑运算符（考虑括号匹配）
         parts = self._split_by_operator(text, ' 或 ')
         if parts:
-            input1 = self._parse_value(parts[0])
-            input2 = self._parse_value(parts[1])
+            input1 = self._parse_boolean(parts[0])
+            input2 = self._parse_boolean(parts[1])
             return [2, self.builder.add_block("operator_or", {"OPERAND1": input1, "OPERAND2": input2}, {}, None, False)]
 
         parts = self._split_by_operator(text, ' 且 ')
         if parts:
-            input1 = self._parse_value(parts[0])
-            input2 = self._parse_value(parts[1])
+            input1 = self._parse_boolean(parts[0])
+            input2 = self._parse_boolean(parts[1])
             return [2, self.builder.add_block("operator_and", {"OPERAND1": input1, "OPERAND2": input2}, {}, None, False)]
 
         # 2. 比较运算符（考虑括号匹配）
@@ -1066,6 +1045,9 @@ class ScratchLangParser:
         if parts:
             input1 = self._parse_value(parts[0].strip())
             input2 = self._parse_value(parts[1].strip())
+            folded = None if boolean else self._fold_comparison('>=', input1, input2)
+            if folded:
+                return folded
             lt_block = self.builder.add_block("operator_lt", {"OPERAND1": input1, "OPERAND2": input2}, {}, None, False)
             not_block = self.builder.add_block("operator_not", {"OPERAND": [2, lt_block]}, {}, None, False)
             return [2, not_block]
@@ -1074,6 +1056,9 @@ class ScratchLangParser:
         if parts:
             input1 = self._parse_value(parts[0].strip())
             input2 = self._parse_value(parts[1].strip())
+            folded = None if boolean else self._fold_comparison('<=', input1, input2)
+            if folded:
+                return folded
             gt_block = self.builder.add_block("operator_gt", {"OPERAND1": input1, "OPERAND2": input2}, {}, None, False)
             not_block = self.builder.add_block("operator_not", {"OPERAND": [2, gt_block]}, {}, None, False)
             return [2, not_block]
@@ -1112,12 +1097,9 @@ class ScratchLangParser:
         if text.startswith('~'):
             return self._parse_variable_or_reporter(text)
         
-        # 6. 数字
-        try:
-            num_val = float(text)
-            return [1, [4, str(num_val)]]
-        except ValueError:
-            pass
+        # 6. 数字（保留源码中的写法："设置 分数 为 0" 的值是 "0" 而不是 "0.0"）
+        if literal_type(text) == NUMBER:
+            return [1, [4, text]]
         
         # 7. 字符串
         if (text.startswith('"') and text.endswith('"')) or (text.startswith("'") and text.endswith("'")):
@@ -1146,7 +1128,18 @@ class ScratchLangParser:
         # 10. 默认: 普通字符串
         return [1, [10, text]]
     
+    def _fold_comparison(self, op, input1, input2):
+        """两侧都是数字字面量时把 >= / <= 折叠成一个字面量，否则返回 None（见 folding.py）"""
+        if not self.ast_converter.fold_constants:
+            return None
+        return self.ast_converter.folder.fold_literals(op, input1, input2)
+
     def _parse_condition(self, text):
+        """解析条件表达式（结果按表达式文本缓存，见 memo.py）"""
+        return self.expression_cache.memoize("condition", text, tuple(self.current_proc_args),
+                                             self._parse_condition_uncached)
+
+    def _parse_condition_uncached(self, text):
         """解析条件表达式"""
         text = text.strip()
         text = self._strip_outer_parentheses(text)
@@ -1205,7 +1198,7 @@ class ScratchLangParser:
                 return [2, self.builder.add_block(op_code, {"OPERAND1": input1, "OPERAND2": input2}, {}, None, False)]
         
         # 6. 默认
-        return self._parse_value(text)
+        return self._parse_boolean(text)
     
     def _parse_variable_or_reporter(self, text):
         """解析变量或reporter积木"""
@@ -1217,15 +1210,8 @@ class ScratchLangParser:
             # 首先检查是否是自定义积木的参数
             if var_or_reporter in self.current_proc_args:
                 arg_id = self.builder.generate_id()
-                self.builder.current_sprite["blocks"][arg_id] = {
-                    "opcode": "argument_reporter_string_number",
-                    "next": None,
-                    "parent": None,
-                    "inputs": {},
-                    "fields": {"VALUE": [var_or_reporter, None]},
-                    "shadow": False,
-                    "topLevel": False
-                }
+                self.builder.current_sprite["blocks"][arg_id] = new_block(
+                    "argument_reporter_string_number", fields={"VALUE": [var_or_reporter, None]})
                 return [2, arg_id]
 
             builtin_reporters = {
@@ -1331,25 +1317,17 @@ class ScratchLangParser:
 
     def _create_variable_block(self, var_name):
         """创建变量引用block"""
-        for var_id, var_data in self.builder.current_sprite.get("variables", {}).items():
-            if var_data[0] == var_name:
-                reporter_id = self.builder.add_block(
-                    "data_variable",
-                    {}, {"VARIABLE": [var_name, var_id]},
-                    None, False
-                )
-                return [2, reporter_id]
-        
-        if self.builder.stage:
-            for var_id, var_data in self.builder.stage.get("variables", {}).items():
-                if var_data[0] == var_name:
-                    reporter_id = self.builder.add_block(
-                        "data_variable",
-                        {}, {"VARIABLE": [var_name, var_id]},
-                        None, False
-                    )
-                    return [2, reporter_id]
+        var_id = self.builder.resolve_variable(var_name)
+        if var_id is not None:
+            reporter_id = self.builder.add_block(
+                "data_variable",
+                {}, {"VARIABLE": [var_name, var_id]},
+                None, False
+            )
+            return [2, reporter_id]
         
+        # 警告需要每次出现都打印，含未定义变量的表达式不缓存
+        self.expression_cache.taint()
         print(f"警告: 未定义的变量 '~{var_name}'，将作为字符串处理")
         return [1, [10, var_name]]
     
@@ -1548,20 +1526,42 @@ class ScratchLangParser:
     
     def compile(self, output_file):
         """编译并保存"""
+        if self.inliner is not None:
+            self.inline_stats = self.inliner.inline_project(self.builder.project)
+        self.peephole.optimize_project(self.builder.project)
+        if self.hoister is not None:
+            self.hoist_stats = self.hoister.hoist_project(self.builder.project)
+        if self.eliminate_dead_code:
+            self.dead_code_report = eliminate_dead_code(self.builder.project, self.builder.symbols)
+        if self.warp_inference:
+            refresh = {(sprite_name, info["proccode"])
+                       for sprite_name, blocks in self.custom_blocks.items()
+                       for info in blocks.values() if info.get("refresh")}
+            self.warp_report = infer_warp(self.builder.project, refresh)
+        if self.infer_types:
+            self.type_report = infer_types(self.builder.project)
+        self.frame_cost = estimate_frame_cost(self.builder.project, self.cost_table, self.source_lines())
+        if self.frame_budget is not None and self.frame_cost.total > self.frame_budget:
+            top = self.frame_cost.scripts[0]
+            raise CompileError(f"每帧代价估计 {self.frame_cost.total:g} 超过预算 {self.frame_budget:g}"
+                               f"（代价最高的是 {top.sprite} 的脚本: {top.total:g}）", top.line)
         self.builder.save(output_file)
 
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """python -m compiler.parser：编译单个源文件（批量编译见 compiler.cli）"""
+    arg_parser = argparse.ArgumentParser(prog="python -m compiler.parser", description="编译单个 ScratchLang 源文件")
+    arg_parser.add_argument("input", help="源文件（.sl）")
+    arg_parser.add_argument("-o", "--output", default="output.sb3", help="输出文件，默认为 output.sb3")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=1, help="并行编译的进程数，0 为 CPU 核数")
+    args = arg_parser.parse_args(argv)
+
+    parser = ScratchLangParser(jobs=args.jobs)
+    parser.parse_file(args.input)
+    parser.compile(args.output)
+    print(f"编译成功: {args.output}")
+    return 0
+
+
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("用法: python parser.py <输入文件.sl> [-o 输出文件.sb3]")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    output_file = "output.sb3"
-    if len(sys.argv) > 3 and sys.argv[2] == "-o":
-        output_file = sys.argv[3]
-
-    parser = ScratchLangParser()
-    parser.parse_file(input_file)
-    parser.compile(output_file)
-    print(f"编译成功: {output_file}")
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,304 @@
+"""
+窥孔优化 - 保存前按规则清理每个 target 的积木图
+
+解析器逐行生成积木，不会回头检查前后积木的组合。这里在保存前反复扫描积木图，
+按规则表改写局部模式，直到没有规则可以应用：
+
+- noop_change: 删除改变量为 0 的 "将 x 坐标增加"、"将大小增加"、"将音量增加" 等积木
+- merge_change: 合并相邻的同类 "增加" 积木（都是整数字面量；会被限制范围的积木还要求同号）
+- merge_wait: 合并相邻的 "等待 N 秒"（负数按 0 计）
+- repeat_zero: 删除 "重复 0 次"（次数按 Scratch 四舍五入后不大于 0）
+- repeat_once: 展开 "重复 1 次"
+- constant_if: 条件是常量（只比较数字字面量）的 "如果"，换成会执行的分支
+- empty_if: 删除两个分支都为空、条件没有副作用的 "如果"
+- empty_else: "否则" 分支为空的 "如果…否则" 改成 "如果"
+- wait_zero: 删除 "等待 0 秒"（默认不启用：它常被用来主动让出一帧）
+
+规则只改变执行所需的帧数，不改变脚本的执行结果。"将变量增加 0" 会把文本变量变成数字，
+不当作空操作删除。空的条件、"重复 ? 次"、比较文本的条件这类非数字字面量在 Scratch 中
+虽然也有确定的值，但通常是没写完或没解析出来的代码，保留下来让用户在编辑器里看到。
+改写通过 blockgraph.py 完成，保证 parent/next 指针一致。
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Sequence
+
+from .blockgraph import (
+    Blocks, child_ids, is_linked, literal_text, replace_in_stack, set_literal, substack,
+)
+from .blockrecord import is_block
+from .folding import BINARY_OPERATORS, is_numeric, js_round, js_to_number, number_to_string
+
+# 全部规则，按应用顺序排列
+RULES = ("noop_change", "merge_change", "merge_wait", "repeat_zero", "repeat_once",
+         "constant_if", "empty_if", "empty_else", "wait_zero")
+
+# 默认启用的规则
+DEFAULT_RULES = tuple(rule for rule in RULES if rule != "wait_zero")
+
+# "增加" 积木的改变量输入
+_CHANGE_INPUTS = {
+    "motion_changexby": "DX",
+    "motion_changeyby": "DY",
+    "looks_changesizeby": "CHANGE",
+    "looks_changeeffectby": "CHANGE",
+    "sound_changevolumeby": "VOLUME",
+    "sound_changeeffectby": "VALUE",
+    "pen_changePenSizeBy": "SIZE",
+    "pen_changePenColorParamBy": "VALUE",
+    "music_changeTempo": "TEMPO",
+    "data_changevariableby": "VALUE",
+}
+
+# 结果不受范围限制的 "增加" 积木，合并时不要求同号
+_UNBOUNDED_CHANGES = ("data_changevariableby",)
+
+# 改变量为 0 时不是空操作的 "增加" 积木（会把变量转换成数字）
+_NOT_NOOP_CHANGES = ("data_changevariableby",)
+
+# 能在编译时求值的条件积木
+_COMPARISONS = {"operator_equals": "=", "operator_gt": ">", "operator_lt": "<"}
+
+# 没有副作用的 reporter 积木的前缀
+_PURE_PREFIXES = ("operator_", "argument_reporter_", "data_", "motion_", "looks_", "sound_", "sensing_")
+
+# 能精确相加的整数范围
+_MAX_SAFE_INTEGER = 2 ** 53
+
+# 表示"不是常量"
+_UNKNOWN = object()
+
+
+@dataclass
+class PeepholeStats:
+    """窥孔优化统计"""
+    # 每条规则的改写次数
+    rules: Dict[str, int] = field(default_factory=dict)
+    # 删除的积木数量
+    removed_blocks: int = 0
+
+    def merge(self, other: 'PeepholeStats') -> None:
+        """累加另一份统计"""
+        for rule, count in other.rules.items():
+            self.rules[rule] = self.rules.get(rule, 0) + count
+        self.removed_blocks += other.removed_blocks
+
+
+class PeepholeOptimizer:
+    """积木图窥孔优化器
+
+    Args:
+        rules: 启用的规则（RULES 中的名称），为空时不做任何改写
+    """
+
+    def __init__(self, rules: Sequence[str] = DEFAULT_RULES) -> None:
+        unknown = [rule for rule in rules if rule not in RULES]
+        if unknown:
+            raise ValueError(f"未知的窥孔优化规则: {', '.join(unknown)}")
+        self.rules = tuple(rules)
+        self.stats = PeepholeStats()
+
+    def optimize_project(self, project: Dict[str, Any]) -> None:
+        """优化项目中每个 target 的积木"""
+        for target in project["targets"]:
+            self.optimize(target["blocks"])
+
+    def optimize(self, blocks: Blocks) -> int:
+        """反复应用规则直到没有可以改写的积木
+
+        Args:
+            blocks: target 的积木字典，原地修改
+
+        Returns:
+            改写次数
+        """
+        rules = [(name, getattr(self, "_" + name)) for name in self.rules]
+        if not rules:
+            return 0
+        rewrites = 0
+        changed = True
+        while changed:
+            changed = False
+            for block_id in list(blocks):
+                block = blocks.get(block_id)
+                if not is_block(block) or block["shadow"] or not is_linked(blocks, block_id):
+                    continue
+                for name, rule in rules:
+                    removed = rule(blocks, block_id, block)
+                    if removed is not None:
+                        self.stats.rules[name] = self.stats.rules.get(name, 0) + 1
+                        self.stats.removed_blocks += removed
+                        rewrites += 1
+                        changed = True
+                        break
+        return rewrites
+
+    # 每条规则不适用时返回 None，改写后返回删除的积木数量
+
+    def _noop_change(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        name = _CHANGE_INPUTS.get(block["opcode"])
+        if name is None or block["opcode"] in _NOT_NOOP_CHANGES:
+            return None
+        if self._number(blocks, block["inputs"].get(name)) != 0:
+            return None
+        return replace_in_stack(blocks, block_id)
+
+    def _merge_change(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        opcode = block["opcode"]
+        name = _CHANGE_INPUTS.get(opcode)
+        following = self._following(blocks, block_id, opcode)
+        if name is None or following is None or following["fields"] != block["fields"]:
+            return None
+        value = block["inputs"].get(name)
+        first = self._integer(blocks, value)
+        second = self._integer(blocks, following["inputs"].get(name))
+        if first is None or second is None:
+            return None
+        if opcode not in _UNBOUNDED_CHANGES and first * second < 0:
+            # 先增加再减少可能在边界处被截断，结果与直接相加不同
+            return None
+        total = first + second
+        if abs(total) >= _MAX_SAFE_INTEGER:
+            return None
+        set_literal(blocks, value, number_to_string(total))
+        return replace_in_stack(blocks, block["next"])
+
+    def _merge_wait(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        following = self._following(blocks, block_id, "control_wait")
+        if block["opcode"] != "control_wait" or following is None:
+            return None
+        value = block["inputs"].get("DURATION")
+        first = self._number(blocks, value)
+        second = self._number(blocks, following["inputs"].get("DURATION"))
+        if first is None or second is None:
+            return None
+        total = max(0.0, first) + max(0.0, second)
+        set_literal(blocks, value, number_to_string(total))
+        return replace_in_stack(blocks, block["next"])
+
+    def _repeat_zero(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        times = self._repeat_times(blocks, block)
+        if times is None or times > 0:
+            return None
+        return replace_in_stack(blocks, block_id)
+
+    def _repeat_once(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        if self._repeat_times(blocks, block) != 1:
+            return None
+        return replace_in_stack(blocks, block_id, substack(block))
+
+    def _constant_if(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        if block["opcode"] not in ("control_if", "control_if_else"):
+            return None
+        condition = self._condition(blocks, block["inputs"].get("CONDITION"))
+        if condition is _UNKNOWN:
+            return None
+        if condition:
+            branch = substack(block)
+        else:
+            branch = substack(block, "SUBSTACK2") if block["opcode"] == "control_if_else" else None
+        return replace_in_stack(blocks, block_id, branch)
+
+    def _empty_if(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        if block["opcode"] not in ("control_if", "control_if_else"):
+            return None
+        if substack(block) is not None or substack(block, "SUBSTACK2") is not None:
+            return None
+        if not self._is_pure(blocks, block["inputs"].get("CONDITION")):
+            return None
+        return replace_in_stack(blocks, block_id)
+
+    def _empty_else(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        if block["opcode"] != "control_if_else" or substack(block, "SUBSTACK2") is not None:
+            return None
+        block["opcode"] = "control_if"
+        block["inputs"].pop("SUBSTACK2", None)
+        return 0
+
+    def _wait_zero(self, blocks: Blocks, block_id: str, block: Dict[str, Any]) -> Optional[int]:
+        if block["opcode"] != "control_wait":
+            return None
+        duration = self._number(blocks, block["inputs"].get("DURATION"))
+        if duration is None or duration > 0:
+            return None
+        return replace_in_stack(blocks, block_id)
+
+    # 规则使用的辅助方法
+
+    @staticmethod
+    def _following(blocks: Blocks, block_id: str, opcode: str) -> Optional[Dict[str, Any]]:
+        """栈中紧接着的积木，操作码不是 opcode 时返回 None"""
+        next_id = blocks[block_id]["next"]
+        following = blocks.get(next_id) if next_id is not None else None
+        if following is None or following["opcode"] != opcode or following["parent"] != block_id:
+            return None
+        return following
+
+    @staticmethod
+    def _number(blocks: Blocks, value: Any) -> Optional[float]:
+        """数字字面量的值，不是字面量或不是数字时返回 None"""
+        text = literal_text(blocks, value)
+        if text is None:
+            return None
+        number = js_to_number(text)
+        return None if math.isnan(number) else number
+
+    def _integer(self, blocks: Blocks, value: Any) -> Optional[float]:
+        """整数字面量的值，不是整数字面量时返回 None"""
+        number = self._number(blocks, value)
+        if number is None or not math.isfinite(number) or number != int(number) \
+                or abs(number) >= _MAX_SAFE_INTEGER:
+            return None
+        return number
+
+    def _repeat_times(self, blocks: Blocks, block: Dict[str, Any]) -> Optional[float]:
+        """"重复 N 次" 的次数是数字字面量时返回四舍五入后的次数"""
+        if block["opcode"] != "control_repeat":
+            return None
+        times = self._number(blocks, block["inputs"].get("TIMES"))
+        return None if times is None else js_round(times)
+
+    def _condition(self, blocks: Blocks, value: Any) -> Any:
+        """条件输入的常量值，不是常量时返回 _UNKNOWN
+
+        只求值由比较和逻辑运算积木组成、操作数都是数字字面量的条件；空的或直接填了文本的条件、
+        比较文本的条件（如 "90" > "abs 方向"，通常是没解析出来的表达式）视为未知。
+        """
+        if value is None:
+            return _UNKNOWN
+        children = [item for item in value[1:] if isinstance(item, str) and item in blocks]
+        if len(children) != 1:
+            return _UNKNOWN
+        block = blocks[children[0]]
+        opcode = block["opcode"]
+        inputs = block["inputs"]
+        if opcode in _COMPARISONS:
+            left = literal_text(blocks, inputs.get("OPERAND1"))
+            right = literal_text(blocks, inputs.get("OPERAND2"))
+            if not is_numeric(left) or not is_numeric(right):
+                return _UNKNOWN
+            return BINARY_OPERATORS[_COMPARISONS[opcode]](left, right)
+        if opcode == "operator_not":
+            operand = self._condition(blocks, inputs.get("OPERAND"))
+            return _UNKNOWN if operand is _UNKNOWN else not operand
+        if opcode in ("operator_and", "operator_or"):
+            left = self._condition(blocks, inputs.get("OPERAND1"))
+            right = self._condition(blocks, inputs.get("OPERAND2"))
+            if left is _UNKNOWN or right is _UNKNOWN:
+                return _UNKNOWN
+            return (left and right) if opcode == "operator_and" else (left or right)
+        return _UNKNOWN
+
+    def _is_pure(self, blocks: Blocks, value: Any) -> bool:
+        """输入值的求值是否没有副作用（删除它不会改变程序行为）"""
+        if value is None or literal_text(blocks, value) is not None:
+            return True
+        for child in [item for item in value[1:] if isinstance(item, str)]:
+            block = blocks.get(child)
+            if block is None:
+                continue
+            if not block["shadow"] and not block["opcode"].startswith(_PURE_PREFIXES):
+                return False
+            if not all(self._is_pure(blocks, [2, grandchild]) for grandchild in child_ids(block)):
+                return False
+        return True
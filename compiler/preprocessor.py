@@ -0,0 +1,397 @@
+"""
+源码预处理器 - 单遍扫描完成块注释、多行字符串、扩展导入和 #code# 块的处理
+
+parse() 原先依次执行四个预处理步骤，每一步都完整遍历（或拆分再拼接）一次源码，
+前两步还逐字符追加。预处理器按状态（普通 / 块注释 / 多行字符串）只扫描一遍，
+每得到一个完整的逻辑行就立即处理扩展导入和 #code# 块，输出：
+
+- lines: 逻辑行列表（与原先四步处理后 split('\\n') 的结果完全一致）
+- line_map: 逻辑行 -> 原始行号、列号
+- comments / strings / imports / code_blocks: 各类结构的类型化记录
+
+行号、列号均从 1 开始，与 ScratchLangError 的显示一致。
+"""
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# 普通状态和多行字符串状态下需要关注的标记（块注释在字符串内同样生效）
+_MARKER_RE = re.compile(r'/\*|"""')
+# 导入扩展: "file.js" 或 import extension: "file.js"
+_IMPORT_RE = re.compile(r'(?:导入扩展|import\s+extension)\s*:\s*["\']([^"\']+)["\']')
+_IMPORT_PREFIXES = ('导入扩展', 'import')
+
+
+def _trailing_quotes(text: str) -> int:
+    """text 末尾连续双引号的个数"""
+    return len(text) - len(text.rstrip('"'))
+
+
+def _leading_quotes(source: str, pos: int) -> int:
+    """source[pos:] 开头连续双引号的个数（最多 3 个）"""
+    count = 0
+    while count < 3 and source.startswith('"', pos + count):
+        count += 1
+    return count
+
+
+def _drop_suffix(parts: List[str], count: int) -> None:
+    """从片段列表末尾删除 count 个字符"""
+    while count:
+        last = parts[-1]
+        if len(last) <= count:
+            parts.pop()
+            count -= len(last)
+        else:
+            parts[-1] = last[:-count]
+            count = 0
+
+
+@dataclass
+class CommentRecord:
+    """块注释 /* ... */"""
+    text: str
+    line: int
+    column: int
+    end_line: int
+    end_column: int
+
+
+@dataclass
+class MultilineStringRecord:
+    """多行字符串 \"\"\"...\"\"\"（value 为去掉块注释后的原始内容）"""
+    value: str
+    line: int
+    column: int
+    logical_line: int
+
+
+@dataclass
+class ExtensionImportRecord:
+    """扩展导入语句"""
+    path: str
+    line: int
+    logical_line: int
+
+
+@dataclass
+class CodeBlockRecord:
+    """#code# ... #end# 内联 JavaScript 块（未闭合时 code 为 None）"""
+    index: int
+    placeholder: str
+    code: Optional[str]
+    line: int
+    logical_line: int
+
+
+class LineMap:
+    """逻辑行到原始位置的映射
+
+    每个逻辑行记录若干分段 (逻辑列, 原始行, 原始列)；逻辑行被块注释或
+    多行字符串拼接时会有多个分段。
+    """
+
+    def __init__(self) -> None:
+        # 每个逻辑行起点的原始行号
+        self.starts: List[int] = []
+        # 只有一个从第 1 列开始的分段的行不单独保存
+        self.segments: Dict[int, List[Tuple[int, int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def add_line(self, segments: List[Tuple[int, int, int]]) -> None:
+        """追加一个逻辑行的分段列表"""
+        index = len(self.starts)
+        self.starts.append(segments[0][1])
+        if len(segments) > 1 or segments[0][2] != 1:
+            self.segments[index] = segments
+
+    def original_line(self, index: int) -> int:
+        """逻辑行（从 0 开始的列表下标）对应的原始行号"""
+        return self.starts[index]
+
+    def locate(self, index: int, column: int = 1) -> Tuple[int, int]:
+        """把逻辑位置映射回原始位置
+
+        Args:
+            index: 逻辑行下标（从 0 开始）
+            column: 逻辑列号（从 1 开始）
+
+        Returns:
+            Tuple[int, int]: (原始行号, 原始列号)
+        """
+        segments = self.segments.get(index)
+        if segments is None:
+            return self.starts[index], column
+        position = bisect_right([segment[0] for segment in segments], column) - 1
+        logical_column, line, original_column = segments[max(position, 0)]
+        return line, original_column + max(column - logical_column, 0)
+
+
+@dataclass
+class PreprocessResult:
+    """预处理结果"""
+    lines: List[str]
+    line_map: LineMap
+    comments: List[CommentRecord] = field(default_factory=list)
+    strings: List[MultilineStringRecord] = field(default_factory=list)
+    imports: List[ExtensionImportRecord] = field(default_factory=list)
+    code_blocks: List[CodeBlockRecord] = field(default_factory=list)
+
+    @property
+    def extension_files(self) -> List[str]:
+        """扩展文件路径列表"""
+        return [record.path for record in self.imports]
+
+    @property
+    def js_blocks(self) -> List[Optional[str]]:
+        """内联 JavaScript 代码列表（与 __INLINE_CODE_n__ 占位符的 n-1 对应）"""
+        return [record.code for record in self.code_blocks]
+
+    @property
+    def code(self) -> str:
+        """预处理后的完整代码"""
+        return '\n'.join(self.lines)
+
+
+class _Scanner:
+    """单遍扫描器的状态"""
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.result = PreprocessResult([], LineMap())
+        # 当前逻辑行的文本片段、长度和分段
+        self.parts: List[str] = []
+        self.length = 0
+        self.segments: List[Tuple[int, int, int]] = [(1, 1, 1)]
+        # 当前逻辑行末尾来自源码的连续双引号个数：原先先删除注释再识别三引号，
+        # 所以被注释隔开的引号也能拼成多行字符串的定界符
+        self.quotes = 0
+        # 当前扫描位置所在的原始行号及该行起始下标
+        self.line = 1
+        self.line_start = 0
+        # #code# 块状态
+        self.code_block: Optional[CodeBlockRecord] = None
+        self.code_lines: List[str] = []
+
+    def position(self, pos: int) -> Tuple[int, int]:
+        """pos 的原始 (行, 列)；pos 必须不早于最近一次 advance 的位置"""
+        return self.line, pos - self.line_start + 1
+
+    def advance(self, start: int, end: int) -> None:
+        """越过 source[start:end]，更新原始行号"""
+        newlines = self.source.count('\n', start, end)
+        if newlines:
+            self.line += newlines
+            self.line_start = self.source.rfind('\n', start, end) + 1
+
+    def append(self, text: str, pos: int) -> None:
+        """把 source 中 pos 处开始的原始片段追加到当前逻辑行"""
+        if not text:
+            return
+        self.mark(pos)
+        self.parts.append(text)
+        self.length += len(text)
+        trailing = _trailing_quotes(text)
+        self.quotes = self.quotes + trailing if trailing == len(text) else trailing
+
+    def mark(self, pos: int) -> None:
+        """如果当前逻辑列与 pos 的原始位置不连续，记录新的分段"""
+        line, column = self.position(pos)
+        if not self.length:
+            self.segments = [(1, line, column)]
+            return
+        logical_column, last_line, last_column = self.segments[-1]
+        if last_line != line or last_column + (self.length + 1 - logical_column) != column:
+            self.segments.append((self.length + 1, line, column))
+
+    def emit_text(self, start: int, end: int) -> None:
+        """输出普通文本 source[start:end]（可能跨越多行）"""
+        source = self.source
+        newline = source.find('\n', start, end)
+        if newline < 0:
+            self.append(source[start:end], start)
+            return
+        self.append(source[start:newline], start)
+        self.advance(start, newline + 1)
+        self.finish_line()
+        pos = newline + 1
+        while True:
+            newline = source.find('\n', pos, end)
+            if newline < 0:
+                break
+            self.finish_line(source[pos:newline])
+            self.line += 1
+            self.line_start = newline + 1
+            pos = newline + 1
+        self.segments = [(1, self.line, 1)]
+        self.append(source[pos:end], pos)
+
+    def finish_line(self, text: Optional[str] = None) -> None:
+        """结束当前逻辑行并开始下一行（新行从 self.line 的第 1 列开始）
+
+        Args:
+            text: 直接给出整行文本（当前行为空时的快速路径）
+        """
+        if text is None:
+            text = ''.join(self.parts)
+            segments = self.segments
+        else:
+            segments = [(1, self.line, 1)]
+        index = len(self.result.lines)
+        self.result.lines.append(self.process_line(text, index, segments[0][1]))
+        self.result.line_map.add_line(segments)
+        self.parts = []
+        self.length = 0
+        self.segments = [(1, self.line, 1)]
+        self.quotes = 0
+
+    def process_line(self, line: str, index: int, original_line: int) -> str:
+        """处理扩展导入和 #code# 块，返回替换后的逻辑行"""
+        stripped = line.strip()
+        if stripped.startswith(_IMPORT_PREFIXES):
+            match = _IMPORT_RE.match(stripped)
+            if match:
+                self.result.imports.append(ExtensionImportRecord(match.group(1), original_line, index))
+                line = stripped = ''
+
+        if stripped == '#code#':
+            self.code_block = self.start_code_block(line, index, original_line)
+            self.code_lines = []
+            return self.code_block.placeholder
+        if self.code_block is not None:
+            if stripped == '#end#':
+                self.code_block.code = '\n'.join(self.code_lines)
+                self.code_block = None
+            else:
+                self.code_lines.append(line)
+            return ''
+        return line
+
+    def start_code_block(self, line: str, index: int, original_line: int) -> CodeBlockRecord:
+        """记录一个新的 #code# 块并生成保留缩进的占位符"""
+        blocks = self.result.code_blocks
+        indent = len(line) - len(line.lstrip())
+        placeholder = ' ' * indent + f'__INLINE_CODE_{len(blocks) + 1}__'
+        record = CodeBlockRecord(len(blocks), placeholder, None, original_line, index)
+        blocks.append(record)
+        return record
+
+    def skip_comment(self, start: int, buffer: Optional[List[str]] = None) -> int:
+        """跳过从 start 开始的块注释，返回注释之后的位置
+
+        普通状态下注释中的换行保留为空行以维持行号；多行字符串中的换行
+        则计入字符串内容（buffer）。
+        """
+        source = self.source
+        comment_line, comment_column = self.position(start)
+        close = source.find('*/', start + 2)
+        end = len(source) if close < 0 else close + 2
+        text = source[start + 2:close if close >= 0 else len(source)]
+
+        newlines = text.count('\n')
+        if newlines:
+            if buffer is not None:
+                buffer.append('\n' * newlines)
+                self.advance(start, end)
+            else:
+                pos = start
+                for _ in range(newlines):
+                    newline = source.find('\n', pos, end)
+                    self.line += 1
+                    self.line_start = newline + 1
+                    self.finish_line()
+                    pos = newline + 1
+        end_line, end_column = self.position(end)
+        self.result.comments.append(CommentRecord(text, comment_line, comment_column, end_line, end_column))
+        return end
+
+    def join_quotes(self, pos: int) -> int:
+        """注释前后的双引号拼成三引号时开始多行字符串"""
+        quotes = self.quotes
+        if not quotes or quotes + _leading_quotes(self.source, pos) < 3:
+            return pos
+        _drop_suffix(self.parts, quotes)
+        self.length -= quotes
+        while len(self.segments) > 1 and self.segments[-1][0] > self.length:
+            self.segments.pop()
+        return self.scan_string(pos, pos + 3 - quotes)
+
+    def scan_string(self, start: int, content_start: int) -> int:
+        """处理多行字符串，返回字符串之后的位置
+
+        Args:
+            start: 开始定界符的位置
+            content_start: 字符串内容的起始位置
+        """
+        source = self.source
+        line, column = self.position(start)
+        self.mark(start)
+        buffer: List[str] = []
+        # buffer 末尾的连续双引号个数（用于识别被注释隔开的结束定界符）
+        quotes = 0
+        pos = content_start
+        while True:
+            match = _MARKER_RE.search(source, pos)
+            if match is None:
+                buffer.append(source[pos:])
+                self.advance(pos, len(source))
+                pos = len(source)
+                break
+            chunk = source[pos:match.start()]
+            buffer.append(chunk)
+            self.advance(pos, match.start())
+            if match.group() == '"""':
+                pos = match.end()
+                break
+            trailing = _trailing_quotes(chunk)
+            quotes = quotes + trailing if trailing == len(chunk) else trailing
+            size = len(buffer)
+            pos = self.skip_comment(match.start(), buffer)
+            if len(buffer) != size:  # 注释中的换行打断了引号
+                quotes = 0
+            if quotes and quotes + _leading_quotes(source, pos) >= 3:
+                _drop_suffix(buffer, quotes)
+                pos += 3 - quotes
+                break
+
+        value = ''.join(buffer)
+        text = '"' + value.replace('\n', '\\n') + '"'
+        self.parts.append(text)
+        self.length += len(text)
+        self.quotes = 0
+        self.result.strings.append(MultilineStringRecord(value, line, column, len(self.result.lines)))
+        return pos
+
+    def run(self) -> PreprocessResult:
+        source = self.source
+        pos = 0
+        while True:
+            match = _MARKER_RE.search(source, pos)
+            if match is None:
+                self.emit_text(pos, len(source))
+                break
+            self.emit_text(pos, match.start())
+            if match.group() == '/*':
+                pos = self.join_quotes(self.skip_comment(match.start()))
+            else:
+                pos = self.scan_string(match.start(), match.end())
+        self.finish_line()
+        return self.result
+
+
+def preprocess(source: str) -> PreprocessResult:
+    """单遍预处理源代码
+
+    等价于依次执行：移除块注释、多行字符串转单行、提取扩展导入、
+    提取 #code# 块。
+
+    Args:
+        source: 原始源代码
+
+    Returns:
+        PreprocessResult: 逻辑行、行映射和各类记录
+    """
+    return _Scanner(source).run()
@@ -0,0 +1,164 @@
+"""
+积木定义注册表 - 每个进程只构建一次的预编译积木定义
+
+ScratchLangParser 原先在每次构造时合并积木定义字典、重新分析和编译所有 pattern，
+is_event_block 每次调用还会重建事件 pattern 列表。注册表把这些工作集中到进程内
+只做一次：
+
+- blocks: 合并后的只读积木定义
+- patterns: 已编译的 re.Pattern
+- event_names / event_regex: 事件积木子集及其组合正则
+- by_opcode: opcode -> 积木定义名称
+- dispatcher: 语句分派器（见 dispatcher.py）
+
+pattern 分析结果（分派器的锚点索引）会写入带版本号的磁盘缓存（JSON），
+IDE 和急救编译器冷启动时直接读取；正则总是用 re.compile 编译，不缓存解释器内部的字节码。
+积木定义、缓存格式或 pattern 分析算法（dispatcher.py 的源码）变化、缓存损坏时指纹不匹配
+或内容无效，自动重建并重新写入缓存。
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from .blocks import BlockDefinitions, BlockDef
+from . import dispatcher as dispatcher_module
+from .cache import fingerprint, get_cache_dir, read_json, write_json
+from .dispatcher import BlockDispatcher
+
+logger = logging.getLogger(__name__)
+
+# 缓存格式版本：修改缓存内容时递增（pattern 分析算法的修改由 analysis_fingerprint 检测）
+REGISTRY_VERSION = 2
+
+
+def analysis_fingerprint() -> Optional[str]:
+    """dispatcher.py 源码的哈希：pattern 分析算法修改后旧的锚点缓存自动失效
+
+    Returns:
+        读不到源码时为 None（此时不使用磁盘缓存）
+    """
+    try:
+        with open(dispatcher_module.__file__, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (OSError, TypeError):
+        return None
+
+
+class BlockRegistry:
+    """只读积木定义注册表
+
+    Args:
+        blocks: 积木定义字典 {名称: 定义}，顺序即匹配优先级
+        event_names: 事件积木名称
+        use_cache: 是否读写磁盘缓存
+    """
+
+    def __init__(self, blocks: Dict[str, BlockDef], event_names: Tuple[str, ...],
+                 use_cache: bool = True) -> None:
+        analysis = analysis_fingerprint()
+        use_cache = use_cache and analysis is not None
+        self.fingerprint = fingerprint(REGISTRY_VERSION, analysis, blocks, list(event_names))
+        cached = self._load_cache(blocks) if use_cache else None
+        self.from_cache = cached is not None
+
+        patterns: Dict[str, 're.Pattern'] = {
+            name: re.compile(block["pattern"]) for name, block in blocks.items() if block.get("pattern")
+        }
+        dispatcher = BlockDispatcher(
+            blocks,
+            state=cached["dispatcher"] if cached else None,
+            compiled=patterns,
+        )
+
+        by_opcode: Dict[str, Tuple[str, ...]] = {}
+        for name, block in blocks.items():
+            by_opcode.setdefault(block["opcode"], ())
+            by_opcode[block["opcode"]] += (name,)
+
+        event_patterns = [patterns[name].pattern for name in event_names if name in patterns]
+        event_regex = re.compile('|'.join(f'(?:{p})' for p in event_patterns)) if event_patterns else None
+
+        self.blocks: Mapping[str, BlockDef] = MappingProxyType(blocks)
+        self.patterns: Mapping[str, 're.Pattern'] = MappingProxyType(patterns)
+        self.event_names: Tuple[str, ...] = event_names
+        self.event_regex = event_regex
+        self.by_opcode: Mapping[str, Tuple[str, ...]] = MappingProxyType(by_opcode)
+        self.dispatcher = dispatcher
+
+        if use_cache and not cached:
+            self._save_cache()
+
+    def is_event(self, cmd: str) -> bool:
+        """判断一行代码是否是事件积木"""
+        return self.event_regex is not None and self.event_regex.search(cmd) is not None
+
+    def definition_for_opcode(self, opcode: str) -> Optional[BlockDef]:
+        """获取 opcode 对应的第一个积木定义"""
+        names = self.by_opcode.get(opcode)
+        return self.blocks[names[0]] if names else None
+
+    @property
+    def cache_path(self) -> Optional[str]:
+        """磁盘缓存文件路径（禁用缓存时为 None）"""
+        directory = get_cache_dir("registry")
+        if directory is None:
+            return None
+        return os.path.join(directory, f"blocks-v{REGISTRY_VERSION}.json")
+
+    def _load_cache(self, blocks: Dict[str, BlockDef]) -> Optional[Dict[str, Any]]:
+        """读取并校验缓存；缓存缺失、过期或内容无效时返回 None（随后重建并重新写入）"""
+        path = self.cache_path
+        if path is None:
+            return None
+        data = read_json(path)
+        if not isinstance(data, dict):
+            return None
+        if data.get("version") != REGISTRY_VERSION or data.get("fingerprint") != self.fingerprint:
+            return None
+        names = [name for name, block in blocks.items() if block.get("pattern")]
+        if not BlockDispatcher.is_valid_state(data.get("dispatcher"), names):
+            logger.debug(f"注册表缓存内容无效: {path}")
+            return None
+        return data
+
+    def _save_cache(self) -> None:
+        path = self.cache_path
+        if path is None:
+            return
+        write_json(path, {
+            "version": REGISTRY_VERSION,
+            "fingerprint": self.fingerprint,
+            "dispatcher": self.dispatcher.to_state(),
+        })
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name in self.__dict__:
+            raise AttributeError(f"BlockRegistry 是只读的，不能修改 {name}")
+        super().__setattr__(name, value)
+
+
+_registry: Optional[BlockRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def build_registry(use_cache: bool = True) -> BlockRegistry:
+    """根据 BlockDefinitions 构建新的注册表"""
+    return BlockRegistry(
+        BlockDefinitions.get_all_blocks(),
+        tuple(BlockDefinitions.EVENTS),
+        use_cache=use_cache,
+    )
+
+
+def get_registry() -> BlockRegistry:
+    """获取进程级共享注册表（首次调用时构建）"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = build_registry()
+    return _registry
@@ -0,0 +1,132 @@
+"""
+符号表 - 每个 target 的变量、列表、云变量和广播索引
+
+Scratch 项目把变量、列表和广播存放在各个 target 的字典里（{ID: 数据}），
+按名称查找只能逐个扫描。符号表与 target 一一对应，维护 名称->ID 和
+ID->记录 两个索引，作用域解析（角色局部 -> 舞台全局）为 O(1)。
+编译器和各优化遍通过 create / remove 增删符号，target 与索引同时更新。
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+# 符号种类
+VARIABLE = "variable"
+LIST = "list"
+BROADCAST = "broadcast"
+
+SYMBOL_KINDS = (VARIABLE, LIST, BROADCAST)
+
+# 各种类符号在 target 中的存放位置
+_STORES = {VARIABLE: "variables", LIST: "lists", BROADCAST: "broadcasts"}
+
+
+@dataclass
+class Symbol:
+    """符号记录"""
+    id: str
+    name: str
+    kind: str
+    cloud: bool = False
+
+
+class SymbolTable:
+    """单个 target 的符号表
+
+    Args:
+        target: 对应的角色/舞台数据
+    """
+
+    def __init__(self, target: Dict[str, Any]) -> None:
+        self.target = target
+        self.by_name: Dict[str, Dict[str, Symbol]] = {kind: {} for kind in SYMBOL_KINDS}
+        self.by_id: Dict[str, Symbol] = {}
+
+    def define(self, kind: str, name: str, symbol_id: str, cloud: bool = False) -> Symbol:
+        """登记符号
+
+        同名符号只保留第一个的名称索引，与按字典顺序扫描时的"第一个匹配"一致。
+
+        Args:
+            kind: 符号种类（VARIABLE / LIST / BROADCAST）
+            name: 名称
+            symbol_id: 符号 ID
+            cloud: 是否为云变量
+
+        Returns:
+            Symbol: 登记的符号
+        """
+        symbol = Symbol(symbol_id, name, kind, cloud)
+        self.by_id[symbol_id] = symbol
+        self.by_name[kind].setdefault(name, symbol)
+        return symbol
+
+    def create(self, kind: str, name: str, symbol_id: str, value: Any = None) -> Symbol:
+        """在 target 中新建符号并登记
+
+        Args:
+            kind: 符号种类（VARIABLE / LIST / BROADCAST）
+            name: 名称
+            symbol_id: 符号 ID
+            value: 变量的初始值（默认 0）或列表的初始项目（默认为空），广播忽略
+
+        Returns:
+            Symbol: 登记的符号
+        """
+        store = self.target[_STORES[kind]]
+        if kind == VARIABLE:
+            store[symbol_id] = [name, 0 if value is None else value]
+        elif kind == LIST:
+            store[symbol_id] = [name, [] if value is None else value]
+        else:
+            store[symbol_id] = name
+        return self.define(kind, name, symbol_id)
+
+    def remove(self, symbol_id: str) -> Optional[Symbol]:
+        """从 target 和索引中删除符号，同名的下一个符号接替名称索引
+
+        Returns:
+            被删除的符号，不存在时为 None
+        """
+        symbol = self.by_id.pop(symbol_id, None)
+        if symbol is None:
+            return None
+        self.target[_STORES[symbol.kind]].pop(symbol_id, None)
+        by_name = self.by_name[symbol.kind]
+        if by_name.get(symbol.name) is symbol:
+            del by_name[symbol.name]
+            for other in self.symbols(symbol.kind):
+                if other.name == symbol.name:
+                    by_name[symbol.name] = other
+                    break
+        return symbol
+
+    def lookup(self, kind: str, name: str) -> Optional[Symbol]:
+        """按名称查找本 target 中的符号"""
+        return self.by_name[kind].get(name)
+
+    def get(self, symbol_id: str) -> Optional[Symbol]:
+        """按 ID 查找符号"""
+        return self.by_id.get(symbol_id)
+
+    def symbols(self, kind: Optional[str] = None) -> Iterator[Symbol]:
+        """遍历符号（按登记顺序）"""
+        for symbol in self.by_id.values():
+            if kind is None or symbol.kind == kind:
+                yield symbol
+
+    def cloud_variables(self) -> Iterator[Symbol]:
+        """遍历云变量"""
+        return (symbol for symbol in self.symbols(VARIABLE) if symbol.cloud)
+
+    @classmethod
+    def from_target(cls, target: Dict[str, Any]) -> 'SymbolTable':
+        """根据 target 中已有的变量、列表和广播建立符号表"""
+        table = cls(target)
+        for var_id, var_data in target.get("variables", {}).items():
+            cloud = len(var_data) > 2 and bool(var_data[2])
+            table.define(VARIABLE, var_data[0], var_id, cloud)
+        for list_id, list_data in target.get("lists", {}).items():
+            table.define(LIST, list_data[0], list_id)
+        for broadcast_id, name in target.get("broadcasts", {}).items():
+            table.define(BROADCAST, name, broadcast_id)
+        return table
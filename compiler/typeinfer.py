@@ -0,0 +1,315 @@
+"""
+输入类型推断 - 按积木输入槽的类型生成字面量和阴影
+
+解析器生成字面量时只区分数字（[4, 文本]）和文本（[10, 文本]），不管输入槽需要什么：
+"重复 10 次" 的次数是 math_whole_number，"等待" 是 math_positive_number，"设置变量" 的值是 text。
+类型不对的阴影在编辑器中显示成错误的输入框（数字槽可以输入文字），文本阴影放进数字槽时
+运行时每次求值都要把文本转换成数字；输入中放了 reporter 而没有阴影时，把 reporter 拖出后输入框消失。
+
+本遍（默认开启）在保存前：
+
+- 按 BlockDefinitions.INPUT_TYPES 中输入槽的类型改写字面量的基本类型编号（4–10）和阴影积木的 opcode，
+  字面量的文本不变。不满足槽的约束（如次数为负数）时用 math_number
+- 输入中放了 reporter 时补上被遮住的阴影：[3, 积木ID, [编号, ""]]
+- 推断变量的值类型：初始值和所有 "设置" 的值类型相同时为该类型，"增加" 的结果总是数字
+- 文本值（非数字的文本字面量、连接等返回文本的 reporter、值总是文本的变量）放入数字槽时给出警告
+
+只改写类型，不改变运行结果：运行时只看字面量的文本，不看类型编号。文本不能写成规范形式，
+例如 "从 1.0 到 10 随机选一个数" 只有两端的文本都不含 "." 时才返回整数（Cast.isInt），
+"1.0" 写成 "1" 会让小数随机数变成整数随机数。
+"""
+import json
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .blockrecord import is_block
+from .blocks import SLOT_PRIMITIVES, BlockDefinitions
+from .folding import js_to_number
+
+# 值类型
+NUMBER = "number"
+STRING = "string"
+BOOLEAN = "boolean"
+UNKNOWN = "unknown"
+
+# 数字类的输入槽
+NUMERIC_SLOTS = ("math_number", "math_positive_number", "math_whole_number", "math_integer", "math_angle")
+
+# reporter 的结果类型（没有列出的为 UNKNOWN，例如回答、列表项、参数）
+REPORTER_TYPES = {
+    **{opcode: NUMBER for opcode in (
+        "operator_add", "operator_subtract", "operator_multiply", "operator_divide", "operator_mod",
+        "operator_random", "operator_round", "operator_mathop", "operator_length",
+        "motion_xposition", "motion_yposition", "motion_direction", "looks_size", "sound_volume",
+        "sensing_timer", "sensing_loudness", "sensing_mousex", "sensing_mousey", "sensing_distanceto",
+        "sensing_current", "sensing_dayssince2000", "data_lengthoflist", "data_itemnumoflist",
+        "music_getTempo",
+    )},
+    **{opcode: STRING for opcode in ("operator_join", "operator_letter_of", "sensing_username")},
+    **{opcode: BOOLEAN for opcode in (
+        "operator_gt", "operator_lt", "operator_equals", "operator_and", "operator_or", "operator_not",
+        "operator_contains", "sensing_touchingobject", "sensing_touchingcolor", "sensing_coloristouchingcolor",
+        "sensing_keypressed", "sensing_mousedown", "data_listcontainsitem",
+    )},
+}
+
+# 造型/背景的 "编号或名称" reporter：结果类型取决于 NUMBER_NAME 字段
+_NUMBER_NAME_REPORTERS = ("looks_costumenumbername", "looks_backdropnumbername")
+
+# 列表位置输入可以是这些关键字（Cast.toListIndex）
+_INDEX_KEYWORDS = ("last", "random", "any", "all")
+
+# 自定义积木参数的输入槽类型
+_ARGUMENT_SLOTS = {"%s": "text", "%n": "math_number", "%b": "boolean"}
+
+# 阴影积木中保存值的字段
+_SHADOW_FIELDS = {**{slot: "NUM" for slot in NUMERIC_SLOTS}, "text": "TEXT", "colour_picker": "COLOUR"}
+
+# 被遮住的阴影的默认值
+_EMPTY_VALUES = {"colour_picker": "#000000"}
+
+_VARIABLE_PRIMITIVE = 12
+_COLOUR_RE = re.compile(r"#[0-9a-fA-F]{6}")
+
+
+@dataclass
+class TypeReport:
+    """输入类型推断的结果"""
+    # 改写了类型编号的字面量和阴影数
+    retyped: int = 0
+    # 补上的被遮住的阴影数
+    shadows: int = 0
+    # 推断出的变量值类型 {"角色/变量名": NUMBER | STRING | BOOLEAN | UNKNOWN}
+    variables: Dict[str, str] = field(default_factory=dict)
+    # 文本值放入数字槽的警告
+    warnings: List[str] = field(default_factory=list)
+
+
+def literal_type(text: str) -> str:
+    """字面量的值类型：能转换成数字的非空文本为 NUMBER，否则为 STRING"""
+    if text.strip() and not math.isnan(js_to_number(text)):
+        return NUMBER
+    return STRING
+
+
+def _join(left: Optional[str], right: str) -> str:
+    if left is None or left == right:
+        return right
+    return UNKNOWN
+
+
+def _fits(slot: str, value: float) -> bool:
+    """数字是否满足输入槽的约束"""
+    if slot in ("math_whole_number", "math_integer") and not (math.isfinite(value) and value == int(value)):
+        return False
+    if slot in ("math_positive_number", "math_whole_number"):
+        return value >= 0
+    return True
+
+
+def slot_types(block: Dict[str, Any]) -> Dict[str, str]:
+    """积木各输入槽的类型（自定义积木调用按签名中的 %s、%n、%b）"""
+    if block["opcode"] == "procedures_call":
+        mutation = block.get("mutation", {})
+        try:
+            argument_ids = json.loads(mutation.get("argumentids", "[]"))
+        except ValueError:
+            return {}
+        kinds = re.findall(r"%[snb]", mutation.get("proccode", ""))
+        return {arg_id: _ARGUMENT_SLOTS[kind] for arg_id, kind in zip(argument_ids, kinds)}
+    return BlockDefinitions.INPUT_TYPES.get(block["opcode"], {})
+
+
+class _Inference:
+    """在整个项目上推断类型（舞台变量在所有角色中可见，变量按 ID 区分）"""
+
+    def __init__(self, project: Dict[str, Any]) -> None:
+        self.project = project
+        self.report = TypeReport()
+        self.variables: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+
+    def run(self) -> TypeReport:
+        self._infer_variables()
+        for target in self.project["targets"]:
+            for block in list(target["blocks"].values()):
+                if is_block(block) and not block.get("shadow"):
+                    self._retype_block(target, block)
+        self.report.variables = {self.names[var_id]: value_type for var_id, value_type in self.variables.items()}
+        return self.report
+
+    # ==================== 变量类型 ====================
+
+    def _infer_variables(self) -> None:
+        """由初始值和所有写入推断变量类型（变量之间互相赋值时迭代到不动点）"""
+        initial: Dict[str, str] = {}
+        for target in self.project["targets"]:
+            for var_id, value in target["variables"].items():
+                self.names[var_id] = f"{target['name']}/{value[0]}"
+                current = value[1]
+                if isinstance(current, bool):
+                    initial[var_id] = BOOLEAN
+                elif isinstance(current, (int, float)):
+                    initial[var_id] = NUMBER
+                else:
+                    initial[var_id] = literal_type(str(current))
+        writes: List[Tuple[str, Dict[str, Any], Any]] = []
+        for target in self.project["targets"]:
+            for block in target["blocks"].values():
+                if not is_block(block) or block["opcode"] not in ("data_setvariableto",
+                                                                           "data_changevariableby"):
+                    continue
+                value = block["fields"].get("VARIABLE")
+                if not isinstance(value, list) or len(value) < 2 or value[1] not in initial:
+                    continue
+                if block["opcode"] == "data_changevariableby":
+                    initial[value[1]] = _join(initial[value[1]], NUMBER)
+                else:
+                    writes.append((value[1], target["blocks"], block["inputs"].get("VALUE")))
+
+        self.variables = dict(initial)
+        changed = True
+        while changed:
+            changed = False
+            types = dict(initial)
+            for var_id, blocks, value in writes:
+                types[var_id] = _join(types[var_id], self._value_type(blocks, value))
+            if types != self.variables:
+                self.variables = types
+                changed = True
+
+    def _value_type(self, blocks: Dict[str, Any], value: Any) -> str:
+        """输入值的类型"""
+        if not isinstance(value, list) or len(value) < 2:
+            return STRING
+        item = value[1]
+        if isinstance(item, list):
+            if len(item) >= 3 and item[0] == _VARIABLE_PRIMITIVE:
+                return self.variables.get(item[2], UNKNOWN)
+            if len(item) >= 2 and item[0] in SLOT_PRIMITIVES.values():
+                return literal_type(str(item[1]))
+            return UNKNOWN
+        block = blocks.get(item)
+        if not is_block(block):
+            return UNKNOWN
+        if block.get("shadow"):
+            text = self._shadow_text(block)
+            return literal_type(text) if text is not None else UNKNOWN
+        return self._reporter_type(block)
+
+    def _reporter_type(self, block: Dict[str, Any]) -> str:
+        opcode = block["opcode"]
+        if opcode == "data_variable":
+            return self.variables.get(block["fields"]["VARIABLE"][1], UNKNOWN)
+        if opcode in _NUMBER_NAME_REPORTERS:
+            option = block["fields"].get("NUMBER_NAME", ["number"])[0]
+            return NUMBER if option == "number" else STRING
+        return REPORTER_TYPES.get(opcode, UNKNOWN)
+
+    @staticmethod
+    def _shadow_text(shadow: Dict[str, Any]) -> Optional[str]:
+        name = _SHADOW_FIELDS.get(shadow["opcode"])
+        value = shadow["fields"].get(name) if name else None
+        return str(value[0]) if value else None
+
+    # ==================== 改写 ====================
+
+    def _retype_block(self, target: Dict[str, Any], block: Dict[str, Any]) -> None:
+        blocks = target["blocks"]
+        for name, slot in slot_types(block).items():
+            value = block["inputs"].get(name)
+            if not isinstance(value, list) or len(value) < 2 or slot == "boolean":
+                continue
+            self._check(target, block, name, slot, value)
+            code = SLOT_PRIMITIVES[slot]
+            if value[0] == 2 and isinstance(value[1], str) and is_block(blocks.get(value[1])) \
+                    and not blocks[value[1]].get("shadow"):
+                # reporter 下面补上被遮住的阴影
+                block["inputs"][name] = [3, value[1], [code, _EMPTY_VALUES.get(slot, "")]]
+                self.report.shadows += 1
+                continue
+            shadow = value[1] if value[0] == 1 else (value[2] if len(value) > 2 else None)
+            if isinstance(shadow, list):
+                self._retype_primitive(shadow, slot)
+            elif isinstance(shadow, str) and is_block(blocks.get(shadow)):
+                self._retype_shadow(blocks[shadow], slot)
+
+    @staticmethod
+    def _target_slot(text: str, slot: str) -> Optional[str]:
+        """字面量在输入槽中应有的槽类型，不改写时返回 None"""
+        if slot == "text":
+            return slot
+        if slot == "colour_picker":
+            return slot if _COLOUR_RE.fullmatch(text) else None
+        if literal_type(text) != NUMBER:
+            return None
+        return slot if _fits(slot, js_to_number(text)) else "math_number"
+
+    def _retype_primitive(self, primitive: List[Any], slot: str) -> None:
+        if len(primitive) != 2 or primitive[0] not in SLOT_PRIMITIVES.values():
+            return
+        new_slot = self._target_slot(str(primitive[1]), slot)
+        if new_slot is not None and primitive[0] != SLOT_PRIMITIVES[new_slot]:
+            primitive[0] = SLOT_PRIMITIVES[new_slot]
+            self.report.retyped += 1
+
+    def _retype_shadow(self, shadow: Dict[str, Any], slot: str) -> None:
+        text = self._shadow_text(shadow)
+        if text is None:
+            return
+        new_slot = self._target_slot(text, slot)
+        if new_slot is not None and shadow["opcode"] != new_slot:
+            old_field = shadow["fields"].pop(_SHADOW_FIELDS[shadow["opcode"]])
+            shadow["opcode"] = new_slot
+            shadow["fields"][_SHADOW_FIELDS[new_slot]] = old_field
+            self.report.retyped += 1
+
+    # ==================== 警告 ====================
+
+    def _check(self, target: Dict[str, Any], block: Dict[str, Any], name: str, slot: str, value: List[Any]) -> None:
+        """文本值放入数字槽时记录警告"""
+        if slot not in NUMERIC_SLOTS:
+            return
+        blocks = target["blocks"]
+        item = value[1]
+        description = None
+        if isinstance(item, list) and len(item) >= 3 and item[0] == _VARIABLE_PRIMITIVE:
+            if self.variables.get(item[2]) == STRING:
+                description = f"变量 {item[1]}（值总是文本）"
+        elif isinstance(item, list) and len(item) == 2:
+            text = str(item[1])
+            if text.strip() and literal_type(text) == STRING and not (
+                    name == "INDEX" and text in _INDEX_KEYWORDS):
+                description = f'文本 "{text}"'
+        elif isinstance(item, str) and is_block(blocks.get(item)):
+            reporter = blocks[item]
+            if reporter.get("shadow"):
+                text = self._shadow_text(reporter)
+                if text and text.strip() and literal_type(text) == STRING:
+                    description = f'文本 "{text}"'
+            elif self._reporter_type(reporter) == STRING:
+                if reporter["opcode"] == "data_variable":
+                    description = f"变量 {reporter['fields']['VARIABLE'][0]}（值总是文本）"
+                else:
+                    description = f"{reporter['opcode']} 的文本结果"
+        if description is not None:
+            message = f"{target['name']}: {description} 放入了 {block['opcode']} 的数字输入 {name}"
+            self.report.warnings.append(message)
+            print(f"⚠️ 警告: {message}")
+
+
+def infer_types(project: Dict[str, Any]) -> TypeReport:
+    """按输入槽的类型改写项目中的字面量和阴影，并推断变量类型
+
+    Args:
+        project: project.json 的内容，原地修改积木的输入
+
+    Returns:
+        TypeReport: 改写数量、变量类型和警告
+    """
+    report = _Inference(project).run()
+    if report.retyped or report.shadows:
+        print(f"🔤 输入类型推断: 改写 {report.retyped} 个字面量的类型，补上 {report.shadows} 个阴影")
+    return report
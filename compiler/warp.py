@@ -0,0 +1,192 @@
+"""
+不刷新屏幕推断 - 自动为不会让出的自定义积木开启 "运行时不刷新屏幕"（warp）
+
+没有开启 warp 的自定义积木里，循环每执行一次就让出一次；如果这一轮请求了重绘
+（移动、说话、画笔等），线程要等到下一帧才继续，纯计算的循环也要和其他线程轮流执行。
+开启 warp 后积木体一次执行完，这是编译出的项目能得到的最大的运行时加速。
+
+一个自定义积木满足以下条件时自动开启 warp：
+
+- 积木体（包括调用的其他自定义积木）中没有会等待的积木：等待、说/思考几秒、滑行、
+  广播并等待、询问并等待、播放声音等待播完等
+- 没有无界循环（重复执行、重复执行直到、等待直到）和递归调用
+- 循环中没有请求重绘的积木（移动、外观、画笔）：开启 warp 会把逐帧的动画变成瞬间完成
+- 没有未知的扩展积木（可能返回 Promise 而让出）
+
+在定义后写 "刷新屏幕"（或 "refresh"）可以禁止自动开启，例如 "定义 跳(高度) 刷新屏幕"。
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .blockgraph import Blocks, CORE_PREFIXES, SUBSTACK_INPUTS, referenced_ids, stack, substack
+from .blockrecord import is_block
+
+# 会等待（让出直到条件满足或时间结束）的积木
+YIELDING_OPCODES = {
+    "control_wait": "等待",
+    "control_wait_until": "等待直到",
+    "looks_sayforsecs": "说几秒",
+    "looks_thinkforsecs": "思考几秒",
+    "looks_switchbackdroptoandwait": "换成背景并等待",
+    "motion_glidesecstoxy": "滑行",
+    "motion_glideto": "滑行",
+    "event_broadcastandwait": "广播并等待",
+    "sensing_askandwait": "询问并等待",
+    "sound_playuntildone": "播放声音等待播完",
+}
+
+# 无界循环
+UNBOUNDED_LOOPS = {
+    "control_forever": "重复执行",
+    "control_repeat_until": "重复执行直到",
+    "control_while": "当条件成立时重复",
+}
+
+# 有界循环（非 warp 时每次循环让出一次）
+BOUNDED_LOOPS = ("control_repeat",)
+
+# 会请求重绘的语句积木类别
+REDRAW_PREFIXES = ("motion_", "looks_", "pen_")
+
+
+@dataclass
+class WarpReport:
+    """不刷新屏幕推断的结果"""
+    # 自动开启 warp 的自定义积木（"角色/积木签名"）
+    promoted: List[str] = field(default_factory=list)
+    # 没有开启的自定义积木及原因
+    kept: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _Procedure:
+    definition_id: str
+    prototype: Dict[str, Any]
+    # 分析结果：None 为未分析，"" 为不会让出，否则为原因
+    reason: Optional[str] = None
+    # 积木体是否请求重绘（调用者在循环中调用它时相当于动画）
+    redraws: bool = False
+
+
+def _is_warp(mutation: Dict[str, Any]) -> bool:
+    return mutation.get("warp") in ("true", True)
+
+
+def infer_warp(project: Dict[str, Any], refresh: Optional[Set[Tuple[str, str]]] = None) -> WarpReport:
+    """为项目中不会让出的自定义积木开启 warp
+
+    Args:
+        project: project.json 的内容，原地修改原型和调用积木的 mutation
+        refresh: 标注了 "刷新屏幕" 的自定义积木 {(角色名, 积木签名)}
+
+    Returns:
+        WarpReport: 开启和没有开启的自定义积木
+    """
+    refresh = refresh or set()
+    report = WarpReport()
+    for target in project["targets"]:
+        _TargetAnalysis(target["blocks"]).run(target["name"], refresh, report)
+    return report
+
+
+class _TargetAnalysis:
+    """分析一个 target 中的自定义积木"""
+
+    def __init__(self, blocks: Blocks) -> None:
+        self.blocks = blocks
+        self.procedures: Dict[str, _Procedure] = {}
+        for block_id, block in blocks.items():
+            if is_block(block) and block["opcode"] == "procedures_definition":
+                value = block["inputs"].get("custom_block")
+                prototype = blocks.get(value[1]) if value and isinstance(value[1], str) else None
+                if prototype is not None and "mutation" in prototype:
+                    self.procedures[prototype["mutation"]["proccode"]] = _Procedure(block_id, prototype)
+        self._active: List[str] = []
+
+    def run(self, target_name: str, refresh: Set[Tuple[str, str]], report: WarpReport) -> None:
+        promoted = set()
+        for proccode, procedure in self.procedures.items():
+            if _is_warp(procedure.prototype["mutation"]):
+                continue
+            name = f"{target_name}/{proccode}"
+            reason = self._analyze(proccode)
+            if (target_name, proccode) in refresh:
+                reason = "标注了刷新屏幕"
+            if reason:
+                report.kept[name] = reason
+                continue
+            procedure.prototype["mutation"]["warp"] = "true"
+            promoted.add(proccode)
+            report.promoted.append(name)
+            print(f"⚡ [{target_name}] 自定义积木 {proccode} 不会让出，自动开启不刷新屏幕")
+        if promoted:
+            for block in self.blocks.values():
+                if is_block(block) and block["opcode"] == "procedures_call" \
+                        and block.get("mutation", {}).get("proccode") in promoted:
+                    block["mutation"]["warp"] = "true"
+
+    def _analyze(self, proccode: str) -> str:
+        """返回自定义积木会让出的原因，不会让出时返回空字符串"""
+        procedure = self.procedures[proccode]
+        if procedure.reason is None:
+            if proccode in self._active:
+                return "递归调用"
+            self._active.append(proccode)
+            procedure.reason = self._walk(self.blocks[procedure.definition_id]["next"], False, procedure) or ""
+            self._active.pop()
+        return procedure.reason
+
+    def _walk(self, first_id: Optional[str], in_loop: bool, procedure: _Procedure) -> Optional[str]:
+        """检查积木栈，返回会让出的原因"""
+        blocks = self.blocks
+        for block_id in stack(blocks, first_id):
+            block = blocks[block_id]
+            opcode = block["opcode"]
+            if opcode in YIELDING_OPCODES:
+                return YIELDING_OPCODES[opcode]
+            if opcode in UNBOUNDED_LOOPS:
+                return f"无界循环（{UNBOUNDED_LOOPS[opcode]}）"
+            if opcode == "procedures_call":
+                callee = block.get("mutation", {}).get("proccode")
+                if callee not in self.procedures:
+                    return f"调用了未定义的积木 {callee}"
+                reason = self._analyze(callee)
+                if reason:
+                    return f"调用 {callee}: {reason}"
+                if self.procedures[callee].redraws:
+                    procedure.redraws = True
+                    if in_loop:
+                        return f"循环中调用了会重绘的 {callee}"
+            elif not opcode.startswith(CORE_PREFIXES):
+                return f"扩展积木 {opcode}"
+            elif opcode.startswith(REDRAW_PREFIXES):
+                procedure.redraws = True
+                if in_loop:
+                    return f"循环中有会重绘的积木 {opcode}（动画）"
+
+            for name, value in block["inputs"].items():
+                if name in SUBSTACK_INPUTS:
+                    continue
+                reason = self._check_reporters(referenced_ids(value))
+                if reason:
+                    return reason
+            loop = in_loop or opcode in BOUNDED_LOOPS
+            for name in SUBSTACK_INPUTS:
+                reason = self._walk(substack(block, name), loop, procedure)
+                if reason:
+                    return reason
+        return None
+
+    def _check_reporters(self, block_ids: List[str]) -> Optional[str]:
+        """检查输入中的 reporter 积木（扩展的 reporter 可能返回 Promise 而让出）"""
+        for block_id in block_ids:
+            block = self.blocks.get(block_id)
+            if block is None:
+                continue
+            if not block["opcode"].startswith(CORE_PREFIXES):
+                return f"扩展积木 {block['opcode']}"
+            for value in block["inputs"].values():
+                reason = self._check_reporters(referenced_ids(value))
+                if reason:
+                    return reason
+        return None
@@ -0,0 +1,146 @@
+"""
+测试共用的 pytest 配置和 fixture
+
+- compile_source: 编译源码，测试模块中的 COMPILE_OPTIONS、SPRITE_VARIABLES 是该模块的默认编译选项和变量声明
+- run_project: 用 compiler/interpreter.py 运行项目，比较优化前后的执行结果
+- no_pil: 检查一段代码不经过 PIL 解码图片（缓存命中、原样使用的 PNG）
+"""
+import contextlib
+import io
+import os
+import sys
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.cache import CACHE_DIR_ENV
+from compiler.folding import to_string
+from compiler.interpreter import Interpreter
+from compiler.parser import ScratchLangParser
+
+# run_project 最多运行的帧数
+MAX_FRAMES = 10_000
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_cache_dir(tmp_path_factory):
+    """测试期间的磁盘缓存（注册表、图片缓存等）写入临时目录，不读写用户的 ~/.cache/scratchlang"""
+    previous = os.environ.get(CACHE_DIR_ENV)
+    os.environ[CACHE_DIR_ENV] = str(tmp_path_factory.mktemp("cache"))
+    yield
+    if previous is None:
+        del os.environ[CACHE_DIR_ENV]
+    else:
+        os.environ[CACHE_DIR_ENV] = previous
+
+
+class Compiled(NamedTuple):
+    """compile_source 的结果"""
+    parser: ScratchLangParser
+    # 编译时的控制台输出
+    output: str
+    # 保存的 .sb3 文件内容，不保存时为 None
+    data: Optional[bytes]
+
+    @property
+    def stage(self) -> Dict[str, Any]:
+        return self.parser.builder.project["targets"][0]
+
+    @property
+    def sprite(self) -> Dict[str, Any]:
+        """第一个角色"""
+        return self.parser.builder.project["targets"][1]
+
+
+def sprite_source(script: Union[str, Dict[str, str], None] = None, variables: str = "",
+                  definitions: str = "") -> str:
+    """只有一个角色 "角色1" 的源码
+
+    Args:
+        script: 绿旗脚本的积木行（自动缩进），或 {帽子积木行: 积木行} 的多个脚本
+        variables: 变量和列表声明
+        definitions: 自定义积木定义
+    """
+    if script is None:
+        script = {}
+    elif isinstance(script, str):
+        script = {"当绿旗被点击": script}
+    body = "".join(hat + "\n" + "".join("  " + line + "\n" for line in lines.strip("\n").split("\n"))
+                   for hat, lines in script.items())
+    return f": 开始\n# 角色1\n{variables}{definitions}\n{body}"
+
+
+@pytest.fixture
+def compile_source(request, tmp_path):
+    """编译源码的函数
+
+    compile_source(code=None, *, script=None, variables=None, definitions="", save=True, name="out.sb3", **options)
+
+    code 为完整的源码；不给出时由 script、variables（默认为模块的 SPRITE_VARIABLES）和 definitions
+    生成只有一个角色的源码（见 sprite_source）。save 为真时调用 parser.compile 保存到临时目录，
+    否则只解析。options 传给 ScratchLangParser，未给出的取模块的 COMPILE_OPTIONS；
+    增量编译的区段缓存默认写入本测试的临时目录，同一个测试中多次编译共用。
+    """
+    module_options = getattr(request.module, "COMPILE_OPTIONS", {})
+    module_variables = getattr(request.module, "SPRITE_VARIABLES", "")
+
+    def compile_source(code: Optional[str] = None, *, script: Union[str, Dict[str, str], None] = None,
+                       variables: Optional[str] = None, definitions: str = "", save: bool = True,
+                       name: str = "out.sb3", **options: Any) -> Compiled:
+        if code is None:
+            code = sprite_source(script, module_variables if variables is None else variables, definitions)
+        parser = ScratchLangParser(**{"cache_dir": str(tmp_path / "cache"), **module_options, **options})
+        parser.current_dir = str(tmp_path)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            parser.parse(code)
+            if save:
+                parser.compile(str(tmp_path / name))
+        data = (tmp_path / name).read_bytes() if save else None
+        return Compiled(parser, output.getvalue(), data)
+
+    return compile_source
+
+
+def run_green_flag(project: Dict[str, Any], sprite: str = "角色1") -> Dict[str, Any]:
+    """点击绿旗并运行到所有脚本结束，返回角色可以观察到的状态
+
+    以下划线开头的变量是优化生成的临时变量（如 "_内联_"、"_不变量_"），不计入结果。
+    """
+    vm = Interpreter(project)
+    vm.green_flag()
+    for _ in range(MAX_FRAMES):
+        if not vm.running:
+            break
+        vm.step_frame()
+    assert not vm.running, f"{MAX_FRAMES} 帧内没有运行结束"
+    assert not vm.unsupported, f"解释器不支持 {dict(vm.unsupported)}"
+    target = vm.sprite(sprite)
+    variables = {value[0]: to_string(target.variables[var_id]) for var_id, value in target.data["variables"].items()
+                 if not value[0].startswith("_")}
+    return {"x": target.x, "y": target.y, "size": target.size, "volume": target.volume,
+            "said": [text for _, name, text in vm.speech if name == sprite], "variables": variables}
+
+
+@pytest.fixture
+def run_project():
+    """运行项目的函数，见 run_green_flag"""
+    return run_green_flag
+
+
+@pytest.fixture
+def no_pil():
+    """上下文管理器，其中调用 PIL 的 Image.open 会让测试失败"""
+    def fail_open(*args, **kwargs):
+        raise AssertionError("不应调用 PIL")
+
+    @contextlib.contextmanager
+    def no_pil():
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(Image, "open", fail_open)
+            yield
+
+    return no_pil
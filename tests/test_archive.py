@@ -0,0 +1,151 @@
+"""
+archive.py 单元测试
+"""
+import pytest
+import io
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler import archive
+from compiler.archive import ArchiveEntry, compress_type, write_archive, zip_info
+from compiler.assets import AssetSource
+from compiler.builder import SB3Builder
+
+CONTENTS = {
+    "project.json": b'{"targets":[]}' * 5000,
+    "0a.png": bytes(range(256)) * 300,
+    "1b.svg": b'<svg xmlns="http://www.w3.org/2000/svg"></svg>' * 100,
+    "2c.wav": b"RIFF" + bytes(100000),
+    "3d.mp3": b"ID3" + bytes(range(256)) * 10,
+    "造型.svg": b"<svg/>",
+    "empty.wav": b"",
+}
+
+
+def entries():
+    return [ArchiveEntry(name, lambda data=data: iter([data[:70000], data[70000:]]))
+            for name, data in CONTENTS.items()]
+
+
+def zipfile_bytes(level):
+    """用 zipfile 逐条目写入同样的条目"""
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w') as zf:
+        for name, data in CONTENTS.items():
+            zf.writestr(zip_info(name, level), data, compresslevel=level)
+    return output.getvalue()
+
+
+def archive_bytes(level=archive.DEFAULT_COMPRESS_LEVEL, workers=1):
+    output = io.BytesIO()
+    write_archive(output, entries(), level, workers)
+    return output.getvalue()
+
+
+class TestWriteArchive:
+    """压缩包写入测试类"""
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    @pytest.mark.parametrize("level", [0, 1, 6, 9])
+    def test_same_bytes_as_zipfile(self, level, workers):
+        """测试写入的字节与 zipfile 逐条目写入时相同"""
+        data = archive_bytes(level, workers)
+        assert data == zipfile_bytes(level)
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            assert {name: zf.read(name) for name in zf.namelist()} == CONTENTS
+            assert [info.filename for info in zf.infolist()] == list(CONTENTS)
+
+    def test_compress_policy(self):
+        """测试已经压缩过的格式原样存储，其余用 deflate，级别 0 时全部原样存储"""
+        with zipfile.ZipFile(io.BytesIO(archive_bytes())) as zf:
+            stored = {info.filename for info in zf.infolist() if info.compress_type == zipfile.ZIP_STORED}
+        assert stored == {"0a.png", "3d.mp3"}
+        assert compress_type("A.JPG") == compress_type("a.gif") == compress_type("b.ogg") == zipfile.ZIP_STORED
+        assert compress_type("c.wav") == compress_type("d.svg") == zipfile.ZIP_DEFLATED
+        assert compress_type("project.json", 0) == zipfile.ZIP_STORED
+        with pytest.raises(ValueError):
+            archive_bytes(level=10)
+
+    @pytest.mark.parametrize("level", [0, 6])
+    def test_entries_read_once(self, level):
+        """测试每个条目的内容只读取一次（包括原样存储的条目）"""
+        calls = []
+
+        def counted(name, data):
+            def chunks():
+                calls.append(name)
+                return iter([data])
+            return ArchiveEntry(name, chunks)
+
+        output = io.BytesIO()
+        write_archive(output, [counted(name, data) for name, data in CONTENTS.items()], level, 2)
+        assert sorted(calls) == sorted(CONTENTS)
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_spools_closed_on_error(self, monkeypatch, workers):
+        """测试写入出错时所有已准备好的条目的临时文件都被关闭"""
+        spools = []
+        spooled_file = archive.tempfile.SpooledTemporaryFile
+
+        def tracked(*args, **kwargs):
+            spools.append(spooled_file(*args, **kwargs))
+            return spools[-1]
+
+        class FailingStream(io.BytesIO):
+            def write(self, data):
+                if self.tell() > 1000:
+                    raise OSError("磁盘已满")
+                return super().write(data)
+
+        monkeypatch.setattr(archive.tempfile, "SpooledTemporaryFile", tracked)
+        with pytest.raises(OSError):
+            write_archive(FailingStream(), entries(), workers=workers)
+        assert spools and all(spool.closed for spool in spools)
+
+    def test_spooled_to_disk(self, monkeypatch):
+        """测试压缩结果超过暂存大小时写入临时文件，结果不变"""
+        expected = archive_bytes()
+        monkeypatch.setattr(archive, "SPOOL_SIZE", 16)
+        assert archive_bytes(workers=2) == expected
+
+
+class TestSave:
+    """SB3Builder.save 测试类"""
+
+    def build(self, tmp_path, **options):
+        builder = SB3Builder(id_mode="counter", **options)
+        builder.add_sprite("Stage", is_stage=True)
+        builder.add_sprite("角色1")
+        builder.add_block("motion_movesteps", {"STEPS": [1, [4, "10"]]}, top_level=True)
+        (tmp_path / "s.wav").write_bytes(b"RIFF" + bytes(5000))
+        builder.asset_manager.assets["x.wav"] = AssetSource.from_file("x.wav", str(tmp_path / "s.wav"))
+        return builder
+
+    def test_workers_and_level(self, tmp_path):
+        """测试多线程压缩的输出与逐个压缩相同，压缩级别影响 deflate 的条目"""
+        outputs = {}
+        for workers, level in ((1, 6), (4, 6), (1, 0)):
+            builder = self.build(tmp_path, asset_workers=workers, compress_level=level)
+            builder.save(str(tmp_path / "out.sb3"))
+            outputs[workers, level] = (tmp_path / "out.sb3").read_bytes()
+        assert outputs[1, 6] == outputs[4, 6] != outputs[1, 0]
+        with zipfile.ZipFile(io.BytesIO(outputs[1, 0])) as zf:
+            assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+    def test_zip64_fallback(self, tmp_path, monkeypatch):
+        """测试需要 zip64 时改用 zipfile 写入"""
+        builder = self.build(tmp_path)
+        monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1000)
+        builder.save(str(tmp_path / "out.sb3"))
+        monkeypatch.undo()
+        with zipfile.ZipFile(tmp_path / "out.sb3") as zf:
+            assert zf.read("x.wav") == (tmp_path / "s.wav").read_bytes()
+            assert zf.namelist()[0] == "project.json"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,290 @@
+"""
+assets.py 单元测试
+"""
+import pytest
+import contextlib
+import hashlib
+import io
+import json
+import os
+import pickle
+import struct
+import sys
+import zipfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from compiler import builder as builder_module
+from compiler.assets import AssetManager, AssetSource, _get_wav_audio_info, _png_size, _read_wav_audio_info
+from compiler.blockrecord import json_default
+from compiler.builder import SB3Builder
+from compiler.exceptions import AssetError
+from compiler.parser import ScratchLangParser
+
+
+def write_wav(path, frames=1000, extra_chunk=b""):
+    pcm = b"\x01\x02" * frames
+    body = b"WAVEfmt " + struct.pack("<IHHIIHH", 16, 1, 1, 22050, 44100, 2, 16) + extra_chunk
+    body += b"data" + struct.pack("<I", len(pcm)) + pcm
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+    return path
+
+
+class TestAssetSource:
+    """资源引用测试类"""
+
+    def test_sound_is_referenced_not_loaded(self, tmp_path):
+        """测试音效引用源文件，MD5 和采样信息与读入内存时相同"""
+        path = write_wav(tmp_path / "a.wav", extra_chunk=b"LIST" + struct.pack("<I", 4) + b"INFO")
+        manager = AssetManager()
+        sound = manager.add_sound(str(path))
+        data = path.read_bytes()
+        asset = manager.assets[sound["md5ext"]]
+        assert asset.data is None and asset.path == str(path) and asset.size == len(data)
+        assert sound["assetId"] == hashlib.md5(data).hexdigest()
+        assert (sound["rate"], sound["sampleCount"]) == (22050, 1000) == _get_wav_audio_info(data)
+        assert manager.read(sound["md5ext"]) == data
+
+    def test_wav_info_from_file(self, tmp_path):
+        """测试从文件解析 WAV 文件头与解析整个文件内容的结果相同"""
+        for path in (write_wav(tmp_path / "a.wav", 5), tmp_path / "short.wav"):
+            if not path.exists():
+                path.write_bytes(b"RIFF")
+            data = path.read_bytes()
+            with open(path, "rb") as f:
+                assert _read_wav_audio_info(f, len(data)) == _get_wav_audio_info(data)
+
+    def test_converted_image_is_spooled(self, tmp_path):
+        """测试转换后的图片写入暂存文件，记录转换方式，AssetManager 回收后删除"""
+        Image.new("RGB", (600, 300), (255, 0, 0)).save(tmp_path / "a.png")
+        manager = AssetManager(auto_scale_costumes=True, max_costume_size=300)
+        costume = manager.add_image(str(tmp_path / "a.png"))
+        asset = manager.assets[costume["md5ext"]]
+        assert asset.spooled and asset.source == str(tmp_path / "a.png") and asset.recipe == ("png", 300)
+        assert hashlib.md5(asset.read()).hexdigest() == costume["assetId"]
+
+        portable = pickle.loads(pickle.dumps(asset.portable()))
+        assert portable.data == asset.read() and not portable.spooled
+        spool = os.path.dirname(asset.path)
+        del manager
+        assert not os.path.exists(spool)
+        assert portable.read() == portable.data
+
+    def test_modified_file(self, tmp_path):
+        """测试引用的文件在保存前被修改时报错"""
+        path = write_wav(tmp_path / "a.wav")
+        asset = AssetSource.from_file("x.wav", str(path))
+        path.write_bytes(path.read_bytes() + b"\0\0")
+        with pytest.raises(AssetError):
+            asset.read()
+        os.unlink(path)
+        with pytest.raises(AssetError):
+            asset.open()
+
+
+class TestStreamingSave:
+    """流式保存测试类"""
+
+    def test_project_json_matches_dumps(self, tmp_path, monkeypatch):
+        """测试分段编码的 project.json 与一次性 json.dumps 逐字节相同"""
+        monkeypatch.setattr(builder_module, "JSON_BLOCK_BATCH", 3)
+        builder = SB3Builder(id_mode="counter")
+        builder.add_sprite("Stage", is_stage=True)
+        builder.add_variable("分数", "\"引号\"")
+        builder.add_sprite("角色1")
+        for index in range(10):
+            builder.add_block("motion_movesteps", {"STEPS": [1, [4, str(index)]]}, top_level=True)
+        builder.add_sprite("角色2")
+        builder.save(str(tmp_path / "out.sb3"))
+
+        expected = json.dumps(builder.project, ensure_ascii=False, separators=(",", ":"), default=json_default)
+        assert "".join(builder.iter_project_json()) == expected
+        with zipfile.ZipFile(tmp_path / "out.sb3") as archive:
+            assert archive.read("project.json").decode("utf-8") == expected
+
+    def test_assets_streamed_into_archive(self, tmp_path):
+        """测试资源内容原样写入 .sb3"""
+        path = write_wav(tmp_path / "a.wav", frames=300000)
+        builder = SB3Builder()
+        builder.add_sprite("角色1")
+        builder.add_sound(str(path))
+        builder.save(str(tmp_path / "out.sb3"))
+        with zipfile.ZipFile(tmp_path / "out.sb3") as archive:
+            assert archive.read(builder.current_sprite["sounds"][0]["md5ext"]) == path.read_bytes()
+            assert len(archive.namelist()) == 3
+
+
+ASSET_CODE = ("@ 舞台\n背景: missing.png\n# 角色1\n造型: a.png\n造型: bad.wav\n造型: b.png\n造型: a.png\n"
+              "音效: s.wav\n# 角色2\n造型: missing.png\n")
+
+
+@pytest.fixture
+def asset_project(tmp_path):
+    Image.new("RGB", (60, 40), (255, 0, 0)).save(tmp_path / "a.png")
+    Image.new("RGB", (30, 20), (0, 0, 255)).save(tmp_path / "b.png")
+    write_wav(tmp_path / "bad.wav")
+    write_wav(tmp_path / "s.wav")
+    return tmp_path
+
+
+class TestAssetRequests:
+    """资源线程池测试类"""
+
+    def test_order_and_names(self, asset_project, compile_source):
+        """测试多线程处理时造型顺序、名称和输出与逐个处理相同，失败的资源被去掉"""
+        serial = compile_source(ASSET_CODE, image_cache=False, asset_workers=1)
+        threaded = compile_source(ASSET_CODE, image_cache=False, asset_workers=4)
+        assert threaded.data == serial.data and threaded.output == serial.output
+        assert threaded.parser.builder.asset_manager.workers == 4
+        threaded_log = threaded.output
+
+        stage, sprite1, sprite2 = threaded.parser.builder.project["targets"]
+        assert [costume["name"] for costume in sprite1["costumes"]] == ["costume1", "costume2", "costume3"]
+        assert sprite1["costumes"][0]["md5ext"] == sprite1["costumes"][2]["md5ext"]
+        assert [sound["name"] for sound in sprite1["sounds"]] == ["s.wav"]
+        # 全部失败时使用默认造型/背景
+        assert sprite2["costumes"][0]["dataFormat"] == "svg" and stage["costumes"][0]["name"] == "backdrop1"
+        # 报告按源码顺序
+        assert threaded_log.index("背景文件不存在") < threaded_log.index("不支持的图片格式") < \
+            threaded_log.index("成功加载造型: b.png") < threaded_log.index("[角色1] 3 个造型")
+
+    def test_timing_stats(self, asset_project, compile_source):
+        """测试按登记顺序记录每个资源的耗时和结果，同一文件只处理一次"""
+        stats = compile_source(ASSET_CODE, image_cache=False, asset_workers=2).parser.builder.asset_stats
+        assert [(os.path.basename(timing.path), timing.kind, timing.ok) for timing in stats.assets] == [
+            ("missing.png", "image", False), ("a.png", "image", True), ("bad.wav", "image", False),
+            ("b.png", "image", True), ("a.png", "image", True), ("s.wav", "sound", True),
+            ("missing.png", "image", False),
+        ]
+        assert stats.workers == 2 and stats.total_seconds >= 0 and stats.wait_seconds >= 0
+
+    def test_builder_api(self, asset_project):
+        """测试 save 前未填入的资源在保存时填入，add_costume 仍立即处理并抛出异常"""
+        builder = SB3Builder(asset_workers=2)
+        builder.add_sprite("角色1")
+        errors = []
+        builder.request_costume(str(asset_project / "missing.png"), report=errors.append)
+        builder.request_costume(str(asset_project / "b.png"), report=errors.append)
+        builder.finalize_sprite()
+        assert builder.current_sprite["costumes"] == [{}, {}]
+        builder.save(str(asset_project / "out.sb3"))
+        assert isinstance(errors[0], FileNotFoundError) and errors[1] is None
+        assert [costume["name"] for costume in builder.current_sprite["costumes"]] == ["costume1"]
+        with pytest.raises(FileNotFoundError):
+            builder.add_costume(str(asset_project / "missing.png"))
+
+
+class TestPngEncoding:
+    """PNG 原样使用和重新编码力度测试类"""
+
+    def test_passthrough(self, tmp_path, no_pil):
+        """测试不需要缩放的 PNG 原样使用、不解码，需要缩放时仍然转换"""
+        Image.new("RGB", (600, 300), (255, 0, 0)).save(tmp_path / "a.png")
+        data = (tmp_path / "a.png").read_bytes()
+        manager = AssetManager(auto_scale_costumes=True, max_costume_size=600)
+        with no_pil():
+            costume = manager.add_image(str(tmp_path / "a.png"))
+        asset = manager.assets[costume["md5ext"]]
+        assert asset.path == str(tmp_path / "a.png") and asset.recipe is None and not asset.spooled
+        assert costume["assetId"] == hashlib.md5(data).hexdigest()
+        assert (costume["rotationCenterX"], costume["rotationCenterY"]) == (300, 150)
+
+        manager = AssetManager(auto_scale_costumes=True, max_costume_size=300, png_effort="fast")
+        asset = manager.assets[manager.add_image(str(tmp_path / "a.png"))["md5ext"]]
+        assert asset.recipe == ("png", 300)
+
+    def test_png_size(self, tmp_path):
+        """测试 PNG 结构检查：CRC 错误、截断和动画 PNG 不原样使用"""
+        Image.new("RGBA", (7, 5)).save(tmp_path / "a.png")
+        data = (tmp_path / "a.png").read_bytes()
+        assert _png_size(data) == (7, 5)
+        assert _png_size(data[:-4]) is None
+        assert _png_size(data[:20] + bytes([data[20] ^ 1]) + data[21:]) is None
+        frames = [Image.new("RGB", (7, 5), color) for color in ((255, 0, 0), (0, 255, 0))]
+        frames[0].save(tmp_path / "b.png", save_all=True, append_images=frames[1:])
+        assert _png_size((tmp_path / "b.png").read_bytes()) is None
+
+    def test_corrupt_pixel_data(self, tmp_path):
+        """测试 CRC 正确但 IDAT 数据损坏的 PNG 不原样使用，与原先一样报错并使用占位造型"""
+        Image.new("RGB", (40, 30), (255, 0, 0)).save(tmp_path / "a.png")
+        data = (tmp_path / "a.png").read_bytes()
+        pos = data.index(b'IDAT') - 4
+        length = struct.unpack('>I', data[pos:pos + 4])[0]
+        payload = data[pos + 8:pos + 8 + length]
+        payload = payload[:2] + bytes([payload[2] ^ 0xFF]) + payload[3:]
+        chunk = b'IDAT' + payload
+        bad = data[:pos + 4] + chunk + struct.pack('>I', zlib.crc32(chunk)) + data[pos + 12 + length:]
+        (tmp_path / "bad.png").write_bytes(bad)
+        assert _png_size(data) == (40, 30)
+        assert _png_size(bad) is None
+
+        with pytest.raises(ValueError, match="无法处理图片文件"):
+            AssetManager().add_image(str(tmp_path / "bad.png"))
+        parser = ScratchLangParser(image_cache=False)
+        parser.current_dir = str(tmp_path)
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            parser.parse("# 角色1\n造型: bad.png\n")
+        assert "无法处理图片文件" in log.getvalue() and "成功加载造型" not in log.getvalue()
+        assert [costume["name"] for costume in parser.builder.current_sprite["costumes"]] == ["costume1"]
+
+        # 数据不完整或过滤类型无效时同样不原样使用
+        Image.new("RGB", (40, 30)).save(tmp_path / "c.png", compress_level=0)
+        data = (tmp_path / "c.png").read_bytes()
+        pos = data.index(b'IDAT') + 4
+        assert _png_size(data[:pos + 2] + bytes([data[pos + 2] ^ 0xFF]) + data[pos + 3:]) is None
+        raw = zlib.compress(bytes([5] + [0] * 120) * 30)
+        chunk = b'IDAT' + raw
+        length = struct.unpack('>I', data[pos - 8:pos - 4])[0]
+        bad = (data[:pos - 8] + struct.pack('>I', len(raw)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+               + data[pos + length + 4:])
+        assert _png_size(bad) is None
+
+    def test_max_effort(self, tmp_path):
+        """测试 max 力度无损转换为调色板图片，且不会比源文件大"""
+        image = Image.new("RGBA", (200, 200), (0, 0, 0, 0))
+        for x in range(0, 200, 10):
+            image.paste((x, 255 - x, 128, 255 if x % 20 else 128), (x, 0, x + 5, 200))
+        image.save(tmp_path / "a.png", compress_level=0)
+
+        manager = AssetManager(png_effort="max")
+        costume = manager.add_image(str(tmp_path / "a.png"))
+        data = manager.read(costume["md5ext"])
+        output = Image.open(io.BytesIO(data))
+        assert output.mode == "P" and output.convert("RGBA").tobytes() == image.tobytes()
+        default = AssetManager(png_effort="default").add_image(str(tmp_path / "a.png"))
+        assert len(data) < os.path.getsize(tmp_path / "a.png") and default["md5ext"] != costume["md5ext"]
+
+        # 源文件已经比重新编码的结果小时保留源文件
+        (tmp_path / "b.png").write_bytes(data)
+        costume = manager.add_image(str(tmp_path / "b.png"))
+        asset = manager.assets[costume["md5ext"]]
+        assert asset.path == str(tmp_path / "b.png") and asset.recipe is None
+
+    def test_effort_settings(self):
+        """测试力度是缓存键的一部分，无效的力度报错"""
+        settings = {effort: AssetManager(png_effort=effort).image_settings for effort in ("fast", "default", "max")}
+        assert len({json.dumps(value, sort_keys=True) for value in settings.values()}) == 3
+        with pytest.raises(ValueError):
+            AssetManager(png_effort="best")
+
+    def test_bytes_saved(self, tmp_path):
+        """测试资源统计记录每个造型比源文件减少的字节数"""
+        Image.new("RGB", (300, 200), (10, 20, 30)).save(tmp_path / "a.png", compress_level=0)
+        Image.new("RGB", (30, 20), (10, 20, 30)).save(tmp_path / "b.jpg")
+        parser = ScratchLangParser(image_cache=False, png_effort="max")
+        parser.current_dir = str(tmp_path)
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            parser.parse("# 角色1\n造型: a.png\n造型: b.jpg\n")
+        a, b = parser.builder.asset_stats.assets
+        assert a.source_bytes == os.path.getsize(tmp_path / "a.png") and 0 < a.output_bytes < a.source_bytes
+        assert a.bytes_saved == a.source_bytes - a.output_bytes
+        assert b.bytes_saved == b.source_bytes - b.output_bytes
+        assert parser.builder.asset_stats.bytes_saved == a.bytes_saved + b.bytes_saved
+        assert "2 个位图造型" in log.getvalue()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
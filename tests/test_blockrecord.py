@@ -0,0 +1,135 @@
+"""
+blockrecord.py 单元测试
+"""
+import pytest
+import copy
+import io
+import json
+import os
+import pickle
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockrecord import Block, is_block, json_default, load_blocks, new_block, plain_project
+from compiler.builder import SB3Builder
+
+
+def sample():
+    return new_block("control_repeat", {"TIMES": [1, [6, "10"]]}, parent="p", next_id="n")
+
+
+class TestNewBlock:
+    """new_block 测试类"""
+
+    def test_defaults(self):
+        """测试默认值，为 None 的可选键不出现"""
+        block = sample()
+        assert isinstance(block, Block)
+        assert block == {"opcode": "control_repeat", "next": "n", "parent": "p", "inputs": {"TIMES": [1, [6, "10"]]},
+                         "fields": {}, "shadow": False, "topLevel": False}
+
+    def test_key_order(self):
+        """测试键的顺序与 project.json 一致"""
+        block = new_block("procedures_prototype", shadow=True, mutation={"proccode": "走"})
+        assert list(block) == ["opcode", "next", "parent", "inputs", "fields", "shadow", "topLevel", "mutation"]
+        block = new_block("procedures_definition", {"custom_block": [1, "proto"]}, top_level=True, x=50, y=60)
+        assert list(block) == ["opcode", "next", "parent", "inputs", "fields", "shadow", "topLevel", "x", "y"]
+        assert list(block.to_dict()) == list(block)
+
+    def test_interned(self):
+        """测试 opcode 和字段中的字符串驻留为同一个对象"""
+        first = new_block("".join(["data_", "variable"]), fields={"VARIABLE": ["".join(["分", "数"]), "id"]})
+        second = new_block("data_variable", fields={"VARIABLE": ["分数", "id"]})
+        assert first["opcode"] is second["opcode"]
+        assert first["fields"]["VARIABLE"][0] is second["fields"]["VARIABLE"][0]
+
+    def test_interned_input_text(self):
+        """测试输入中字面量的文本驻留为同一个对象"""
+        first = new_block("motion_movesteps", {"STEPS": [1, [4, "".join(["1", "0"])]]})
+        second = new_block("motion_turnright", {"DEGREES": [1, [4, "10"]]})
+        assert first["inputs"]["STEPS"][1][1] is second["inputs"]["DEGREES"][1][1]
+
+    def test_empty_inputs_are_writable(self):
+        """测试没有输入或字段的积木各有自己的空字典，可以直接写入"""
+        first = new_block("control_forever")
+        second = new_block("control_forever", {}, {})
+        first["inputs"]["SUBSTACK"] = [2, "a"]
+        first["fields"].update({"VARIABLE": ["分数", "id"]})
+        assert second["inputs"] == {} and second["fields"] == {}
+
+
+class TestBlock:
+    """Block 字典协议测试类"""
+
+    def test_mapping_access(self):
+        """测试按键读写和可选键"""
+        block = sample()
+        assert (block["opcode"], block["next"], block["parent"]) == ("control_repeat", "n", "p")
+        assert "mutation" not in block and block.get("mutation") is None and block.get("x", 0) == 0
+        with pytest.raises(KeyError):
+            block["x"]
+        block["x"] = 10
+        assert "x" in block and block["x"] == 10 and len(block) == 8
+        del block["x"]
+        assert "x" not in block and len(block) == 7
+        with pytest.raises(KeyError):
+            del block["x"]
+        with pytest.raises(KeyError):
+            del block["opcode"]
+
+    def test_copy_pickle_deepcopy(self):
+        """测试浅复制、pickle 和深复制保留可选键"""
+        block = new_block("procedures_definition", top_level=True, x=50, y=60)
+        shallow = block.copy()
+        shallow["x"] = 0
+        assert block["x"] == 50 and shallow["inputs"] is block["inputs"]
+        for clone in (pickle.loads(pickle.dumps(block)), copy.deepcopy(block)):
+            assert isinstance(clone, Block) and clone == block
+            assert clone["inputs"] is not block["inputs"]
+
+    def test_is_block(self):
+        """测试积木和顶层 reporter 的区分"""
+        assert is_block(sample()) and is_block({"opcode": "motion_movesteps"})
+        assert not is_block([12, "分数", "id"]) and not is_block(None)
+
+
+class TestSerialization:
+    """序列化和字典视图测试类"""
+
+    def test_compiler_emits_blocks(self, compile_source):
+        """测试编译器生成 Block，保存的 project.json 与字典视图一致"""
+        result = compile_source(script="当绿旗被点击\n  走 3\n  将 n 增加 (~n + 1)\n", variables="变量: n = 0\n",
+                                definitions="定义 走(k)\n  移动 ~k 步\n结束\n")
+        blocks = result.sprite["blocks"]
+        assert blocks and all(isinstance(block, Block) for block in blocks.values())
+        with zipfile.ZipFile(io.BytesIO(result.data)) as archive:
+            saved = json.loads(archive.read("project.json"))
+        plain = plain_project(result.parser.builder.project)
+        assert all(type(block) is dict for block in plain["targets"][1]["blocks"].values())
+        assert saved["targets"] == json.loads(json.dumps(plain["targets"]))
+
+    def test_json_default(self):
+        """测试 json.dumps 的 default 只转换 Block"""
+        assert json.loads(json.dumps({"a": sample()}, default=json_default))["a"] == sample().to_dict()
+        with pytest.raises(TypeError):
+            json.dumps({"a": object()}, default=json_default)
+
+    def test_load_and_plain_round_trip(self):
+        """测试字典积木转换为 Block 后字典视图不变"""
+        builder = SB3Builder(id_mode="counter")
+        builder.add_sprite("角色1")
+        hat = builder.add_block("event_whenflagclicked", top_level=True)
+        builder.add_block("motion_movesteps", {"STEPS": [1, [4, "10"]]}, parent=hat)
+        data = json.loads(json.dumps(builder.project, default=json_default))
+        target = data["targets"][0]
+        target["blocks"]["reporter"] = [12, "分数", "id"]
+        load_blocks(target["blocks"])
+        assert isinstance(target["blocks"][hat], Block)
+        assert target["blocks"]["reporter"] == [12, "分数", "id"]
+        assert plain_project(data)["targets"][0]["blocks"][hat] == builder.project["targets"][0]["blocks"][hat]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,124 @@
+"""
+cli.py 单元测试
+"""
+import pytest
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compiler.cli import main, expand_inputs, output_paths, EXIT_OK, EXIT_FAILED, EXIT_USAGE
+
+GOOD = ": 开始\n# 角色1\n当绿旗被点击\n  移动 10 步\n"
+BAD = ": 开始\n# 角色1\n造型: ../../外部.png\n"
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "game.sl").write_text(GOOD, encoding="utf-8")
+    (tmp_path / "b" / "game.sl").write_text(GOOD, encoding="utf-8")
+    return tmp_path
+
+
+class TestInputs:
+    """输入展开和输出路径测试类"""
+
+    def test_expand_glob_and_directory(self, project):
+        """测试通配符、目录展开和去重"""
+        files, unmatched = expand_inputs([str(project / "**" / "*.sl"), str(project / "a"),
+                                          str(project / "无*.sl")])
+        assert [os.path.relpath(f, project) for f in files] == \
+            [os.path.join("a", "game.sl"), os.path.join("b", "game.sl")]
+        assert unmatched == [str(project / "无*.sl")]
+
+    def test_output_paths(self, project):
+        """测试输出到源文件旁边或保留子目录结构"""
+        inputs = [str(project / "a" / "game.sl"), str(project / "b" / "game.sl")]
+        assert output_paths(inputs, None) == [str(project / "a" / "game.sb3"), str(project / "b" / "game.sb3")]
+        out = str(project / "out")
+        assert output_paths(inputs, out) == [os.path.join(out, "a", "game.sb3"),
+                                             os.path.join(out, "b", "game.sb3")]
+
+
+class TestMain:
+    """命令行入口测试类"""
+
+    def test_success_summary(self, project, capsys):
+        """测试全部成功时的退出码和 JSON 汇总"""
+        code = main([str(project / "**" / "*.sl"), "-o", str(project / "out"), "-j", "1"])
+        assert code == EXIT_OK
+        summary = json.loads(capsys.readouterr().out)
+        assert summary["total"]["files"] == 2 and summary["total"]["failed"] == 0
+        record = summary["files"][0]
+        assert record["blocks"] == 2 and record["targets"] == 2
+        assert record["asset_bytes"] > 0 and record["seconds"] >= 0
+        assert record["expression_cache"]["misses"] > 0
+        assert summary["total"]["constant_folding"]["removed_blocks"] == 0
+        assert summary["total"]["peephole"] == {"rules": {}, "removed_blocks": 0}
+        assert summary["total"]["warp_promoted"] == 0
+        assert summary["total"]["dead_code_removed_blocks"] == 0
+        assert summary["total"]["inlined_calls"] == 0
+        assert summary["total"]["hoisted_expressions"] == 0
+        assert summary["total"]["type_warnings"] == 0
+        assert set(summary["total"]["image_cache"]) == {"hits", "misses", "stores", "evictions"}
+        assert record["asset_loading"]["workers"] == 1 and summary["total"]["asset_seconds"] >= 0
+        assert summary["total"]["asset_bytes_saved"] == 0
+        assert summary["total"]["max_frame_cost"] == record["frame_cost"]["total"] == 2
+        assert record["frame_cost"]["scripts"][0]["line"] == 3
+        with zipfile.ZipFile(record["output"]) as zf:
+            assert "project.json" in zf.namelist()
+
+    def test_failure_exit_code(self, project, capsys):
+        """测试有文件失败时其他文件仍然编译"""
+        (project / "a" / "bad.sl").write_text(BAD, encoding="utf-8")
+        code = main([str(project / "a"), "-j", "1"])
+        assert code == EXIT_FAILED
+        files = {os.path.basename(r["input"]): r for r in json.loads(capsys.readouterr().out)["files"]}
+        assert files["bad.sl"]["error_type"] == "SecurityError"
+        assert files["game.sl"]["ok"]
+
+    def test_frame_budget_and_cost_report(self, project, tmp_path, capsys):
+        """测试超过每帧代价预算的文件失败，文本报告按文件列出"""
+        (project / "a" / "busy.sl").write_text(GOOD + "  重复 50 次\n    广播 开始\n  结束\n", encoding="utf-8")
+        report_path = tmp_path / "cost.txt"
+        code = main([str(project / "a"), "-j", "1", "--frame-budget", "10", "--cost-report", str(report_path)])
+        assert code == EXIT_FAILED
+        files = {os.path.basename(r["input"]): r for r in json.loads(capsys.readouterr().out)["files"]}
+        assert files["game.sl"]["ok"]
+        assert files["busy.sl"]["error_type"] == "CompileError"
+        assert files["busy.sl"]["frame_cost"]["total"] > 10
+        report = report_path.read_text(encoding="utf-8")
+        assert "busy.sl" in report and "game.sl" in report
+
+    def test_bad_cost_table(self, project, tmp_path, capsys):
+        """测试代价表格式错误时为参数错误"""
+        table = tmp_path / "costs.json"
+        table.write_text("[1, 2]", encoding="utf-8")
+        assert main([str(project / "a"), "--cost-table", str(table)]) == EXIT_USAGE
+
+    def test_no_inputs(self, project, capsys):
+        """测试没有匹配的输入文件"""
+        assert main([str(project / "*.txt")]) == EXIT_USAGE
+
+    def test_module_entry_with_pool(self, project, tmp_path):
+        """测试 python -m compiler 使用进程池编译"""
+        summary_path = tmp_path / "summary.json"
+        result = subprocess.run(
+            [sys.executable, "-m", "compiler", str(project / "a"), str(project / "b"),
+             "-j", "2", "--summary", str(summary_path)],
+            cwd=ROOT, capture_output=True, text=True, timeout=120)
+        assert result.returncode == EXIT_OK, result.stderr
+        assert result.stdout == ""
+        summary = json.loads(summary_path.read_text(encoding="utf-8"))
+        assert summary["total"]["succeeded"] == 2
+        assert os.path.exists(project / "b" / "game.sb3")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,167 @@
+"""
+deadcode.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.parser import ScratchLangParser
+from compiler.blockgraph import check_links
+from compiler.blockrecord import new_block
+from compiler.deadcode import eliminate_dead_code
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+COMPILE_OPTIONS = {"eliminate_dead_code": True}
+
+
+def opcodes(target):
+    """target 中积木 opcode 的列表"""
+    return sorted(block["opcode"] for block in target["blocks"].values())
+
+
+class TestScripts:
+    """脚本和自定义积木的可达性测试类"""
+
+    def test_hatless_fragment_removed(self):
+        """测试没有帽子积木的顶层脚本被删除，帽子积木和扩展积木开头的脚本保留"""
+        blocks = {
+            "hat": new_block("event_whenflagclicked", next_id="say", top_level=True),
+            "say": new_block("looks_say", parent="hat", inputs={"MESSAGE": [1, [10, "你好"]]}),
+            "move": new_block("motion_movesteps", next_id="turn", inputs={"STEPS": [3, "x", [4, "10"]]},
+                              top_level=True),
+            "x": new_block("motion_xposition", parent="move"),
+            "turn": new_block("motion_turnright", parent="move", inputs={"DEGREES": [1, [4, "15"]]}),
+            "ext": new_block("makeymakey_whenMakeyKeyPressed", top_level=True),
+            "loose": [12, "分数", "v1", 10, 10],
+        }
+        project = {"targets": [{"name": "角色1", "blocks": blocks, "variables": {}, "lists": {}}]}
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = eliminate_dead_code(project)
+        assert set(blocks) == {"hat", "say", "ext"}
+        assert report.scripts == ["角色1/motion_movesteps", "角色1/data_variable"]
+        assert report.removed_blocks == 4
+
+    def test_unused_procedures_removed(self, compile_source):
+        """测试没有被调用的自定义积木（包括只被它们调用的）被删除"""
+        compiled = compile_source(
+            script="用到",
+            definitions="定义 用到()\n  移动 1 步\n结束\n"
+                        "定义 没用()\n  间接没用\n结束\n"
+                        "定义 间接没用()\n  右转 15 度\n结束\n")
+        report = compiled.parser.dead_code_report
+        assert sorted(report.procedures) == ["角色1/没用", "角色1/间接没用"]
+        assert opcodes(compiled.sprite) == ["event_whenflagclicked", "motion_movesteps", "procedures_call",
+                                            "procedures_definition", "procedures_prototype"]
+        assert check_links(compiled.sprite["blocks"]) == []
+
+    def test_recursive_procedure_kept(self, compile_source):
+        """测试被调用的递归积木保留，只被自己调用的递归积木删除"""
+        compiled = compile_source(
+            script="倒数(3)",
+            definitions="定义 倒数(k)\n  倒数(1)\n结束\n"
+                        "定义 自己(k)\n  自己(1)\n结束\n")
+        assert compiled.parser.dead_code_report.procedures == ["角色1/自己 %s"]
+
+
+class TestSymbols:
+    """变量、列表和广播测试类"""
+
+    def test_unused_variable_removed(self, compile_source):
+        """测试没有被读取的变量被删除，只写入它的积木一并删除"""
+        compiled = compile_source(script="设置 只写 为 ~读\n添加 1 到 日志\n说 ~读",
+                                  variables="变量: 读 = 0\n变量: 只写 = 0\n变量: 没用 = 0\n列表: 日志\n")
+        report = compiled.parser.dead_code_report
+        sprite = compiled.sprite
+        assert sorted(report.variables) == ["角色1/只写", "角色1/没用"]
+        assert report.lists == ["角色1/日志"]
+        assert [value[0] for value in sprite["variables"].values()] == ["读"]
+        assert sprite["lists"] == {}
+        assert opcodes(sprite) == ["data_variable", "event_whenflagclicked", "looks_say"]
+        assert check_links(sprite["blocks"]) == []
+
+    def test_shown_and_cloud_variables_kept(self, compile_source):
+        """测试被显示的变量和云变量保留"""
+        compiled = compile_source(script="显示变量 分数\n将 ☁ 高分 增加 1",
+                                  variables="变量: 分数 = 0\n云变量: 高分 = 0\n")
+        assert compiled.parser.dead_code_report.variables == []
+        assert len(compiled.sprite["variables"]) + len(compiled.stage["variables"]) == 2
+
+    def test_monitor_and_sensing_of_reads(self):
+        """测试被监视器显示、被 "侦测 X 的属性" 按名称读取的变量保留"""
+        def writer(var_id, name):
+            return {"hat": new_block("event_whenflagclicked", next_id="set", top_level=True),
+                    "set": new_block("data_setvariableto", parent="hat", inputs={"VALUE": [1, [10, "1"]]},
+                                     fields={"VARIABLE": [name, var_id]})}
+        sprite = {"name": "角色1", "blocks": writer("v1", "速度"), "lists": {},
+                  "variables": {"v1": ["速度", 0], "v2": ["血量", 0]}}
+        stage = {"name": "Stage", "blocks": {
+            "hat": new_block("event_whenflagclicked", next_id="say", top_level=True),
+            "say": new_block("looks_say", parent="hat", inputs={"MESSAGE": [3, "of", [10, ""]]}),
+            "of": new_block("sensing_of", parent="say", fields={"PROPERTY": ["速度", None]}),
+        }, "variables": {}, "lists": {}}
+        project = {"targets": [stage, sprite], "monitors": [{"id": "v2", "params": {"VARIABLE": "血量"}}]}
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = eliminate_dead_code(project)
+        assert report.variables == []
+        assert "set" in sprite["blocks"]
+
+    def test_extension_writer_kept(self):
+        """测试写入的值来自扩展积木时不删除（扩展积木可能有副作用）"""
+        blocks = {
+            "hat": new_block("event_whenflagclicked", next_id="set", top_level=True),
+            "set": new_block("data_setvariableto", parent="hat", inputs={"VALUE": [3, "ext", [10, ""]]},
+                             fields={"VARIABLE": ["结果", "v1"]}),
+            "ext": new_block("translate_getTranslate", parent="set"),
+        }
+        target = {"name": "角色1", "blocks": blocks, "variables": {"v1": ["结果", 0]}, "lists": {}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = eliminate_dead_code({"targets": [target]})
+        assert report.variables == []
+        assert set(blocks) == {"hat", "set", "ext"}
+
+    def test_write_chain_removed(self, compile_source):
+        """测试删除写入后不再被读取的变量也被删除"""
+        compiled = compile_source(script="设置 b 为 ~a", variables="变量: a = 1\n变量: b = 0\n")
+        assert sorted(compiled.parser.dead_code_report.variables) == ["角色1/a", "角色1/b"]
+        assert opcodes(compiled.sprite) == ["event_whenflagclicked"]
+
+    def test_broadcasts(self, compile_source):
+        """测试警告没有接收者的广播，删除没有用到的广播声明"""
+        compiled = compile_source(script={"当绿旗被点击": "广播 开始\n广播 没人听", "当收到 开始": "移动 10 步"},
+                                  definitions="定义 没用()\n  广播 旧消息\n结束\n")
+        report = compiled.parser.dead_code_report
+        assert report.unreceived == ["没人听"]
+        assert report.broadcasts == ["旧消息"]
+        assert sorted(compiled.stage["broadcasts"].values()) == ["开始", "没人听"]
+
+    def test_disabled_by_default(self, compile_source):
+        """测试默认不做死代码消除"""
+        compiled = compile_source(variables="变量: 没用 = 0\n", definitions="定义 没用()\n  移动 1 步\n结束\n",
+                                  eliminate_dead_code=False)
+        assert compiled.parser.dead_code_report is None
+        assert len(compiled.sprite["variables"]) == 1
+        assert "procedures_definition" in opcodes(compiled.sprite)
+
+
+class TestExamples:
+    """示例项目测试类"""
+
+    @pytest.mark.parametrize("name", ["demo.sl", "custom_blocks_test.sl", "经典乒乓球_完美版.sl"])
+    def test_links_consistent(self, tmp_path, name):
+        """测试示例项目删除死代码后积木图指针一致"""
+        parser = ScratchLangParser(eliminate_dead_code=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser.parse_file(os.path.join(EXAMPLES_DIR, name))
+            parser.compile(str(tmp_path / "out.sb3"))
+        for target in parser.builder.project["targets"]:
+            assert check_links(target["blocks"]) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
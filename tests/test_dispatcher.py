@@ -0,0 +1,122 @@
+"""
+dispatcher.py 单元测试
+"""
+import pytest
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blocks import BlockDefinitions
+from compiler.dispatcher import (
+    BlockDispatcher, split_alternatives, literal_prefix, required_literals, pattern_anchors
+)
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+def _example_lines():
+    lines = []
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.sl"))):
+        with open(path, encoding="utf-8") as f:
+            lines.extend(line.strip() for line in f if line.strip())
+    return lines
+
+
+class TestPatternAnalysis:
+    """正则字面量提取测试"""
+
+    def test_split_alternatives_top_level_only(self):
+        """测试只拆分顶层的 |"""
+        assert split_alternatives(r"a(b|c)|d[|]") == ["a(b|c)", "d[|]"]
+
+    def test_literal_prefix_stops_at_meta(self):
+        """测试字面量在元字符处结束"""
+        assert literal_prefix(r"移动\s+(.+)\s*步") == "移动"
+        assert literal_prefix(r"^显示$") == "显示"
+
+    def test_literal_prefix_drops_optional_char(self):
+        """测试可选字符不计入字面量"""
+        assert literal_prefix(r"当作为克隆体启动时?") == "当作为克隆体启动"
+
+    def test_required_literal_inside_pattern(self):
+        """测试使用模式中间最长的必需字面量"""
+        assert required_literals(r"(.+?)\s*的\s*(x坐标|y坐标)") == ("的",)
+        assert required_literals(r"将\s*颜色\s*特效增加\s+([-\d.]+)") == ("特效增加",)
+
+    def test_required_literal_group(self):
+        """测试纯字面量分组作为候选字面量"""
+        assert required_literals(r"(abs|e\^)\s+(.+)") == ("abs", "e^")
+        assert required_literals(r"(?:abs|sqrt)?\s+(.+)") == ()
+
+    def test_pattern_anchors(self):
+        """测试每个分支都需要字面量"""
+        assert pattern_anchors(r"重复\s+(.+)\s*次|repeat\s+(.+)") == ("重复", "repeat")
+        assert pattern_anchors(r"显示|(.+)") is None
+
+
+class TestBlockDispatcher:
+    """BlockDispatcher 测试类"""
+
+    def setup_method(self):
+        self.dispatcher = BlockDispatcher(BlockDefinitions.get_all_blocks())
+
+    def test_every_pattern_is_registered(self):
+        """测试所有带 pattern 的定义都被注册"""
+        blocks = BlockDefinitions.get_all_blocks()
+        expected = [name for name, block in blocks.items() if "pattern" in block]
+        assert [entry[0] for entry in self.dispatcher.entries] == expected
+
+    @pytest.mark.parametrize("line", [
+        "移动 10 步",
+        "move 10 steps",
+        "重复执行直到 碰到 边缘",
+        "如果 碰到 鼠标指针 那么",
+        "将 分数 增加 1",
+        "设置 ~x 为 10",
+        "小猫 的 x坐标",
+        "sqrt 9",
+        "当作为克隆体启动时",
+        "广播 开始 并等待",
+        "播放声音 喵 并等待",
+        "这一行什么也不匹配",
+        "",
+    ])
+    def test_matches_linear_scan(self, line):
+        """测试分派结果与逐个扫描一致"""
+        fast = self.dispatcher.match(line)
+        slow = self.dispatcher.match_linear(line)
+        if slow is None:
+            assert fast is None
+        else:
+            assert fast.name == slow.name
+            assert fast.match.groups() == slow.match.groups()
+
+    def test_matches_linear_scan_on_examples(self):
+        """测试示例程序的每一行分派结果与逐个扫描一致"""
+        for line in _example_lines():
+            fast = self.dispatcher.match(line)
+            slow = self.dispatcher.match_linear(line)
+            assert (fast and fast.name) == (slow and slow.name), line
+
+    def test_fallback_preserves_priority(self):
+        """测试无法索引的定义仍按原始顺序参与匹配"""
+        dispatcher = BlockDispatcher({
+            "任意": {"opcode": "a", "pattern": r"^(\d+)$"},
+            "显示": {"opcode": "b", "pattern": r"显示"},
+        })
+        assert dispatcher.fallback == [0]
+        assert dispatcher.match("42").name == "任意"
+        assert dispatcher.match("显示").name == "显示"
+
+    def test_reports_matched_definition(self):
+        """测试返回匹配到的积木定义"""
+        result = self.dispatcher.match("旋转右 90 度")
+        assert result.name == "旋转右"
+        assert result.block_def["opcode"] == "motion_turnright"
+        assert result.match.group(1).strip() == "90"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
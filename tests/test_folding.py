@@ -0,0 +1,191 @@
+"""
+folding.py 单元测试
+"""
+import pytest
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.parser import ScratchLangParser
+from compiler.folding import (
+    BINARY_OPERATORS, MATH_FUNCTIONS, compare, js_round, js_to_number, number_to_string, to_boolean,
+)
+
+
+def make_parser(**options):
+    """创建已添加舞台和一个角色的解析器"""
+    parser = ScratchLangParser(**options)
+    parser.builder.add_sprite("Stage", is_stage=True)
+    parser.has_stage = True
+    parser.builder.add_sprite("角色1")
+    return parser
+
+
+def blocks(parser):
+    return parser.builder.current_sprite["blocks"]
+
+
+class TestCast:
+    """Scratch 类型转换规则测试类"""
+
+    @pytest.mark.parametrize("text, expected", [
+        ("", 0), ("  12 ", 12), ("1e3", 1000), (".5", 0.5), ("5.", 5), ("0x10", 16), ("0b11", 3),
+        ("Infinity", math.inf), ("-Infinity", -math.inf), (" 7　", 7),
+    ])
+    def test_js_to_number(self, text, expected):
+        """测试 JavaScript 的字符串转数字"""
+        assert js_to_number(text) == expected
+
+    @pytest.mark.parametrize("text", ["abc", "1 2", "infinity", "0x", "1e", "--1"])
+    def test_js_to_number_nan(self, text):
+        """测试无法转换的字符串为 NaN"""
+        assert math.isnan(js_to_number(text))
+
+    @pytest.mark.parametrize("value, expected", [
+        (185.0, "185"), (0.1 + 0.2, "0.30000000000000004"), (1e21, "1e+21"), (1e20, "100000000000000000000"),
+        (1e-7, "1e-7"), (0.000001, "0.000001"), (-2.5, "-2.5"), (-0.0, "0"), (1.5e300, "1.5e+300"),
+        (math.nan, "NaN"), (-math.inf, "-Infinity"),
+    ])
+    def test_number_to_string(self, value, expected):
+        """测试 JavaScript 的数字转字符串"""
+        assert number_to_string(value) == expected
+
+    def test_to_boolean(self):
+        """测试布尔转换："0"、"false" 和空字符串为假"""
+        assert [to_boolean(v) for v in ("", "0", "false", "FALSE", "abc", "0.0", 0.0, 1.0)] == \
+            [False, False, False, False, True, True, False, True]
+
+    def test_compare(self):
+        """测试比较：都是数字时按数值，否则按不区分大小写的字符串比较，空白不算数字"""
+        assert compare("10", "9") > 0
+        assert compare("abc", "ABC") == 0
+        assert compare("a", "B") < 0
+        assert compare(" ", "0") != 0
+        assert compare("", "0") != 0
+        assert BINARY_OPERATORS['='](True, "true")
+
+    def test_math(self):
+        """测试取余的符号、四舍五入和三角函数的取整"""
+        assert BINARY_OPERATORS['%']("-5", "3") == 1
+        assert BINARY_OPERATORS['%']("5", "-3") == -1
+        assert js_round(2.5) == 3 and js_round(-2.5) == -2
+        assert MATH_FUNCTIONS['sin'](180) == 0
+        assert MATH_FUNCTIONS['tan'](90) == math.inf
+        assert MATH_FUNCTIONS['tan'](-90) == -math.inf
+        assert math.isnan(MATH_FUNCTIONS['sqrt'](-1))
+        assert BINARY_OPERATORS['/']("0", "0") != BINARY_OPERATORS['/']("0", "0")
+
+
+class TestFolding:
+    """表达式折叠测试类"""
+
+    def test_arithmetic(self):
+        """测试算术表达式折叠成一个数字字面量"""
+        parser = make_parser()
+        assert parser._parse_value("3 * 60 + 5") == [1, [4, "185"]]
+        assert blocks(parser) == {}
+        stats = parser.ast_converter.folding_stats
+        assert (stats.expressions, stats.removed_blocks) == (1, 2)
+
+    def test_functions(self):
+        """测试数学函数折叠"""
+        parser = make_parser()
+        assert parser._parse_value("sqrt(16) + floor(2.7)") == [1, [4, "6"]]
+        assert parser._parse_value("四舍五入(2.5) * 2") == [1, [4, "6"]]
+        assert parser._parse_value("1 / 0") == [1, [4, "Infinity"]]
+        assert blocks(parser) == {}
+
+    @pytest.mark.parametrize("text, expected", [
+        ("(2 >= 1)", "true"), ("10 <= 9", "false"), ("1 > 0 且 1 < 2", "true"),
+    ])
+    def test_comparison(self, text, expected):
+        """测试比较（包括脱糖成两个积木的 >= 和 <=）折叠成一个字面量"""
+        parser = make_parser()
+        assert parser._parse_value(text) == [1, [10, expected]]
+        assert blocks(parser) == {}
+        assert parser.ast_converter.folding_stats.removed_blocks >= 1
+
+    @pytest.mark.parametrize("text", ["1e400 + 0", "1e400 - 1e400", "1e400 * 0", "2.50 + 0"])
+    def test_literal_text_matches_unfolded(self, text):
+        """测试折叠时数字字面量的文本与不折叠时输出到积木中的文本相同（溢出的字面量是 Infinity）"""
+        folded = make_parser()._parse_value(text)
+        parser = make_parser(fold_constants=False)
+        kind, block_id = parser._parse_value(text)
+        block = blocks(parser)[block_id]
+        left, right = (value[1][1] for value in block["inputs"].values())
+        operator = {"operator_add": "+", "operator_subtract": "-", "operator_multiply": "*"}[block["opcode"]]
+        assert folded == [1, [4, number_to_string(BINARY_OPERATORS[operator](left, right))]]
+
+    @pytest.mark.parametrize("text", ['"b" >= "a"', "abc >= def", "abc <= 1"])
+    def test_text_comparison_not_folded(self, text):
+        """测试比较文本的表达式不折叠（与 peephole.py 一样只比较数字）"""
+        parser = make_parser()
+        kind, block_id = parser._parse_value(text)
+        assert kind == 2 and blocks(parser)[block_id]["opcode"] == "operator_not"
+        assert parser.ast_converter.folding_stats.expressions == 0
+
+    def test_boolean_inputs_not_folded(self):
+        """测试 且/或/非 的操作数和条件中的常量不折叠成文本字面量"""
+        source = (": 开始\n# 角色1\n变量: 分数 = 0\n当绿旗被点击\n"
+                  "  设置 分数 为 (~分数 > 0) 且 (1 < 2)\n"
+                  "  设置 分数 为 (~分数 > 0) 或 非 (1 > 2 * 3)\n"
+                  "  设置 分数 为 1 >= 0 且 2 <= 3\n"
+                  "  如果 非 (1 < 2) 那么\n    移动 10 步\n  结束\n")
+        parser = ScratchLangParser()
+        parser.parse(source)
+        sprite = next(t for t in parser.builder.project["targets"] if t["name"] == "角色1")
+        checked = 0
+        for block in sprite["blocks"].values():
+            if block["opcode"] in ("operator_and", "operator_or", "operator_not", "control_if"):
+                for name in ("CONDITION", "OPERAND", "OPERAND1", "OPERAND2"):
+                    if name in block["inputs"]:
+                        checked += 1
+                        assert block["inputs"][name][0] != 1, (block["opcode"], name)
+        assert checked >= 7
+        # 布尔输入中的数值子表达式仍然折叠
+        assert any(block["inputs"].get("OPERAND2") == [1, [4, "6"]] for block in sprite["blocks"].values())
+
+    def test_partial(self):
+        """测试只折叠常量子表达式，变量和内置 reporter 保留"""
+        parser = make_parser()
+        kind, block_id = parser._parse_value("x坐标 + 2 * 3")
+        assert kind == 2
+        block = blocks(parser)[block_id]
+        assert block["opcode"] == "operator_add"
+        assert blocks(parser)[block["inputs"]["NUM1"][1]]["opcode"] == "motion_xposition"
+        assert block["inputs"]["NUM2"] == [1, [4, "6"]]
+        assert len(blocks(parser)) == 2
+
+    def test_boolean_operand(self):
+        """测试布尔值在算术中折叠成 1/0，在比较中保留积木"""
+        parser = make_parser()
+        assert parser._parse_value("(1 < 2) + 1") == [1, [4, "2"]]
+        kind, block_id = parser._parse_value("(1 < 2) = ~x")
+        block = blocks(parser)[block_id]
+        assert blocks(parser)[block["inputs"]["OPERAND1"][1]]["opcode"] == "operator_lt"
+
+    def test_disabled(self):
+        """测试关闭折叠时生成原来的积木"""
+        parser = make_parser(fold_constants=False)
+        kind, block_id = parser._parse_value("3 * 60 + 5")
+        assert kind == 2 and blocks(parser)[block_id]["opcode"] == "operator_add"
+        assert len(blocks(parser)) == 2
+        kind, block_id = parser._parse_value("10 <= 9")
+        assert blocks(parser)[block_id]["opcode"] == "operator_not"
+        assert parser.ast_converter.folding_stats.expressions == 0
+
+    def test_same_project_as_unfolded_when_nothing_to_fold(self):
+        """测试没有常量表达式时输出与关闭折叠相同"""
+        source = ": 开始\n# 角色1\n变量: 分数 = 0\n当绿旗被点击\n  将 分数 设为 ~分数 + x坐标\n"
+        results = []
+        for fold in (True, False):
+            parser = ScratchLangParser(fold_constants=fold)
+            parser.parse(source)
+            results.append(parser.builder.project)
+        assert results[0] == results[1]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,182 @@
+"""
+framecost.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockrecord import json_default
+from compiler.exceptions import CompileError
+from compiler.framecost import (
+    CLONE_LIMIT, DEFAULT_ASSUMED_ITERATIONS, DEFAULT_COSTS, estimate_frame_cost, format_report, load_cost_table,
+)
+from compiler.inliner import ARGUMENT_COST, CALL_COST
+
+COMPILE_OPTIONS = {"peephole": False}
+SPRITE_VARIABLES = "变量: n = 0\n"
+
+
+def script_cost(parser, hat="event_whenflagclicked"):
+    return next(script for script in parser.frame_cost.scripts if script.hat == hat)
+
+
+class TestLoops:
+    """循环和让出测试类"""
+
+    def test_straight_line(self, compile_source):
+        """测试没有循环的脚本为各积木代价之和"""
+        parser = compile_source(script="移动 10 步\n将 n 增加 1").parser
+        assert script_cost(parser).cost == 3
+        assert parser.frame_cost.total == 3
+
+    def test_literal_repeat_expanded(self, compile_source):
+        """测试不重绘的重复循环在一帧内按字面量次数展开"""
+        parser = compile_source(script="重复 10 次\n  将 n 增加 1\n结束").parser
+        assert script_cost(parser).cost == 1 + 10 * (1 + 1)
+        assert script_cost(parser).assumptions == []
+
+    def test_redrawing_loop_one_iteration_per_frame(self, compile_source):
+        """测试循环中有重绘的积木时每帧只执行一轮"""
+        parser = compile_source(script="重复 100 次\n  移动 1 步\n结束").parser
+        assert script_cost(parser).cost == 1 + 1 + 1
+
+    def test_wait_splits_frames(self, compile_source):
+        """测试等待把脚本分成多帧，取最大的一段"""
+        parser = compile_source(script="将 n 增加 1\n等待 1 秒\n重复 5 次\n  将 n 增加 1\n结束").parser
+        assert script_cost(parser).cost == 5 * 2
+
+    def test_unknown_count_assumed(self, compile_source):
+        """测试次数未知的循环按假设次数估计并记录假设"""
+        parser = compile_source(script="重复 ~n 次\n  将 n 增加 1\n结束").parser
+        script = script_cost(parser)
+        assert script.cost == 1 + DEFAULT_ASSUMED_ITERATIONS * (2 + 1)
+        assert script.assumptions == [f"重复的次数未知，按 {DEFAULT_ASSUMED_ITERATIONS} 次估计"]
+
+    def test_busy_forever(self, compile_source):
+        """测试不会让出的重复执行按假设次数估计"""
+        parser = compile_source(script="重复执行\n  将 n 增加 1\n结束").parser
+        assert script_cost(parser).cost == 1 + DEFAULT_ASSUMED_ITERATIONS * 2
+        assert script_cost(parser).assumptions
+
+    def test_if_takes_worst_branch(self, compile_source):
+        """测试如果否则取代价较大的分支"""
+        parser = compile_source(script="如果 ~n > 1 那么\n  将 n 增加 1\n否则\n  图章\n结束").parser
+        assert script_cost(parser).cost == 1 + (1 + 1 + 1) + DEFAULT_COSTS["pen_stamp"]
+
+
+class TestProcedures:
+    """自定义积木测试类"""
+
+    def test_warp_body_runs_fully(self, compile_source):
+        """测试不刷新屏幕的积木体中重绘的循环也在一帧内执行完"""
+        definitions = "定义 画(k) 不刷新屏幕\n  重复 10 次\n    移动 1 步\n  结束\n结束\n"
+        parser = compile_source(script="画(1)", definitions=definitions).parser
+        assert script_cost(parser).cost == 1 + CALL_COST + ARGUMENT_COST + 10 * 2
+
+    def test_refresh_body_yields(self, compile_source):
+        """测试刷新屏幕的积木体中重绘的循环每帧一轮"""
+        definitions = "定义 画(k) 刷新屏幕\n  重复 10 次\n    移动 1 步\n  结束\n结束\n"
+        parser = compile_source(script="画(1)", definitions=definitions).parser
+        assert script_cost(parser).cost == 1 + CALL_COST + ARGUMENT_COST + 2
+
+    def test_recursion_guarded(self, compile_source):
+        """测试递归调用只计调用本身并记录假设"""
+        definitions = "定义 递归(k)\n  将 n 增加 1\n  递归(1)\n结束\n"
+        parser = compile_source(script="递归(1)", definitions=definitions).parser
+        assert any("递归" in text for text in script_cost(parser).assumptions)
+
+
+class TestClones:
+    """克隆体测试类"""
+
+    CLONE_SCRIPT = {"当作为克隆体启动": "重复执行\n  移动 1 步\n结束"}
+
+    def test_clones_counted_from_loops(self, compile_source):
+        """测试按循环次数估计克隆体数量，克隆体脚本乘以数量"""
+        parser = compile_source(script={"当绿旗被点击": "重复 4 次\n  克隆 自己\n结束", **self.CLONE_SCRIPT}).parser
+        assert parser.frame_cost.clones == {"角色1": 4}
+        clone_script = script_cost(parser, "control_start_as_clone")
+        assert (clone_script.instances, clone_script.total) == (4, 4 * clone_script.cost)
+        assert parser.frame_cost.warnings == []
+
+    def test_clones_in_unbounded_loop_hit_limit(self, compile_source):
+        """测试在跨帧的循环中创建克隆体时按上限计"""
+        parser = compile_source(script={"当绿旗被点击": "重复执行\n  克隆 自己\n  等待 1 秒\n结束",
+                                        **self.CLONE_SCRIPT}).parser
+        assert parser.frame_cost.clones == {"角色1": CLONE_LIMIT}
+        assert parser.frame_cost.warnings == [f"角色1: 克隆体数量可能达到上限 {CLONE_LIMIT}"]
+
+    def test_no_clones(self, compile_source):
+        """测试没有创建克隆体时克隆体脚本不计代价"""
+        parser = compile_source(script=self.CLONE_SCRIPT).parser
+        assert parser.frame_cost.total == 0
+
+
+class TestReport:
+    """报告、代价表和预算测试类"""
+
+    SCRIPT = {
+        "当绿旗被点击": "重复 10 次\n  如果 碰到 边缘 那么\n    将 n 增加 1\n  结束\n结束",
+        "当按下 空格 键": "将 n 增加 1",
+    }
+
+    def test_ranked_with_source_lines(self, compile_source):
+        """测试脚本和热点积木按代价排序，并对应到源码行号"""
+        parser = compile_source(script=self.SCRIPT).parser
+        report = parser.frame_cost
+        assert [(script.hat, script.line) for script in report.scripts] == \
+            [("event_whenflagclicked", 5), ("event_whenkeypressed", 11)]
+        top = report.hotspots[0]
+        assert (top.opcode, top.line, top.script_line) == ("control_if", 7, 5)
+        assert top.cost == 10 * (1 + DEFAULT_COSTS["sensing_touchingobject"])
+        costs = [hotspot.cost for hotspot in report.hotspots]
+        assert costs == sorted(costs, reverse=True)
+
+    def test_format_report(self, compile_source):
+        """测试文本报告"""
+        text = format_report(compile_source(script=self.SCRIPT).parser.frame_cost, title="game.sl")
+        assert text.startswith("每帧代价估计 - game.sl: ")
+        assert "1. 角色1 第 5 行 event_whenflagclicked" in text
+        assert "1. 角色1 第 7 行 control_if: 210" in text
+
+    def test_cost_table_override(self, compile_source):
+        """测试代价表覆盖默认代价"""
+        parser = compile_source(script=self.SCRIPT, cost_table={"sensing_touchingobject": 1}).parser
+        assert script_cost(parser).cost == 1 + 10 * (1 + 2 + 1)
+
+    def test_load_cost_table(self, tmp_path):
+        """测试读取和校验 JSON 代价表"""
+        path = tmp_path / "costs.json"
+        path.write_text('{"pen_stamp": 50}', encoding="utf-8")
+        assert load_cost_table(str(path)) == {"pen_stamp": 50}
+        path.write_text('{"pen_stamp": "贵"}', encoding="utf-8")
+        with pytest.raises(CompileError):
+            load_cost_table(str(path))
+        with pytest.raises(CompileError):
+            load_cost_table(str(tmp_path / "无.json"))
+
+    def test_budget_exceeded(self, compile_source, tmp_path):
+        """测试超过预算时编译失败，错误指向代价最高的脚本"""
+        with pytest.raises(CompileError) as info:
+            compile_source(script=self.SCRIPT, frame_budget=100)
+        assert info.value.line == 5
+        assert "超过预算 100" in str(info.value)
+        assert not (tmp_path / "out.sb3").exists()
+        compile_source(script=self.SCRIPT, frame_budget=1000)
+
+    def test_does_not_modify_project(self, compile_source):
+        """测试估计不修改项目"""
+        parser = compile_source(script=self.SCRIPT).parser
+        before = json.dumps(parser.builder.project, sort_keys=True, default=json_default)
+        with contextlib.redirect_stdout(io.StringIO()):
+            estimate_frame_cost(parser.builder.project)
+        assert json.dumps(parser.builder.project, sort_keys=True, default=json_default) == before
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
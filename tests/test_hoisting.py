@@ -0,0 +1,208 @@
+"""
+hoisting.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockgraph import check_links, stack, substack
+from compiler.hoisting import LoopHoister
+
+COMPILE_OPTIONS = {"hoist_invariants": True, "peephole": False, "warp_inference": False}
+SPRITE_VARIABLES = "变量: w = 4\n变量: s = 1\n变量: a = 0\n"
+
+
+def opcodes(target, first_id):
+    """积木栈中各积木的 opcode"""
+    return [target["blocks"][block_id]["opcode"] for block_id in stack(target["blocks"], first_id)]
+
+
+def green_flag(target):
+    hat_id = next(block_id for block_id, block in target["blocks"].items()
+                  if block["opcode"] == "event_whenflagclicked")
+    return target["blocks"][hat_id]["next"]
+
+
+def temporaries(target):
+    return sorted(value[0] for value in target["variables"].values() if value[0].startswith("_不变量_"))
+
+
+EXPRESSIONS = ["~w * 2", "~w * 2", "(~w / 2) * ~s", "~a + ~w", "~w * 2 + 1", "计时器 * 2", "~w * x坐标",
+               "~s - 1", "3"]
+
+
+def random_body(rng, depth=0):
+    """生成随机的积木行（变量 a、s、w 和一个会修改 s 的自定义积木）"""
+    lines = []
+    for _ in range(rng.randint(1, 4)):
+        roll = rng.random()
+        if roll < 0.25:
+            lines.append(f"将x坐标增加 {rng.choice(EXPRESSIONS)}")
+        elif roll < 0.45:
+            lines.append(f"将 {rng.choice('aaas')} 增加 {rng.choice(EXPRESSIONS)}")
+        elif roll < 0.55:
+            lines.append(f"设置 {rng.choice('asw')} 为 {rng.choice(EXPRESSIONS)}")
+        elif roll < 0.6:
+            lines.append("改缩放")
+        elif depth < 2 and roll < 0.85:
+            lines.append(f"重复 {rng.choice(['2', '3', '(~w * 2) % 7', '(~s + 1) % 7'])} 次")
+            lines += ["  " + line for line in random_body(rng, depth + 1)]
+            lines.append("结束")
+        elif depth < 2:
+            lines.append(f"如果 {rng.choice(['~a', '~s', 'x坐标'])} > 1 那么")
+            lines += ["  " + line for line in random_body(rng, depth + 1)]
+            lines.append("结束")
+    return lines
+
+
+class TestHoist:
+    """外提规则测试类"""
+
+    def test_hoist_before_loop(self, compile_source):
+        """测试只在同一个脚本的循环之前写入的变量组成的表达式提到循环之前"""
+        compiled = compile_source(script="设置 w 为 10\n重复 5 次\n  将x坐标增加 (~w / 2) * ~s\n结束")
+        blocks = compiled.sprite["blocks"]
+        first = green_flag(compiled.sprite)
+        assert opcodes(compiled.sprite, first) == ["data_setvariableto", "data_setvariableto", "control_repeat"]
+        hoisted = blocks[blocks[first]["next"]]
+        assert hoisted["fields"]["VARIABLE"][0] == "_不变量_1"
+        assert blocks[hoisted["inputs"]["VALUE"][1]]["opcode"] == "operator_multiply"
+        loop = blocks[hoisted["next"]]
+        move = blocks[substack(loop)]
+        assert blocks[move["inputs"]["DX"][1]]["opcode"] == "data_variable"
+        stats = compiled.parser.hoister.stats
+        assert (stats.expressions, stats.temporaries, stats.before_loop, stats.loops) == (1, 1, 1, 1)
+        assert check_links(blocks) == []
+
+    def test_written_in_loop_not_hoisted(self, compile_source):
+        """测试循环中写入的变量不外提，其余部分仍然外提"""
+        compiled = compile_source(script="重复 5 次\n  将x坐标增加 (~w / 2) * ~s\n  将 s 增加 1\n结束")
+        blocks = compiled.sprite["blocks"]
+        first = green_flag(compiled.sprite)
+        assert opcodes(compiled.sprite, first) == ["data_setvariableto", "control_repeat"]
+        assert blocks[blocks[first]["inputs"]["VALUE"][1]]["opcode"] == "operator_divide"
+        assert check_links(blocks) == []
+
+    def test_written_by_other_script_not_hoisted(self, compile_source):
+        """测试其他脚本写入的变量可能在两次循环之间改变，不提到循环之前"""
+        compiled = compile_source(script={
+            "当绿旗被点击": "重复 5 次\n  将x坐标增加 ~w * 2\n结束",
+            "当按下 空格 键": "将 w 增加 1",
+        })
+        assert temporaries(compiled.sprite) == []
+        assert compiled.parser.hoister.stats.expressions == 0
+
+    def test_stage_variable_not_hoisted_across_yields(self, compile_source):
+        """测试舞台变量被所有克隆体共享，同一个脚本在其他克隆体中的写入会让外提的值过期"""
+        compiled = compile_source(": 开始\n变量: g = 0\n# 角色1\n当作为克隆体启动\n  设置 g 为 x坐标\n"
+                                  "  重复 10 次\n    移动 (~g * 2) 步\n  结束\n")
+        assert [value[0] for value in compiled.stage["variables"].values()] == ["g"]
+        assert temporaries(compiled.sprite) == []
+        assert compiled.parser.hoister.stats.expressions == 0
+
+    def test_volatile_reporters_not_hoisted(self, compile_source):
+        """测试计时器和坐标等每次求值结果可能不同的积木不外提"""
+        compiled = compile_source(script="重复 5 次\n  将x坐标增加 计时器 * 2\n  将 a 增加 ~w * x坐标\n结束")
+        assert temporaries(compiled.sprite) == []
+
+    def test_per_iteration_hoist(self, compile_source):
+        """测试不能提到循环之前、但一次循环中出现多次的表达式提到每次循环的开头"""
+        compiled = compile_source(script={
+            "当绿旗被点击": "重复执行\n  将x坐标增加 ~w * 2\n  将 a 增加 ~w * 2\n结束",
+            "当按下 空格 键": "将 w 增加 1",
+        })
+        blocks = compiled.sprite["blocks"]
+        loop = blocks[green_flag(compiled.sprite)]
+        assert loop["opcode"] == "control_forever"
+        assert opcodes(compiled.sprite, substack(loop)) == \
+            ["data_setvariableto", "motion_changexby", "data_changevariableby"]
+        stats = compiled.parser.hoister.stats
+        assert (stats.expressions, stats.temporaries, stats.before_loop) == (2, 1, 0)
+        assert check_links(blocks) == []
+
+    def test_per_iteration_needs_no_yield(self, compile_source):
+        """测试循环体中有让出点时不提到每次循环的开头"""
+        compiled = compile_source(script={
+            "当绿旗被点击": "重复执行\n  将x坐标增加 ~w * 2\n  等待 1 秒\n  将 a 增加 ~w * 2\n结束",
+            "当按下 空格 键": "将 w 增加 1",
+        })
+        assert temporaries(compiled.sprite) == []
+
+    def test_procedure_call_writes_all(self, compile_source):
+        """测试循环中调用自定义积木时视为所有变量都可能被写入"""
+        compiled = compile_source(script="重复 5 次\n  将x坐标增加 ~w * 2\n  改缩放\n结束",
+                                  definitions="定义 改缩放()\n  将 s 增加 1\n结束\n")
+        assert temporaries(compiled.sprite) == []
+
+    def test_warp_procedure(self, compile_source):
+        """测试开启不刷新屏幕、循环体不会让出的自定义积木中的表达式提到循环之前"""
+        compiled = compile_source(
+            script={"当按下 空格 键": "将 w 增加 1"},
+            definitions="定义 画() 不刷新屏幕\n  重复 5 次\n    将x坐标增加 ~w * 2\n  结束\n结束\n"
+                        "定义 慢画()\n  重复 5 次\n    将x坐标增加 ~w * 2\n  结束\n结束\n")
+        assert temporaries(compiled.sprite) == ["_不变量_1"]
+        assert compiled.parser.hoister.stats.before_loop == 1
+        assert check_links(compiled.sprite["blocks"]) == []
+
+    def test_nested_loops_hoist_outermost(self, compile_source):
+        """测试对外层循环也不变的表达式提到最外层循环之前"""
+        compiled = compile_source(
+            script="设置 w 为 3\n重复 2 次\n  重复 3 次\n    将x坐标增加 ~w * 2\n    将 a 增加 ~a + ~w\n  结束\n结束")
+        blocks = compiled.sprite["blocks"]
+        first = green_flag(compiled.sprite)
+        assert opcodes(compiled.sprite, first) == ["data_setvariableto", "data_setvariableto", "control_repeat"]
+        assert temporaries(compiled.sprite) == ["_不变量_1"]
+        assert check_links(blocks) == []
+
+    def test_cloud_variable_not_hoisted(self, compile_source):
+        """测试云变量可能被其他用户修改，不外提"""
+        compiled = compile_source(script="重复 5 次\n  将x坐标增加 ~☁ 分数 * 2\n结束",
+                                  variables="云变量: 分数 = 0\n")
+        cloud = [value for owner in (compiled.stage, compiled.sprite) for value in owner["variables"].values()
+                 if len(value) > 2]
+        assert cloud, "测试前提：变量是云变量"
+        assert temporaries(compiled.sprite) == []
+
+    def test_disabled_by_default(self, compile_source):
+        """测试默认不外提"""
+        compiled = compile_source(script="重复 5 次\n  将x坐标增加 ~w * 2\n结束", hoist_invariants=False)
+        assert compiled.parser.hoister is None
+        assert temporaries(compiled.sprite) == []
+
+    def test_compile_reports_stats(self, compile_source):
+        """测试 compile() 外提并报告统计"""
+        compiled = compile_source(script="重复 10 次\n  将x坐标增加 ~w * 2\n结束", peephole=True, warp_inference=True)
+        assert compiled.parser.hoist_stats.expressions == 1
+
+    def test_standalone_hoister(self, compile_source):
+        """测试直接在 project.json 上使用 LoopHoister"""
+        compiled = compile_source(script="重复 5 次\n  将x坐标增加 ~w * 2\n结束", hoist_invariants=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = LoopHoister().hoist_project(compiled.parser.builder.project)
+        assert stats.expressions == 1
+        assert temporaries(compiled.sprite) == ["_不变量_1"]
+        assert check_links(compiled.sprite["blocks"]) == []
+
+
+class TestRoundTrip:
+    """随机程序外提前后执行结果一致"""
+
+    @pytest.mark.parametrize("seed", range(200))
+    def test_random_projects(self, compile_source, run_project, seed):
+        """测试随机的循环和表达式外提前后执行结果相同"""
+        rng = random.Random(seed)
+        script = "\n".join(random_body(rng))
+        definitions = "定义 改缩放()\n  将 s 增加 1\n结束\n"
+        original = compile_source(script=script, definitions=definitions, hoist_invariants=False)
+        hoisted = compile_source(script=script, definitions=definitions)
+        assert check_links(hoisted.sprite["blocks"]) == []
+        assert run_project(hoisted.parser.builder.project) == run_project(original.parser.builder.project), script
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
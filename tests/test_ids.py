@@ -0,0 +1,126 @@
+"""
+ids.py 单元测试
+"""
+import pytest
+import hashlib
+import io
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.archive import ZIP_TIMESTAMP
+from compiler.builder import SB3Builder
+from compiler.ids import (
+    CounterIdAllocator, IdAllocator, ReproducibleIdAllocator, RandomIdAllocator,
+    create_id_allocator, to_base62, ID_MODES,
+)
+
+CODE = (": 开始\n@ 舞台\n变量: 分数 = 0\n"
+        "# 角色1\n当绿旗被点击\n  重复 10 次\n    移动 10 步\n  广播 开始\n"
+        "# 角色2\n当收到 开始\n  说 你好 2 秒\n")
+
+
+class TestAllocators:
+    """ID 分配器测试类"""
+
+    def test_base62(self):
+        """测试 base62 编码"""
+        assert to_base62(0) == "a"
+        assert to_base62(61) == "9"
+        assert to_base62(62) == "ba"
+
+    def test_abstract_base(self):
+        """测试没有实现 new_id/named_id 的分配器在创建时就报错"""
+        with pytest.raises(TypeError):
+            IdAllocator()
+
+        class Partial(IdAllocator):
+            def new_id(self, target=None, length=20):
+                return "x"
+
+        with pytest.raises(TypeError):
+            Partial()
+
+    def test_counter_unique_and_short(self):
+        """测试计数器 ID 跨 target 不重复且较短"""
+        allocator = CounterIdAllocator()
+        targets = [{"name": "角色"}, {"name": "角色"}, {"name": "舞台"}]
+        ids = [allocator.new_id(t) for t in targets for _ in range(5000)]
+        assert len(set(ids)) == len(ids)
+        assert max(len(i) for i in ids) <= 6
+
+    def test_counter_prefix_from_target_name(self):
+        """测试前缀由 target 名称和同名序号决定，与创建顺序无关"""
+        a, b = CounterIdAllocator(), CounterIdAllocator()
+        first = a.new_id({"name": "角色1"})
+        b.new_id({"name": "角色2"})
+        assert b.new_id({"name": "角色1"}) == first
+        assert a.prefix({"name": "角色1"}) != a.prefix({"name": "角色2"})
+
+    def test_reproducible_ids(self):
+        """测试可复现 ID 为 20 位且跨实例一致"""
+        target = {"name": "角色1"}
+        first = [ReproducibleIdAllocator().new_id(target) for _ in range(3)]
+        allocator = ReproducibleIdAllocator()
+        second = [allocator.new_id(target) for _ in range(3)]
+        assert first[0] == second[0]
+        assert len(set(second)) == 3
+        assert all(len(i) == 20 for i in second)
+
+    def test_named_id_stable(self):
+        """测试按名称分配的 ID 与使用顺序无关"""
+        a, b = CounterIdAllocator(), CounterIdAllocator()
+        assert a.named_id("broadcast", "开始") == a.named_id("broadcast", "开始")
+        b.named_id("broadcast", "结束")
+        assert b.named_id("broadcast", "开始") == a.named_id("broadcast", "开始")
+
+    def test_seed_changes_ids(self):
+        """测试不同种子得到不同 ID"""
+        target = {"name": "角色1"}
+        assert CounterIdAllocator("x").new_id(target) != CounterIdAllocator("y").new_id(target)
+
+    def test_create_id_allocator(self):
+        """测试按模式名创建分配器"""
+        assert isinstance(create_id_allocator("random"), RandomIdAllocator)
+        assert [create_id_allocator(mode).mode for mode in ID_MODES] == list(ID_MODES)
+        with pytest.raises(ValueError):
+            create_id_allocator("unknown")
+
+    def test_builder_uses_allocator(self):
+        """测试 SB3Builder 使用传入的分配器"""
+        builder = SB3Builder(id_allocator=ReproducibleIdAllocator())
+        builder.add_sprite("角色1")
+        assert len(builder.generate_id()) == 20
+        assert len(SB3Builder(id_mode="random").generate_id()) == 20
+
+
+class TestReproducibleOutput:
+    """输出可复现性测试类"""
+
+    @pytest.mark.parametrize("mode", ["counter", "reproducible"])
+    def test_byte_identical(self, compile_source, mode):
+        """测试相同源码两次编译得到逐字节相同的 sb3"""
+        first = compile_source(CODE, id_mode=mode, name="a.sb3").data
+        second = compile_source(CODE, id_mode=mode, name="b.sb3").data
+        assert hashlib.sha256(first).digest() == hashlib.sha256(second).digest()
+
+    def test_random_mode_differs(self, compile_source):
+        """测试 random 模式仍为随机 ID"""
+        assert (compile_source(CODE, id_mode="random", name="a.sb3").data
+                != compile_source(CODE, id_mode="random", name="b.sb3").data)
+
+    def test_zip_layout(self, compile_source):
+        """测试 zip 条目顺序和时间戳固定"""
+        data = compile_source(CODE, id_mode="counter").data
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            infos = zf.infolist()
+        assert infos[0].filename == "project.json"
+        names = [info.filename for info in infos[1:]]
+        assert names == sorted(names)
+        assert all(info.date_time == ZIP_TIMESTAMP for info in infos)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
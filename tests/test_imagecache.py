@@ -0,0 +1,188 @@
+"""
+imagecache.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from compiler.assets import AssetManager
+from compiler.imagecache import ImageCache, main
+
+CODE = ": 开始\n@ 舞台\n背景: bg.png\n# 角色1\n造型: a.png\n造型: b.jpg\n造型: c.svg\n"
+
+# max 力度时不需要缩放的 PNG 也经过 PIL 和缓存（fast/default 时原样使用）
+COMPILE_OPTIONS = {"png_effort": "max"}
+
+
+@pytest.fixture
+def project(tmp_path):
+    Image.new("RGB", (800, 400), (255, 0, 0)).save(tmp_path / "bg.png")
+    Image.new("RGBA", (60, 40), (0, 0, 255, 128)).save(tmp_path / "a.png")
+    Image.new("RGB", (30, 20), (0, 200, 0)).save(tmp_path / "b.jpg")
+    (tmp_path / "c.svg").write_text('<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"></svg>')
+    return tmp_path
+
+
+class TestImageCache:
+    """造型图片缓存测试类"""
+
+    def test_warm_build_skips_pil(self, project, no_pil, compile_source):
+        """测试再次编译时命中缓存、不调用 PIL，输出与不用缓存时相同"""
+        cold_cache = ImageCache(str(project / "cache"))
+        cold = compile_source(CODE, image_cache=cold_cache, auto_scale_costumes=True).data
+        assert (cold_cache.stats.hits, cold_cache.stats.misses, cold_cache.stats.stores) == (0, 3, 3)
+
+        warm_cache = ImageCache(str(project / "cache"))
+        with no_pil():
+            warm = compile_source(CODE, image_cache=warm_cache, auto_scale_costumes=True).data
+        assert (warm_cache.stats.hits, warm_cache.stats.misses) == (3, 0)
+        assert warm == cold
+        assert compile_source(CODE, image_cache=False, auto_scale_costumes=True).data == cold
+
+    def test_settings_change_key(self, project, compile_source):
+        """测试缩放设置或源文件内容改变时不复用缓存"""
+        compile_source(CODE, image_cache=ImageCache(str(project / "cache")))
+        cache = ImageCache(str(project / "cache"))
+        compile_source(CODE, image_cache=cache, auto_scale_costumes=True, max_costume_size=100)
+        assert (cache.stats.hits, cache.stats.misses) == (0, 3)
+
+        Image.new("RGB", (60, 40), (1, 2, 3)).save(project / "a.png")
+        cache = ImageCache(str(project / "cache"))
+        compile_source(CODE, image_cache=cache)
+        assert (cache.stats.hits, cache.stats.misses) == (2, 1)
+
+    def test_corrupt_entry(self, project):
+        """测试缓存的 PNG 大小不符时视为未命中并重新处理"""
+        cache = ImageCache(str(project / "cache"))
+        AssetManager(image_cache=cache, png_effort="max").add_image(str(project / "a.png"))
+        for entry in cache.entries():
+            with open(os.path.join(cache.directory, entry.key[:2], f"{entry.key}.png"), "ab") as f:
+                f.write(b"\0")
+        cache = ImageCache(str(project / "cache"))
+        costume = AssetManager(image_cache=cache, png_effort="max").add_image(str(project / "a.png"))
+        assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+        assert costume == AssetManager(png_effort="max").add_image(str(project / "a.png"))
+
+    def test_tampered_entry(self, project):
+        """测试缓存的 PNG 大小不变但内容与 MD5 文件名不符时视为未命中"""
+        cache = ImageCache(str(project / "cache"))
+        AssetManager(image_cache=cache, png_effort="max").add_image(str(project / "a.png"))
+        for entry in cache.entries():
+            path = os.path.join(cache.directory, entry.key[:2], f"{entry.key}.png")
+            with open(path, "r+b") as f:
+                data = f.read()
+                f.seek(len(data) - 1)
+                f.write(bytes([data[-1] ^ 0xFF]))
+        cache = ImageCache(str(project / "cache"))
+        costume = AssetManager(image_cache=cache, png_effort="max").add_image(str(project / "a.png"))
+        assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+        assert costume == AssetManager(png_effort="max").add_image(str(project / "a.png"))
+
+    def test_hit_survives_eviction_before_save(self, project, compile_source):
+        """测试命中的条目在保存前被其他编译淘汰时项目仍能保存（资源不引用缓存中的文件）"""
+        cold = compile_source(CODE, image_cache=ImageCache(str(project / "cache"))).data
+        cache = ImageCache(str(project / "cache"))
+        parser = compile_source(CODE, image_cache=cache, save=False).parser
+        assert ImageCache(str(project / "cache")).clear() == 3
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser.compile(str(project / "out.sb3"))
+        assert cache.stats.hits == 3
+        assert (project / "out.sb3").read_bytes() == cold
+
+    def test_lru_eviction(self, project):
+        """测试超出大小上限时淘汰最久未使用的条目，本次用到的条目不淘汰"""
+        cache = ImageCache(str(project / "cache"))
+        manager = AssetManager(image_cache=cache, png_effort="max")
+        for name in ("a.png", "b.jpg"):
+            manager.add_image(str(project / name))
+        entries = cache.entries()
+        assert len(entries) == 2
+        old, new = (entry.key for entry in entries)
+        past = time.time() - 100
+        os.utime(os.path.join(cache.directory, old[:2], f"{old}.json"), (past, past))
+
+        # 超出一个字节时只淘汰最久未使用的条目
+        cache = ImageCache(str(project / "cache"))
+        assert cache.prune(sum(entry.size for entry in entries) - 1) == 1
+        assert [entry.key for entry in cache.entries()] == [new]
+
+        # 写入后自动淘汰，刚写入的条目保留
+        cache = ImageCache(str(project / "cache"), max_bytes=1)
+        AssetManager(image_cache=cache, png_effort="max").add_image(str(project / "bg.png"))
+        keys = [entry.key for entry in cache.entries()]
+        assert new not in keys and len(keys) == 1
+        assert cache.stats.evictions == 1
+
+    def test_orphan_png(self, project):
+        """测试没有元数据的 PNG 也是条目：按 PNG 的修改时间计入总大小，可以被淘汰和清空"""
+        cache = ImageCache(str(project / "cache"))
+        manager = AssetManager(image_cache=cache, png_effort="max")
+        for name in ("a.png", "b.jpg"):
+            manager.add_image(str(project / name))
+        orphan, kept = (entry.key for entry in cache.entries())
+        meta_path = os.path.join(cache.directory, orphan[:2], f"{orphan}.json")
+        png_path = os.path.join(cache.directory, orphan[:2], f"{orphan}.png")
+        os.unlink(meta_path)
+        past = time.time() - 100
+        os.utime(png_path, (past, past))
+
+        cache = ImageCache(str(project / "cache"))
+        entries = cache.entries()
+        assert [entry.key for entry in entries] == sorted([orphan, kept])
+        orphan_entry = next(entry for entry in entries if entry.key == orphan)
+        assert orphan_entry.size == os.path.getsize(png_path) and orphan_entry.mtime == past
+        assert cache.total_size() == sum(entry.size for entry in entries)
+        assert cache.prune(cache.total_size() - 1) == 1
+        assert not os.path.exists(png_path) and [entry.key for entry in cache.entries()] == [kept]
+
+        with open(png_path, "wb") as f:
+            f.write(b"\x89PNG")
+        assert cache.clear() == 2 and cache.entries() == []
+
+    def test_disabled(self, project, monkeypatch):
+        """测试禁用磁盘缓存时照常处理图片"""
+        monkeypatch.setenv("SCRATCHLANG_CACHE_DIR", "")
+        cache = ImageCache()
+        assert not cache.enabled
+        AssetManager(image_cache=cache).add_image(str(project / "a.png"))
+        assert cache.stats.misses == 0 and cache.entries() == []
+
+    def test_parallel_workers(self, project, compile_source):
+        """测试并行编译时工作进程的命中统计合并到主进程"""
+        code = CODE + "# 角色2\n造型: a.png\n"
+        stats = []
+        for _ in range(2):
+            cache = ImageCache(str(project / "cache"))
+            compile_source(code, image_cache=cache, jobs=2)
+            assert len(cache.pinned) == 3
+            stats.append(cache.stats)
+        # 第一次编译时两个工作进程都可能处理 a.png，另一个也可能读到先写入的条目
+        assert stats[0].hits + stats[0].misses == 4
+        assert (stats[1].hits, stats[1].misses) == (4, 0)
+
+
+class TestCommandLine:
+    """缓存命令行测试类"""
+
+    def test_info_prune_clear(self, project, capsys, compile_source):
+        """测试查看、淘汰和清空缓存"""
+        compile_source(CODE, image_cache=ImageCache(str(project / "cache")))
+        directory = str(project / "cache")
+        assert main(["--dir", directory]) == 0
+        assert "3 个条目" in capsys.readouterr().out
+        assert main(["--dir", directory, "--prune", "0.000001"]) == 0
+        assert "淘汰 3 个条目" in capsys.readouterr().out
+        compile_source(CODE, image_cache=ImageCache(directory))
+        assert main(["--dir", directory, "--clear"]) == 0
+        assert "0 个条目" in capsys.readouterr().out.splitlines()[-1]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,106 @@
+"""
+incremental.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.incremental import split_sections
+from compiler.parser import ScratchLangParser
+
+COMPILE_OPTIONS = {"incremental": True}
+STAGE = ": 开始\n@ 舞台\n变量: 分数 = 0\n"
+SPRITE_A = "# 角色A\n当绿旗被点击\n  将 分数 增加 1\n  广播 开始\n"
+SPRITE_B = "# 角色B\n当收到 开始\n  移动 10 步\n"
+
+
+class TestSections:
+    """区段划分测试类"""
+
+    def test_split_sections(self):
+        """测试按角色和舞台声明划分区段"""
+        lines = [": 开始", "@ 舞台", "变量: a = 1", "# 角色1", "当绿旗被点击", "  移动 1 步", "@", "# 角色2"]
+        sections = split_sections(lines)
+        assert [(s.start, s.end, s.sprite) for s in sections] == \
+            [(0, 1, None), (1, 3, None), (3, 6, "角色1"), (6, 7, None), (7, 8, "角色2")]
+
+
+class TestIncrementalCompile:
+    """增量编译测试类"""
+
+    def test_output_matches_full_compile(self, compile_source):
+        """测试冷、热缓存的输出都与完整编译逐字节相同"""
+        code = STAGE + SPRITE_A + SPRITE_B
+        full = compile_source(code, incremental=False).data
+        cold_parser, _, cold = compile_source(code)
+        warm_parser, _, warm = compile_source(code)
+        assert full == cold == warm
+        assert cold_parser.incremental_stats.rebuilt == ["角色A", "角色B"]
+        assert warm_parser.incremental_stats.reused == ["角色A", "角色B"]
+
+    def test_only_edited_sprite_rebuilt(self, compile_source):
+        """测试只重建修改过的角色（空行和注释不算修改）"""
+        compile_source(STAGE + SPRITE_A + SPRITE_B)
+        edited = SPRITE_B.replace("10", "20") + "\n// 注释\n"
+        parser, _, data = compile_source(STAGE + SPRITE_A + edited)
+        assert parser.incremental_stats.reused == ["角色A"]
+        assert parser.incremental_stats.rebuilt == ["角色B"]
+        full = compile_source(STAGE + SPRITE_A + edited, incremental=False).data
+        assert data == full
+
+    def test_source_lines_after_reuse(self, compile_source):
+        """测试复用的角色按当前源码的行号记录积木位置（插入空行和注释后仍然命中缓存）"""
+        compile_source(STAGE + SPRITE_A + SPRITE_B)
+        edited = STAGE + SPRITE_A.replace("\n  将", "\n\n  // 注释\n  将") + SPRITE_B
+        parser = compile_source(edited).parser
+        assert parser.incremental_stats.reused == ["角色A", "角色B"]
+        full_parser = compile_source(edited, incremental=False).parser
+        assert parser.source_lines() == full_parser.source_lines()
+        assert sorted(parser.source_lines()["角色A"].values()) == [5, 8, 9]
+
+    def test_stage_variable_invalidates_dependents(self, compile_source):
+        """测试舞台变量改动只使依赖它的角色失效"""
+        compile_source(STAGE + SPRITE_A + SPRITE_B)
+        parser = compile_source(": 开始\n@ 舞台\n" + SPRITE_A + SPRITE_B).parser
+        assert parser.incremental_stats.rebuilt == ["角色A"]
+        assert parser.incremental_stats.reused == ["角色B"]
+
+    def test_broadcasts_replayed(self, compile_source):
+        """测试复用角色时重放广播登记"""
+        code = STAGE + SPRITE_A + SPRITE_B
+        compile_source(code)
+        parser = compile_source(code).parser
+        stage = parser.builder.project["targets"][0]
+        assert list(stage["broadcasts"].values()) == ["开始"]
+        assert parser.builder.broadcasts == {"开始": next(iter(stage["broadcasts"]))}
+
+    def test_asset_change_invalidates(self, compile_source, tmp_path):
+        """测试造型文件内容改变时重建角色"""
+        svg = tmp_path / "a.svg"
+        svg.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"></svg>')
+        code = STAGE + "# 角色A\n造型: a.svg\n"
+        compile_source(code)
+        parser = compile_source(code).parser
+        assert parser.incremental_stats.reused == ["角色A"]
+
+        svg.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="20" height="20"></svg>')
+        parser, _, data = compile_source(code)
+        assert parser.incremental_stats.rebuilt == ["角色A"]
+        full = compile_source(code, incremental=False).data
+        assert data == full
+
+    def test_disabled_cache_dir(self, tmp_path, monkeypatch):
+        """测试禁用磁盘缓存时正常编译"""
+        monkeypatch.setenv("SCRATCHLANG_CACHE_DIR", "")
+        parser = ScratchLangParser(incremental=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser.parse(STAGE + SPRITE_A)
+        assert parser.incremental_stats.rebuilt == ["角色A"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
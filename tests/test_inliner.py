@@ -0,0 +1,193 @@
+"""
+inliner.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockgraph import check_links, stack
+from compiler.inliner import Inliner
+
+
+COMPILE_OPTIONS = {"inline_procedures": True, "peephole": False, "warp_inference": False}
+SPRITE_VARIABLES = "变量: a = 0\n变量: b = 0\n"
+
+
+def calls(target):
+    """角色中剩余的自定义积木调用"""
+    return sorted(block["mutation"]["proccode"] for block in target["blocks"].values()
+                  if block["opcode"] == "procedures_call")
+
+
+def random_body(rng, params, depth=0):
+    """生成随机的积木体（params 为可以引用的参数名）"""
+    values = ["1", "-2", "0.5", "~a", "~b", "~a + 1", "x坐标"] + [f"~{name}" for name in params] * 2
+    lines = []
+    for _ in range(rng.randint(1, 4)):
+        roll = rng.random()
+        if roll < 0.25:
+            lines.append(f"将x坐标增加 {rng.choice(values)}")
+        elif roll < 0.45:
+            lines.append(f"将 {rng.choice('ab')} 增加 {rng.choice(values)}")
+        elif roll < 0.6:
+            lines.append(f"设置 {rng.choice('ab')} 为 {rng.choice(values)}")
+        elif roll < 0.75:
+            lines.append(f"说 {rng.choice(values)}")
+        elif depth < 1 and roll < 0.88:
+            lines.append(f"重复 {rng.choice(['2', '3', '~a'])} 次")
+            lines += ["  " + line for line in random_body(rng, params, depth + 1)]
+            lines.append("结束")
+        elif depth < 1:
+            lines.append(f"如果 {rng.choice(values)} > 1 那么")
+            lines += ["  " + line for line in random_body(rng, params, depth + 1)]
+            lines.append("结束")
+    return lines
+
+
+def random_project(rng):
+    """生成随机的自定义积木定义和调用它们的绿旗脚本"""
+    definitions = []
+    procedures = []
+    for index in range(rng.randint(1, 3)):
+        params = [f"p{index}{k}" for k in range(rng.randint(0, 2))]
+        name = f"积木{index}"
+        body = random_body(rng, params)
+        # 后定义的积木可以调用先定义的积木，测试逐层内联
+        if procedures and rng.random() < 0.5:
+            body.insert(rng.randint(0, len(body)), call_line(rng, rng.choice(procedures), params))
+        definitions.append(f"定义 {name}({', '.join(params)})")
+        definitions += ["  " + line for line in body]
+        definitions.append("结束")
+        procedures.append((name, len(params)))
+    script = []
+    for _ in range(rng.randint(1, 4)):
+        if rng.random() < 0.3:
+            script.append(f"重复 {rng.choice(['2', '3'])} 次")
+            script.append("  " + call_line(rng, rng.choice(procedures), []))
+            script.append("结束")
+        else:
+            script.append(call_line(rng, rng.choice(procedures), []))
+    return "\n".join(definitions), "\n".join(script)
+
+
+def call_line(rng, procedure, params):
+    """生成调用自定义积木的一行"""
+    name, count = procedure
+    values = ["3", "0", "-1.5", "~a", "~a + ~b", "x坐标", "你好"] + [f"~{param}" for param in params]
+    if count == 0:
+        return name
+    return f"{name}({', '.join(rng.choice(values) for _ in range(count))})"
+
+
+class TestInline:
+    """内联规则测试类"""
+
+    def test_literal_and_temporary(self, compile_source):
+        """测试字面量参数直接代入，多次使用的表达式参数存入临时变量"""
+        compiled = compile_source(script="加两次(3)\n加两次(~b + 1)",
+                                  definitions="定义 加两次(k)\n  将 a 增加 ~k\n  将 a 增加 ~k\n结束")
+        assert calls(compiled.sprite) == []
+        stats = compiled.parser.inliner.stats
+        assert stats.calls == 2 and stats.temporaries == 1
+        assert [name for name, _ in compiled.sprite["variables"].values()] == ["a", "b", "_内联_加两次_k"]
+        assert check_links(compiled.sprite["blocks"]) == []
+
+    def test_direct_substitution(self, compile_source):
+        """测试只在第一个积木中用到一次的表达式参数直接代入，不建临时变量"""
+        compiled = compile_source(script="走(~a + 1)", definitions="定义 走(s)\n  将x坐标增加 ~s\n  说 完成\n结束")
+        assert calls(compiled.sprite) == []
+        assert compiled.parser.inliner.stats.temporaries == 0
+
+    def test_size_limit_and_recursion(self, compile_source):
+        """测试积木体太大或递归的积木不内联"""
+        compiled = compile_source(
+            script="大\n递归(1)",
+            definitions="定义 大()\n  将 a 增加 1\n  将 a 增加 1\n  将 a 增加 1\n结束\n定义 递归(k)\n  递归(1)\n结束",
+            inline_max_size=2)
+        assert calls(compiled.sprite) == ["大", "递归 %s", "递归 %s"]
+        assert compiled.parser.inliner.stats.skipped == {"角色1/大": "积木太多（3 > 2）", "角色1/递归 %s": "递归调用"}
+
+    def test_nested_calls_inlined_bottom_up(self, compile_source):
+        """测试调用其他积木的积木在被调用的积木内联后也能内联"""
+        compiled = compile_source(script="外(~b)",
+                                  definitions="定义 内(k)\n  将 a 增加 ~k\n结束\n定义 外(k)\n  内(~k)\n  内(1)\n结束")
+        assert calls(compiled.sprite) == []
+        assert check_links(compiled.sprite["blocks"]) == []
+
+    def test_yielding_body_needs_no_temporary(self, compile_source):
+        """测试积木体会让出时，需要临时变量的调用不内联，字面量参数的调用仍然内联"""
+        compiled = compile_source(script="数(~b)\n数(3)",
+                                  definitions="定义 数(k)\n  重复 ~k 次\n    将 a 增加 ~k\n  结束\n结束")
+        assert calls(compiled.sprite) == ["数 %s"]
+        assert compiled.parser.inliner.stats.skipped == {"角色1/数 %s": "积木体会让出，参数不能存入临时变量"}
+
+    def test_warp_semantics(self, compile_source):
+        """测试开启 warp 的积木体有循环时，只内联到同样开启 warp 的积木中"""
+        compiled = compile_source(
+            script="快(1)",
+            definitions="定义 快(k) 不刷新屏幕\n  重复 3 次\n    将 a 增加 1\n  结束\n结束\n"
+                        "定义 也快() 不刷新屏幕\n  快(1)\n结束")
+        assert calls(compiled.sprite) == ["快 %s"]
+        assert compiled.parser.inliner.stats.skipped == {"角色1/快 %s": "开启了不刷新屏幕且积木体会让出，调用处没有开启"}
+
+    def test_stop_this_script_not_inlined(self, compile_source):
+        """测试积木体中有 "停止此脚本" 时不内联（内联后会停止调用处的脚本，后面的积木不再执行）"""
+        compiled = compile_source(
+            script="检查(5)\n说 完成",
+            definitions="定义 检查(n)\n  如果 ~n > 1 那么\n    停止 此脚本\n  结束\n  将 a 增加 1\n结束")
+        assert calls(compiled.sprite) == ["检查 %s"]
+        assert compiled.parser.inliner.stats.calls == 0
+        assert compiled.parser.inliner.stats.skipped == {"角色1/检查 %s": "积木体中有停止此脚本"}
+        blocks = compiled.sprite["blocks"]
+        hat = next(block for block in blocks.values() if block["opcode"] == "event_whenflagclicked")
+        assert [blocks[block_id]["opcode"] for block_id in stack(blocks, hat["next"])] == \
+            ["procedures_call", "looks_say"]
+
+    def test_disabled_by_default(self, compile_source):
+        """测试默认不内联"""
+        compiled = compile_source(script="走", definitions="定义 走()\n  将x坐标增加 1\n结束", inline_procedures=False)
+        assert compiled.parser.inliner is None
+        assert calls(compiled.sprite) == ["走"]
+
+    def test_compile_reports_stats(self, compile_source):
+        """测试 compile() 内联并报告积木数和估计代价的变化"""
+        compiled = compile_source(script="重复 10 次\n  加\n结束", variables="变量: a = 0\n",
+                                  definitions="定义 加()\n  将 a 增加 1\n结束\n", peephole=True, warp_inference=True)
+        stats = compiled.parser.inline_stats
+        assert stats.calls == 1
+        assert stats.block_delta == 0
+        assert stats.cost_delta == -20
+
+    def test_standalone_inliner(self, compile_source):
+        """测试直接在 project.json 上使用 Inliner"""
+        compiled = compile_source(script="走\n走", definitions="定义 走()\n  将x坐标增加 1\n结束", inline_procedures=False)
+        inliner = Inliner()
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = inliner.inline_project(compiled.parser.builder.project)
+        assert stats.calls == 2
+        assert calls(compiled.sprite) == []
+        assert check_links(compiled.sprite["blocks"]) == []
+
+
+class TestRoundTrip:
+    """随机程序内联前后执行结果一致"""
+
+    @pytest.mark.parametrize("seed", range(200))
+    def test_random_projects(self, compile_source, run_project, seed):
+        """测试随机的自定义积木和调用内联前后执行结果相同"""
+        rng = random.Random(seed)
+        definitions, script = random_project(rng)
+        original = compile_source(script=script, definitions=definitions, inline_procedures=False)
+        inlined = compile_source(script=script, definitions=definitions)
+        assert check_links(inlined.sprite["blocks"]) == []
+        assert run_project(inlined.parser.builder.project) == run_project(original.parser.builder.project), \
+            f"{definitions}\n---\n{script}"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
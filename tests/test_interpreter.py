@@ -0,0 +1,171 @@
+"""
+interpreter.py 单元测试
+"""
+import pytest
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockrecord import json_default
+from compiler.framecost import CLONE_LIMIT
+from compiler.interpreter import FPS, Interpreter
+
+
+@pytest.fixture
+def run(compile_source):
+    """编译一个角色并点击绿旗运行 frames 帧的函数，返回解释器"""
+    def run(script, frames=10, definitions="", others="", **options):
+        source = f": 开始\n变量: 总数 = 0\n列表: 记录\n\n# 角色1\n变量: n = 0\n{definitions}\n{script}\n{others}"
+        vm = Interpreter(compile_source(source, **options).parser.builder.project)
+        vm.green_flag()
+        vm.run_frames(frames)
+        return vm
+
+    return run
+
+
+class TestControl:
+    """控制积木和调度测试类"""
+
+    def test_repeat_and_variables(self, run):
+        """测试重复循环、变量读写和执行计数"""
+        vm = run("当绿旗被点击\n  重复 10 次\n    将 总数 增加 1\n    将 n 增加 ~总数\n  结束\n")
+        assert vm.variable("总数") == 10
+        assert vm.variable("n", "角色1") == 55
+        assert vm.opcode_counts["data_changevariableby"] == 20
+        assert not vm.running
+
+    def test_loop_yields_once_per_redraw(self, run):
+        """测试移动角色的循环每帧只执行一轮"""
+        vm = run("当绿旗被点击\n  重复执行\n    移动 1 步\n  结束\n", frames=5)
+        assert vm.sprite("角色1").x == 5
+        assert vm.opcode_counts["motion_movesteps"] == 5
+
+    def test_loop_without_redraw_runs_within_frame(self, run):
+        """测试不重绘的循环在同一帧内继续执行"""
+        vm = run("当绿旗被点击\n  重复 200 次\n    将 n 增加 1\n  结束\n", frames=1)
+        assert vm.variable("n", "角色1") == 200
+
+    def test_if_else(self, run):
+        """测试如果否则"""
+        script = ("当绿旗被点击\n  设置 n 为 3\n  如果 ~n > 2 那么\n    设置 总数 为 大\n  否则\n"
+                  "    设置 总数 为 小\n  结束\n")
+        assert run(script).variable("总数") == "大"
+
+    def test_wait(self, run):
+        """测试等待按帧时间计算"""
+        vm = run("当绿旗被点击\n  等待 1 秒\n  设置 n 为 1\n", frames=FPS)
+        assert vm.variable("n", "角色1") == 0
+        vm.run_frames(1)
+        assert vm.variable("n", "角色1") == "1"
+
+    def test_stop_all(self, run):
+        """测试停止全部"""
+        vm = run("当绿旗被点击\n  重复执行\n    移动 1 步\n    如果 x坐标 > 2 那么\n      停止 全部\n"
+                           "    结束\n  结束\n", frames=10)
+        assert vm.sprite("角色1").x == 3
+        assert not vm.threads
+
+
+class TestProcedures:
+    """自定义积木测试类"""
+
+    def test_arguments(self, run):
+        """测试参数传递"""
+        definitions = "定义 移动到位置(x, y)\n  移到 ~x ~y\n结束\n"
+        vm = run("当绿旗被点击\n  移动到位置 100 50\n", definitions=definitions)
+        assert (vm.sprite("角色1").x, vm.sprite("角色1").y) == (100, 50)
+
+    def test_warp_runs_without_yielding(self, run):
+        """测试不刷新屏幕的积木中重绘的循环在一帧内执行完"""
+        definitions = "定义 走(k) 不刷新屏幕\n  重复 ~k 次\n    移动 1 步\n  结束\n结束\n"
+        vm = run("当绿旗被点击\n  走 50\n", frames=1, definitions=definitions)
+        assert vm.sprite("角色1").x == 50
+
+    def test_refresh_yields(self, run):
+        """测试刷新屏幕的积木中循环每帧一轮"""
+        definitions = "定义 走(k) 刷新屏幕\n  重复 ~k 次\n    移动 1 步\n  结束\n结束\n"
+        vm = run("当绿旗被点击\n  走 50\n", frames=3, definitions=definitions)
+        assert vm.sprite("角色1").x == 3
+
+    def test_recursion(self, run):
+        """测试递归调用"""
+        definitions = "定义 数(k)\n  如果 ~总数 < 50 那么\n    将 总数 增加 ~k\n    数 ~k\n  结束\n结束\n"
+        vm = run("当绿旗被点击\n  数 10\n", frames=20, definitions=definitions)
+        assert vm.variable("总数") == 50
+        assert vm.opcode_counts["procedures_call"] == 6
+
+
+class TestEvents:
+    """事件、广播和克隆体测试类"""
+
+    def test_broadcast(self, run):
+        """测试广播启动接收脚本"""
+        vm = run("当绿旗被点击\n  广播 完成\n", others="当收到 完成\n  添加 你好 到 记录\n")
+        assert vm.list("记录") == ["你好"]
+        assert vm.opcode_counts["event_broadcast"] == 1
+
+    def test_key_press(self, run):
+        """测试按键启动脚本"""
+        vm = run("当按下 空格 键\n  将 n 增加 1\n")
+        vm.press_key("空格")
+        vm.run_frames(1)
+        assert vm.variable("n", "角色1") == 1
+
+    def test_clones(self, run):
+        """测试克隆体有独立的变量并在删除后消失（等待请求重绘，每帧创建一个）"""
+        script = "当绿旗被点击\n  重复 3 次\n    克隆 自己\n  结束\n"
+        others = "当作为克隆体启动\n  将 n 增加 1\n  将 总数 增加 1\n  等待 1 秒\n  删除此克隆体\n"
+        vm = run(script, frames=3, others=others)
+        assert len(vm.clones("角色1")) == 3
+        assert all(clone.variable("n") == 1 for clone in vm.clones("角色1"))
+        assert vm.variable("n", "角色1") == 0
+        assert vm.variable("总数") == 3
+        vm.run_frames(FPS)
+        assert vm.clones("角色1") == []
+
+    def test_clone_limit(self, run):
+        """测试克隆体数量上限"""
+        vm = run("当绿旗被点击\n  重复 400 次\n    克隆 自己\n  结束\n", frames=1)
+        assert len(vm.clones("角色1")) == CLONE_LIMIT
+
+
+class TestInterpreter:
+    """解释器接口测试类"""
+
+    SCRIPT = "当绿旗被点击\n  重复执行\n    移动 (在 1 和 10 之间取随机数) 步\n    向右旋转 15 度\n  结束\n"
+
+    def test_deterministic(self, run):
+        """测试相同的种子得到相同的结果"""
+        first, second = run(self.SCRIPT, frames=30), run(self.SCRIPT, frames=30)
+        assert (first.sprite("角色1").x, first.sprite("角色1").y) == (second.sprite("角色1").x,
+                                                                     second.sprite("角色1").y)
+        assert first.opcode_counts == second.opcode_counts
+
+    def test_direction_wraps(self, run):
+        """测试方向保持在 -179 到 180 之间"""
+        vm = run(self.SCRIPT, frames=30)
+        assert -179 <= vm.sprite("角色1").direction <= 180
+
+    def test_load_sb3(self, run, tmp_path):
+        """测试从 .sb3 文件加载"""
+        run("当绿旗被点击\n  设置 总数 为 7\n")
+        vm = Interpreter.load(str(tmp_path / "out.sb3"))
+        vm.green_flag()
+        vm.run_frames(1)
+        assert vm.variable("总数") == "7"
+
+    def test_does_not_modify_project(self, compile_source):
+        """测试运行不修改项目"""
+        parser = compile_source(script="重复 5 次\n  将 n 增加 1\n  克隆 自己\n结束", variables="变量: n = 0\n").parser
+        before = json.dumps(parser.builder.project, sort_keys=True, default=json_default)
+        vm = Interpreter(parser.builder.project)
+        vm.green_flag()
+        vm.run_frames(5)
+        assert json.dumps(parser.builder.project, sort_keys=True, default=json_default) == before
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,84 @@
+"""
+lexer.py 单元测试
+"""
+import pytest
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.lexer import Lexer, TokenType
+from benchmarks.char_lexer import CharLexer
+from compiler.exceptions import ParseError
+
+
+def tokenize(lexer_class, text):
+    """返回 token 列表，或者 (错误信息, 错误位置)"""
+    try:
+        return lexer_class(text).tokenize()
+    except ParseError as e:
+        return str(e), e.line
+
+
+class TestEquivalence:
+    """与逐字符词法分析器结果一致性测试"""
+
+    @pytest.mark.parametrize("text", [
+        "",
+        "1 + 2 * (3 - 4) / 5 % 6",
+        "1.5e3 + 2E-4 - 3e+2",
+        "1e", "2ex", "1e+", "1.2.3", ".5", ".", "3.", "1..2",
+        "１２ + ３", "²", "1²", "x²",
+        "\"你好\" + 'world'", "\"未闭合", "'", "\"a\0b\"",
+        "~变量 + ~", "~玩家 分数",
+        "a = b", "a == b", "a != b", "a ≠ b", "a≠b", "!", "!!=",
+        "a >= 1 且 b <= 2 或 不是 c", "a > 1 and b < 2 or not c",
+        "sqrt(16) + abs(-1) + 四舍五入(2.5)",
+        "向下取整(x) 不 是",
+        "a　+\tb\r\n",
+        "[", "a @ b", "1 + #", "\0",
+    ])
+    def test_edge_cases(self, text):
+        """测试各类边界情况，包括错误信息和位置"""
+        assert tokenize(Lexer, text) == tokenize(CharLexer, text)
+
+    def test_random_fuzz(self):
+        """随机输入与逐字符实现一致"""
+        pool = list("0123456789.eE+-*/%\"'~<>=!≠(), _ax") + [
+            "　", "且", "不是", "sqrt", "²", "１", "\0", "[", "and", "中"]
+        rng = random.Random(2024)
+        for _ in range(20000):
+            text = "".join(rng.choice(pool) for _ in range(rng.randint(0, 12)))
+            assert tokenize(Lexer, text) == tokenize(CharLexer, text), repr(text)
+
+
+class TestTokens:
+    """token 流测试类"""
+
+    def test_logic_words_and_functions(self):
+        """测试中文逻辑词和函数名"""
+        types = [token.type for token in Lexer("不是 abs(x) 且 y").tokenize()]
+        assert types == [TokenType.LOGIC, TokenType.FUNCTION, TokenType.LPAREN, TokenType.STRING,
+                         TokenType.RPAREN, TokenType.LOGIC, TokenType.STRING, TokenType.EOF]
+        assert Lexer("不是 x").tokenize()[0].value == "非"
+
+    def test_scientific_notation(self):
+        """测试科学计数法"""
+        token = Lexer("6.02e23").tokenize()[0]
+        assert token.type == TokenType.NUMBER and token.value == 6.02e23
+
+    def test_not_equal(self):
+        """测试 != 统一为 ≠，紧贴单词的 ≠ 属于单词本身"""
+        assert [Lexer(text).tokenize()[1].value for text in ("a != b", "a ≠ b")] == ["≠", "≠"]
+        assert Lexer("a≠b").tokenize()[0].value == "a≠b"
+
+    def test_invalid_character(self):
+        """测试无效字符抛出 ParseError 而不是死循环"""
+        with pytest.raises(ParseError) as exc_info:
+            Lexer("1 + [2]").tokenize()
+        assert exc_info.value.line == 4
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,135 @@
+"""
+memo.py 单元测试
+"""
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPEATED = """: 开始
+@ 舞台
+变量: 分数 = 0
+# 角色1
+变量: 速度 = 3
+当绿旗被点击
+  重复执行
+    将x坐标增加 (~速度 + 1) * 2
+    将y坐标增加 (~速度 + 1) * 2
+    如果 ~分数 > 10 那么
+      说 从 1 到 10 随机选一个数
+    结束
+    如果 ~分数 > 10 那么
+      说 从 1 到 10 随机选一个数
+    结束
+  结束
+"""
+
+
+def sprite(parser, name="角色1"):
+    return next(target for target in parser.builder.project["targets"] if target["name"] == name)
+
+
+def sprite_blocks(parser, name="角色1"):
+    return sprite(parser, name)["blocks"]
+
+
+def variable_ids(blocks, name):
+    """按出现顺序列出引用变量 name 的 data_variable 积木中的变量 ID"""
+    return [block["fields"]["VARIABLE"][1] for block in blocks.values()
+            if block["opcode"] == "data_variable" and block["fields"]["VARIABLE"][0] == name]
+
+
+class TestExpressionCache:
+    """表达式缓存测试类"""
+
+    def test_same_project_as_uncached(self, compile_source):
+        """测试开启缓存（包括容量很小时）与不开启时生成的项目相同"""
+        expected = compile_source(REPEATED, save=False, expression_cache_size=0).parser.builder.project
+        for size in (1024, 1):
+            assert compile_source(REPEATED, save=False, expression_cache_size=size).parser.builder.project == expected
+
+    def test_hits_create_fresh_blocks(self, compile_source):
+        """测试命中时复制出新的积木并正确连接 parent"""
+        parser = compile_source(REPEATED, save=False).parser
+        stats = parser.expression_cache.stats
+        assert stats.hits >= 2 and stats.misses > 0
+        blocks = sprite_blocks(parser)
+        multiplies = [block_id for block_id, block in blocks.items() if block["opcode"] == "operator_multiply"]
+        assert len(multiplies) == 2
+        for block_id in multiplies:
+            child = blocks[block_id]["inputs"]["NUM1"][1]
+            assert blocks[child]["opcode"] == "operator_add" and blocks[child]["parent"] == block_id
+            assert blocks[blocks[block_id]["parent"]]["opcode"] == "motion_changexby" or \
+                blocks[blocks[block_id]["parent"]]["opcode"] == "motion_changeyby"
+
+    def test_disabled(self, compile_source):
+        """测试容量为 0 时不缓存"""
+        parser = compile_source(REPEATED, save=False, expression_cache_size=0).parser
+        assert parser.expression_cache.stats.hits == 0 and len(parser.expression_cache) == 0
+
+    def test_eviction(self, compile_source):
+        """测试超出容量时淘汰最久未使用的条目"""
+        parser = compile_source(REPEATED, save=False, expression_cache_size=1).parser
+        assert len(parser.expression_cache) <= 1
+        assert parser.expression_cache.stats.evictions > 0
+
+    def test_declaration_invalidates(self, compile_source):
+        """测试声明变量后，之前解析时还不存在该变量的表达式重新解析"""
+        source = """# 角色1
+定义 前进()
+  将x坐标增加 ~分数 + 1
+结束
+变量: 分数 = 5
+当绿旗被点击
+  将x坐标增加 ~分数 + 1
+"""
+        parser = compile_source(source, save=False).parser
+        builder = parser.builder
+        var_id = builder.symbols(sprite(parser)).lookup("variable", "分数").id
+        assert variable_ids(sprite_blocks(parser), "分数") == [None, var_id]
+        assert parser.expression_cache.stats.invalidations >= 1
+
+    def test_targets_resolve_separately(self, compile_source):
+        """测试同一表达式在不同角色中解析到各自的局部变量"""
+        source = """: 开始
+# 角色1
+变量: 速度 = 1
+当绿旗被点击
+  将x坐标增加 ~速度 + 1
+# 角色2
+变量: 速度 = 2
+当绿旗被点击
+  将x坐标增加 ~速度 + 1
+"""
+        parser = compile_source(source, save=False).parser
+        builder = parser.builder
+        for target in (sprite(parser, "角色1"), sprite(parser, "角色2")):
+            expected = builder.symbols(target).lookup("variable", "速度").id
+            assert variable_ids(target["blocks"], "速度") == [expected]
+
+    def test_warnings_not_cached(self, compile_source):
+        """测试含未定义变量的表达式每次出现都打印警告"""
+        source = "# 角色1\n当绿旗被点击\n  说 ~不存在\n  说 ~不存在\n"
+        output = compile_source(source, save=False).output
+        assert output.count("未定义的变量 '~不存在'") == 2
+
+    def test_custom_block_arguments(self, compile_source):
+        """测试自定义积木参数与同名变量分别缓存"""
+        source = """# 角色1
+变量: n = 0
+定义 跳(n)
+  将y坐标增加 ~n
+结束
+当绿旗被点击
+  将y坐标增加 ~n
+"""
+        parser = compile_source(source, save=False).parser
+        blocks = sprite_blocks(parser)
+        opcodes = sorted(blocks[block["inputs"]["DY"][1]]["opcode"]
+                         for block in blocks.values() if block["opcode"] == "motion_changeyby")
+        assert opcodes == ["argument_reporter_string_number", "data_variable"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,87 @@
+"""
+parallel.py 单元测试
+"""
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.exceptions import SecurityError
+from compiler.parallel import resolve_jobs
+
+CODE = (": 开始\n@ 舞台\n变量: 分数 = 0\n"
+        "# 角色A\n定义 跳(高度)\n  移动 1 步\n当绿旗被点击\n  将 分数 增加 1\n  跳(5)\n  广播 开始\n"
+        "# 角色B\n当收到 开始\n  说 你好 2 秒\n  使用 画笔 落笔\n"
+        "@\n变量: 生命 = 3\n当绿旗被点击\n  广播 结束\n"
+        "# 角色C\n当收到 结束\n  将 生命 增加 -1\n"
+        "# 角色A\n当绿旗被点击\n  跳(1)\n")
+
+
+class TestParallelCompile:
+    """并行编译测试类"""
+
+    def test_resolve_jobs(self):
+        """测试进程数规范化"""
+        assert resolve_jobs(None) == 1
+        assert resolve_jobs(3) == 3
+        assert resolve_jobs(0) >= 1
+
+    @pytest.mark.parametrize("mode", ["counter", "reproducible"])
+    def test_matches_serial(self, compile_source, mode):
+        """测试并行编译的输出和控制台信息与串行编译相同"""
+        _, serial_log, serial = compile_source(CODE, name="a.sb3", id_mode=mode)
+        parser, parallel_log, parallel = compile_source(CODE, name="b.sb3", id_mode=mode, jobs=2)
+        assert parallel == serial
+        assert parallel_log == serial_log
+        assert parser.incremental_stats.rebuilt == ["角色A", "角色B", "角色C", "角色A"]
+
+    def test_source_lines_match_serial(self, compile_source):
+        """测试工作进程编译的角色也记录积木的源码行号"""
+        serial_parser = compile_source(CODE, name="a.sb3").parser
+        parser = compile_source(CODE, name="b.sb3", jobs=2).parser
+        assert parser.source_lines() == serial_parser.source_lines()
+        assert parser.frame_cost == serial_parser.frame_cost
+
+    def test_random_mode_structure(self, compile_source):
+        """测试 random 模式下除 ID 外结构一致，广播 ID 在各角色间一致"""
+        serial_parser = compile_source(CODE, name="a.sb3", id_mode="random").parser
+        parser = compile_source(CODE, name="b.sb3", id_mode="random", jobs=2).parser
+        targets = parser.builder.project["targets"]
+        assert [t["name"] for t in targets] == [t["name"] for t in serial_parser.builder.project["targets"]]
+        stage = targets[0]
+        for target in targets[1:]:
+            for block in target["blocks"].values():
+                if block["opcode"] == "event_whenbroadcastreceived":
+                    name, broadcast_id = block["fields"]["BROADCAST_OPTION"]
+                    assert stage["broadcasts"][broadcast_id] == name
+
+    def test_backdrop_in_sprite_section(self, compile_source, tmp_path):
+        """测试含 "背景:" 的角色区段在主进程中编译"""
+        svg = tmp_path / "bg.svg"
+        svg.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="480" height="360"></svg>')
+        code = ": 开始\n# 角色A\n背景: bg.svg\n变量: x = 1\n# 角色B\n当绿旗被点击\n  将 x 增加 1\n"
+        serial = compile_source(code, name="a.sb3").data
+        parallel = compile_source(code, name="b.sb3", jobs=2).data
+        assert parallel == serial
+
+    def test_with_incremental_cache(self, compile_source):
+        """测试并行编译与增量缓存同时使用"""
+        serial = compile_source(CODE, name="a.sb3").data
+        compile_source(CODE, name="b.sb3", jobs=2, incremental=True)
+        parser, _, warm = compile_source(CODE, name="c.sb3", jobs=2, incremental=True)
+        assert warm == serial
+        assert parser.incremental_stats.reused == ["角色A", "角色B", "角色C", "角色A"]
+
+    def test_worker_error_reported(self, compile_source):
+        """测试工作进程出错时报告与串行编译相同的错误"""
+        code = ": 开始\n# 角色A\n造型: ../../外部.png\n"
+        with pytest.raises(SecurityError) as serial_error:
+            compile_source(code)
+        with pytest.raises(SecurityError) as parallel_error:
+            compile_source(code, jobs=2)
+        assert str(parallel_error.value) == str(serial_error.value)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -9,8 +9,10 @@ import tempfile
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from compiler.parser import ScratchLangParser
+from compiler.blockrecord import is_block
+from compiler.parser import ScratchLangParser, main
 from compiler.exceptions import SecurityError
+from compiler.preprocessor import preprocess
 
 
 class TestScratchLangParser:
@@ -85,7 +87,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "event_whenflagclicked" in opcodes
 
     def test_parse_key_press_event(self):
@@ -98,7 +100,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "event_whenkeypressed" in opcodes
 
     # ==================== 动作积木测试 ====================
@@ -113,7 +115,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "motion_movesteps" in opcodes
 
     def test_parse_goto_xy(self):
@@ -126,7 +128,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "motion_gotoxy" in opcodes
 
     def test_parse_turn_right(self):
@@ -139,7 +141,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "motion_turnright" in opcodes
 
     # ==================== 控制积木测试 ====================
@@ -156,7 +158,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "control_repeat" in opcodes
 
     def test_parse_forever_block(self):
@@ -171,7 +173,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "control_forever" in opcodes
 
     def test_parse_if_block(self):
@@ -186,7 +188,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "control_if" in opcodes
 
     def test_parse_if_else_block(self):
@@ -203,7 +205,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "control_if_else" in opcodes
 
     # ==================== 变量测试 ====================
@@ -247,7 +249,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "operator_gt" in opcodes
 
     def test_parse_less_than(self):
@@ -262,7 +264,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         assert "operator_lt" in opcodes
 
     def test_parse_greater_equal(self):
@@ -277,7 +279,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         # >= 实现为 not (a < b)
         assert "operator_not" in opcodes
         assert "operator_lt" in opcodes
@@ -294,7 +296,7 @@ class TestScratchLangParser:
         result = self.parser.parse(code)
         sprite = next(t for t in result.project["targets"] if t["name"] == "小猫")
         blocks = sprite["blocks"]
-        opcodes = [b["opcode"] for b in blocks.values() if isinstance(b, dict)]
+        opcodes = [b["opcode"] for b in blocks.values() if is_block(b)]
         # <= 实现为 not (a > b)
         assert "operator_not" in opcodes
         assert "operator_gt" in opcodes
@@ -418,7 +420,7 @@ class TestNewFeatures:
 多行
 字符串""" 2 秒
 '''
-        cleaned = self.parser._process_multiline_strings(code)
+        cleaned = '\n'.join(preprocess(code).lines)
         assert '"""' not in cleaned
         assert '\\n' in cleaned
 
@@ -438,7 +440,8 @@ console.log('test');
 
 # 小猫
 """
-        cleaned, js_blocks = self.parser._extract_js_blocks(code)
+        result = preprocess(code)
+        cleaned, js_blocks = '\n'.join(result.lines), result.js_blocks
         assert len(js_blocks) == 1
         assert 'console.log' in js_blocks[0]
         assert '#code#' not in cleaned
@@ -470,5 +473,31 @@ console.log('block2');
         assert 'console.log' in extension_urls['inlinecode1']
 
 
+class TestCommandLine:
+    """python -m compiler.parser 命令行测试类"""
+
+    def test_compile(self, tmp_path, capsys):
+        """测试编译单个文件到 -o 指定的输出文件"""
+        (tmp_path / "a.sl").write_text(": 开始\n# 角色1\n说 你好\n", encoding="utf-8")
+        output = tmp_path / "a.sb3"
+        assert main([str(tmp_path / "a.sl"), "-o", str(output), "--jobs", "1"]) == 0
+        assert output.exists()
+        assert f"编译成功: {output}" in capsys.readouterr().out
+
+    @pytest.mark.parametrize("argv", [
+        ["a.sl", "--jobs"],
+        ["a.sl", "--jobs", "two"],
+        ["a.sl", "--unknown", "x"],
+        ["a.sl", "-o"],
+        [],
+    ])
+    def test_bad_arguments(self, argv, capsys):
+        """测试缺少值、非整数和未知的参数报告用法错误"""
+        with pytest.raises(SystemExit) as exc_info:
+            main(argv)
+        assert exc_info.value.code == 2
+        assert "usage: python -m compiler.parser" in capsys.readouterr().err
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
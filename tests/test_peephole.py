@@ -0,0 +1,201 @@
+"""
+peephole.py 单元测试
+"""
+import pytest
+import copy
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockgraph import check_links, stack, substack
+from compiler.peephole import DEFAULT_RULES, RULES, PeepholeOptimizer
+
+
+SPRITE_VARIABLES = "变量: a = 0\n"
+
+
+@pytest.fixture
+def parse_script(compile_source):
+    """只解析绿旗脚本（不经过 compile 中的优化），返回角色的积木"""
+    return lambda body: compile_source(script=body, save=False).sprite["blocks"]
+
+
+def opcodes(blocks, first_id):
+    """栈中积木的操作码，C 形积木的子栈展开为嵌套列表"""
+    result = []
+    for block_id in stack(blocks, first_id):
+        block = blocks[block_id]
+        result.append(block["opcode"])
+        for name in ("SUBSTACK", "SUBSTACK2"):
+            if substack(block, name):
+                result.append(opcodes(blocks, substack(block, name)))
+    return result
+
+
+def script(blocks):
+    """绿旗脚本（不含事件积木）的操作码"""
+    hat = next(block for block in blocks.values() if block["topLevel"])
+    return opcodes(blocks, hat["next"])
+
+
+def optimize(blocks, rules=DEFAULT_RULES):
+    optimizer = PeepholeOptimizer(rules)
+    optimizer.optimize(blocks)
+    assert check_links(blocks) == []
+    return optimizer.stats
+
+
+def random_program(rng, depth=0):
+    """生成随机的脚本行"""
+    lines = []
+    for _ in range(rng.randint(1, 6)):
+        roll = rng.random()
+        n = rng.choice(["0", "1", "2", "-1", "-3", "0.5", "7", "300", "-300"])
+        if roll < 0.12:
+            lines.append(f"将x坐标增加 {n}")
+        elif roll < 0.2:
+            lines.append(f"将y坐标增加 {n}")
+        elif roll < 0.27:
+            lines.append(f"将大小增加 {n}")
+        elif roll < 0.32:
+            lines.append(f"将音量增加 {n}")
+        elif roll < 0.42:
+            lines.append(f"将 a 增加 {n}")
+        elif roll < 0.47:
+            lines.append(f"设置 a 为 {rng.choice(['0', '2.5', '你好', '~a + 1'])}")
+        elif roll < 0.57:
+            lines.append(f"等待 {rng.choice(['0', '0.1', '1', '-1', '0.25'])} 秒")
+        elif roll < 0.62:
+            lines.append("说 ~a")
+        elif depth < 2 and roll < 0.75:
+            lines.append(f"重复 {rng.choice(['0', '1', '2', '0.4', '1.5', '-2', '~a'])} 次")
+            lines += ["  " + line for line in random_program(rng, depth + 1)]
+            lines.append("结束")
+        elif depth < 2:
+            condition = rng.choice(["1 = 1", "1 > 2", "~a > 1", "\"a\" = \"A\"", "不是 (1 = 2)",
+                                    "1 < 2 且 ~a = 0", "1 > 2 或 2 > 1", "~a < 3 或 1 = 2"])
+            lines.append(f"如果 {condition} 那么")
+            if rng.random() < 0.8:
+                lines += ["  " + line for line in random_program(rng, depth + 1)]
+            if rng.random() < 0.4:
+                lines.append("否则")
+                if rng.random() < 0.7:
+                    lines += ["  " + line for line in random_program(rng, depth + 1)]
+            lines.append("结束")
+    return lines
+
+
+class TestRules:
+    """规则测试类"""
+
+    def test_noop_change(self, parse_script):
+        """测试删除改变量为 0 的积木，但保留 "将变量增加 0"（会把文本变成数字）"""
+        blocks = parse_script("将x坐标增加 0\n将大小增加 0\n将 a 增加 0\n说 你好")
+        stats = optimize(blocks)
+        assert script(blocks) == ["data_changevariableby", "looks_say"]
+        assert stats.rules == {"noop_change": 2} and stats.removed_blocks == 2
+
+    def test_merge_change(self, parse_script):
+        """测试合并相邻的同类增加积木，异号的位置改变不合并"""
+        blocks = parse_script("将 a 增加 2\n将 a 增加 -3\n将x坐标增加 10\n将x坐标增加 5\n将y坐标增加 10\n将y坐标增加 -5")
+        stats = optimize(blocks)
+        assert script(blocks) == ["data_changevariableby", "motion_changexby", "motion_changeyby", "motion_changeyby"]
+        hat = next(block for block in blocks.values() if block["topLevel"])
+        first = blocks[hat["next"]]
+        assert first["inputs"]["VALUE"] == [1, [4, "-1"]]
+        assert blocks[first["next"]]["inputs"]["DX"] == [1, [4, "15"]]
+        assert stats.rules == {"merge_change": 2}
+
+    def test_merge_wait(self, parse_script):
+        """测试合并相邻的等待，负数按 0 计"""
+        blocks = parse_script("等待 1 秒\n等待 0.5 秒\n等待 -2 秒\n说 好")
+        optimize(blocks)
+        assert script(blocks) == ["control_wait", "looks_say"]
+        hat = next(block for block in blocks.values() if block["topLevel"])
+        assert blocks[hat["next"]]["inputs"]["DURATION"] == [1, [4, "1.5"]]
+
+    def test_wait_zero_is_opt_in(self, parse_script):
+        """测试 "等待 0 秒" 默认保留，启用 wait_zero 规则时删除"""
+        blocks = parse_script("等待 0 秒\n说 好")
+        assert optimize(blocks).rules == {}
+        optimize(blocks, RULES)
+        assert script(blocks) == ["looks_say"]
+
+    def test_repeat(self, parse_script):
+        """测试展开 "重复 1 次"、删除 "重复 0 次"，次数按四舍五入计算"""
+        blocks = parse_script("重复 1 次\n  说 一\n  说 二\n结束\n重复 0.4 次\n  说 三\n结束\n说 四")
+        stats = optimize(blocks)
+        assert script(blocks) == ["looks_say", "looks_say", "looks_say"]
+        assert stats.rules == {"repeat_once": 1, "repeat_zero": 1}
+        assert stats.removed_blocks == 3
+
+    def test_constant_if(self, parse_script):
+        """测试常量条件的如果换成执行的分支"""
+        blocks = parse_script("如果 1 = 1 那么\n  说 是\n否则\n  说 否\n结束\n"
+                              "如果 9 > 10 那么\n  说 大\n结束\n说 完")
+        stats = optimize(blocks)
+        assert script(blocks) == ["looks_say", "looks_say"]
+        said = [blocks[block_id]["inputs"]["MESSAGE"] for block_id in stack(blocks, blocks[next(
+            block_id for block_id, block in blocks.items() if block["topLevel"])]["next"])]
+        assert said == [[1, [10, "是"]], [1, [10, "完"]]]
+        assert stats.rules == {"constant_if": 2}
+
+    def test_empty_if(self, parse_script):
+        """测试删除空的如果，条件有变量也可以删除；否则分支为空时改成如果"""
+        blocks = parse_script("如果 ~a > 1 那么\n结束\n如果 ~a = 2 那么\n  说 是\n否则\n结束")
+        stats = optimize(blocks)
+        assert script(blocks) == ["control_if", ["looks_say"]]
+        assert stats.rules == {"empty_if": 1, "empty_else": 1}
+
+    def test_keeps_unparsed_code(self, parse_script):
+        """测试不删除非数字的重复次数（通常是没写完的代码）"""
+        blocks = parse_script("重复 ? 次\n  说 好\n结束")
+        assert optimize(blocks).rules == {}
+
+    def test_keeps_text_comparison(self, parse_script):
+        """测试比较文本的条件不折叠（经典乒乓球_完美版.sl 中没解析出来的表达式）"""
+        blocks = parse_script("如果 (\"90\" > abs 方向) 那么\n  设置 a 为 1\n结束\n"
+                              "如果 \"a\" = \"A\" 那么\n  说 好\n结束")
+        assert optimize(blocks).rules == {}
+        assert script(blocks) == ["control_if", ["data_setvariableto"], "control_if", ["looks_say"]]
+
+    def test_unknown_rule(self):
+        """测试未知规则名"""
+        with pytest.raises(ValueError):
+            PeepholeOptimizer(["不存在"])
+
+
+class TestIntegration:
+    """编译流程测试类"""
+
+    def test_compile_runs_optimizer(self, compile_source):
+        """测试 compile 保存前优化，peephole=False 时不优化"""
+        body = "将x坐标增加 0\n说 好"
+        compiled = compile_source(script=body)
+        assert script(compiled.sprite["blocks"]) == ["looks_say"]
+        assert compiled.parser.peephole.stats.rules == {"noop_change": 1}
+
+        compiled = compile_source(script=body, peephole=False)
+        assert script(compiled.sprite["blocks"]) == ["motion_changexby", "looks_say"]
+        assert compiled.parser.peephole.stats.removed_blocks == 0
+
+
+class TestFuzz:
+    """随机程序的语义等价测试类"""
+
+    @pytest.mark.parametrize("seed", range(300))
+    def test_equivalent(self, compile_source, run_project, seed):
+        """测试优化前后执行结果相同、积木图指针一致"""
+        rng = random.Random(seed)
+        original = compile_source(script="\n".join(random_program(rng)), save=False).parser.builder.project
+        project = copy.deepcopy(original)
+        blocks = project["targets"][1]["blocks"]
+        stats = optimize(blocks, RULES if seed % 2 else DEFAULT_RULES)
+        assert run_project(project) == run_project(original)
+        assert len(original["targets"][1]["blocks"]) - len(blocks) == stats.removed_blocks
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
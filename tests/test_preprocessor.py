@@ -0,0 +1,126 @@
+"""
+preprocessor.py 单元测试
+"""
+import pytest
+import glob
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.parser import ScratchLangParser
+from compiler.preprocessor import preprocess
+from benchmarks.preprocess_steps import four_pass
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+
+def single_pass(source):
+    result = preprocess(source)
+    return result.lines, result.extension_files, result.js_blocks
+
+
+class TestEquivalence:
+    """与四步预处理结果一致性测试"""
+
+    @pytest.mark.parametrize("source", [
+        "",
+        "移动 10 步\n",
+        "a /* 注释 */ b",
+        "a /* 跨\n越\n行 */ b\nc",
+        "/* 未闭合的注释\n还在注释里",
+        '说 """第一行\n第二行""" 2 秒',
+        '"""未闭合的字符串\n结尾',
+        '"""字符串里 /* 注释\n */ 继续"""',
+        'a""/**/"b"""',
+        '"""x""/**/"y',
+        '""""四个引号"""',
+        '导入扩展: "ext.js"\nimport extension: \'b.js\'',
+        "  #code#\nconsole.log(1)\n导入扩展: \"x.js\"\n#end#\n移动 1 步",
+        "#code#\n未闭合",
+        "#code#\na\n#code#\nb\n#end#",
+        "#end#\n",
+    ])
+    def test_edge_cases(self, source):
+        """测试各类边界情况"""
+        assert single_pass(source) == four_pass(source)
+
+    def test_examples(self):
+        """测试所有示例程序"""
+        for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.sl"))):
+            with open(path, encoding="utf-8") as f:
+                source = f.read()
+            assert single_pass(source) == four_pass(source), path
+
+    def test_random_sources(self):
+        """测试随机拼接的源码"""
+        rng = random.Random(0)
+        pieces = ['a', ' ', '\n', '"', '"""', '/*', '*/', '/', '*',
+                  '#code#', '#end#', '\n#code#\n', '\n#end#\n', '导入扩展: "e.js"']
+        for _ in range(3000):
+            source = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+            assert single_pass(source) == four_pass(source), repr(source)
+
+
+class TestLineMap:
+    """行映射测试"""
+
+    def test_plain_lines(self):
+        """测试没有注释时逻辑行与原始行一一对应"""
+        result = preprocess("a\nb\nc")
+        assert [result.line_map.locate(i) for i in range(3)] == [(1, 1), (2, 1), (3, 1)]
+
+    def test_lines_after_multiline_string(self):
+        """测试多行字符串合并行后的行号"""
+        source = 'a\n说 """x\ny""" b\nc'
+        result = preprocess(source)
+        assert result.lines == ['a', '说 "x\\ny" b', 'c']
+        assert result.line_map.original_line(2) == 4
+        # "b" 位于原始第 3 行第 6 列
+        assert result.line_map.locate(1, result.lines[1].index('b') + 1) == (3, 6)
+
+    def test_columns_after_comment(self):
+        """测试块注释之后的列号"""
+        source = 'ab /* x */cd\n/* y\n */ef'
+        result = preprocess(source)
+        original = source.split('\n')
+        for index, line in enumerate(result.lines):
+            for column, char in enumerate(line, 1):
+                line_no, original_column = result.line_map.locate(index, column)
+                assert original[line_no - 1][original_column - 1] == char
+
+
+class TestRecords:
+    """类型化记录测试"""
+
+    def test_records(self):
+        """测试注释、字符串、导入和代码块记录"""
+        source = ('/* 头部 */\n'
+                  '导入扩展: "ext.js"\n'
+                  '说 """多\n行"""\n'
+                  '    #code#\n'
+                  'run()\n'
+                  '#end#\n')
+        result = preprocess(source)
+
+        assert [(c.text, c.line, c.column, c.end_line, c.end_column) for c in result.comments] == \
+            [(" 头部 ", 1, 1, 1, 9)]
+        assert [(s.value, s.line, s.column) for s in result.strings] == [("多\n行", 3, 3)]
+        assert [(i.path, i.line) for i in result.imports] == [("ext.js", 2)]
+
+        block = result.code_blocks[0]
+        assert block.code == "run()"
+        assert block.placeholder == "    __INLINE_CODE_1__"
+        assert block.line == 5
+        assert result.lines[block.logical_line] == block.placeholder
+
+    def test_parser_uses_line_map(self):
+        """测试解析器保存行映射"""
+        parser = ScratchLangParser()
+        parser.parse('/* 注释\n*/\n: 开始\n# 角色1\n当绿旗被点击\n  移动 10 步\n')
+        assert parser.line_map.original_line(2) == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
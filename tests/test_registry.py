@@ -0,0 +1,159 @@
+"""
+registry.py 单元测试
+"""
+import pytest
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blocks import BlockDefinitions
+from compiler.cache import CACHE_DIR_ENV
+from compiler.parser import ScratchLangParser
+from compiler import registry as registry_module
+from compiler.registry import BlockRegistry, build_registry, get_registry
+
+SAMPLE_LINES = [
+    "当绿旗被点击",
+    "when I receive 开始",
+    "当按下 空格 键",
+    "移动 10 步",
+    "小猫 的 x坐标",
+    "sqrt 9",
+    "如果 <碰到 边缘> 那么",
+    "",
+]
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path))
+    return tmp_path
+
+
+class TestBlockRegistry:
+    """BlockRegistry 测试类"""
+
+    def test_registry_is_shared(self):
+        """测试进程内只构建一次，解析器共享同一个注册表"""
+        assert get_registry() is get_registry()
+        assert ScratchLangParser().dispatcher is ScratchLangParser().dispatcher
+
+    def test_registry_is_read_only(self):
+        """测试注册表不可修改"""
+        registry = get_registry()
+        with pytest.raises(AttributeError):
+            registry.dispatcher = None
+        with pytest.raises(TypeError):
+            registry.blocks["新积木"] = {}
+
+    def test_is_event_matches_event_patterns(self):
+        """测试事件判断与逐个匹配事件 pattern 一致"""
+        registry = get_registry()
+        patterns = [block["pattern"] for block in BlockDefinitions.EVENTS.values()]
+        for line in SAMPLE_LINES:
+            expected = any(re.search(pattern, line) for pattern in patterns)
+            assert registry.is_event(line) == expected, line
+
+    def test_by_opcode(self):
+        """测试 opcode 到积木定义的映射"""
+        registry = get_registry()
+        assert registry.by_opcode["motion_movesteps"] == ("移动步",)
+        assert registry.definition_for_opcode("motion_movesteps")["pattern"].startswith("移动")
+        assert registry.definition_for_opcode("no_such_opcode") is None
+
+
+class TestRegistryCache:
+    """注册表磁盘缓存测试类"""
+
+    def test_cache_round_trip(self, cache_dir):
+        """测试第二次构建从缓存加载且结果一致"""
+        first = build_registry()
+        assert not first.from_cache
+        assert os.path.exists(first.cache_path)
+
+        second = build_registry()
+        assert second.from_cache
+        assert second.dispatcher.to_state() == first.dispatcher.to_state()
+        assert dict(second.by_opcode) == dict(first.by_opcode)
+        for name, regex in first.patterns.items():
+            restored = second.patterns[name]
+            assert restored.pattern == regex.pattern
+            assert restored.groups == regex.groups
+            for line in SAMPLE_LINES:
+                a, b = regex.search(line), restored.search(line)
+                assert (a and a.groups()) == (b and b.groups())
+        for line in SAMPLE_LINES:
+            assert second.is_event(line) == first.is_event(line)
+
+    def test_corrupt_cache_is_rebuilt(self, cache_dir):
+        """测试缓存文件损坏时重新构建"""
+        path = build_registry().cache_path
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{not json")
+        registry = build_registry()
+        assert not registry.from_cache
+        assert build_registry().from_cache
+
+    def test_tampered_cache_is_rebuilt_and_saved(self, cache_dir):
+        """测试缓存中的分析结果被篡改时重新分析并重新写入，积木仍能匹配"""
+        path = build_registry().cache_path
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        position = data["dispatcher"]["names"].index("移动步")
+        for positions in data["dispatcher"]["anchors"].values():
+            if position in positions:
+                positions.remove(position)
+        if position in data["dispatcher"]["fallback"]:
+            data["dispatcher"]["fallback"].remove(position)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+        registry = build_registry()
+        assert not registry.from_cache
+        assert registry.dispatcher.match("移动 10 步").name == "移动步"
+        assert registry.patterns["移动步"].search("移动 10 步")
+        assert build_registry().from_cache
+
+    def test_cache_has_no_regex_internals(self, cache_dir):
+        """测试缓存只保存 pattern 分析结果，正则总是重新编译"""
+        path = build_registry().cache_path
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        assert set(data) == {"version", "fingerprint", "dispatcher"}
+
+    def test_changed_definitions_invalidate_cache(self, cache_dir):
+        """测试积木定义变化时缓存失效"""
+        blocks = {"显示": {"opcode": "looks_show", "pattern": r"^显示$"}}
+        BlockRegistry(blocks, ())
+        changed = {"显示": {"opcode": "looks_show", "pattern": r"^显示角色$"}}
+        registry = BlockRegistry(changed, ())
+        assert not registry.from_cache
+        assert registry.dispatcher.match("显示角色").name == "显示"
+
+    def test_changed_analysis_invalidates_cache(self, cache_dir, monkeypatch):
+        """测试 dispatcher.py 的 pattern 分析算法变化（未递增版本号）时缓存失效"""
+        assert not build_registry().from_cache
+        assert build_registry().from_cache
+        monkeypatch.setattr(registry_module, "analysis_fingerprint", lambda: "changed")
+        assert not build_registry().from_cache
+        assert build_registry().from_cache
+
+        # 读不到 dispatcher.py 源码时不读写缓存
+        monkeypatch.setattr(registry_module, "analysis_fingerprint", lambda: None)
+        registry = build_registry()
+        assert not registry.from_cache
+        assert registry.dispatcher.match("移动 10 步").name == "移动步"
+
+    def test_cache_can_be_disabled(self, monkeypatch):
+        """测试缓存目录设为空时不读写缓存"""
+        monkeypatch.setenv(CACHE_DIR_ENV, "")
+        registry = build_registry()
+        assert registry.cache_path is None
+        assert not registry.from_cache
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,180 @@
+"""
+symbols.py 单元测试
+"""
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockrecord import is_block
+from compiler.builder import SB3Builder
+from compiler.symbols import SymbolTable, VARIABLE, LIST, BROADCAST
+
+
+def blocks_by_opcode(target, opcode):
+    return [b for b in target["blocks"].values() if is_block(b) and b.get("opcode") == opcode]
+
+
+def snapshot(table):
+    """符号表内容（与登记顺序无关）"""
+    symbols = sorted((s.id, s.name, s.kind, s.cloud) for s in table.symbols())
+    names = {kind: {name: s.id for name, s in index.items()} for kind, index in table.by_name.items()}
+    return symbols, names
+
+
+class TestSymbolTable:
+    """SymbolTable 测试类"""
+
+    def test_define_and_lookup(self):
+        """测试按名称和 ID 查找"""
+        table = SymbolTable({})
+        symbol = table.define(VARIABLE, "分数", "id1")
+        assert table.lookup(VARIABLE, "分数") is symbol
+        assert table.get("id1") is symbol
+        assert table.lookup(LIST, "分数") is None
+
+    def test_first_definition_wins(self):
+        """测试同名符号按第一个登记的解析"""
+        table = SymbolTable({})
+        table.define(LIST, "数据", "a")
+        table.define(LIST, "数据", "b")
+        assert table.lookup(LIST, "数据").id == "a"
+        assert table.get("b").name == "数据"
+
+    def test_from_target(self):
+        """测试根据已有 target 建立符号表"""
+        target = {
+            "variables": {"v": ["分数", 0], "c": ["☁ 最高分", 0, True]},
+            "lists": {"l": ["数据", []]},
+            "broadcasts": {"b": "开始"},
+        }
+        table = SymbolTable.from_target(target)
+        assert table.lookup(VARIABLE, "分数").id == "v"
+        assert [s.id for s in table.cloud_variables()] == ["c"]
+        assert table.lookup(LIST, "数据").id == "l"
+        assert table.lookup(BROADCAST, "开始").id == "b"
+
+    def test_create_and_remove(self):
+        """测试新建和删除符号时 target 与索引同时更新，同名的下一个符号接替名称索引"""
+        target = {"variables": {}, "lists": {}, "broadcasts": {}}
+        table = SymbolTable(target)
+        table.create(VARIABLE, "分数", "a")
+        table.create(VARIABLE, "分数", "b", 5)
+        table.create(LIST, "数据", "l")
+        table.create(BROADCAST, "开始", "m")
+        assert target == {"variables": {"a": ["分数", 0], "b": ["分数", 5]},
+                          "lists": {"l": ["数据", []]}, "broadcasts": {"m": "开始"}}
+
+        assert table.remove("a").name == "分数"
+        assert table.lookup(VARIABLE, "分数").id == "b"
+        table.remove("l")
+        table.remove("m")
+        assert table.remove("l") is None
+        assert target == {"variables": {"b": ["分数", 5]}, "lists": {}, "broadcasts": {}}
+        assert snapshot(table) == snapshot(SymbolTable.from_target(target))
+
+
+class TestBuilderScopes:
+    """SB3Builder 作用域解析测试类"""
+
+    def setup_method(self):
+        self.builder = SB3Builder()
+        self.stage = self.builder.add_sprite("Stage", is_stage=True)
+        self.stage_var = self.builder.add_variable("分数", 0)
+        self.stage_list = self.builder.add_list("数据")
+        self.sprite = self.builder.add_sprite("角色1")
+
+    def test_stage_variable_visible_from_sprite(self):
+        """测试角色可以解析舞台全局变量"""
+        assert self.builder.resolve_variable("分数") == self.stage_var
+        assert self.builder.add_variable("分数") == self.stage_var
+        assert self.sprite["variables"] == {}
+
+    def test_local_variable_shadows_stage(self):
+        """测试角色局部变量优先于舞台变量"""
+        self.builder.add_variable("速度", 1)
+        local = self.builder.resolve_variable("速度")
+        assert local in self.sprite["variables"]
+        self.builder.current_sprite = self.stage
+        assert self.builder.resolve_variable("速度") is None
+
+    def test_lists_and_cloud_variables(self):
+        """测试列表和云变量登记"""
+        assert self.builder.resolve_list("数据") == self.stage_list
+        cloud_id = self.builder.add_cloud_variable("最高分")
+        assert self.builder.resolve_variable("☁ 最高分") == cloud_id
+        assert self.builder.symbols().get(cloud_id).cloud
+
+    def test_broadcasts_registered_on_stage(self):
+        """测试广播登记在舞台上且同名共用 ID"""
+        first = self.builder.add_broadcast("开始")
+        assert self.builder.add_broadcast("开始") == first
+        assert self.stage["broadcasts"] == {first: "开始"}
+        assert self.builder.lookup(BROADCAST, "开始").id == first
+
+
+class TestParserResolution:
+    """解析器名称解析测试类"""
+
+    CODE = (": 开始\n@ 舞台\n变量: 分数 = 0\n列表: 数据\n"
+            "# 角色1\n变量: 本地 = 1\n"
+            "当绿旗被点击\n"
+            "  设置 ~本地 为 ~分数 + 1\n"
+            "  添加 1 到 数据\n"
+            "  广播 开始\n"
+            "当收到 开始\n"
+            "  移动 10 步\n")
+
+    def test_variable_and_list_ids(self, compile_source):
+        """测试变量和列表字段引用正确的 ID"""
+        parser = compile_source(self.CODE, save=False).parser
+        stage, sprite = parser.builder.project["targets"][:2]
+        stage_var = next(iter(stage["variables"]))
+        local_var = next(iter(sprite["variables"]))
+        stage_list = next(iter(stage["lists"]))
+
+        set_block = blocks_by_opcode(sprite, "data_setvariableto")[0]
+        assert set_block["fields"]["VARIABLE"] == ["本地", local_var]
+        reporters = blocks_by_opcode(sprite, "data_variable")
+        assert reporters and all(b["fields"]["VARIABLE"] == ["分数", stage_var] for b in reporters)
+        add_block = blocks_by_opcode(sprite, "data_addtolist")[0]
+        assert add_block["fields"]["LIST"] == ["数据", stage_list]
+
+    def test_broadcast_ids(self, compile_source):
+        """测试广播积木与接收积木共用舞台上的广播 ID"""
+        parser = compile_source(self.CODE, save=False).parser
+        stage, sprite = parser.builder.project["targets"][:2]
+        broadcast_id = next(iter(stage["broadcasts"]))
+        assert stage["broadcasts"][broadcast_id] == "开始"
+
+        send = blocks_by_opcode(sprite, "event_broadcast")[0]
+        assert send["inputs"]["BROADCAST_INPUT"] == [1, [11, "开始", broadcast_id]]
+        receive = blocks_by_opcode(sprite, "event_whenbroadcastreceived")[0]
+        assert receive["fields"]["BROADCAST_OPTION"] == ["开始", broadcast_id]
+
+
+class TestOptimizationPasses:
+    """优化遍通过符号表增删变量测试类"""
+
+    def test_tables_match_project(self, compile_source):
+        """测试内联、外提新建的临时变量和死代码消除删除的符号都反映在编译器的符号表中"""
+        parser = compile_source(": 开始\n@ 舞台\n变量: 没用 = 0\n"
+                                "# 角色1\n变量: w = 4\n变量: a = 0\n变量: 只写 = 0\n"
+                                "定义 加两次(k)\n  将 a 增加 ~k\n  将 a 增加 ~k\n结束\n"
+                                "当绿旗被点击\n"
+                                "  加两次(~w + 1)\n"
+                                "  设置 只写 为 1\n"
+                                "  重复 5 次\n    将x坐标增加 ~w * 2\n  结束\n"
+                                "  说 ~a\n",
+                                inline_procedures=True, hoist_invariants=True, eliminate_dead_code=True).parser
+        stage, sprite = parser.builder.project["targets"]
+        names = {value[0] for value in sprite["variables"].values()}
+        assert {"_内联_加两次_k", "_不变量_1"} <= names and "只写" not in names
+        assert stage["variables"] == {}
+        for target in (stage, sprite):
+            assert snapshot(parser.builder.symbols(target)) == snapshot(SymbolTable.from_target(target))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
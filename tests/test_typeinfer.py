@@ -0,0 +1,196 @@
+"""
+typeinfer.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.blockgraph import check_links
+from compiler.blockrecord import new_block
+from compiler.blocks import SLOT_PRIMITIVES, BlockDefinitions
+from compiler.typeinfer import NUMBER, STRING, UNKNOWN, infer_types, literal_type
+
+COMPILE_OPTIONS = {"peephole": False}
+SPRITE_VARIABLES = "变量: a = 0\n变量: 名字 = \"玩家\"\n列表: 数据\n"
+
+
+def inputs(target, opcode):
+    """角色中第一个 opcode 积木的输入"""
+    return next(block["inputs"] for block in target["blocks"].values() if block["opcode"] == opcode)
+
+
+def project_with(blocks, variables=None):
+    """只有舞台和一个角色的 project.json"""
+    return {"targets": [
+        {"isStage": True, "name": "Stage", "variables": {}, "blocks": {}},
+        {"isStage": False, "name": "角色1", "variables": variables or {}, "blocks": blocks},
+    ]}
+
+
+class TestSlotTypes:
+    """输入槽元数据测试类"""
+
+    def test_slot_types_are_known(self):
+        """测试 INPUT_TYPES 中只使用已知的输入槽类型"""
+        known = set(SLOT_PRIMITIVES) | {"boolean"}
+        for opcode, slots in BlockDefinitions.INPUT_TYPES.items():
+            assert set(slots.values()) <= known, opcode
+
+    def test_get_input_type(self):
+        """测试按 opcode 和输入名查询输入槽类型"""
+        assert BlockDefinitions.get_input_type("control_repeat", "TIMES") == "math_whole_number"
+        assert BlockDefinitions.get_input_type("control_if", "CONDITION") == "boolean"
+        assert BlockDefinitions.get_input_type("control_if", "SUBSTACK") is None
+        assert BlockDefinitions.get_input_type("event_broadcast", "BROADCAST_INPUT") is None
+
+    def test_literal_type(self):
+        """测试字面量按 JavaScript 的 Number() 判断是否为数字"""
+        assert [literal_type(text) for text in ("5", "-2.5", "1e3", "0x10", " 7 ")] == [NUMBER] * 5
+        assert [literal_type(text) for text in ("", "abc", "1_000", "nan", "5 步")] == [STRING] * 5
+
+
+class TestRetype:
+    """字面量和阴影改写测试类"""
+
+    def test_primitive_codes_follow_slots(self, compile_source):
+        """测试字面量按输入槽改写基本类型编号"""
+        compiled = compile_source(
+            script="重复 4 次\n  等待 0.5 秒\n结束\n设置 a 为 5\n说 3\n面向 90 方向")
+        assert inputs(compiled.sprite, "control_repeat")["TIMES"] == [1, [6, "4"]]
+        assert inputs(compiled.sprite, "control_wait")["DURATION"] == [1, [5, "0.5"]]
+        assert inputs(compiled.sprite, "data_setvariableto")["VALUE"] == [1, [10, "5"]]
+        assert inputs(compiled.sprite, "motion_pointindirection")["DIRECTION"] == [1, [8, "90"]]
+        assert compiled.parser.type_report.retyped >= 4
+
+    def test_constraint_falls_back_to_math_number(self, compile_source):
+        """测试不满足槽约束的数字（负的等待时间、小数次数）用 math_number"""
+        target = compile_source(script="重复 2.5 次\n  等待 -1 秒\n结束").sprite
+        assert inputs(target, "control_repeat")["TIMES"] == [1, [4, "2.5"]]
+        assert inputs(target, "control_wait")["DURATION"] == [1, [4, "-1"]]
+
+    def test_numbers_keep_source_spelling(self, compile_source):
+        """测试数字字面量不再写成 "0.0"，改写类型编号时保留源码中的写法"""
+        target = compile_source(script="设置 a 为 0\n移动 1e2 步\n将 a 增加 +3").sprite
+        assert inputs(target, "data_setvariableto")["VALUE"] == [1, [10, "0"]]
+        assert inputs(target, "motion_movesteps")["STEPS"] == [1, [4, "1e2"]]
+        assert inputs(target, "data_changevariableby")["VALUE"] == [1, [4, "+3"]]
+
+    def test_reporters_get_obscured_shadows(self, compile_source):
+        """测试数字和文本槽中的 reporter 下补上被遮住的阴影，布尔槽不变"""
+        target = compile_source(script="移动 ~a 步\n说 ~a\n如果 ~a > 1 那么\n  移动 1 步\n结束").sprite
+        steps = inputs(target, "motion_movesteps")["STEPS"]
+        assert steps[0] == 3 and steps[2] == [4, ""]
+        assert target["blocks"][steps[1]]["opcode"] == "data_variable"
+        assert inputs(target, "looks_say")["MESSAGE"][2] == [10, ""]
+        assert inputs(target, "control_if")["CONDITION"][0] == 2
+        assert inputs(target, "operator_gt")["OPERAND1"][2] == [10, ""]
+        assert check_links(target["blocks"]) == []
+
+    @pytest.mark.parametrize("text", ["1.0", "0.5e1", "1e0", "+3", "010"])
+    def test_same_result_as_uninferred(self, compile_source, run_project, text):
+        """测试改写前后运行结果相同（随机数两端的文本含 "." 时返回小数，不能写成规范形式）"""
+        script = f"设置 a 为 (从 {text} 到 10 随机选一个数)\n说 (从 0 到 {text} 随机选一个数)\n等待 {text} 秒\n移动 {text} 步"
+        inferred = compile_source(script=script)
+        assert inferred.parser.type_report.retyped > 0
+        expected = run_project(compile_source(script=script, infer_types=False).parser.builder.project)
+        assert run_project(inferred.parser.builder.project) == expected
+
+    def test_colour_picker(self, compile_source):
+        """测试颜色字面量使用 colour_picker（9）"""
+        target = compile_source(script="将笔的颜色设为 #FF0000").sprite
+        assert inputs(target, "pen_setPenColorToColor")["COLOR"] == [1, [9, "#FF0000"]]
+
+    def test_custom_block_arguments_are_text(self, compile_source):
+        """测试自定义积木调用的 %s 参数使用文本槽"""
+        target = compile_source(script="走(5)", definitions="定义 走(步数)\n  移动 ~步数 步\n结束\n").sprite
+        call = next(block for block in target["blocks"].values() if block["opcode"] == "procedures_call")
+        assert list(call["inputs"].values()) == [[1, [10, "5"]]]
+
+    def test_shadow_blocks_retyped(self):
+        """测试阴影积木按输入槽改写 opcode 和字段"""
+        blocks = {
+            "loop": new_block("control_repeat", {"TIMES": [1, "times"]}, top_level=True),
+            "times": new_block("math_number", fields={"NUM": ["10.0", None]}, parent="loop", shadow=True),
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = infer_types(project_with(blocks))
+        assert blocks["times"]["opcode"] == "math_whole_number"
+        assert blocks["times"]["fields"] == {"NUM": ["10.0", None]}
+        assert report.retyped == 1
+
+    def test_idempotent(self, compile_source):
+        """测试再次推断时没有需要改写的输入"""
+        compiled = compile_source(script="重复 4 次\n  移动 ~a 步\n结束")
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = infer_types(compiled.parser.builder.project)
+        assert (report.retyped, report.shadows) == (0, 0)
+
+    def test_disabled(self, compile_source):
+        """测试 infer_types=False 时保持解析器生成的输入"""
+        compiled = compile_source(script="重复 4 次\n  移动 ~a 步\n结束", infer_types=False)
+        assert compiled.parser.type_report is None
+        assert inputs(compiled.sprite, "control_repeat")["TIMES"] == [1, [4, "4"]]
+        assert inputs(compiled.sprite, "motion_movesteps")["STEPS"][0] == 2
+
+
+class TestVariables:
+    """变量类型推断测试类"""
+
+    def test_variable_types(self, compile_source):
+        """测试由初始值和所有写入推断变量类型"""
+        compiled = compile_source(
+            script="设置 b 为 ~a\n设置 c 为 x坐标\n设置 c 为 你好\n将 d 增加 1",
+            variables="变量: a = 0\n变量: b = 1\n变量: c = 0\n变量: d = \"\"\n变量: 名字 = \"玩家\"\n")
+        assert compiled.parser.type_report.variables == {
+            "角色1/a": NUMBER, "角色1/b": NUMBER, "角色1/c": UNKNOWN, "角色1/d": UNKNOWN, "角色1/名字": STRING,
+        }
+
+    def test_types_flow_through_assignments(self):
+        """测试变量之间互相赋值时迭代到不动点"""
+        variables = {"va": ["a", 0], "vb": ["b", 0], "vc": ["c", "文本"]}
+        blocks = {
+            "set_a": new_block("data_setvariableto", {"VALUE": [2, "read_b"]}, {"VARIABLE": ["a", "va"]},
+                               top_level=True),
+            "read_b": new_block("data_variable", fields={"VARIABLE": ["b", "vb"]}, parent="set_a"),
+            "set_b": new_block("data_setvariableto", {"VALUE": [3, [12, "c", "vc"], [10, ""]]},
+                               {"VARIABLE": ["b", "vb"]}, top_level=True),
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = infer_types(project_with(blocks, variables))
+        assert report.variables == {"角色1/a": UNKNOWN, "角色1/b": UNKNOWN, "角色1/c": STRING}
+
+
+class TestWarnings:
+    """类型警告测试类"""
+
+    def test_text_literal_in_numeric_slot(self, compile_source):
+        """测试非数字文本放入数字槽时给出警告"""
+        compiled = compile_source(script="将 a 增加 abc\n移动 ~名字 步")
+        assert compiled.parser.type_report.warnings == [
+            '角色1: 文本 "abc" 放入了 data_changevariableby 的数字输入 VALUE',
+            "角色1: 变量 名字（值总是文本） 放入了 motion_movesteps 的数字输入 STEPS",
+        ]
+
+    def test_text_reporter_in_numeric_slot(self):
+        """测试连接等返回文本的 reporter 放入数字槽时给出警告"""
+        blocks = {
+            "move": new_block("motion_movesteps", {"STEPS": [2, "join"]}, top_level=True),
+            "join": new_block("operator_join", {"STRING1": [1, [10, "1"]], "STRING2": [1, [10, "2"]]}, parent="move"),
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = infer_types(project_with(blocks))
+        assert report.warnings == ["角色1: operator_join 的文本结果 放入了 motion_movesteps 的数字输入 STEPS"]
+
+    def test_no_false_alarms(self, compile_source):
+        """测试数字、回答、列表位置关键字和文本槽中的文本不警告"""
+        compiled = compile_source(
+            script="移动 ~a 步\n移动 回答 步\n删除 数据 的第 last 项\n说 ~名字\n设置 a 为 你好")
+        assert compiled.parser.type_report.warnings == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
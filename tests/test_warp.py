@@ -0,0 +1,114 @@
+"""
+warp.py 单元测试
+"""
+import pytest
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compiler.warp import infer_warp
+
+SPRITE_VARIABLES = "变量: n = 0\n列表: 数据\n"
+
+
+def warp_flags(blocks, opcode="procedures_prototype"):
+    """按积木签名返回 mutation 中的 warp"""
+    return {block["mutation"]["proccode"]: block["mutation"]["warp"]
+            for block in blocks.values() if block["opcode"] == opcode}
+
+
+class TestInference:
+    """推断规则测试类"""
+
+    def test_pure_loop_promoted(self, compile_source):
+        """测试纯计算的循环开启 warp，调用积木的 mutation 同步修改"""
+        compiled = compile_source(
+            script="累加(100)",
+            definitions="定义 累加(次数)\n  重复 ~次数 次\n    将 n 增加 1\n    添加 ~n 到 数据\n  结束\n结束")
+        blocks = compiled.sprite["blocks"]
+        assert warp_flags(blocks) == {"累加 %s": "true"}
+        assert warp_flags(blocks, "procedures_call") == {"累加 %s": "true"}
+        assert compiled.parser.warp_report.promoted == ["角色1/累加 %s"]
+        assert compiled.parser.warp_report.kept == {}
+
+    @pytest.mark.parametrize("body, reason", [
+        ("  等待 1 秒", "等待"),
+        ("  说 你好 2 秒", "说几秒"),
+        ("  重复执行\n    将 n 增加 1\n  结束", "无界循环（重复执行）"),
+        ("  重复 10 次\n    移动 10 步\n  结束", "循环中有会重绘的积木 motion_movesteps（动画）"),
+    ])
+    def test_yielding_kept(self, compile_source, body, reason):
+        """测试会让出或循环中有动画的积木不开启 warp"""
+        compiled = compile_source(definitions=f"定义 动作()\n{body}\n结束")
+        blocks = compiled.sprite["blocks"]
+        assert warp_flags(blocks) == {"动作": "false"}
+        assert compiled.parser.warp_report.kept == {"角色1/动作": reason}
+
+    def test_straight_line_redraw_promoted(self, compile_source):
+        """测试没有循环的移动（本来就不会让出）可以开启 warp"""
+        compiled = compile_source(definitions="定义 归位()\n  移到 0 0\n  面向 90 方向\n结束")
+        blocks = compiled.sprite["blocks"]
+        assert warp_flags(blocks) == {"归位": "true"}
+
+    def test_transitive_calls(self, compile_source):
+        """测试调用会让出的积木也会让出，循环中调用会重绘的积木视为动画"""
+        compiled = compile_source(
+            definitions="定义 等一下()\n  等待 1 秒\n结束\n"
+                        "定义 外层()\n  等一下\n结束\n"
+                        "定义 走一步()\n  移动 1 步\n结束\n"
+                        "定义 走很多步()\n  重复 10 次\n    走一步\n  结束\n结束\n"
+                        "定义 调用走一步()\n  走一步\n结束")
+        blocks = compiled.sprite["blocks"]
+        assert warp_flags(blocks) == {"等一下": "false", "外层": "false", "走一步": "true",
+                                      "走很多步": "false", "调用走一步": "true"}
+        assert compiled.parser.warp_report.kept["角色1/外层"] == "调用 等一下: 等待"
+        assert compiled.parser.warp_report.kept["角色1/走很多步"] == "循环中调用了会重绘的 走一步"
+
+    def test_recursion_kept(self, compile_source):
+        """测试递归的积木不开启 warp"""
+        compiled = compile_source(definitions="定义 倒数(k)\n  将 n 增加 1\n  倒数(1)\n结束")
+        blocks = compiled.sprite["blocks"]
+        assert warp_flags(blocks) == {"倒数 %s": "false"}
+        assert "递归调用" in compiled.parser.warp_report.kept["角色1/倒数 %s"]
+
+    def test_refresh_annotation(self, compile_source):
+        """测试 "刷新屏幕" 标注禁止自动开启，"不刷新屏幕" 仍然手动开启"""
+        compiled = compile_source(
+            definitions="定义 计算(k) 刷新屏幕\n  将 n 增加 1\n结束\n定义 快速() 不刷新屏幕\n  等待 1 秒\n结束")
+        blocks = compiled.sprite["blocks"]
+        assert warp_flags(blocks) == {"计算 %s": "false", "快速": "true"}
+        assert compiled.parser.warp_report.kept == {"角色1/计算 %s": "标注了刷新屏幕"}
+        assert compiled.parser.custom_blocks["角色1"]["计算"]["refresh"]
+
+    def test_disabled(self, compile_source):
+        """测试 warp_inference=False 时不修改"""
+        compiled = compile_source(definitions="定义 计算()\n  将 n 增加 1\n结束", warp_inference=False)
+        blocks = compiled.sprite["blocks"]
+        assert warp_flags(blocks) == {"计算": "false"}
+        assert compiled.parser.warp_report is None
+
+    def test_extension_reporter(self):
+        """测试输入中有未知扩展的 reporter 时不开启 warp（可能返回 Promise）"""
+        blocks = {
+            "def": {"opcode": "procedures_definition", "next": "set", "parent": None,
+                    "inputs": {"custom_block": [1, "proto"]}, "fields": {}, "shadow": False, "topLevel": True},
+            "proto": {"opcode": "procedures_prototype", "next": None, "parent": "def", "inputs": {}, "fields": {},
+                      "shadow": True, "topLevel": False,
+                      "mutation": {"tagName": "mutation", "proccode": "翻译", "warp": "false"}},
+            "set": {"opcode": "data_setvariableto", "next": None, "parent": "def",
+                    "inputs": {"VALUE": [3, "ext", [10, ""]]}, "fields": {"VARIABLE": ["n", "v"]},
+                    "shadow": False, "topLevel": False},
+            "ext": {"opcode": "translate_getTranslate", "next": None, "parent": "set", "inputs": {},
+                    "fields": {}, "shadow": False, "topLevel": False},
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = infer_warp({"targets": [{"name": "角色1", "blocks": blocks}]})
+        assert report.kept == {"角色1/翻译": "扩展积木 translate_getTranslate"}
+        assert blocks["proto"]["mutation"]["warp"] == "false"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])